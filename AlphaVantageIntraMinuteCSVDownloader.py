@@ -1,33 +1,270 @@
 # -*- coding: utf-8 -*-
-import pandas as pd
+import os
+import json
+import random
+import typing
+import asyncio
+import urllib.error
+import urllib.parse
 import urllib.request
-import time
+import pandas as pd
+
+from rate_limit import TokenBucket
+
+
+"""
+NOTE:
+Downloader of the Alpha Vantage extended intraday data (TIME_SERIES_INTRADAY_EXTENDED), which is
+served as 24 monthly slices per symbol (year1month1 ... year2month12).
+Every (symbol, slice) pair is one job. The jobs are run by a fixed number of asyncio workers,
+the requests go through a token bucket matched to the API quota (5 requests per minute for a free
+key), and failed requests are retried with exponential backoff.
+The state of every job is kept in a JSON ledger, so an interrupted download resumes where it stopped.
+Each completed slice is handed to a sink: IntradayStore.sink() merges it into the intraday store,
+csv_sink (the default) writes it to <symbol>_<slice>.csv as before.
+"""
+
+API_BASE = "https://www.alphavantage.co/query"
+
+SLICES = [f"year{year}month{month}" for year in range(1, 3) for month in range(1, 13)]
+
+# =============================================================================
+# Job Ledger
+# =============================================================================
+
+
+class JobLedger:
+    """
+    Persisted state of the download jobs (JSON file)
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: JSON file of the ledger (created if missing)
+        """
+        self.path = path
+        self.jobs = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.jobs = json.load(f)
+
+    def is_done(self, job: str) -> bool:
+        return self.jobs.get(job, {}).get("status") == "done"
+
+    def record(self, job: str, status: str, attempts: int, rows: int = 0, error: str = None):
+        """
+        :param job: job key (symbol/slice)
+        :param status: "done" or "failed"
+        :param attempts: number of requests made
+        :param rows: number of rows written by the sink
+        :param error: last error of a failed job
+        """
+        self.jobs[job] = {"status": status, "attempts": attempts, "rows": rows, "error": error}
+        self.save()
+
+    def save(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.jobs, f)
+        os.replace(temporary, self.path)
+
+
+# =============================================================================
+# Sinks
+# =============================================================================
+
+
+def csv_sink(directory: str = ".") -> typing.Callable[[str, str, str], int]:
+    """
+    :param directory: folder the slices are written to
+
+    :return: sink writing every slice to <directory>/<symbol>_<slice>.csv
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    def sink(symbol: str, s_slice: str, text: str) -> int:
+        with open(os.path.join(directory, f"{symbol}_{s_slice}.csv"), "w", newline="") as f:
+            f.write(text)
+        return max(text.count("\n") - 1, 0)
+
+    return sink
+
+
+# =============================================================================
+# Scheduler
+# =============================================================================
+
+
+class RetryableError(Exception):
+    pass
+
+
+class AlphaVantageScheduler:
+    """
+    Rate limited asynchronous download of intraday slices
+    """
+
+    def __init__(
+        self,
+        key: str,
+        symbols: typing.List[str],
+        slices: typing.List[str] = SLICES,
+        interval: str = "1min",
+        sink: typing.Callable[[str, str, str], int] = None,
+        ledger_path: str = "alphavantage_ledger.json",
+        requests_per_minute: float = 5,
+        burst: int = 1,
+        max_concurrency: int = 4,
+        max_retries: int = 5,
+        backoff: float = 2.0,
+        timeout: float = 60,
+        api_base: str = API_BASE,
+    ):
+        """
+        :param key: Alpha Vantage API key
+        :param symbols: symbols to download
+        :param slices: slices downloaded for every symbol
+        :param interval: 1min, 5min, 15min, 30min or 60min
+        :param sink: called as sink(symbol, slice, csv_text) for every completed slice, returns the number of rows
+            (defaults to csv_sink in the working directory)
+        :param ledger_path: JSON file with the state of the jobs, completed jobs are skipped on the next run
+        :param requests_per_minute: API quota
+        :param burst: number of requests that can be sent at once after an idle period
+        :param max_concurrency: number of requests in flight at the same time
+        :param max_retries: retries of a failed request before the job is marked failed
+        :param backoff: base of the exponential backoff in seconds (backoff * 2 ** attempt, with jitter)
+        :param timeout: timeout of a request in seconds
+        :param api_base: URL of the API (i.e. a local server for testing)
+        """
+        self.key = key
+        self.symbols = list(symbols)
+        self.slices = list(slices)
+        self.interval = interval
+        self.sink = csv_sink() if sink is None else sink
+        self.ledger = JobLedger(ledger_path)
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.api_base = api_base
+
+    def run(self) -> typing.Dict[str, int]:
+        """
+        :return: number of jobs done, failed and skipped (already done in the ledger)
+        """
+        return asyncio.run(self.run_async())
+
+    async def run_async(self) -> typing.Dict[str, int]:
+        """
+        :return: number of jobs done, failed and skipped (already done in the ledger)
+        """
+        bucket = TokenBucket(self.requests_per_minute / 60, self.burst)
+        queue = asyncio.Queue()
+        skipped = 0
+        for symbol in self.symbols:
+            for s_slice in self.slices:
+                if self.ledger.is_done(f"{symbol}/{s_slice}"):
+                    skipped += 1
+                else:
+                    queue.put_nowait((symbol, s_slice))
+
+        counts = {"done": 0, "failed": 0, "skipped": skipped}
+        workers = [asyncio.create_task(self._worker(queue, bucket, counts)) for _ in range(self.max_concurrency)]
+        await queue.join()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        return counts
+
+    def url(self, symbol: str, s_slice: str) -> str:
+        """
+        :return: request URL of one slice
+        """
+        query = {
+            "function": "TIME_SERIES_INTRADAY_EXTENDED",
+            "symbol": symbol,
+            "interval": self.interval,
+            "slice": s_slice,
+            "apikey": self.key,
+            "datatype": "csv",
+        }
+        return self.api_base + "?" + urllib.parse.urlencode(query)
+
+    async def _worker(self, queue: asyncio.Queue, bucket: TokenBucket, counts: typing.Dict[str, int]):
+        while True:
+            symbol, s_slice = await queue.get()
+            try:
+                await self._run_job(symbol, s_slice, bucket, counts)
+            finally:
+                queue.task_done()
+
+    async def _run_job(self, symbol: str, s_slice: str, bucket: TokenBucket, counts: typing.Dict[str, int]):
+        job = f"{symbol}/{s_slice}"
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * (0.5 + random.random()))
+            await bucket.acquire_async()
+            try:
+                text = await asyncio.to_thread(_fetch, self.url(symbol, s_slice), self.timeout)
+                rows = await asyncio.to_thread(self.sink, symbol, s_slice, text)
+            except RetryableError as e:
+                error = str(e)
+                continue
+            except Exception as e:
+                error = str(e)
+                break
+            self.ledger.record(job, "done", attempt + 1, rows)
+            counts["done"] += 1
+            return
+        self.ledger.record(job, "failed", attempt + 1, error=error)
+        counts["failed"] += 1
+
+
+def _fetch(url: str, timeout: float) -> str:
+    """
+    :return: CSV text of the response
+    :raise RetryableError for network errors, server errors and quota messages
+    """
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            text = response.read().decode("utf-8")
+    except urllib.error.HTTPError as e:
+        if e.code == 429 or e.code >= 500:
+            raise RetryableError(f"HTTP {e.code}")
+        raise Exception(f"HTTPException: {e.code} for {url}")
+    except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+        raise RetryableError(str(e))
+
+    # errors and quota messages are sent as JSON with a 200 status
+    if text.lstrip().startswith("{"):
+        message = json.loads(text)
+        if "Error Message" in message:
+            raise Exception(f"APIException: {message['Error Message']}")
+        raise RetryableError(message.get("Note") or message.get("Information") or text)
+    return text
 
-df_tickers = pd.read_csv('FinnhubID.csv')
 
-# sort tickers with most recent trading dates first
-df_sorted = df_tickers.sort_values(by=['end'],ascending = False).reset_index(drop = True)
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
 
-symbol_list = df_sorted.symbol
+if __name__ == "__main__":
 
-key= 'demo'  # CHANGE it to YOUR OWN requested API key from Alphavantage
+    from intraday_store import IntradayStore
 
-y = range(1,3)
-m = range(1,13)
-slices = []
-for i in y:
-    for j in m:
-        slices.append('year'+str(i)+'month'+str(j))
-        
-interval = '1min'
+    df_tickers = pd.read_csv("FinnhubID.csv")
 
-############
-# CSV Download - change the symbol to desired ticker
-##################
-symbol = symbol_list[0]  
+    # sort tickers with most recent trading dates first
+    df_sorted = df_tickers.sort_values(by=["end"], ascending=False).reset_index(drop=True)
+    symbol_list = list(df_sorted.symbol.dropna().unique())
 
-for s_slice in slices:
-    url = 'https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY_EXTENDED&symbol=' + symbol + '&interval=' + interval + '&slice=' + s_slice + '&apikey=' + key + '&datatype=csv'
-    urllib.request.urlretrieve(url, symbol+'_'+ s_slice+'.csv')
-    time.sleep(3)  # to comply with 5 requests/minute constraint - adjust this sleep time if needed
+    key = "demo"  # CHANGE it to YOUR OWN requested API key from Alphavantage
 
+    # 5 requests/minute for a free key, re-running the script resumes from the ledger
+    # every slice is merged into the intraday store (use csv_sink("data/alphavantage") to keep csv files)
+    store = IntradayStore("data/intraday")
+    scheduler = AlphaVantageScheduler(key, symbol_list[:10], sink=store.sink(), requests_per_minute=5)
+    print(scheduler.run())
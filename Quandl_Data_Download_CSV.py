@@ -1,20 +1,248 @@
-import quandl
+import io
+import os
+import re
+import json
+import time
+import typing
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import numpy as np
 import pandas as pd
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
-name_stock_ls= pd.read_csv('FinnhubID.csv')
-name_stock_ls = name_stock_ls.symbol
-auth_key = "RSJU_9Zsy_ryxzT2UN5G"
-name_head = 'FNSQ'
+from rate_limit import TokenBucket
+from instrumentation import count
 
 
-def data_to_csv_from_quandl(name_head,name_stock_ls,auth_key):
-# This funnction returns CSVs from the FINRA, using ticker list and name_head provided
-## the name_stock_ls is a list of tickers, such as QQQ, which needs to be provided.
-## name_head is the name such as FNSQ
-    for i in range(len(name_stock_ls)):
-        name_stock = name_stock_ls[i]
-        nof = "FINRA/{name1}_{name2}".format(name1 = name_head, name2 = name_stock)#name of file
-        data_frame = quandl.get(nof, authtoken=auth_key) # getting data using my token
-        data_frame.to_csv (r'{name3}.csv'.format(name3=name_stock), header=True) #converts to csv file
+"""
+NOTE:
+Incremental download of the FINRA short volume datasets from Quandl (FINRA/<name_head>_<symbol>).
+A high-water mark (last date downloaded) is kept for every symbol in <root>/_high_water.json, so
+every run only requests the dates after it. The symbols are fetched by a bounded thread pool
+sharing a token bucket matched to the Quandl rate limit.
+A symbol whose request or csv fails (HTTP error, network error, malformed csv) does not stop the run:
+its count is -1 and the error is kept in failures until the next update. Other errors propagate.
+The new rows of every run are appended as one parquet part per finnhub_id:
+    <root>/finnhub_id=<id>/<symbol>_<first date>_<last date>.parquet
+with columns finnhub_id, symbol, date, short_volume, short_exempt_volume, total_volume.
+A symbol can belong to several finnhub IDs over time (FinnhubID.csv), every row goes to the ID
+listed most recently on or before its date.
+You need pyarrow (pip install pyarrow) to read and write the parquet parts.
+"""
 
-data_to_csv_from_quandl(name_head,name_stock_ls,auth_key)
+API_BASE = "https://www.quandl.com/api/v3"
+
+# =============================================================================
+# Short Volume Fetcher
+# =============================================================================
+
+
+class ShortVolumeFetcher:
+    """
+    Incremental, rate limited fetcher of the FINRA short volume data
+    """
+
+    def __init__(
+        self,
+        root: str,
+        auth_key: str,
+        name_head: str = "FNSQ",
+        id_file: str = "FinnhubID.csv",
+        requests_per_second: float = 3.0,
+        max_workers: int = 8,
+        max_retries: int = 3,
+        backoff: float = 2.0,
+        timeout: float = 60,
+        api_base: str = API_BASE,
+    ):
+        """
+        :param root: directory of the short volume dataset (created if missing)
+        :param auth_key: Quandl API key
+        :param name_head: FINRA dataset prefix (i.e. FNSQ, FNYX, FNRA)
+        :param id_file: csv with the symbol, class, finnhub_id, start and end of every listing
+        :param requests_per_second: Quandl rate limit (2000 calls per 10 minutes for a free key)
+        :param max_workers: number of requests in flight at the same time
+        :param max_retries: retries of a request failing with 429 or a server error
+        :param backoff: base of the exponential backoff in seconds
+        :param timeout: timeout of a request in seconds
+        :param api_base: URL of the API (i.e. a local server for testing)
+        """
+        self.root = root
+        self.auth_key = auth_key
+        self.name_head = name_head
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.api_base = api_base
+        self._bucket = TokenBucket(requests_per_second, max(1.0, requests_per_second))
+        self._lock = threading.Lock()
+        self._high_water_path = os.path.join(root, "_high_water.json")
+        self.failures = {}  # symbol -> error of the last update
+        os.makedirs(root, exist_ok=True)
+
+        ids = pd.read_csv(id_file, keep_default_na=False)
+        ids = ids[ids["class"] == ""].sort_values(["symbol", "start"], kind="mergesort")
+        self._listings = {
+            symbol: (pd.DatetimeIndex(group["start"]).values, group["finnhub_id"].to_numpy())
+            for symbol, group in ids.groupby("symbol", sort=False)
+        }
+        self.high_water = {}
+        if os.path.exists(self._high_water_path):
+            with open(self._high_water_path) as f:
+                self.high_water = json.load(f)
+
+    def update(self, symbols: typing.List[str] = None) -> typing.Dict[str, int]:
+        """
+        :param symbols: symbols to update (if None every symbol of the id file)
+
+        :return: number of new rows of every symbol (-1 when the request or the csv failed,
+            the error is in failures)
+        """
+        symbols = list(self._listings) if symbols is None else symbols
+        self.failures = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(symbols, executor.map(self._update_symbol, symbols)))
+
+    def url(self, symbol: str, start_date: str = None) -> str:
+        """
+        :return: request URL of the dataset of the symbol, from start_date on
+        """
+        query = {"api_key": self.auth_key, "order": "asc"}
+        if start_date is not None:
+            query["start_date"] = start_date
+        return f"{self.api_base}/datasets/FINRA/{self.name_head}_{symbol}.csv?" + urllib.parse.urlencode(query)
+
+    def _update_symbol(self, symbol: str) -> int:
+        mark = self.high_water.get(symbol)
+        start_date = None if mark is None else (pd.Timestamp(mark) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        try:
+            text = self._fetch(self.url(symbol, start_date))
+            if text is None:
+                return 0
+            df = pd.read_csv(io.StringIO(text))
+            df.columns = [_snake_case(column) for column in df.columns]
+            df["date"] = pd.to_datetime(df["date"])
+        except (urllib.error.URLError, TimeoutError, ConnectionError, ValueError, KeyError) as e:
+            # HTTP / network errors once the retries are exhausted, and csv without a valid date column
+            with self._lock:
+                self.failures[symbol] = f"{type(e).__name__}: {e}"
+            count("fetch_failures", source="quandl")
+            return -1
+        if mark is not None:
+            df = df[df["date"] > pd.Timestamp(mark)]
+        if len(df) == 0:
+            return 0
+
+        df = df.sort_values("date", kind="mergesort")
+        last = df["date"].iloc[-1]
+        df.insert(0, "symbol", symbol)
+        df.insert(0, "finnhub_id", self._finnhub_ids(symbol, df["date"].values))
+        df = df[df["finnhub_id"].notna()]
+        for finnhub_id, part in df.groupby("finnhub_id", sort=False):
+            _write_part(self.root, finnhub_id, symbol, part)
+
+        with self._lock:
+            self.high_water[symbol] = last.strftime("%Y-%m-%d")
+            temporary = self._high_water_path + f".{threading.get_ident()}.tmp"
+            with open(temporary, "w") as f:
+                json.dump(self.high_water, f)
+            os.replace(temporary, self._high_water_path)
+        return len(df)
+
+    def _finnhub_ids(self, symbol: str, dates: np.ndarray) -> np.ndarray:
+        """
+        :return: finnhub ID listed most recently on or before every date (None before the first listing)
+        """
+        if symbol not in self._listings:
+            return np.full(len(dates), None, dtype=object)
+        starts, finnhub_ids = self._listings[symbol]
+        position = np.searchsorted(starts, dates, side="right") - 1
+        return np.where(position >= 0, finnhub_ids[np.maximum(position, 0)], None)
+
+    def _fetch(self, url: str) -> typing.Optional[str]:
+        """
+        :return: CSV text of the response (None if the dataset does not exist)
+        :raise HTTPError or URLError if the request still fails after the retries (or fails with a client error)
+        """
+        for attempt in range(self.max_retries + 1):
+            self._bucket.acquire()
+            try:
+                with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                    return response.read().decode("utf-8")
+            except urllib.error.HTTPError as e:
+                if e.code == 404:
+                    return None
+                if (e.code != 429 and e.code < 500) or attempt == self.max_retries:
+                    raise
+            except (urllib.error.URLError, TimeoutError, ConnectionError):
+                if attempt == self.max_retries:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+
+
+def read_short_volume(
+    root: str, finnhub_ids: typing.List[str] = None, start: datetime = None, end: datetime = None
+) -> pd.DataFrame:
+    """
+    :param root: directory of the short volume dataset
+    :param finnhub_ids: IDs to read (if None all)
+    :param start: first date (if None from the beginning)
+    :param end: last date, inclusive (if None to the end)
+
+    :return: Dataframe sorted by finnhub_id and date
+    """
+    frames = []
+    for folder in sorted(os.listdir(root)):
+        if not folder.startswith("finnhub_id="):
+            continue
+        if finnhub_ids is not None and folder[len("finnhub_id=") :] not in finnhub_ids:
+            continue
+        for name in sorted(os.listdir(os.path.join(root, folder))):
+            if name.endswith(".parquet"):
+                frames.append(pd.read_parquet(os.path.join(root, folder, name)))
+    if len(frames) == 0:
+        return pd.DataFrame(columns=["finnhub_id", "symbol", "date"])
+
+    df = pd.concat(frames, ignore_index=True)
+    if start is not None:
+        df = df[df["date"] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df["date"] <= pd.Timestamp(end)]
+    return df.sort_values(["finnhub_id", "date"], kind="mergesort").reset_index(drop=True)
+
+
+def _write_part(root: str, finnhub_id: str, symbol: str, df: pd.DataFrame):
+    folder = os.path.join(root, f"finnhub_id={finnhub_id}")
+    os.makedirs(folder, exist_ok=True)
+    first, last = df["date"].iloc[0].strftime("%Y%m%d"), df["date"].iloc[-1].strftime("%Y%m%d")
+    path = os.path.join(folder, f"{symbol}_{first}_{last}.parquet")
+    df.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+
+def _snake_case(name: str) -> str:
+    """
+    :return: ShortExemptVolume -> short_exempt_volume
+    """
+    return re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", name.strip()).replace(" ", "_").lower()
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    auth_key = "RSJU_9Zsy_ryxzT2UN5G"
+    name_head = "FNSQ"
+
+    # the first run downloads the full history, later runs only the new dates
+    fetcher = ShortVolumeFetcher("data/finra_short_volume", auth_key, name_head)
+    print(fetcher.update(["AAPL", "MSFT", "QQQ"]))
+    print(fetcher.failures)
+
+    print(read_short_volume("data/finra_short_volume").tail())
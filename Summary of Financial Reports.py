@@ -60,11 +60,6 @@ def CollateSummary(start_year = 2009, end_year = 2020):
     return dsummary
 
 
-all_summary=CollateSummary() #get a summary of the available data in financial reports 
-#structure of 'all_summary': 
-#year.QTR -> symbol -> types of reports (bs, cf, ic) -> available information ('concept') in the report
-
-
 #######################################################################################################
 
 #all possible concepts in different types of financial reports (bs, cf, ic)
@@ -104,6 +99,14 @@ def CollateConcepts(start_year = 2009, end_year = 2020, path = 'D:/ReportedFinan
     return bs_concept, cf_concept, ic_concept
 
 
-#all available concepts in bs, cf, ic during the period 2009-2020
-bs,cf,ic = CollateConcepts()
+
+#the reports are only read when the script is run, importing the functions does not touch the disk
+if __name__ == "__main__":
+
+    all_summary=CollateSummary() #get a summary of the available data in financial reports 
+    #structure of 'all_summary': 
+    #year.QTR -> symbol -> types of reports (bs, cf, ic) -> available information ('concept') in the report
+
+    #all available concepts in bs, cf, ic during the period 2009-2020
+    bs,cf,ic = CollateConcepts()
 
@@ -0,0 +1,297 @@
+import typing
+import numpy as np
+import pandas as pd
+
+
+"""
+NOTE:
+Alignment of loaded data onto the trading-session grid.
+All the per-ticker Dataframes returned by a loader are stacked once, and every column is
+scattered into a (sessions x IDs) array in a single vectorized pass. The presence matrix tells
+which (session, ID) pairs had data, and gaps are the sessions without data inside the listed
+interval of an ID.
+Loaders that can read their source column by column (see load_panel in dataloader.py) build the
+Panel directly with build_panel, without going through per-ticker Dataframes, and the values can
+be stored as float32 to halve the memory of large universes.
+"""
+
+# Columns that hold labels rather than numbers (kept out of the numeric values array)
+LABEL_COLUMNS = ["symbol", "class", "finnhub_id", "adjustment"]
+
+# =============================================================================
+# Panel
+# =============================================================================
+
+
+class Panel:
+    """
+    Data aligned on a (sessions x IDs x fields) grid
+    """
+
+    def __init__(
+        self,
+        values: np.ndarray,
+        sessions: pd.DatetimeIndex,
+        ids: typing.List[str],
+        fields: typing.List[str],
+        presence: np.ndarray = None,
+        labels: typing.Dict[str, typing.Tuple[np.ndarray, np.ndarray]] = None,
+        listed: np.ndarray = None,
+    ):
+        """
+        :param values: numeric array of shape (sessions, IDs, fields)
+        :param sessions: trading sessions (first axis)
+        :param ids: tickers or finnhub IDs (second axis)
+        :param fields: names of the numeric fields (third axis)
+        :param presence: boolean (sessions, IDs) array, True where the source had data (defaults to all True)
+        :param labels: non-numeric fields as (codes, categories), codes is an int32 (sessions, IDs)
+            array indexing categories (-1 where missing)
+        :param listed: boolean (sessions, IDs) array of the listed interval of each ID
+            (defaults to the first to last session with data)
+        """
+        self.values = values
+        self.sessions = pd.DatetimeIndex(sessions)
+        self.ids = pd.Index(ids)
+        self.fields = list(fields)
+        if presence is None:
+            presence = np.ones(values.shape[:2], dtype=bool)
+        self.presence = presence
+        self.labels = {} if labels is None else labels
+        self.listed = _listed_interval(presence) if listed is None else listed
+
+    @property
+    def gaps(self) -> np.ndarray:
+        """
+        :return: boolean (sessions, IDs) array, True where an ID is listed but has no data
+        """
+        return self.listed & ~self.presence
+
+    def field(self, name: str) -> pd.DataFrame:
+        """
+        :param name: numeric or label field
+
+        :return: Dataframe of one field (index: sessions, columns: IDs)
+        """
+        if name in self.labels:
+            return pd.DataFrame(_decode(*self.labels[name]), index=self.sessions, columns=self.ids)
+        return pd.DataFrame(
+            self.values[:, :, self.fields.index(name)], index=self.sessions, columns=self.ids
+        )
+
+    def split_factor(self) -> np.ndarray:
+        """
+        :return: (sessions, IDs) cumulative split adjustment from the "adjustment" label ("a:b" -> a / b),
+            same roll forward factor as adjust_cum in compute_features
+        """
+        n_sessions, n_ids = self.presence.shape
+        if "adjustment" not in self.labels:
+            return np.ones((n_sessions, n_ids))
+        codes, categories = self.labels["adjustment"]
+        ratios = np.append([_split_ratio(entry) for entry in categories], 1.0)
+        factor = ratios[codes]
+        factor[~self.presence] = 1.0  # forward-filled rows must not repeat a split
+        return np.cumprod(factor, axis=0)
+
+    def missing_report(self) -> pd.DataFrame:
+        """
+        :return: Dataframe with the number of listed sessions, the number of gaps and the first gap of every ID
+        """
+        gaps = self.gaps
+        has_gap = gaps.any(axis=0)
+        first_gap = np.where(has_gap, gaps.argmax(axis=0), 0)
+        return pd.DataFrame(
+            {
+                "listed_sessions": self.listed.sum(axis=0),
+                "gaps": gaps.sum(axis=0),
+                "first_gap": pd.Series(self.sessions[first_gap]).where(has_gap).to_numpy(),
+            },
+            index=self.ids,
+        )
+
+    def fill_gaps(self, method: str = "ffill") -> "Panel":
+        """
+        :param method: "ffill" carries the last value with data forward over the gaps,
+            "mask" leaves the gaps as NaN
+
+        :return: new Panel with the gaps filled (presence still marks the filled rows as missing)
+        """
+        if method == "mask":
+            return self
+        if method != "ffill":
+            raise ValueError(f"unknown fill method {method}")
+
+        n_sessions, n_ids = self.presence.shape
+        # row of the last session with data, for every (session, ID)
+        source = np.where(self.presence, np.arange(n_sessions)[:, None], 0)
+        np.maximum.accumulate(source, axis=0, out=source)
+        rows, columns = np.nonzero(self.gaps)
+        source_rows = source[rows, columns]
+        values = self.values.copy()
+        values[rows, columns] = self.values[source_rows, columns]
+        labels = {}
+        for name, (codes, categories) in self.labels.items():
+            codes = codes.copy()
+            codes[rows, columns] = codes[source_rows, columns]
+            labels[name] = (codes, categories)
+        return Panel(values, self.sessions, self.ids, self.fields, self.presence, labels, self.listed)
+
+    def to_dict(self) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :return: Dict of Dataframes (one per ID, over its listed interval, gaps included)
+        """
+        data_dict = {}
+        columns = list(self.labels) + self.fields
+        for i, ticker in enumerate(self.ids):
+            rows = np.flatnonzero(self.listed[:, i])
+            if len(rows) == 0:
+                continue
+            df = pd.DataFrame(self.values[rows, i, :], index=self.sessions[rows], columns=self.fields)
+            for name, (codes, categories) in self.labels.items():
+                df[name] = _decode(codes[rows, i], categories)
+            df.index.name = "datetime"
+            data_dict[ticker] = df[columns]
+        return data_dict
+
+    def to_frame(self, gaps: bool = False) -> pd.DataFrame:
+        """
+        :param gaps: if True the gaps of the listed intervals are kept as rows (NaN or filled values)
+
+        :return: one long Dataframe indexed by (datetime, symbol), symbols and label columns as
+            categoricals, numeric fields in the dtype of the panel
+        """
+        rows, columns = np.nonzero(self.listed if gaps else self.presence)
+        index = pd.MultiIndex.from_arrays(
+            [
+                self.sessions[rows],
+                pd.Categorical.from_codes(columns, categories=self.ids),
+            ],
+            names=["datetime", "symbol"],
+        )
+        df = pd.DataFrame(self.values[rows, columns, :], index=index, columns=self.fields)
+        for name, (codes, categories) in self.labels.items():
+            df[name] = pd.Categorical.from_codes(codes[rows, columns], categories=pd.Index(categories))
+        return df[list(self.labels) + self.fields]
+
+    def astype(self, dtype) -> "Panel":
+        """
+        :param dtype: dtype of the values (i.e. np.float32 halves the memory)
+
+        :return: Panel with the values cast (self if already of this dtype)
+        """
+        if self.values.dtype == np.dtype(dtype):
+            return self
+        return Panel(self.values.astype(dtype), self.sessions, self.ids, self.fields, self.presence, self.labels, self.listed)
+
+
+# =============================================================================
+# Alignment
+# =============================================================================
+
+
+def align_to_sessions(
+    data_dict: typing.Dict[str, pd.DataFrame],
+    sessions: pd.DatetimeIndex,
+    listed: typing.Dict[str, typing.Tuple[pd.Timestamp, pd.Timestamp]] = None,
+    fill: str = "mask",
+    dtype=np.float64,
+) -> Panel:
+    """
+    :param data_dict: output of a loader (each df is indexed by datetime)
+    :param sessions: trading sessions to align on (i.e. calendar.sessions_between(start, end))
+    :param listed: (listing, delisting) dates of IDs (if None the interval from the first to the last row with data is used)
+    :param fill: "mask" leaves the gaps as NaN, "ffill" forward-fills them
+    :param dtype: dtype of the numeric values (np.float64 or np.float32)
+
+    :return: Panel of all IDs on the session grid
+    """
+    ids = list(data_dict)
+    frames = [data_dict[ticker] for ticker in ids]
+    lengths = np.array([len(df) for df in frames], dtype=np.int64)
+    stacked = pd.concat(frames) if len(frames) else pd.DataFrame()
+    column = np.repeat(np.arange(len(ids)), lengths)
+    columns = {name: stacked[name] for name in stacked.columns}
+    return build_panel(sessions, ids, stacked.index, column, columns, listed, fill, dtype)
+
+
+def build_panel(
+    sessions: pd.DatetimeIndex,
+    ids: typing.List[str],
+    dates,
+    column: np.ndarray,
+    columns: typing.Dict[str, typing.Any],
+    listed: typing.Dict[str, typing.Tuple[pd.Timestamp, pd.Timestamp]] = None,
+    fill: str = "mask",
+    dtype=np.float64,
+) -> Panel:
+    """
+    :param sessions: trading sessions to align on
+    :param ids: tickers or finnhub IDs (second axis)
+    :param dates: date of every row (same length as column)
+    :param column: position in ids of every row
+    :param columns: name -> values of every row (LABEL_COLUMNS become labels, the others numeric fields)
+    :param listed: (listing, delisting) dates of IDs (if None the interval from the first to the last row with data is used)
+    :param fill: "mask" leaves the gaps as NaN, "ffill" forward-fills them
+    :param dtype: dtype of the numeric values (np.float64 or np.float32)
+
+    :return: Panel of the rows scattered on the (sessions x IDs) grid (for duplicated (date, ID) rows the last one wins)
+    """
+    sessions = pd.DatetimeIndex(sessions)
+    session_days = sessions.values.astype("datetime64[D]").astype(np.int64)
+    days = pd.DatetimeIndex(dates).values.astype("datetime64[D]").astype(np.int64)
+    row = np.searchsorted(session_days, days)
+    column = np.asarray(column, dtype=np.int64)
+    # rows dated outside of the session grid are dropped
+    on_grid = row < len(session_days)
+    on_grid[on_grid] = session_days[row[on_grid]] == days[on_grid]
+    row, column = row[on_grid], column[on_grid]
+
+    presence = np.zeros((len(sessions), len(ids)), dtype=bool)
+    presence[row, column] = True
+
+    fields = [c for c in columns if c not in LABEL_COLUMNS]
+    values = np.full((len(sessions), len(ids), len(fields)), np.nan, dtype=dtype)
+    for k, name in enumerate(fields):
+        column_values = pd.to_numeric(pd.Series(columns[name]).replace("", np.nan), errors="coerce")
+        values[row, column, k] = column_values.to_numpy(dtype=np.float64)[on_grid]
+
+    labels = {}
+    for name in [c for c in columns if c in LABEL_COLUMNS]:
+        column_codes, categories = pd.factorize(pd.Series(columns[name]))
+        codes = np.full((len(sessions), len(ids)), -1, dtype=np.int32)
+        codes[row, column] = column_codes[on_grid]
+        labels[name] = (codes, np.asarray(categories, dtype=object))
+
+    listed_mask = None
+    if listed is not None:
+        listed_mask = _listed_interval(presence)
+        for i, ticker in enumerate(ids):
+            if ticker in listed:
+                start, end = listed[ticker]
+                listed_mask[:, i] = (sessions >= pd.Timestamp(start)) & (sessions <= pd.Timestamp(end))
+
+    panel = Panel(values, sessions, ids, fields, presence, labels, listed_mask)
+    return panel.fill_gaps(fill)
+
+
+def _split_ratio(entry) -> float:
+    try:
+        previous_ratio, after_ratio = str(entry).split(":")
+        return float(previous_ratio) / float(after_ratio)
+    except (ValueError, ZeroDivisionError):
+        return 1.0
+
+
+def _decode(codes: np.ndarray, categories: np.ndarray) -> np.ndarray:
+    """
+    :return: object array of the labels (None where the code is -1)
+    """
+    return np.append(categories, None)[codes]
+
+
+def _listed_interval(presence: np.ndarray) -> np.ndarray:
+    """
+    :return: boolean (sessions, IDs) array, True from the first to the last session with data of each ID
+    """
+    seen_before = np.logical_or.accumulate(presence, axis=0)
+    seen_after = np.logical_or.accumulate(presence[::-1], axis=0)[::-1]
+    return seen_before & seen_after
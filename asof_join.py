@@ -0,0 +1,164 @@
+import typing
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from alignment import Panel
+
+
+"""
+NOTE:
+Point-in-time (as-of) join of the reported financials onto price data.
+For every (ID, date) the value of a concept is taken from the latest report filed on or before
+that date, so nothing is used before it was public.
+Reports and queries are encoded as composite int64 keys (ID code * span + day), which sorts them
+by ID and then by date, so all queries of all IDs are answered by one np.searchsorted per concept
+instead of a merge_asof per ticker.
+The input is the long format of FundamentalsStore.read (symbol, fiscal_year, fiscal_quarter,
+concept, value, filed_date).
+"""
+
+# =============================================================================
+# As-of Join
+# =============================================================================
+
+
+def asof_join(
+    fundamentals: pd.DataFrame,
+    query_ids: typing.List[str],
+    query_dates: typing.List[datetime],
+    concepts: typing.List[str] = None,
+    id_column: str = "symbol",
+    date_column: str = "filed_date",
+    max_age: int = None,
+) -> pd.DataFrame:
+    """
+    :param fundamentals: reported values in long format (one row per report and concept)
+    :param query_ids: ID of every query row
+    :param query_dates: date of every query row (same length as query_ids)
+    :param concepts: concepts joined (if None all concepts of fundamentals)
+    :param id_column: column of fundamentals matched against query_ids
+    :param date_column: column with the date the report became public
+    :param max_age: values older than this number of days are left as NaN (if None no limit)
+
+    :return: Dataframe with one row per query and one column per concept (NaN before the first filing)
+    """
+    if concepts is None:
+        concepts = list(pd.unique(fundamentals["concept"].dropna()))
+    query_codes, ids = pd.factorize(np.asarray(query_ids, dtype=object))
+    output = _join(fundamentals, pd.Index(ids), query_codes.astype(np.int64), _to_days(query_dates), concepts, id_column, date_column, max_age)
+    return pd.DataFrame(output, columns=concepts)
+
+
+def asof_panel(
+    fundamentals: pd.DataFrame,
+    sessions: pd.DatetimeIndex,
+    ids: typing.List[str],
+    concepts: typing.List[str] = None,
+    id_column: str = "symbol",
+    date_column: str = "filed_date",
+    max_age: int = None,
+) -> Panel:
+    """
+    :param fundamentals: reported values in long format (one row per report and concept)
+    :param sessions: trading sessions of the panel (i.e. the sessions of a price Panel)
+    :param ids: IDs of the panel
+    :param concepts: concepts joined (if None all concepts of fundamentals)
+    :param id_column: column of fundamentals matched against ids
+    :param date_column: column with the date the report became public
+    :param max_age: values older than this number of days are left as NaN (if None no limit)
+
+    :return: Panel of (sessions x IDs x concepts), presence is True where any concept is known
+    """
+    sessions = pd.DatetimeIndex(sessions)
+    ids = list(ids)
+    if concepts is None:
+        concepts = list(pd.unique(fundamentals["concept"].dropna()))
+    query_codes = np.tile(np.arange(len(ids), dtype=np.int64), len(sessions))
+    query_days = np.repeat(_to_days(sessions), len(ids))
+    output = _join(fundamentals, pd.Index(ids), query_codes, query_days, concepts, id_column, date_column, max_age)
+    values = output.reshape(len(sessions), len(ids), len(concepts))
+    presence = ~np.isnan(values).all(axis=2)
+    return Panel(values, sessions, ids, concepts, presence, listed=np.ones_like(presence))
+
+
+def _join(
+    fundamentals: pd.DataFrame,
+    ids: pd.Index,
+    query_codes: np.ndarray,
+    query_days: np.ndarray,
+    concepts: typing.List[str],
+    id_column: str,
+    date_column: str,
+    max_age: int,
+) -> np.ndarray:
+    """
+    :return: float array (queries, concepts) of the values as of every (ID code, day) query
+    """
+    output = np.full((len(query_days), len(concepts)), np.nan)
+    if len(fundamentals) == 0 or len(query_days) == 0:
+        return output
+
+    reports = fundamentals[fundamentals["concept"].isin(concepts) & fundamentals[date_column].notna()]
+    report_codes = ids.get_indexer(reports[id_column])
+    reports = reports[report_codes >= 0]
+    report_codes = report_codes[report_codes >= 0]
+    report_days = _to_days(reports[date_column])
+    report_concepts = pd.Index(concepts).get_indexer(reports["concept"])
+    values = pd.to_numeric(reports["value"], errors="coerce").to_numpy(dtype=np.float64)
+
+    # reports of an ID filed on the same day are ordered by fiscal period, the latest period wins
+    # (rows without fiscal period come first; the sort is stable, so full ties keep the input order
+    # and the last row wins)
+    tiebreak = [np.zeros(len(reports))] * 2
+    if "fiscal_year" in reports and "fiscal_quarter" in reports:
+        tiebreak = [reports[c].astype("float64").fillna(-1).to_numpy() for c in ["fiscal_quarter", "fiscal_year"]]
+
+    base = min(report_days.min(), query_days.min())
+    span = max(report_days.max(), query_days.max()) - base + 1
+    query_keys = query_codes * span + (query_days - base)
+    report_keys = report_codes * span + (report_days - base)
+
+    for k in range(len(concepts)):
+        rows = np.flatnonzero(report_concepts == k)
+        order = np.lexsort((tiebreak[0][rows], tiebreak[1][rows], report_keys[rows]))
+        rows = rows[order]
+        keys = report_keys[rows]
+        # position of the latest report filed on or before every query
+        match = np.searchsorted(keys, query_keys, side="right") - 1
+        found = match >= 0
+        found[found] = report_codes[rows[match[found]]] == query_codes[found]
+        if max_age is not None:
+            found[found] = query_days[found] - report_days[rows[match[found]]] <= max_age
+        output[found, k] = values[rows[match[found]]]
+
+    return output
+
+
+def _to_days(dates) -> np.ndarray:
+    return pd.DatetimeIndex(dates).values.astype("datetime64[D]").astype(np.int64)
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    from dataloader import Data_Loader_CSV
+    from fundamentals_store import FundamentalsStore
+
+    tickers = ["AAPL", "MSFT", "GE"]
+    loader = Data_Loader_CSV("../data/kaggle_us_eod", tickers, [], datetime(2018, 1, 2), datetime(2018, 12, 31))
+    fundamentals = FundamentalsStore("data/fundamentals").read(
+        symbols=tickers, concepts=["us-gaap_EarningsPerShareDiluted", "us-gaap_StockholdersEquity"]
+    )
+
+    # price to last reported earnings per share over the whole universe, as known on every session
+    prices = loader.load_aligned(fill="ffill")
+    reported = asof_panel(fundamentals, prices.sessions, prices.ids)
+    pe = prices.field("close") / reported.field("us-gaap_EarningsPerShareDiluted")
+    print(pe.tail())
+
+    # or as extra columns of compute_features
+    print(loader.compute_features(["volatility_20"], fundamentals=fundamentals)["AAPL"].tail())
@@ -0,0 +1,312 @@
+import typing
+import numpy as np
+import pandas as pd
+
+
+"""
+NOTE:
+Streaming aggregation of trades and quotes into bars (open, high, low, close, volume, vwap, bid, ask).
+Events are pushed in batches of flat arrays (ID code, time in ns, price, volume, bid, ask); a trade has
+a price, a quote has a bid and/or an ask (NaN for the missing values). Every event falls in a bar
+keyed by bucket * n_ids + code. A batch is sorted once by key (and time when it is out of order) and
+reduced with np.*.reduceat into one partial bar per key, which is then combined with the bars still open:
+    open / close   value of the earliest / latest trade
+    high / low     max / min of the trades
+    volume, vwap   sum of the volumes, sum(price * volume) / volume
+    bid / ask      latest quote, carried forward from the previous bars when a bar has no quote
+Bars are closed by a watermark: the latest event time seen minus the allowed lateness. Once a bar
+has been emitted, events falling in it arrive too late; they are dropped and counted in `late`.
+"""
+
+BAR_FIELDS = ["open", "high", "low", "close", "volume", "vwap", "bid", "ask"]
+
+_MIN_TIME = np.iinfo(np.int64).min
+_MAX_TIME = np.iinfo(np.int64).max
+
+# =============================================================================
+# Bar Aggregator
+# =============================================================================
+
+
+class BarAggregator:
+    """
+    Vectorized tick to bar aggregation with watermarks
+    """
+
+    def __init__(self, ids: typing.List[str], interval: str = "1min", lateness: str = "2s"):
+        """
+        :param ids: IDs (i.e. finnhub IDs) of the events, an event refers to its ID by position (code)
+        :param interval: bar size (i.e. "1s", "1min", "5min")
+        :param lateness: how late an event can arrive (event time) before its bar is closed
+        """
+        self.ids = list(ids)
+        self.n_ids = len(self.ids)
+        self.width = pd.Timedelta(interval).value
+        self.lateness = pd.Timedelta(lateness).value
+        if self.width <= 0:
+            raise ValueError(f"interval must be positive, got {interval}")
+        self.watermark = _MIN_TIME
+        self.closed_until = _MIN_TIME  # bars starting before this time have been emitted
+        self.late = 0
+        self._state = _empty()
+        self._last_bid = np.full(self.n_ids, np.nan)
+        self._last_ask = np.full(self.n_ids, np.nan)
+
+    def push(
+        self,
+        codes: np.ndarray,
+        times: np.ndarray,
+        price: np.ndarray = None,
+        volume: np.ndarray = None,
+        bid: np.ndarray = None,
+        ask: np.ndarray = None,
+    ) -> typing.Dict[str, np.ndarray]:
+        """
+        :param codes: position of the ID of every event in ids
+        :param times: event times in ns (int64 or datetime64[ns])
+        :param price: trade prices (NaN for quotes)
+        :param volume: trade volumes
+        :param bid: quote bids (NaN for trades)
+        :param ask: quote asks (NaN for trades)
+
+        :return: bars closed by the new watermark (see emit)
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        times = np.asarray(times).astype(np.int64, copy=False)
+        on_time = times >= self.closed_until
+        if not on_time.all():
+            self.late += int(len(on_time) - on_time.sum())
+            codes, times = codes[on_time], times[on_time]
+            price, volume, bid, ask = [None if a is None else np.asarray(a)[on_time] for a in (price, volume, bid, ask)]
+        if len(times) == 0:
+            return self.advance(self.watermark)
+        keys = (times // self.width) * self.n_ids + codes
+
+        if price is not None:
+            price = np.asarray(price, dtype=np.float64)
+            volume = np.ones(len(price)) if volume is None else np.asarray(volume, dtype=np.float64)
+            trade = ~np.isnan(price)
+            if trade.any():
+                self._combine(_reduce_trades(keys[trade], times[trade], price[trade], volume[trade]))
+        if bid is not None or ask is not None:
+            bid = np.full(len(times), np.nan) if bid is None else np.asarray(bid, dtype=np.float64)
+            ask = np.full(len(times), np.nan) if ask is None else np.asarray(ask, dtype=np.float64)
+            quote = ~(np.isnan(bid) & np.isnan(ask))
+            if quote.any():
+                self._combine(_reduce_quotes(keys[quote], times[quote], bid[quote], ask[quote]))
+
+        return self.advance(max(self.watermark, int(times.max()) - self.lateness))
+
+    def advance(self, watermark: int) -> typing.Dict[str, np.ndarray]:
+        """
+        Moves the watermark forward (i.e. to the wall clock minus the lateness when the feed is idle)
+
+        :param watermark: time in ns, bars ending at or before it are closed
+
+        :return: bars closed (see emit)
+        """
+        self.watermark = max(self.watermark, int(watermark))
+        closed_until = (self.watermark // self.width) * self.width
+        if closed_until <= self.closed_until:
+            return _bars(np.array([], dtype=np.int64), np.array([], dtype=np.int64), _empty())
+        self.closed_until = closed_until
+        return self.emit(closed_until)
+
+    def emit(self, until: int = _MAX_TIME) -> typing.Dict[str, np.ndarray]:
+        """
+        :param until: bars starting before this time (ns) are closed (by default all open bars)
+
+        :return: closed bars, sorted by code and time: code, time (start of the bar, ns) and BAR_FIELDS arrays
+        """
+        state = self._state
+        buckets = state["key"] // self.n_ids
+        closed = buckets < (until // self.width if until != _MAX_TIME else _MAX_TIME)
+        if until == _MAX_TIME and len(buckets):
+            self.closed_until = max(self.closed_until, int(buckets.max() + 1) * self.width)
+        out = {name: column[closed] for name, column in state.items()}
+        self._state = {name: column[~closed] for name, column in state.items()}
+
+        codes, starts = out["key"] % self.n_ids, out["key"] // self.n_ids * self.width
+        order = np.lexsort((starts, codes))
+        codes, starts = codes[order], starts[order]
+        out = {name: column[order] for name, column in out.items()}
+        out["bid"] = _carry_forward(out["bid"], codes, self._last_bid)
+        out["ask"] = _carry_forward(out["ask"], codes, self._last_ask)
+        return _bars(codes, starts, out)
+
+    def to_frames(self, bars: typing.Dict[str, np.ndarray]) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :param bars: bars returned by push, advance or emit
+
+        :return: Dict of Dataframes indexed by datetime, one per ID (same schema as the loaders)
+        """
+        bounds = np.searchsorted(bars["code"], np.arange(self.n_ids + 1))
+        data_dict = {}
+        for code in np.flatnonzero(np.diff(bounds)):
+            lo, hi = bounds[code], bounds[code + 1]
+            df = pd.DataFrame({field: bars[field][lo:hi] for field in BAR_FIELDS})
+            df.index = pd.DatetimeIndex(bars["time"][lo:hi].astype("datetime64[ns]"), name="datetime")
+            data_dict[self.ids[code]] = df
+        return data_dict
+
+    def _combine(self, part: typing.Dict[str, np.ndarray]):
+        """
+        Merges partial bars (unique sorted keys) into the open bars
+        """
+        state = self._state
+        keys = np.union1d(state["key"], part["key"])
+        merged = _empty(len(keys))
+        merged["key"] = keys
+        old = np.searchsorted(keys, state["key"])
+        for name, column in state.items():
+            merged[name][old] = column
+
+        position = np.searchsorted(keys, part["key"])
+        if "open" in part:
+            earlier = part["first_time"] < merged["first_time"][position]
+            merged["first_time"][position[earlier]] = part["first_time"][earlier]
+            merged["open"][position[earlier]] = part["open"][earlier]
+            later = part["last_time"] >= merged["last_time"][position]
+            merged["last_time"][position[later]] = part["last_time"][later]
+            merged["close"][position[later]] = part["close"][later]
+            merged["high"][position] = np.fmax(merged["high"][position], part["high"])
+            merged["low"][position] = np.fmin(merged["low"][position], part["low"])
+            merged["volume"][position] += part["volume"]
+            merged["turnover"][position] += part["turnover"]
+        else:
+            later = part["quote_time"] >= merged["quote_time"][position]
+            merged["quote_time"][position[later]] = part["quote_time"][later]
+            merged["bid"][position[later]] = part["bid"][later]
+            merged["ask"][position[later]] = part["ask"][later]
+        self._state = merged
+
+
+def aggregate(
+    ticks: pd.DataFrame, interval: str = "1min", id_column: str = "symbol"
+) -> typing.Dict[str, pd.DataFrame]:
+    """
+    One-shot aggregation of recorded ticks
+
+    :param ticks: Dataframe with id_column, time (datetime) and price, volume and/or bid, ask columns
+    :param interval: bar size
+    :param id_column: column of the IDs
+
+    :return: Dict of Dataframes with the BAR_FIELDS columns indexed by datetime, one per ID
+    """
+    codes, ids = pd.factorize(ticks[id_column])
+    aggregator = BarAggregator(list(ids), interval, lateness="0s")
+    columns = {name: ticks[name].to_numpy() if name in ticks.columns else None for name in ["price", "volume", "bid", "ask"]}
+    aggregator.push(codes, pd.DatetimeIndex(ticks["time"]).values.astype("datetime64[ns]").astype(np.int64), **columns)
+    return aggregator.to_frames(aggregator.emit())
+
+
+# =============================================================================
+# Helpers
+# =============================================================================
+
+
+def _empty(n: int = 0) -> typing.Dict[str, np.ndarray]:
+    """
+    :return: n open bars with no event
+    """
+    return {
+        "key": np.zeros(n, dtype=np.int64),
+        "first_time": np.full(n, _MAX_TIME, dtype=np.int64),
+        "last_time": np.full(n, _MIN_TIME, dtype=np.int64),
+        "open": np.full(n, np.nan),
+        "close": np.full(n, np.nan),
+        "high": np.full(n, np.nan),
+        "low": np.full(n, np.nan),
+        "volume": np.zeros(n),
+        "turnover": np.zeros(n),
+        "quote_time": np.full(n, _MIN_TIME, dtype=np.int64),
+        "bid": np.full(n, np.nan),
+        "ask": np.full(n, np.nan),
+    }
+
+
+def _runs(keys: np.ndarray, times: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :return: order sorting the events by (key, time), first and last position of every key in that order
+    """
+    if len(times) < 2 or (times[1:] >= times[:-1]).all():
+        order = np.argsort(keys, kind="stable")  # events already in time order
+    else:
+        order = np.lexsort((times, keys))
+    sorted_keys = keys[order]
+    start = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    end = np.append(start[1:], len(keys)) - 1
+    return order, start, end
+
+
+def _reduce_trades(keys: np.ndarray, times: np.ndarray, price: np.ndarray, volume: np.ndarray) -> typing.Dict[str, np.ndarray]:
+    order, start, end = _runs(keys, times)
+    keys, times, price, volume = keys[order], times[order], price[order], volume[order]
+    volume = np.nan_to_num(volume)
+    return {
+        "key": keys[start],
+        "first_time": times[start],
+        "last_time": times[end],
+        "open": price[start],
+        "close": price[end],
+        "high": np.maximum.reduceat(price, start),
+        "low": np.minimum.reduceat(price, start),
+        "volume": np.add.reduceat(volume, start),
+        "turnover": np.add.reduceat(price * volume, start),
+    }
+
+
+def _reduce_quotes(keys: np.ndarray, times: np.ndarray, bid: np.ndarray, ask: np.ndarray) -> typing.Dict[str, np.ndarray]:
+    order, start, end = _runs(keys, times)
+    last = order[end]
+    return {"key": keys[last], "quote_time": times[last], "bid": bid[last], "ask": ask[last]}
+
+
+def _carry_forward(values: np.ndarray, codes: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """
+    :param values: quotes of bars sorted by (code, time), NaN where a bar has no quote
+    :param codes: code of every bar
+    :param last: latest quote of every code before these bars (updated in place)
+
+    :return: quotes carried forward within every code, starting from last
+    """
+    if len(values) == 0:
+        return values
+    valid = ~np.isnan(values)
+    first = np.concatenate(([True], codes[1:] != codes[:-1]))
+    source = np.maximum.accumulate(np.where(valid, np.arange(len(values)), -1))
+    group_start = np.maximum.accumulate(np.where(first, np.arange(len(values)), 0))
+    # a quote of an earlier code does not carry over, the last known quote of the code is used instead
+    output = np.where(source >= group_start, values[np.maximum(source, 0)], last[codes])
+    final = np.append(np.flatnonzero(first[1:]), len(values) - 1)
+    last[codes[final]] = output[final]
+    return output
+
+
+def _bars(codes: np.ndarray, starts: np.ndarray, state: typing.Dict[str, np.ndarray]) -> typing.Dict[str, np.ndarray]:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vwap = state["turnover"] / state["volume"]
+    output = {"code": codes, "time": starts}
+    for field in BAR_FIELDS:
+        output[field] = vwap if field == "vwap" else state[field]
+    return output
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    rng = np.random.default_rng(0)
+    n = 1_000_000
+    ids = [f"ID{i}" for i in range(3000)]
+    times = pd.Timestamp("2021-03-01 14:30").value + np.sort(rng.integers(0, 3600 * 10 ** 9, n))
+    codes = rng.integers(0, len(ids), n)
+
+    aggregator = BarAggregator(ids, "1min", lateness="2s")
+    for lo in range(0, n, 100_000):
+        hi = lo + 100_000
+        bars = aggregator.push(codes[lo:hi], times[lo:hi], 100 + rng.standard_normal(hi - lo), rng.integers(1, 100, hi - lo).astype(float))
+        print(len(bars["code"]), "bars closed up to", pd.Timestamp(aggregator.closed_until))
+    print(aggregator.to_frames(aggregator.emit())["ID0"].tail())
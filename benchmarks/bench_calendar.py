@@ -0,0 +1,33 @@
+import os
+import tempfile
+from datetime import datetime
+
+from user_manual.USCalendar import USTradingCalendar
+
+
+class Calendar:
+    """
+    Session index of USTradingCalendar
+    """
+
+    def setup(self):
+        self.cache_dir = tempfile.mkdtemp()
+        USTradingCalendar(cache_dir=self.cache_dir).sessions  # writes the disk cache
+
+    def teardown(self):
+        for name in os.listdir(self.cache_dir):
+            os.remove(os.path.join(self.cache_dir, name))
+        os.rmdir(self.cache_dir)
+
+    def time_build_sessions(self):
+        USTradingCalendar(cache_dir=None)._build_sessions()
+
+    def time_load_cached_sessions(self):
+        USTradingCalendar._sessions_memo.clear()
+        USTradingCalendar(cache_dir=self.cache_dir).sessions
+
+    def time_sessions_between(self):
+        USTradingCalendar().sessions_between(datetime(2000, 1, 3), datetime(2019, 12, 31))
+
+    def time_resolve_range(self):
+        USTradingCalendar().resolve_range(datetime(2000, 1, 1), datetime(2019, 12, 31))
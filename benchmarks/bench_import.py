@@ -0,0 +1,19 @@
+class Import:
+    """
+    Cold import time of the modules (every sample runs in a new interpreter)
+    """
+
+    timeout = 120
+
+    def timeraw_import_dataloader(self):
+        return "import dataloader"
+
+    def timeraw_import_dataloader_after_pandas(self):
+        # cost of the module itself, numpy and pandas are imported by every user anyway
+        return "import dataloader", "import numpy, pandas"
+
+    def timeraw_import_mongoDB_initialize(self):
+        return "import mongoDB_initialize", "import numpy, pandas"
+
+    def timeraw_import_wrds_loader(self):
+        return "import wrds_loader", "import numpy, pandas"
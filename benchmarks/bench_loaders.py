@@ -0,0 +1,62 @@
+import numpy as np
+from dataloader import Data_Loader_CSV
+from volume_ratio import volume_ratio_calc
+
+from .common import dates, kaggle_dataset, tickers
+
+
+class CSVLoader:
+    """
+    Data_Loader_CSV over the synthetic Kaggle dataset
+    """
+
+    params = [10, 50]
+    param_names = ["tickers"]
+    timeout = 600
+
+    def setup_cache(self):
+        return kaggle_dataset()
+
+    def setup(self, dataset, n):
+        directory, listings = dataset
+        start, end = dates(directory)
+        self.loader = Data_Loader_CSV(directory, tickers(listings, n), [], start, end)
+
+    def time_load_data(self, dataset, n):
+        self.loader.load_data()
+
+    def peakmem_load_data(self, dataset, n):
+        self.loader.load_data()
+
+    def time_load_aligned(self, dataset, n):
+        self.loader.load_aligned()
+
+    def time_compute_features(self, dataset, n):
+        self.loader.compute_features(["volatility_20", "skewness_20", "kurtosis_60"])
+
+    def time_load_panel(self, dataset, n):
+        self.loader.load_panel(dtype=np.float32)
+
+    def peakmem_load_panel(self, dataset, n):
+        self.loader.load_panel(dtype=np.float32)
+
+    def time_compute_panel(self, dataset, n):
+        self.loader.compute_panel(["volatility_20", "skewness_20", "kurtosis_60"])
+
+
+class VolumeRatio:
+    """
+    volume_ratio_calc (loads through Data_Loader_CSV)
+    """
+
+    params = [10]
+    param_names = ["tickers"]
+    timeout = 600
+
+    def setup_cache(self):
+        return kaggle_dataset()
+
+    def time_volume_ratio_calc(self, dataset, n):
+        directory, listings = dataset
+        start, end = dates(directory)
+        volume_ratio_calc(directory, tickers(listings, n), [], start, end)
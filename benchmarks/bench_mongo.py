@@ -0,0 +1,72 @@
+import mongoDB_initialize
+from dataloader import Data_Loader_mongo, Data_Loader_mongo_V2
+
+from .common import dates, kaggle_dataset, mongo_client, tickers
+
+# the Mongo paths insert row by row, so they run on a smaller dataset
+N_SYMBOLS = 50
+
+N_DAYS = 60
+
+
+class MongoIngest:
+    """
+    csv to MongoDB ingestion of mongoDB_initialize
+    """
+
+    number = 1
+    repeat = 3
+    timeout = 600
+
+    def setup_cache(self):
+        return kaggle_dataset("kaggle_eod_mongo", N_SYMBOLS, N_DAYS)
+
+    def setup(self, dataset):
+        # every repeat starts from empty databases
+        client = mongo_client()
+        for name in ["benchmark_ticker", "benchmark_id"]:
+            client.drop_database(name)
+
+    def time_create_database_ticker(self, dataset):
+        mongoDB_initialize.create_database_ticker("benchmark_ticker", dataset[0])
+
+    def time_create_database_id_and_ticker(self, dataset):
+        mongoDB_initialize.create_database_id_and_ticker("benchmark_id", dataset[0])
+
+
+class MongoLoaders:
+    """
+    Data_Loader_mongo (collection per ticker) and Data_Loader_mongo_V2 (collection per finnhub ID)
+    """
+
+    params = [10]
+    param_names = ["tickers"]
+    timeout = 600
+
+    def setup_cache(self):
+        return kaggle_dataset("kaggle_eod_mongo", N_SYMBOLS, N_DAYS)
+
+    def setup(self, dataset, n):
+        directory, listings = dataset
+        client = mongo_client()
+        if "benchmark_ticker_loaded" not in client.list_database_names():
+            for name in ["benchmark_ticker_loaded", "benchmark_id_loaded"]:
+                client.drop_database(name)
+            mongoDB_initialize.create_database_ticker("benchmark_ticker_loaded", directory)
+            mongoDB_initialize.create_database_id_and_ticker("benchmark_id_loaded", directory)
+        start, end = dates(directory)
+        symbols = tickers(listings, n)
+        self.loader = Data_Loader_mongo("benchmark_ticker_loaded", symbols, [], start, end)
+        self.loader_v2 = Data_Loader_mongo_V2("benchmark_id_loaded", symbols, [], start, end)
+
+    def time_load_data(self, dataset, n):
+        self.loader.load_data()
+
+    def time_compute_features(self, dataset, n):
+        self.loader.compute_features(["volatility_20", "skewness_20"])
+
+    def time_load_data_v2(self, dataset, n):
+        self.loader_v2.load_data()
+
+    def time_compute_features_v2(self, dataset, n):
+        self.loader_v2.compute_features(["return_volatility_20", "adjvolume_skewness_20"])
@@ -0,0 +1,71 @@
+import os
+import pandas as pd
+from datetime import datetime
+
+from .synthetic_kaggle import write_kaggle_dataset
+
+
+"""
+NOTE:
+Shared setup of the benchmarks. The size of the synthetic dataset can be changed with the
+BENCHMARK_SYMBOLS and BENCHMARK_DAYS environment variables (results are only comparable for
+the same size). The Mongo benchmarks run against mongomock unless BENCHMARK_MONGO_URI points to
+a mongod (i.e. mongodb://localhost:27017), the benchmark databases are dropped and recreated.
+"""
+
+N_SYMBOLS = int(os.environ.get("BENCHMARK_SYMBOLS", 300))
+
+N_DAYS = int(os.environ.get("BENCHMARK_DAYS", 250))
+
+START = datetime(2016, 1, 4)
+
+_client = None
+
+
+def kaggle_dataset(name: str = "kaggle_eod", n_symbols: int = N_SYMBOLS, n_days: int = N_DAYS):
+    """
+    :return: absolute path of the daily csv folder, listings of the IDs (written in the working directory)
+    """
+    directory = os.path.abspath(name)
+    listings = write_kaggle_dataset(directory, n_symbols, n_days, START)
+    return directory, listings
+
+
+def tickers(listings: pd.DataFrame, n: int):
+    """
+    :return: n symbols, spread over the listings (same symbols for the same dataset)
+    """
+    symbols = listings["symbol"].drop_duplicates().to_numpy()
+    return list(symbols[:: max(1, len(symbols) // n)][:n])
+
+
+def dates(directory: str):
+    """
+    :return: first and last session of the dataset
+    """
+    names = sorted(os.listdir(directory))
+    return datetime.strptime(names[0][:8], "%Y%m%d"), datetime.strptime(names[-1][:8], "%Y%m%d")
+
+
+def mongo_client():
+    """
+    :return: client used by mongoDB_initialize and the Mongo loaders in this process
+    """
+    global _client
+    if _client is None:
+        uri = os.environ.get("BENCHMARK_MONGO_URI")
+        if uri:
+            import pymongo
+
+            _client = pymongo.MongoClient(uri)
+        else:
+            import mongomock
+
+            _client = mongomock.MongoClient()
+
+        import dataloader
+        import mongoDB_initialize
+
+        mongoDB_initialize._client = _client
+        dataloader._mongo_client = lambda: _client
+    return _client
@@ -0,0 +1,140 @@
+import os
+import string
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from user_manual.USCalendar import USTradingCalendar
+
+
+"""
+NOTE:
+Generator of a synthetic daily dataset with the schema of the Kaggle US end of day data, one csv
+per session (<directory>/YYYYMMDD.csv) with the columns
+    finnhub_id, symbol, class, open, high, low, close, volume, div, adjustment, bid, ask
+Prices follow a geometric random walk. Some IDs are listed after the first session or delisted
+before the last one, some pay quarterly dividends, and splits ("a:b", price divided by a / b on the
+split day) happen at random. A few symbols are reused by a second finnhub ID after the first
+listing ended, as in FinnhubID.csv.
+"""
+
+COLUMNS = ["finnhub_id", "symbol", "class", "open", "high", "low", "close", "volume", "div", "adjustment", "bid", "ask"]
+
+SPLITS = [(2, 1), (3, 1), (3, 2), (1, 10)]
+
+# =============================================================================
+# Generator
+# =============================================================================
+
+
+def write_kaggle_dataset(
+    directory: str,
+    n_symbols: int = 200,
+    n_days: int = 250,
+    start: datetime = datetime(2016, 1, 4),
+    seed: int = 0,
+    split_rate: float = 1 / 1000,
+    listing_rate: float = 0.2,
+) -> pd.DataFrame:
+    """
+    :param directory: folder the daily csv files are written to (created if missing)
+    :param n_symbols: number of finnhub IDs
+    :param n_days: number of trading sessions from start
+    :param start: first session (moved forward to the next session)
+    :param seed: random seed (same arguments, same files)
+    :param split_rate: probability of a split per ID and session
+    :param listing_rate: share of IDs listed after the first session (the same share is delisted early)
+
+    :return: Dataframe of the listings (symbol, class, finnhub_id, start, end) like FinnhubID.csv
+    """
+    rng = np.random.default_rng(seed)
+    calendar = USTradingCalendar()
+    sessions = calendar.ordinal_to_date(calendar.date_to_ordinal([start], "next")[0] + np.arange(n_days))
+
+    # listings: (first, last) session of every ID, some symbols reused by a second ID
+    listed_from = np.where(rng.random(n_symbols) < listing_rate, rng.integers(0, n_days // 2, n_symbols), 0)
+    listed_to = np.where(rng.random(n_symbols) < listing_rate, rng.integers(n_days // 2, n_days, n_symbols), n_days - 1)
+    symbols = _symbols(rng, n_symbols)
+    classes = np.where(rng.random(n_symbols) < 0.05, "A", "")
+    pairs = rng.permutation(n_symbols)[: 2 * max(1, n_symbols // 50)].reshape(-1, 2)
+    for old, new in pairs:
+        delisted = rng.integers(n_days // 4, 3 * n_days // 4)
+        listed_from[old], listed_to[old] = min(listed_from[old], delisted), delisted
+        listed_from[new], listed_to[new] = min(delisted + rng.integers(1, 20), n_days - 1), n_days - 1
+        symbols[new], classes[new] = symbols[old], classes[old]
+    finnhub_ids = np.array([f"FH{code:09d}" for code in rng.choice(10 ** 9, n_symbols, replace=False)])
+    days = np.arange(n_days)[:, None]
+    listed = (days >= listed_from) & (days <= listed_to)
+
+    # prices: random walk, splits divide the price on the split day
+    log_returns = rng.normal(0.0003, 0.02, (n_days, n_symbols))
+    split_choice = rng.integers(0, len(SPLITS), (n_days, n_symbols))
+    split = (rng.random((n_days, n_symbols)) < split_rate) & listed & (days > listed_from)
+    ratio = np.array([a / b for a, b in SPLITS])[split_choice]
+    log_returns -= np.where(split, np.log(ratio), 0.0)
+    close = np.exp(np.log(rng.uniform(5, 200, n_symbols)) + np.cumsum(log_returns, axis=0)).round(2).clip(0.01)
+    open_ = (close * np.exp(rng.normal(0, 0.005, close.shape))).round(2)
+    high = (np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, close.shape)))).round(2)
+    low = (np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, close.shape)))).round(2)
+    spread = np.maximum(0.01, (close * rng.uniform(0.0002, 0.002, close.shape)).round(2))
+    volume = (rng.lognormal(12, 1.5, close.shape) * rng.uniform(0.5, 1.5, n_symbols)).astype(np.int64) // 100 * 100
+    payer = rng.random(n_symbols) < 0.4
+    pays = payer & ((days - listed_from) % 63 == 62) & listed
+    div = np.where(pays, (close * 0.005).round(2), np.nan)
+    adjustment = np.array([f"{a}:{b}" for a, b in SPLITS], dtype=object)[split_choice]
+
+    os.makedirs(directory, exist_ok=True)
+    for d, session in enumerate(sessions):
+        rows = np.flatnonzero(listed[d])
+        df = pd.DataFrame(
+            {
+                "finnhub_id": finnhub_ids[rows],
+                "symbol": symbols[rows],
+                "class": classes[rows],
+                "open": open_[d, rows],
+                "high": high[d, rows],
+                "low": low[d, rows],
+                "close": close[d, rows],
+                "volume": volume[d, rows],
+                "div": div[d, rows],
+                "adjustment": np.where(split[d, rows], adjustment[d, rows], None),
+                "bid": (close[d, rows] - spread[d, rows]).round(2),
+                "ask": (close[d, rows] + spread[d, rows]).round(2),
+            },
+            columns=COLUMNS,
+        )
+        df.to_csv(os.path.join(directory, session.strftime("%Y%m%d") + ".csv"), index=False)
+
+    return pd.DataFrame(
+        {
+            "symbol": symbols,
+            "class": classes,
+            "finnhub_id": finnhub_ids,
+            "start": sessions[listed_from].strftime("%Y-%m-%d"),
+            "end": sessions[listed_to].strftime("%Y-%m-%d"),
+        }
+    ).sort_values(["symbol", "start"], ignore_index=True)
+
+
+def _symbols(rng: np.random.Generator, n: int) -> np.ndarray:
+    """
+    :return: n distinct tickers of 1 to 4 capital letters
+    """
+    letters = np.array(list(string.ascii_uppercase))
+    symbols = set()
+    while len(symbols) < n:
+        length = rng.integers(1, 5)
+        symbols.add("".join(rng.choice(letters, length)))
+    return rng.permutation(sorted(symbols)).astype(object)
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    # python -m benchmarks.synthetic_kaggle (from the repository root)
+    listings = write_kaggle_dataset("data/synthetic_kaggle", n_symbols=500, n_days=500)
+    listings.to_csv("data/synthetic_FinnhubID.csv", index=False)
+    print(listings.head())
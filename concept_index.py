@@ -0,0 +1,267 @@
+import typing
+import numpy as np
+import pandas as pd
+
+from fundamentals_store import FundamentalsStore, STATEMENTS
+
+
+"""
+NOTE:
+Inverted index from reported concepts to the (symbol, period) pairs that reported them, by statement.
+A (symbol, period) pair is encoded as one int64 key: symbol code << 16 | year * 4 + quarter - 1.
+Symbol codes are only ever appended, so keys stay valid when new quarters are added.
+The keys of every (statement, concept) entry are kept sorted and unique in one concatenated array
+(CSR layout: entry i owns keys[offsets[i]:offsets[i + 1]]), i.e. a sparse bitmap over the pairs.
+Intersections and unions are then merges of sorted arrays (np.intersect1d / np.union1d), and the
+whole index is saved as a single .npz file.
+"""
+
+PERIOD_BITS = 16
+
+# =============================================================================
+# Concept Index
+# =============================================================================
+
+
+class ConceptIndex:
+    """
+    Concept -> (symbol, period) index of the reported financials
+    """
+
+    def __init__(
+        self,
+        symbols: typing.List[str],
+        entries: typing.List[typing.Tuple[str, str]],
+        offsets: np.ndarray,
+        keys: np.ndarray,
+        periods: np.ndarray = None,
+    ):
+        """
+        :param symbols: symbols the codes of the keys refer to
+        :param entries: sorted (statement, concept) pairs
+        :param offsets: int64 array of len(entries) + 1 boundaries into keys
+        :param keys: int64 sorted keys of every entry, concatenated
+        :param periods: sorted period ordinals (year * 4 + quarter - 1) in the index
+        """
+        self.symbols = list(symbols)
+        self.entries = [tuple(entry) for entry in entries]
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.periods = np.array([] if periods is None else periods, dtype=np.int64)
+        self._symbol_code = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._build_lookups()
+
+    @classmethod
+    def from_store(cls, store: FundamentalsStore, years: typing.List[int] = None) -> "ConceptIndex":
+        """
+        :param store: FundamentalsStore with the ingested reports
+        :param years: partition years indexed (if None index all)
+
+        :return: index over the partitions of the store
+        """
+        return cls([], [], np.zeros(1, dtype=np.int64), np.array([], dtype=np.int64)).update(store, years)
+
+    @classmethod
+    def load(cls, path: str) -> "ConceptIndex":
+        """
+        :param path: file written with save
+
+        :return: index read from disk
+        """
+        with np.load(path, allow_pickle=True) as data:
+            entries = list(zip(data["statements"].tolist(), data["concepts"].tolist()))
+            return cls(data["symbols"].tolist(), entries, data["offsets"], data["keys"], data["periods"])
+
+    def save(self, path: str):
+        """
+        :param path: .npz file the index is written to
+        """
+        np.savez_compressed(
+            path,
+            symbols=np.asarray(self.symbols, dtype=object),
+            statements=np.asarray([statement for statement, _ in self.entries], dtype=object),
+            concepts=np.asarray([concept for _, concept in self.entries], dtype=object),
+            offsets=self.offsets,
+            keys=self.keys,
+            periods=self.periods,
+        )
+
+    def update(
+        self, store: FundamentalsStore, years: typing.List[int] = None, quarters: typing.List[int] = None
+    ) -> "ConceptIndex":
+        """
+        Add (or re-index) the partitions of the store, the other periods are kept as they are
+
+        :param store: FundamentalsStore with the ingested reports
+        :param years: partition years to index (if None all)
+        :param quarters: partition quarters to index (if None all)
+
+        :return: self
+        """
+        df = store.read(years, quarters, columns=["symbol", "statement", "concept"])
+        df = df.dropna(subset=["symbol", "statement", "concept"])
+        new_periods = np.array(
+            [_period(year, quarter) for year, quarter in store.partitions()
+             if (years is None or year in years) and (quarters is None or quarter in quarters)],
+            dtype=np.int64,
+        )
+
+        for symbol in pd.unique(df["symbol"]):
+            if symbol not in self._symbol_code:
+                self._symbol_code[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+        symbol_codes = df["symbol"].map(self._symbol_code).to_numpy(dtype=np.int64)
+        new_keys = (symbol_codes << PERIOD_BITS) | (df["year"].to_numpy(dtype=np.int64) * 4 + df["quarter"].to_numpy(dtype=np.int64) - 1)
+
+        # existing (entry, key) pairs, without the periods being re-indexed
+        old_entry = np.repeat(np.arange(len(self.entries)), np.diff(self.offsets))
+        keep = ~np.isin(self.keys & ((1 << PERIOD_BITS) - 1), new_periods)
+        old_pairs = [(statement, concept) for statement, concept in self.entries]
+
+        new_pairs = pd.MultiIndex.from_arrays([df["statement"], df["concept"]])
+        entries = sorted(set(old_pairs) | set(new_pairs))
+        entry_code = {entry: i for i, entry in enumerate(entries)}
+        remap = np.array([entry_code[entry] for entry in old_pairs], dtype=np.int64)
+        new_entry = new_pairs.map(entry_code).to_numpy(dtype=np.int64) if len(df) else np.array([], dtype=np.int64)
+
+        entry_of_key = np.concatenate((remap[old_entry[keep]], new_entry))
+        keys = np.concatenate((self.keys[keep], new_keys))
+        order = np.lexsort((keys, entry_of_key))
+        entry_of_key, keys = entry_of_key[order], keys[order]
+        unique = np.ones(len(keys), dtype=bool)
+        unique[1:] = (keys[1:] != keys[:-1]) | (entry_of_key[1:] != entry_of_key[:-1])
+        entry_of_key, keys = entry_of_key[unique], keys[unique]
+
+        counts = np.bincount(entry_of_key, minlength=len(entries))
+        # entries left without keys (all their periods re-indexed away) are dropped
+        used = counts > 0
+        entries = [entry for entry, u in zip(entries, used) if u]
+        offsets = np.concatenate(([0], np.cumsum(counts[used]))).astype(np.int64)
+        self.entries = entries
+        self.offsets = offsets
+        self.keys = keys
+        self.periods = np.union1d(self.periods, new_periods)
+        self._build_lookups()
+        return self
+
+    def lookup(self, concept: str, statement: str = None) -> np.ndarray:
+        """
+        :param concept: reported concept (i.e. "us-gaap_Revenues")
+        :param statement: "bs", "cf" or "ic" (if None the union over all statements)
+
+        :return: sorted keys of the (symbol, period) pairs that reported the concept
+        """
+        if statement is not None:
+            i = self._entry_code.get((statement, concept))
+            return np.array([], dtype=np.int64) if i is None else self.keys[self.offsets[i] : self.offsets[i + 1]]
+        blocks = [self.keys[self.offsets[i] : self.offsets[i + 1]] for i in self._by_concept.get(concept, [])]
+        if len(blocks) == 1:
+            return blocks[0]
+        return np.unique(np.concatenate(blocks + [np.array([], dtype=np.int64)]))
+
+    def intersect(self, concepts: typing.List[str], statement: str = None) -> np.ndarray:
+        """
+        :param concepts: concepts that must all be reported
+        :param statement: "bs", "cf" or "ic" (if None any statement)
+
+        :return: sorted keys of the (symbol, period) pairs that reported every concept
+        """
+        blocks = sorted((self.lookup(concept, statement) for concept in concepts), key=len)
+        output = blocks[0] if blocks else np.array([], dtype=np.int64)
+        for block in blocks[1:]:
+            output = np.intersect1d(output, block, assume_unique=True)
+        return output
+
+    def union(self, concepts: typing.List[str], statement: str = None) -> np.ndarray:
+        """
+        :param concepts: concepts of which at least one must be reported
+        :param statement: "bs", "cf" or "ic" (if None any statement)
+
+        :return: sorted keys of the (symbol, period) pairs that reported any of the concepts
+        """
+        return np.unique(np.concatenate([self.lookup(concept, statement) for concept in concepts] + [np.array([], dtype=np.int64)]))
+
+    def covering(
+        self,
+        concepts: typing.List[str],
+        start: typing.Tuple[int, int],
+        end: typing.Tuple[int, int],
+        statement: str = None,
+    ) -> typing.List[str]:
+        """
+        :param concepts: concepts that must all be reported
+        :param start: first (year, quarter)
+        :param end: last (year, quarter), inclusive
+        :param statement: "bs", "cf" or "ic" (if None any statement)
+
+        :return: symbols that reported every concept in every quarter from start to end
+        """
+        first, last = _period(*start), _period(*end)
+        keys = self.keys_between(self.intersect(concepts, statement), start, end)
+        counts = np.bincount(keys >> PERIOD_BITS, minlength=len(self.symbols))
+        return [self.symbols[i] for i in np.flatnonzero(counts == last - first + 1)]
+
+    def keys_between(self, keys: np.ndarray, start: typing.Tuple[int, int], end: typing.Tuple[int, int]) -> np.ndarray:
+        """
+        :return: keys whose period is from start to end (inclusive)
+        """
+        period = keys & ((1 << PERIOD_BITS) - 1)
+        return keys[(period >= _period(*start)) & (period <= _period(*end))]
+
+    def to_frame(self, keys: np.ndarray) -> pd.DataFrame:
+        """
+        :param keys: keys returned by lookup, intersect or union
+
+        :return: Dataframe with the symbol, year and quarter of every key
+        """
+        period = keys & ((1 << PERIOD_BITS) - 1)
+        return pd.DataFrame(
+            {
+                "symbol": np.asarray(self.symbols, dtype=object)[keys >> PERIOD_BITS] if len(self.symbols) else [],
+                "year": period // 4,
+                "quarter": period % 4 + 1,
+            }
+        )
+
+    def summary(self, year: int, quarter: int) -> typing.Dict[str, typing.Dict[str, typing.Set[str]]]:
+        """
+        Same output as RepSum in "Summary of Financial Reports.py", without reading the reports
+
+        :return: symbol -> statement -> set of concepts
+        """
+        period = _period(year, quarter)
+        entry_of_key = np.repeat(np.arange(len(self.entries)), np.diff(self.offsets))
+        selected = (self.keys & ((1 << PERIOD_BITS) - 1)) == period
+        summary = {}
+        for code, entry in zip((self.keys[selected] >> PERIOD_BITS).tolist(), entry_of_key[selected].tolist()):
+            statement, concept = self.entries[entry]
+            summary.setdefault(self.symbols[code], {s: set() for s in STATEMENTS})[statement].add(concept)
+        return summary
+
+    def _build_lookups(self):
+        self._entry_code = {entry: i for i, entry in enumerate(self.entries)}
+        self._by_concept = {}
+        for i, (_, concept) in enumerate(self.entries):
+            self._by_concept.setdefault(concept, []).append(i)
+
+
+def _period(year: int, quarter: int) -> int:
+    return year * 4 + quarter - 1
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    store = FundamentalsStore("data/fundamentals")
+    index = ConceptIndex.from_store(store)
+    index.save("data/concept_index.npz")
+
+    # symbols that reported revenues in every quarter from 2012 to 2018
+    print(index.covering(["us-gaap_Revenues"], (2012, 1), (2018, 4), statement="ic"))
+
+    # after new quarters are ingested, only those are indexed again
+    store.ingest("D:/ReportedFinancials", 2020, 2020)
+    index.update(store, years=[2020]).save("data/concept_index.npz")
@@ -0,0 +1,460 @@
+import os
+import typing
+import numpy as np
+import pandas as pd
+import dask
+import dask.dataframe as dd
+from datetime import datetime
+
+import dataloader
+from dataloader import Data_Loader
+from alignment import Panel, align_to_sessions
+from instrumentation import span, count
+
+
+"""
+NOTE:
+Out-of-core loader for universe-wide loads that do not fit in memory (needs pip install "dask[dataframe]",
+and "distributed" for local_cluster).
+load_data returns one lazy long Dataframe (datetime index, symbol column) split into partitions of
+`partition_sessions` consecutive trading sessions, read from
+    "csv"       the daily csv files of the Kaggle dataset (one partition reads its own files)
+    "mongo"     a database with one collection per ticker (create_database_ticker), one range query
+                per ticker and partition
+    "parquet"   a columnar store written by Data_Loader_Dask.load_data().to_parquet(path)
+                (partitions must be sorted by date with known divisions)
+compute_features runs partition by partition with the same definitions as Data_Loader_CSV:
+    - the cumulative split ratio and the cumulative adjusted dividend of every ticker only depend on
+      earlier rows, each partition computes them locally and the per-ticker totals of the partitions
+      before it (a prefix scan over small per-ticker summaries) are applied as carries
+    - returns and rolling features need the previous rows of the ticker, each partition is extended
+      with a halo holding the last max(lookback) adjusted closes of every ticker before it (also
+      carried by the scan, so a halo can span several partitions)
+Only the scan is sequential and it handles at most max(lookback) rows per ticker, reading and
+computing the partitions runs in parallel. The memory used by a worker is bounded by the partition
+size (partition_sessions x universe) plus the halo, use local_cluster to run on local processes
+with a fixed memory limit per worker.
+"""
+
+# Columns read as text, every other column is read as float64
+STRING_COLUMNS = ["symbol", "finnhub_id", "class", "adjustment"]
+
+# Columns needed by compute_features
+PRICE_COLUMNS = ["symbol", "close", "div", "adjustment", "bid", "ask"]
+
+# =============================================================================
+# Dask Data Loader
+# =============================================================================
+
+
+class Data_Loader_Dask(Data_Loader):
+    """
+    Data Loader returning lazy date-partitioned Dask Dataframes
+    """
+
+    def __init__(
+        self,
+        datasource: str,
+        tickers: typing.List[str],
+        features: typing.List[str],
+        start: datetime,
+        end: datetime,
+        source: str = "csv",
+        partition_sessions: int = 20,
+    ):
+        """
+        :param datasource: folder of the daily csv files, name of the mongoDB database or path of the parquet store
+        :param tickers: symbols/tickers of the stocks you want to load (if empty the whole universe)
+        :param features: features you want to extract (if empty all columns)
+        :param start: start date
+        :param end: end date ( result includes ending date)
+        :param source: "csv", "mongo" or "parquet"
+        :param partition_sessions: number of trading sessions per partition (csv and mongo)
+        """
+        super().__init__(datasource, tickers, features, start, end)
+        if source not in ("csv", "mongo", "parquet"):
+            raise ValueError(f"unknown source {source}, use 'csv', 'mongo' or 'parquet'")
+        if partition_sessions < 1:
+            raise ValueError("partition_sessions must be at least 1")
+        self.source = source
+        self.partition_sessions = partition_sessions
+
+        sessions = self.calendar.sessions_between(self.start, self.end)
+        if source == "csv":
+            with span("csv.listdir"):
+                file_names = set(os.listdir(datasource))
+            dated = [(session, f"{session:%Y%m%d}.csv") for session in sessions]
+            # sessions without a file are skipped (reported as gaps by load_aligned)
+            self._sessions = [(session, os.path.join(datasource, name)) for session, name in dated if name in file_names]
+            if len(self._sessions) == 0:
+                raise Exception(
+                    f"DateNoInvalidException: no file between {self.start.date()} and {self.end.date()} in the dataset"
+                )
+        else:
+            self._sessions = [(session, None) for session in sessions]
+        self._features_list = self.return_features()
+
+    def load_data(self, columns: typing.List[str] = None) -> dd.DataFrame:
+        """
+        :param columns: columns to read (if None the features of the loader)
+
+        :return: lazy Dataframe indexed by datetime with a symbol column, rows sorted by (datetime, symbol)
+            and partitioned by dates (known divisions)
+        :raise FeaturesMismatchException if feature does not exist in dataset
+        """
+        if columns is None:
+            columns = self.features if len(self.features) > 0 else self._features_list
+        if not set(columns).issubset(self._features_list):
+            raise Exception("FeaturesMismatchException: Some input features not present in dataset")
+        columns = ["symbol"] + [c for c in self._features_list if c in columns and c != "symbol"]
+        tickers = sorted(self.tickers)
+
+        if self.source == "parquet":
+            ddf = dd.read_parquet(self.datasource, columns=columns[1:] + ["symbol"], calculate_divisions=True)
+            if not ddf.known_divisions:
+                raise Exception("UnsortedStoreException: the parquet store has no date divisions")
+            ddf = ddf.loc[pd.Timestamp(self.start) : pd.Timestamp(self.end)][columns]
+            return ddf[ddf["symbol"].isin(tickers)] if len(tickers) > 0 else ddf
+
+        step = self.partition_sessions
+        chunks = [self._sessions[i : i + step] for i in range(0, len(self._sessions), step)]
+        if self.source == "csv":
+            parts = [dask.delayed(_read_csv_partition)([path for _, path in chunk], [s for s, _ in chunk], tickers, columns) for chunk in chunks]
+        else:
+            parts = [
+                dask.delayed(_read_mongo_partition)(self.datasource, tickers, columns, chunk[0][0], chunk[-1][0])
+                for chunk in chunks
+            ]
+        divisions = [chunk[0][0] for chunk in chunks] + [chunks[-1][-1][0]]
+        return dd.from_delayed(parts, meta=_empty_frame(columns), divisions=divisions)
+
+    def load_aligned(self, fill: str = "mask") -> Panel:
+        """
+        Computes the load in memory and aligns it on the trading sessions between start and end
+        (only for selections that fit in memory)
+
+        :param fill: "mask" leaves missing sessions as NaN, "ffill" forward-fills them
+
+        :return: Panel with the presence matrix and the gaps of every ticker
+        """
+        df = self.load_data().compute()
+        data_dict = {ticker: frame for ticker, frame in df.groupby("symbol", sort=True)}
+        sessions = self.calendar.sessions_between(self.start, self.end)
+        with span("align", loader="Data_Loader_Dask"):
+            return align_to_sessions(data_dict, sessions, fill=fill)
+
+    def return_features(self) -> typing.List[str]:
+        """
+        :return: List of features found in dataset (column names)
+        """
+        if self.source == "csv":
+            with open(self._sessions[0][1]) as file:
+                return file.readline().strip().split(",")
+        if self.source == "mongo":
+            db = _mongo_database(self.datasource)
+            names = db.list_collection_names()
+            if len(names) == 0:
+                raise dataloader.EmptyDatabase(f"{self.datasource} is an empty database")
+            features = list(db[names[0]].find_one())
+            return [f for f in features if f not in ("_id", "datetime")]
+        return ["symbol"] + [c for c in dd.read_parquet(self.datasource).columns if c != "symbol"]
+
+    def compute_features(self, features: typing.List[str]) -> dd.DataFrame:
+        """
+        :param features: rolling features to compute (i.e. "volatility_20"), same definitions as Data_Loader_CSV
+
+        :return: lazy Dataframe indexed by datetime (symbol, return, tcost, adjust_close and the features),
+            same partitions as load_data
+        """
+        windows = []
+        for f in features:
+            function, lookback = f.split("_")
+            if function not in ROLLING_FUNCTIONS:
+                raise ValueError(f"unknown rolling feature {f}, use one of {list(ROLLING_FUNCTIONS)}")
+            windows.append((f, function, int(lookback)))
+        halo = max([lookback for _, _, lookback in windows] + [1])
+
+        raw = self.load_data(PRICE_COLUMNS)
+        if hasattr(raw, "optimize"):
+            raw = raw.optimize()  # dask-expr may fuse partitions, the divisions must match to_delayed
+        local = [dask.delayed(_local_adjustments, nout=3)(part, halo) for part in raw.to_delayed()]
+
+        # prefix scan of the per-ticker carries (small), then every partition runs on its own
+        carry = dask.delayed(_first_carry)()
+        outputs = []
+        for frame, summary, tail in local:
+            outputs.append(dask.delayed(_partition_features)(frame, carry, windows))
+            carry = dask.delayed(_next_carry)(carry, summary, tail, halo)
+
+        columns = ["symbol", "return", "tcost", "adjust_close"] + [f for f, _, _ in windows]
+        meta = _empty_frame(columns)
+        return dd.from_delayed(outputs, meta=meta, divisions=raw.divisions)
+
+
+# =============================================================================
+# Partition readers
+# =============================================================================
+
+
+def _empty_frame(columns: typing.List[str]) -> pd.DataFrame:
+    """
+    :return: empty partition with the dtypes of the loader (text columns as object, others float64)
+    """
+    return pd.DataFrame(
+        {c: pd.Series(dtype=object if c in STRING_COLUMNS else np.float64) for c in columns},
+        index=pd.DatetimeIndex([], name="datetime", dtype="datetime64[ns]"),
+    )
+
+
+def _as_partition(frames: typing.List[pd.DataFrame], columns: typing.List[str]) -> pd.DataFrame:
+    """
+    :return: frames stacked, sorted by (datetime, symbol) and cast to the dtypes of _empty_frame
+    """
+    if len(frames) == 0:
+        return _empty_frame(columns)
+    df = pd.concat(frames, ignore_index=True).sort_values(["datetime", "symbol"], kind="stable")
+    df = df.set_index(pd.DatetimeIndex(df.pop("datetime"), name="datetime").astype("datetime64[ns]"))
+    for c in columns:
+        if c not in STRING_COLUMNS:
+            df[c] = pd.to_numeric(df[c].replace("", np.nan), errors="coerce").astype(np.float64)
+        else:
+            text = df[c].astype(object)
+            df[c] = text.where(text.notna() & (text != ""), None)
+    return df[columns]
+
+
+def _read_csv_partition(
+    paths: typing.List[str], sessions: typing.List[pd.Timestamp], tickers: typing.List[str], columns: typing.List[str]
+) -> pd.DataFrame:
+    """
+    :return: rows of the tickers (all if empty) in the daily files of one partition
+    """
+    dtypes = {c: object for c in columns if c in STRING_COLUMNS}
+    frames = []
+    for path, session in zip(paths, sessions):
+        with span("csv.read_csv", loader="Data_Loader_Dask"):
+            df = pd.read_csv(path, usecols=columns, dtype=dtypes)
+        count("bytes_read", os.path.getsize(path), source="csv")
+        if len(tickers) > 0:
+            df = df[df["symbol"].isin(tickers)]
+        df["datetime"] = session
+        frames.append(df)
+    df = _as_partition(frames, columns)
+    count("rows_read", len(df), source="csv")
+    return df
+
+
+_client = None
+
+
+def _mongo_database(name: str):
+    """
+    :return: database of the client of this process (workers open their own client on first use)
+    """
+    global _client
+    if _client is None:
+        _client = dataloader._mongo_client()
+    return _client[name]
+
+
+def _read_mongo_partition(
+    database: str, tickers: typing.List[str], columns: typing.List[str], start: pd.Timestamp, end: pd.Timestamp
+) -> pd.DataFrame:
+    """
+    :return: rows of the tickers (all collections if empty) between start and end (included)
+    """
+    db = _mongo_database(database)
+    if len(tickers) == 0:
+        tickers = sorted(name for name in db.list_collection_names() if name != "ticker_id_meta_data")
+    projection = {c: 1 for c in columns + ["datetime"]}
+    projection["_id"] = 0
+    query = {"datetime": {"$gte": start.to_pydatetime(), "$lte": end.to_pydatetime()}}
+    frames = []
+    for ticker in tickers:
+        with span("mongo.find", loader="Data_Loader_Dask"):
+            rows = list(db[ticker].find(query, projection))
+        count("queries_issued", source="mongo")
+        if len(rows) > 0:
+            frames.append(pd.DataFrame(rows).reindex(columns=columns + ["datetime"]))
+    df = _as_partition(frames, columns)
+    count("rows_read", len(df), source="mongo")
+    return df
+
+
+# =============================================================================
+# Partition-wise features
+# =============================================================================
+
+
+def _split_ratio(adjustment: pd.Series) -> np.ndarray:
+    """
+    :return: before / after ratio of the "a:b" splits (1.0 where there is no split)
+    """
+    ratio = np.ones(len(adjustment))
+    has_split = adjustment.notna().to_numpy()
+    if has_split.any():
+        parts = adjustment[has_split].astype(str).str.split(":", expand=True).astype(np.float64)
+        ratio[has_split] = (parts[0] / parts[1]).to_numpy()
+    return ratio
+
+
+def _local_adjustments(part: pd.DataFrame, halo: int) -> typing.Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    :param part: partition of load_data (PRICE_COLUMNS)
+    :param halo: number of rows kept per ticker for the next partitions
+
+    :return: partition with the cumulative split ratio and adjusted dividend since its first row (local_cum,
+        local_div), their per-ticker totals (summary), and the last halo rows of every ticker (tail)
+    """
+    df = part.sort_index(kind="stable")
+    symbol = df["symbol"].to_numpy()
+    local_cum = pd.Series(_split_ratio(df["adjustment"]), index=df.index).groupby(symbol, sort=False).cumprod()
+    dividend = (df["div"].fillna(0.0) * local_cum).groupby(symbol, sort=False).cumsum()
+    frame = pd.DataFrame(
+        {
+            "symbol": symbol,
+            "close": df["close"].to_numpy(),
+            "tcost": ((df["ask"] - df["bid"]) / (df["ask"] + df["bid"])).to_numpy(),
+            "local_cum": local_cum.to_numpy(),
+            "local_div": dividend.to_numpy(),
+        },
+        index=df.index,
+    )
+    summary = frame.groupby("symbol", sort=False)[["local_cum", "local_div"]].last()
+    tail = frame.groupby("symbol", sort=False).tail(halo)[["symbol", "close", "local_cum", "local_div"]]
+    return frame, summary, tail
+
+
+def _first_carry() -> typing.Tuple[pd.Series, pd.Series, pd.DataFrame]:
+    """
+    :return: carries of the first partition (no adjustment, empty halo)
+    """
+    halo = pd.DataFrame(
+        {"symbol": pd.Series(dtype=object), "adjust_close": pd.Series(dtype=np.float64)},
+        index=pd.DatetimeIndex([], name="datetime", dtype="datetime64[ns]"),
+    )
+    return pd.Series(dtype=np.float64), pd.Series(dtype=np.float64), halo
+
+
+def _adjust(frame: pd.DataFrame, ratio: pd.Series, dividend: pd.Series) -> np.ndarray:
+    """
+    :return: adjusted close of the rows of frame given the carries of the partitions before
+    """
+    carried_ratio = ratio.reindex(frame["symbol"]).fillna(1.0).to_numpy()
+    carried_div = dividend.reindex(frame["symbol"]).fillna(0.0).to_numpy()
+    return frame["close"].to_numpy() * carried_ratio * frame["local_cum"].to_numpy() + (
+        carried_div + carried_ratio * frame["local_div"].to_numpy()
+    )
+
+
+def _next_carry(
+    carry: typing.Tuple[pd.Series, pd.Series, pd.DataFrame], summary: pd.DataFrame, tail: pd.DataFrame, halo: int
+) -> typing.Tuple[pd.Series, pd.Series, pd.DataFrame]:
+    """
+    :return: carries of the next partition (cumulative split ratio, cumulative adjusted dividend and
+        last halo adjusted closes of every ticker)
+    """
+    ratio, dividend, previous_halo = carry
+    adjusted = pd.DataFrame({"symbol": tail["symbol"].to_numpy(), "adjust_close": _adjust(tail, ratio, dividend)}, index=tail.index)
+    next_halo = pd.concat([previous_halo, adjusted]).groupby("symbol", sort=False).tail(halo)
+
+    symbols = ratio.index.union(summary.index)
+    previous_ratio = ratio.reindex(symbols).fillna(1.0)
+    next_ratio = previous_ratio * summary["local_cum"].reindex(symbols).fillna(1.0)
+    next_dividend = dividend.reindex(symbols).fillna(0.0) + previous_ratio * summary["local_div"].reindex(symbols).fillna(0.0)
+    return next_ratio, next_dividend, next_halo
+
+
+def _partition_features(
+    frame: pd.DataFrame, carry: typing.Tuple[pd.Series, pd.Series, pd.DataFrame], windows: typing.List[typing.Tuple[str, str, int]]
+) -> pd.DataFrame:
+    """
+    :return: returns, transaction cost, adjusted close and rolling features of the rows of one partition
+    """
+    ratio, dividend, halo = carry
+    current = pd.DataFrame(
+        {"symbol": frame["symbol"].to_numpy(), "adjust_close": _adjust(frame, ratio, dividend), "tcost": frame["tcost"].to_numpy()},
+        index=frame.index,
+    )
+    extended = pd.concat([halo.assign(tcost=np.nan), current])
+    index = extended.index
+    extended = extended.reset_index(drop=True)
+    group = np.log(extended["adjust_close"]).groupby(extended["symbol"], sort=False)
+    extended["return"] = group.diff()
+
+    by_symbol = extended.groupby("symbol", sort=False)["return"]
+    for name, function, lookback in windows:
+        extended[name] = ROLLING_FUNCTIONS[function](by_symbol, lookback)
+
+    output = extended.iloc[len(halo) :]
+    output.index = index[len(halo) :]
+    return output[["symbol", "return", "tcost", "adjust_close"] + [name for name, _, _ in windows]]
+
+
+def _rolling(by_symbol, lookback: int, statistic: str) -> pd.Series:
+    """
+    :return: rolling statistic over the previous lookback rows of each ticker, aligned on the rows
+    """
+    rolling = by_symbol.rolling(lookback, min_periods=lookback)
+    if statistic == "std":
+        result = rolling.std(ddof=0)
+    else:
+        result = getattr(rolling, statistic)()
+    return result.reset_index(level=0, drop=True).sort_index()
+
+
+def _biased_skew(by_symbol, n: int) -> pd.Series:
+    # pandas returns the adjusted Fisher-Pearson skewness, scipy.stats.skew (Data_Loader_CSV) the biased one
+    return _rolling(by_symbol, n, "skew") * (n - 2) / np.sqrt(n * (n - 1))
+
+
+def _biased_kurtosis(by_symbol, n: int) -> pd.Series:
+    # pandas returns the adjusted excess kurtosis, scipy.stats.kurtosis (Data_Loader_CSV) the biased one
+    return (_rolling(by_symbol, n, "kurt") * (n - 2) * (n - 3) / (n - 1) - 6) / (n + 1)
+
+
+ROLLING_FUNCTIONS = {
+    "return": lambda by_symbol, n: _rolling(by_symbol, n, "sum"),
+    "volatility": lambda by_symbol, n: _rolling(by_symbol, n, "std"),
+    "skewness": _biased_skew,
+    "kurtosis": _biased_kurtosis,
+}
+
+# =============================================================================
+# Local cluster
+# =============================================================================
+
+
+def local_cluster(n_workers: int = None, memory_limit: str = "4GB", threads_per_worker: int = 1):
+    """
+    :param n_workers: number of worker processes (if None one per core)
+    :param memory_limit: memory limit of each worker (workers spill to disk, then pause, above it)
+    :param threads_per_worker: threads of each worker
+
+    :return: dask.distributed Client of a LocalCluster of processes (becomes the default scheduler,
+        close it when done)
+    """
+    from dask.distributed import Client, LocalCluster
+
+    cluster = LocalCluster(
+        n_workers=n_workers, threads_per_worker=threads_per_worker, memory_limit=memory_limit, processes=True
+    )
+    return Client(cluster)
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    client = local_cluster(n_workers=4, memory_limit="8GB")
+
+    # whole universe, 20 years: nothing is read until compute / to_parquet
+    loader = Data_Loader_Dask("data/kaggle", [], [], datetime(2000, 1, 3), datetime(2019, 12, 31), partition_sessions=60)
+    loader.load_data().to_parquet("data/kaggle_parquet")
+
+    loader = Data_Loader_Dask("data/kaggle_parquet", [], [], datetime(2000, 1, 3), datetime(2019, 12, 31), source="parquet")
+    features = loader.compute_features(["volatility_20", "skewness_60", "kurtosis_60"])
+    features.to_parquet("data/kaggle_features")
+    client.close()
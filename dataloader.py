@@ -1,630 +1,1111 @@
-import os
-import csv
-import pymongo
-import pandas as pd
-import numpy as np
-import scipy.stats
-
-import typing
-from pymongo import MongoClient
-from abc import ABC, abstractmethod
-from datetime import datetime
-
-# =============================================================================
-# Data Loader Abstract Class
-# =============================================================================
-
-
-class Data_Loader(ABC):
-    """
-    Abstract Class for data loading
-    """
-
-    def __init__(
-        self,
-        datasource: str,
-        tickers: typing.List[str],
-        features: typing.List[str],
-        start: datetime,
-        end: datetime,
-    ):
-        """
-        :param datasource: where is the dataset located
-        :param tickers: symbols/tickers of the stocks you want to load
-        :param features: features you want to extract
-        :param start: start date
-        :param end: end date (includes ending date)
-        """
-
-        if end < start:
-            raise TimeInvalid("The end date cannot be before the start date")
-
-        self.datasource = datasource
-        self.tickers = list(set(tickers))
-        self.features = list(set(features))
-        self.start = start
-        self.end = end
-        super().__init__()
-
-    @abstractmethod
-    def load_data(self) -> typing.Dict[str, pd.DataFrame]:
-        """
-        :return: List of Dataframes (each df represents the time series for a particular stock)
-        """
-        pass
-
-
-# =============================================================================
-# CSV Data Loader
-# =============================================================================
-
-
-class Data_Loader_CSV(Data_Loader):
-    """
-    Data Loader for CSV files
-    """
-
-    def __init__(
-        self,
-        datasource: str,
-        tickers: typing.List[str],
-        features: typing.List[str],
-        start: datetime,
-        end: datetime,
-    ):
-        """
-        :param datasource: relative (from root) or absolute path of folder containing all csv files
-        :param tickers: symbols/tickers of the stocks you want to load
-        :param features: features you want to extract
-        :param start: start date
-        :param end: end date ( result includes ending date)
-        """
-        super().__init__(datasource, tickers, features, start, end)
-        self._file_names = os.listdir(datasource)
-        self._features_list = self.return_features()
-        self.__datetime_filename_HashMap = {
-            datetime.strptime(filename[:-4], "%Y%m%d"): filename
-            for filename in self._file_names
-        }
-
-    def load_data(self) -> typing.Dict[str, pd.DataFrame]:
-        """
-        :return: List of Dataframes (each df represents the time series for a particular stock)
-        :raise FeaturesMismatchException if feature does not exist in dataset
-        """
-
-        filenames = self._extract_filesnames_from_date()
-
-        if len(self.features) == 0:
-            columns = self._features_list
-        else:
-            if len(set(self.features).intersection(set(self._features_list))) == len(
-                self.features
-            ):
-                features = set(self.features)
-                features.add("symbol")
-                columns = list(features)
-            else:
-                raise Exception(
-                    "FeaturesMismatchException: Some input features not present in dataset"
-                )
-
-        data_dict = {}
-        for filename in filenames:
-            date_time = datetime.strptime(filename[:-4], "%Y%m%d")
-            df = pd.read_csv(
-                self.datasource + "/" + filename, usecols=columns, index_col="symbol"
-            )
-
-            for ticker in self.tickers:
-                df_row = None
-                try:
-                    row = df.loc[ticker]
-                    df_row = row.to_frame().transpose()
-                    df_row["datetime"] = date_time
-                    df_row = df_row.set_index("datetime")
-                    df_row.insert(loc=0, column="symbol", value=ticker)
-                except:
-                    pass  # TODO: Pass for now, implement method for checking missing data later
-                try:
-                    data_dict[ticker] = data_dict[ticker].append(
-                        df_row, verify_integrity=True
-                    )
-                except KeyError:
-                    if not df_row is None:
-                        data_dict[ticker] = df_row
-        # TODO: A mapping between stock ticker and price data needs to be there
-        return data_dict
-
-    def return_features(self) -> typing.List[str]:
-        """
-        :return: List of features found in dataset (column names)
-        """
-        file = open(self.datasource + "/" + self._file_names[0])
-        return next(csv.reader(file))
-
-    def _extract_filesnames_from_date(self) -> typing.List[str]:
-        """
-        :return: List of filenames from start date to end date
-        :raise DateNoInvalidException if date does not exist in dataset
-        """
-        dt = sorted(list(self.__datetime_filename_HashMap))
-
-        # TODO: How to handle weekend and trading holidays?
-        try:
-            start_index = dt.index(self.start)
-        except:
-            raise Exception(
-                f"DateNoInvalidException: {self.start.date()} is not in the dataset"
-            )
-
-        try:
-            end_index = dt.index(self.end)
-        except:
-            raise Exception(
-                f"DateNoInvalidException: {self.end.date()} is not in the dataset"
-            )
-
-        filenames = []
-        for index in dt[start_index : end_index + 1]:
-            filenames.append(self.__datetime_filename_HashMap[index])
-
-        return filenames
-
-    def compute_features(
-        self, features: typing.List[str]
-    ) -> typing.Dict[str, pd.DataFrame]:
-        raw_data_dict = self.load_data()
-        data_dict = dict()
-        feature_map = {
-            "return": np.sum,
-            "volatility": np.std,
-            "skewness": scipy.stats.skew,
-            "kurtosis": scipy.stats.kurtosis,
-        }
-
-        def compute_split_ratio(entry):
-            if not np.isnan(entry):
-                previous_ratio = np.float(entry.split(":")[0])
-                after_ratio = np.float(entry.split(":")[1])
-                return previous_ratio / after_ratio
-            else:
-                return 1.0
-
-        for ticker, raw_df in raw_data_dict.items():
-            # compute adjusted_close with roll forward method,
-            # which add the dividend back to the price
-            raw_df["div"] = raw_df["div"].fillna(0)
-            raw_df["adjust_cum"] = (
-                raw_df["adjustment"].apply(compute_split_ratio).cumprod()
-            )
-            raw_df["adjust_div"] = raw_df["div"] * raw_df["adjust_cum"]
-            raw_df["adjust_close"] = (
-                raw_df["close"] * raw_df["adjust_cum"] + raw_df["adjust_div"].cumsum()
-            )
-            # compute t-cost and return
-            raw_df["return"] = raw_df["adjust_close"].apply(lambda x: np.log(x)).diff(1)
-            raw_df["tcost"] = (raw_df["ask"] - raw_df["bid"]) / (
-                raw_df["ask"] + raw_df["bid"]
-            )
-
-            for f in features:
-                f_funcstr = f.split("_")[0]
-                f_lookback = np.int(f.split("_")[1])
-                raw_df[f] = (
-                    raw_df["return"].rolling(f_lookback).apply(feature_map[f_funcstr])
-                )
-
-            selected_features = ["return", "tcost"] + features
-            data_dict[ticker] = raw_df[selected_features]
-
-        return data_dict
-
-
-# =============================================================================
-# MongoDB Data Loader
-# =============================================================================
-
-
-class Data_Loader_mongo(Data_Loader):
-    """
-    Data Loader from mongoDB
-    """
-
-    def __init__(
-        self,
-        datasource: str,
-        tickers: typing.List[str],
-        features: typing.List[str],
-        start: datetime,
-        end: datetime,
-    ):
-        """
-        :param datasource: name of database in mongoDB
-        :param tickers: symbols/tickers of the stocks you want to load
-        :param features: features you want to extract
-        :param start: start date
-        :param end: end date ( result includes ending date)
-        """
-        super().__init__(datasource, tickers, features, start, end)
-        client = MongoClient()
-        self._db = client[datasource]
-        if len(self._db.list_collection_names()) == 0:
-            raise EmptyDatabase(f"{datasource} is an empty database")
-        self._features_list = self.return_features()
-
-    def load_data(self) -> typing.Dict[str, pd.DataFrame]:
-        """
-        :return: List of Dataframes (each df represents the time series for a particular stock)
-        :raise FeaturesMismatchException if feature does not exist in dataset
-        """
-        if len(self.features) == 0:
-            columns = self._features_list
-        else:
-            if len(set(self.features).intersection(set(self._features_list))) == len(
-                self.features
-            ):
-                features = set(self.features)
-                features.add("symbol")
-                features.add("datetime")
-                columns = list(set(features))
-            else:
-                raise Exception(
-                    "FeaturesMismatchException: Some input features not present in dataset"
-                )
-
-        columns_dict = {column: 1 for column in columns}
-        columns_dict["_id"] = 0
-
-        data_dict = {}
-        for ticker in self.tickers:
-            collection = self._db[ticker]
-            if collection.count_documents({}) == 0:
-                raise Exception(f"{ticker} collection is empty (check ticker name)")
-
-            range_query_statement = {"datetime": {"$gte": self.start, "$lte": self.end}}
-            query_result = pd.DataFrame(
-                collection.find(range_query_statement, columns_dict).sort("datetime")
-            )
-            query_result = query_result.set_index("datetime")
-
-            try:
-                data_dict[ticker] = data_dict[ticker].append(
-                    query_result, verify_integrity=True
-                )
-            except KeyError:
-                data_dict[ticker] = query_result
-
-        return data_dict
-
-    def return_features(self) -> typing.List[str]:
-        """
-        :return: List of features found in dataset (column names)
-        """
-        collection = self._db[self._db.list_collection_names()[0]]
-        features = list(collection.find_one())
-        features.remove("_id")
-        return features
-
-    def compute_features(
-        self, features: typing.List[str]
-    ) -> typing.Dict[str, pd.DataFrame]:
-        raw_data_dict = self.load_data()
-        data_dict = dict()
-        feature_map = {
-            "return": np.sum,
-            "volatility": np.std,
-            "skewness": scipy.stats.skew,
-            "kurtosis": scipy.stats.kurtosis,
-        }
-
-        def compute_split_ratio(entry):
-            try:
-                previous_ratio = np.float(entry.split(":")[0])
-                after_ratio = np.float(entry.split(":")[1])
-                return previous_ratio / after_ratio
-            except:
-                return 1.0
-
-        for ticker, raw_df in raw_data_dict.items():
-            # compute adjusted_close with roll forward method,
-            # which add the dividend back to the price
-            raw_df = raw_df.astype(np.float, errors="ignore")
-            raw_df["div"] = raw_df["div"].replace("", 0.0).astype(np.float)
-            raw_df["adjust_cum"] = (
-                raw_df["adjustment"].apply(compute_split_ratio).cumprod()
-            )
-
-            raw_df["adjust_div"] = raw_df["div"] * raw_df["adjust_cum"]
-            raw_df["adjust_close"] = (
-                raw_df["close"].astype(np.float) * raw_df["adjust_cum"]
-                + raw_df["adjust_div"].cumsum()
-            )
-            # compute t-cost and return
-            raw_df["return"] = raw_df["adjust_close"].apply(lambda x: np.log(x)).diff(1)
-            raw_df["ask"] = raw_df["ask"].replace("", 0.0)
-            raw_df["bid"] = raw_df["bid"].replace("", 0.0)
-            raw_df["tcost"] = (
-                raw_df["ask"].astype(np.float) - raw_df["bid"].astype(np.float)
-            ) / (raw_df["ask"].astype(np.float) + raw_df["bid"].astype(np.float))
-
-            for f in features:
-                f_funcstr = f.split("_")[0]
-                f_lookback = np.int(f.split("_")[1])
-                raw_df[f] = (
-                    raw_df["return"].rolling(f_lookback).apply(feature_map[f_funcstr])
-                )
-
-            selected_features = ["return", "tcost", "adjust_close"] + features
-            data_dict[ticker] = raw_df[selected_features]
-
-        return data_dict
-
-
-# =============================================================================
-# MongoDB Data Loader V2 (Finnhub IDs are the collection name)
-# =============================================================================
-
-
-class Data_Loader_mongo_V2(Data_Loader):
-    """
-    Data Loader from mongoDB
-    """
-
-    def __init__(
-        self,
-        datasource: str,
-        tickers: typing.List[str],
-        features: typing.List[str],
-        start: datetime,
-        end: datetime,
-    ):
-        """
-        :param datasource: name of database in mongoDB
-        :param tickers: symbols/tickers of the stocks you want to load
-        :param features: features you want to extract
-        :param start: start date
-        :param end: end date ( result includes ending date)
-        """
-        super().__init__(datasource, tickers, features, start, end)
-        client = MongoClient()
-        self._db = client[datasource]
-        if len(self._db.list_collection_names()) == 0:
-            raise EmptyDatabase(f"{datasource} is an empty database")
-        self._features_list = self.return_features()
-
-    def load_data(self) -> typing.Dict[str, pd.DataFrame]:
-        """
-        :return: List of Dataframes (each df represents the time series for a particular stock)
-        :raise FeaturesMismatchException if feature does not exist in dataset
-        """
-        if len(self.features) == 0:
-            columns = self._features_list
-        else:
-            if len(set(self.features).intersection(set(self._features_list))) == len(
-                self.features
-            ):
-                features = set(self.features)
-                features.add("symbol")
-                features.add("datetime")
-                columns = list(set(features))
-            else:
-                raise Exception(
-                    "FeaturesMismatchException: Some input features not present in dataset"
-                )
-
-        columns_dict = {column: 1 for column in columns}
-        columns_dict["_id"] = 0
-
-        tickers_new = self.__match_ticker_finnhub_id()
-
-        data_dict = {}
-        for ticker_class, values in tickers_new.items():
-            for id_start_end in values:
-                collection = self._db[id_start_end[0]]
-
-                if collection.count_documents({}) == 0:
-                    raise Exception(
-                        f"{ticker_class} collection is empty (check ticker name)"
-                    )
-
-                range_query_statement = {
-                    "datetime": {"$gte": id_start_end[1], "$lte": id_start_end[2]}
-                }
-                query_result = pd.DataFrame(
-                    collection.find(range_query_statement, columns_dict).sort(
-                        "datetime"
-                    )
-                )
-                query_result = query_result.set_index("datetime")
-
-                try:
-                    data_dict[ticker_class] = data_dict[ticker_class].append(
-                        query_result, verify_integrity=True
-                    )
-                except KeyError:
-                    data_dict[ticker_class] = query_result
-
-        return data_dict
-
-    def return_features(self) -> typing.List[str]:
-        """
-        :return: List of features found in dataset (column names)
-        """
-        collection = self._db[self._db.list_collection_names()[0]]
-        features = list(collection.find_one())
-        features.remove("_id")
-        return features
-
-    def compute_features(
-        self, features: typing.List[str]
-    ) -> typing.Dict[str, pd.DataFrame]:
-        raw_data_dict = self.load_data()
-        data_dict = dict()
-        feature_map = {
-            "return": np.sum,
-            "volatility": np.std,
-            "skewness": scipy.stats.skew,
-            "kurtosis": scipy.stats.kurtosis,
-        }
-
-        def compute_split_ratio(entry):
-            try:
-                previous_ratio = np.float(entry.split(":")[0])
-                after_ratio = np.float(entry.split(":")[1])
-                return previous_ratio / after_ratio
-            except:
-                return 1.0
-
-        for ticker, raw_df in raw_data_dict.items():
-            # compute adjusted_close with roll forward method,
-            # which add the dividend back to the price
-            raw_df = raw_df.astype(np.float, errors="ignore")
-            raw_df["div"] = raw_df["div"].replace("", 0.0).astype(np.float)
-            raw_df["adjust_cum"] = (
-                raw_df["adjustment"].apply(compute_split_ratio).cumprod()
-            )
-            raw_df["adjvolume"] = (
-                raw_df["volume"].astype(np.float) / raw_df["adjust_cum"]
-            )
-            raw_df["adjvolumeratio"] = (
-                raw_df["adjvolume"] / raw_df["adjvolume"].rolling(20).mean()
-            )
-            raw_df["adjust_div"] = raw_df["div"] * raw_df["adjust_cum"]
-            raw_df["adjclose"] = (
-                raw_df["close"].astype(np.float) * raw_df["adjust_cum"]
-                + raw_df["adjust_div"].cumsum()
-            )
-            # compute t-cost and return
-            raw_df["ask"] = raw_df["ask"].replace("", 0.0)
-            raw_df["bid"] = raw_df["bid"].replace("", 0.0)
-            raw_df["return"] = raw_df["adjclose"].apply(lambda x: np.log(x)).diff(1)
-            raw_df["tcost"] = (
-                raw_df["ask"].astype(np.float) - raw_df["bid"].astype(np.float)
-            ) / (raw_df["ask"].astype(np.float) + raw_df["bid"].astype(np.float))
-
-            for f in features:
-                f_field = f.split("_")[0]
-                f_funcstr = f.split("_")[1]
-                f_lookback = np.int(f.split("_")[2])
-                raw_df[f] = (
-                    raw_df[f_field].rolling(f_lookback).apply(feature_map[f_funcstr])
-                )
-
-            selected_features = [
-                "return",
-                "tcost",
-                "adjclose",
-                "adjvolume",
-                "adjvolumeratio",
-            ] + features
-            data_dict[ticker] = raw_df[selected_features]
-
-        return data_dict
-
-    def __match_ticker_finnhub_id(
-        self,
-    ) -> typing.Dict[str, typing.List[typing.Tuple[str, datetime, datetime]]]:
-        """
-        :return: A dictionary with the key being the ticker + class and the value being the finnhub id and start and end dates
-        """
-
-        collection = self._db["ticker_id_meta_data"]
-
-        tickers_new = {}
-        for ticker in self.tickers:
-            query_statement_ticker = {"symbol": ticker}
-
-            tickers_all_class = collection.find(query_statement_ticker, {"_id": 0})
-
-            for ticker_one_class in tickers_all_class:
-                ticker = ticker_one_class["symbol"]
-                class_of_ticker = ticker_one_class["class"]
-
-                query_statement = {
-                    "symbol": ticker,
-                    "class": class_of_ticker,
-                    # "start": {"$lte": self.start},
-                    "end": {"$gte": self.end},
-                }
-
-                result = collection.find_one(query_statement, {"_id": 0})
-                try:
-                    tickers_new[result["symbol"] + "_" + result["class"]] = [
-                        (result["finnhub_id"], self.start, self.end)
-                    ]
-                except:
-                    pass
-
-        return tickers_new
-
-    def __match_ticker_finnhub_id_advance(
-        self,
-    ) -> typing.Dict[str, typing.List[typing.Tuple[str, datetime, datetime]]]:
-        """
-        #WIP: maps start date and end date to a range of date (needs the trading calendar class)
-        :return: A dictionary with the key being the ticker + class and the value being the finnhub id and start and end dates
-        """
-        pass
-
-    def get_date_range(self):
-        raw_data_dict = self.load_data()
-        tickers = raw_data_dict.keys()
-        date_range = {}
-        for one_ticker in tickers:
-            df = raw_data_dict[one_ticker]
-            listing = df.index[0]
-            delisting = df.index[-1]
-            date_range[one_ticker] = [(listing, delisting)]
-
-        return date_range
-
-
-# =============================================================================
-# Exceptions
-# =============================================================================
-
-
-class TimeInvalid(Exception):
-    pass
-
-
-class EmptyDatabase(Exception):
-    pass
-
-
-# =============================================================================
-# Test
-# =============================================================================
-
-if __name__ == "__main__":
-
-    # Test MongoDB Loader
-    data_loader_mongo = Data_Loader_mongo_V2(
-        "kaggle_US_Equity_daily",
-        [
-            "T",
-            "GS",
-            "GE",
-            "AAPL",
-            "BRK",
-            "GOLD",
-            "TLT",
-        ],
-        [],
-        datetime(1992, 1, 2),
-        datetime(2019, 12, 31),
-    )
-
-    features = data_loader_mongo.compute_features(
-        [
-            "return_volatility_20",
-            "return_skewness_20",
-            "return_kurtosis_20",
-            "adjvolume_volatility_20",
-        ]
-    )
-    for key, df in features.items():
-        df = df.reset_index().dropna()
-        print(key, df)
-        df.to_csv("data/{}.csv".format(key), index=False)
+import os
+import csv
+import bisect
+import pandas as pd
+import numpy as np
+
+import typing
+from abc import ABC, abstractmethod
+from datetime import datetime
+from user_manual.USCalendar import USTradingCalendar
+from alignment import Panel, align_to_sessions, build_panel
+from asof_join import asof_join
+from intraday_store import IntradayStore, FIELDS as INTRADAY_FIELDS
+from realized_vol import MEASURES, realized_measures
+from instrumentation import span, count, traced
+
+
+"""
+NOTE:
+pymongo and scipy are only imported when a Mongo loader connects or rolling features are computed,
+so importing the module (i.e. for the CSV loader) stays cheap.
+load_panel / compute_panel are the wide alternatives of load_data / compute_features: one Panel
+(sessions x IDs x fields, optionally float32) built from the source rows in one pass instead of a
+Dict of small Dataframes that has to be concatenated again downstream (see Panel.to_frame for a
+(datetime, symbol) MultiIndex Dataframe).
+"""
+
+# =============================================================================
+# Data Loader Abstract Class
+# =============================================================================
+
+
+class Data_Loader(ABC):
+    """
+    Abstract Class for data loading
+    """
+
+    def __init__(
+        self,
+        datasource: str,
+        tickers: typing.List[str],
+        features: typing.List[str],
+        start: datetime,
+        end: datetime,
+    ):
+        """
+        :param datasource: where is the dataset located
+        :param tickers: symbols/tickers of the stocks you want to load
+        :param features: features you want to extract
+        :param start: start date (moved forward to the next trading session)
+        :param end: end date (includes ending date, moved back to the previous trading session)
+        """
+
+        if end < start:
+            raise TimeInvalid("The end date cannot be before the start date")
+
+        self.calendar = USTradingCalendar()
+        try:
+            start, end = self.calendar.resolve_range(start, end)
+        except ValueError as e:
+            raise TimeInvalid(str(e))
+
+        self.datasource = datasource
+        self.tickers = list(set(tickers))
+        self.features = list(set(features))
+        self.start = start.to_pydatetime()
+        self.end = end.to_pydatetime()
+        super().__init__()
+
+    @abstractmethod
+    def load_data(self) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :return: List of Dataframes (each df represents the time series for a particular stock)
+        """
+        pass
+
+    def symbol_of(self, key: str) -> str:
+        """
+        :param key: key of the output of load_data
+
+        :return: symbol of the key (the key itself, except for Data_Loader_mongo_V2)
+        """
+        return key
+
+    def load_aligned(self, fill: str = "mask") -> Panel:
+        """
+        Loads the data and aligns it on the trading sessions between start and end
+
+        :param fill: "mask" leaves missing sessions as NaN, "ffill" forward-fills them
+
+        :return: Panel with the presence matrix and the gaps of every ticker
+        """
+        sessions = self.calendar.sessions_between(self.start, self.end)
+        data_dict = self.load_data()
+        with span("align", loader=type(self).__name__):
+            return align_to_sessions(data_dict, sessions, fill=fill)
+
+    def load_panel(self, fill: str = "mask", dtype=np.float64) -> Panel:
+        """
+        Loads the data as one Panel, the IDs are the keys of load_data (loaders that can read their
+        source row by row build it directly, the others go through load_aligned)
+
+        :param fill: "mask" leaves missing sessions as NaN, "ffill" forward-fills them
+        :param dtype: dtype of the numeric values (np.float32 halves the memory)
+
+        :return: Panel of the loaded fields
+        """
+        return self.load_aligned(fill).astype(dtype)
+
+    @traced()
+    def compute_panel(self, features: typing.List[str], dtype=np.float64) -> Panel:
+        """
+        Vectorized compute_features over the whole universe: adjusted close, return, t-cost and
+        rolling features as fields of one Panel (rows without data in the source are NaN and are
+        skipped by the returns and the rolling windows, as in compute_features)
+
+        :param features: rolling features to compute, "volatility_20" (on the returns) or
+            "adjvolume_volatility_20" (field, function, lookback as in Data_Loader_mongo_V2)
+        :param dtype: dtype of the values of the output (computed in float64)
+
+        :return: Panel with the fields return, tcost, adjust_close (adjvolume if used) and features
+        :raise ValueError if a feature is unknown
+        """
+        windows = []
+        for f in features:
+            parts = f.split("_")
+            field, function, lookback = (["return"] + parts) if len(parts) == 2 else parts
+            if function not in PANEL_FUNCTIONS or field not in ["return", "adjvolume"]:
+                raise ValueError(f"unknown rolling feature {f}, use one of {list(PANEL_FUNCTIONS)}")
+            windows.append((f, field, function, int(lookback)))
+
+        panel = self.load_panel(fill="mask")
+        loader = type(self).__name__
+        with span("features.adjust", loader=loader):
+            presence = panel.presence
+            split = panel.split_factor()
+            dividend = np.nan_to_num(panel.values[:, :, panel.fields.index("div")])
+            close = panel.values[:, :, panel.fields.index("close")]
+            # roll forward adjustment, the dividends are added back to the price
+            adjust_close = close * split + np.cumsum(dividend * split, axis=0)
+            adjust_close[~presence] = np.nan
+            series = {"return": _present_diff(np.log(adjust_close), presence)}
+            if any(field == "adjvolume" for _, field, _, _ in windows):
+                series["adjvolume"] = panel.values[:, :, panel.fields.index("volume")] / split
+            ask = panel.values[:, :, panel.fields.index("ask")]
+            bid = panel.values[:, :, panel.fields.index("bid")]
+            tcost = (ask - bid) / (ask + bid)
+
+        with span("features.rolling", loader=loader):
+            outputs = [series["return"], tcost, adjust_close] + [series[key] for key in series if key != "return"]
+            for _, field, function, lookback in windows:
+                outputs.append(_present_rolling(series[field], presence, lookback, function))
+
+        fields = ["return", "tcost", "adjust_close"] + [key for key in series if key != "return"] + [w[0] for w in windows]
+        values = np.stack(outputs, axis=2).astype(dtype, copy=False)
+        return Panel(values, panel.sessions, panel.ids, fields, presence, listed=panel.listed)
+
+    @traced()
+    def _attach_fundamentals(
+        self, data_dict: typing.Dict[str, pd.DataFrame], fundamentals: pd.DataFrame
+    ) -> typing.Dict[str, pd.DataFrame]:
+        """
+        Adds the point-in-time value of every concept of fundamentals to the rows of each ticker
+        (all tickers are joined at once, see asof_join)
+
+        :param data_dict: Dataframes indexed by datetime, keyed like load_data (matched on symbol_of(key))
+        :param fundamentals: reported values in long format (i.e. FundamentalsStore.read)
+
+        :return: same Dict with one extra column per concept
+        """
+        tickers = [ticker for ticker, df in data_dict.items() if len(df) > 0]
+        if len(tickers) == 0:
+            return data_dict
+        lengths = [len(data_dict[ticker]) for ticker in tickers]
+        symbols = np.array([self.symbol_of(ticker) for ticker in tickers], dtype=object)
+        query_ids = np.repeat(symbols, lengths)
+        query_dates = np.concatenate([pd.DatetimeIndex(data_dict[ticker].index).values for ticker in tickers])
+        joined = asof_join(fundamentals, query_ids, query_dates)
+
+        bounds = np.cumsum([0] + lengths)
+        for ticker, lo, hi in zip(tickers, bounds[:-1], bounds[1:]):
+            df = data_dict[ticker].copy()
+            for concept in joined.columns:
+                df[concept] = joined[concept].to_numpy()[lo:hi]
+            data_dict[ticker] = df
+        return data_dict
+
+    @traced()
+    def _attach_realized(
+        self, data_dict: typing.Dict[str, pd.DataFrame], intraday: typing.Dict[str, pd.DataFrame]
+    ) -> typing.Dict[str, pd.DataFrame]:
+        """
+        Adds the daily realized measures of the minute bars (see realized_vol.MEASURES) to the rows of each ticker
+
+        :param data_dict: Dataframes indexed by datetime, keyed like load_data (matched on symbol_of(key))
+        :param intraday: minute bars keyed by symbol (i.e. Data_Loader_Intraday.load_data)
+
+        :return: same Dict with one realized_<measure> column per measure (NaN on days without minute bars)
+        """
+        measures = realized_measures(intraday)
+        for ticker, df in data_dict.items():
+            daily = measures.get(self.symbol_of(ticker))
+            if daily is None:
+                daily = pd.DataFrame(columns=MEASURES, dtype=np.float64)
+            data_dict[ticker] = df.join(daily.add_prefix("realized_"), how="left")
+        return data_dict
+
+
+# =============================================================================
+# CSV Data Loader
+# =============================================================================
+
+
+class Data_Loader_CSV(Data_Loader):
+    """
+    Data Loader for CSV files
+    """
+
+    def __init__(
+        self,
+        datasource: str,
+        tickers: typing.List[str],
+        features: typing.List[str],
+        start: datetime,
+        end: datetime,
+    ):
+        """
+        :param datasource: relative (from root) or absolute path of folder containing all csv files
+        :param tickers: symbols/tickers of the stocks you want to load
+        :param features: features you want to extract
+        :param start: start date
+        :param end: end date ( result includes ending date)
+        """
+        super().__init__(datasource, tickers, features, start, end)
+        with span("csv.listdir"):
+            self._file_names = os.listdir(datasource)
+        self._features_list = self.return_features()
+        self.__datetime_filename_HashMap = {
+            datetime.strptime(filename[:-4], "%Y%m%d"): filename
+            for filename in self._file_names
+        }
+
+    @traced()
+    def load_data(self) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :return: List of Dataframes (each df represents the time series for a particular stock)
+        :raise FeaturesMismatchException if feature does not exist in dataset
+        """
+
+        filenames = self._extract_filesnames_from_date()
+
+        if len(self.features) == 0:
+            columns = self._features_list
+        else:
+            if len(set(self.features).intersection(set(self._features_list))) == len(
+                self.features
+            ):
+                features = set(self.features)
+                features.add("symbol")
+                columns = list(features)
+            else:
+                raise Exception(
+                    "FeaturesMismatchException: Some input features not present in dataset"
+                )
+
+        data_dict = {}
+        for filename in filenames:
+            date_time = datetime.strptime(filename[:-4], "%Y%m%d")
+            path = self.datasource + "/" + filename
+            with span("csv.read_csv"):
+                df = pd.read_csv(path, usecols=columns, index_col="symbol")
+            count("files_read", source="csv")
+            count("bytes_read", os.path.getsize(path), source="csv")
+            count("rows_read", len(df), source="csv")
+            if df.index.has_duplicates:
+                df = df[_primary_rows(df.index.to_numpy(), df.get("class"))]
+
+            with span("csv.append"):
+                for ticker in self.tickers:
+                    df_row = None
+                    try:
+                        row = df.loc[ticker]
+                        df_row = row.to_frame().transpose()
+                        df_row["datetime"] = date_time
+                        df_row = df_row.set_index("datetime")
+                        df_row.insert(loc=0, column="symbol", value=ticker)
+                    except KeyError:
+                        pass  # missing rows are reported as gaps by load_aligned
+                    try:
+                        data_dict[ticker] = data_dict[ticker].append(
+                            df_row, verify_integrity=True
+                        )
+                    except KeyError:
+                        if not df_row is None:
+                            data_dict[ticker] = df_row
+        # TODO: A mapping between stock ticker and price data needs to be there
+        return data_dict
+
+    @traced()
+    def load_panel(self, fill: str = "mask", dtype=np.float64) -> Panel:
+        """
+        Reads every daily file once and scatters the rows of the tickers straight into the Panel
+        (no per-ticker Dataframe, the symbol is the ID axis instead of a repeated column)
+
+        :param fill: "mask" leaves missing sessions as NaN, "ffill" forward-fills them
+        :param dtype: dtype of the numeric values (np.float32 halves the memory)
+
+        :return: Panel of the tickers found in the files (sorted)
+        :raise FeaturesMismatchException if feature does not exist in dataset
+        """
+        if not set(self.features).issubset(self._features_list):
+            raise Exception("FeaturesMismatchException: Some input features not present in dataset")
+        columns = [c for c in self._features_list if c in self.features or len(self.features) == 0]
+        columns = ["symbol"] + [c for c in columns if c != "symbol"]
+
+        tickers = pd.Index(sorted(self.tickers))
+        frames, dates = [], []
+        for filename in self._extract_filesnames_from_date():
+            path = self.datasource + "/" + filename
+            with span("csv.read_csv"):
+                df = pd.read_csv(path, usecols=columns)
+            count("files_read", source="csv")
+            count("bytes_read", os.path.getsize(path), source="csv")
+            count("rows_read", len(df), source="csv")
+            df = df[df["symbol"].isin(tickers)]
+            df = df[_primary_rows(df["symbol"].to_numpy(), df.get("class"))]
+            frames.append(df)
+            dates.append(np.full(len(df), np.datetime64(datetime.strptime(filename[:-4], "%Y%m%d"), "D")))
+
+        with span("align", loader="Data_Loader_CSV"):
+            rows = pd.concat(frames, ignore_index=True)
+            column = tickers.get_indexer(rows.pop("symbol"))
+            found = np.unique(column)
+            # IDs without any row are dropped, as in load_data
+            column = np.searchsorted(found, column)
+            sessions = self.calendar.sessions_between(self.start, self.end)
+            return build_panel(
+                sessions, tickers[found], np.concatenate(dates), column, dict(rows.items()), fill=fill, dtype=dtype
+            )
+
+    def return_features(self) -> typing.List[str]:
+        """
+        :return: List of features found in dataset (column names)
+        """
+        file = open(self.datasource + "/" + self._file_names[0])
+        return next(csv.reader(file))
+
+    def _extract_filesnames_from_date(self) -> typing.List[str]:
+        """
+        :return: List of filenames from start date to end date
+        :raise DateNoInvalidException if date does not exist in dataset
+        """
+        dt = sorted(list(self.__datetime_filename_HashMap))
+
+        # start and end are already snapped to trading sessions by the calendar
+        start_index = bisect.bisect_left(dt, self.start)
+        end_index = bisect.bisect_right(dt, self.end)
+        if start_index >= end_index:
+            raise Exception(
+                f"DateNoInvalidException: no file between {self.start.date()} and {self.end.date()} in the dataset"
+            )
+
+        filenames = []
+        for index in dt[start_index:end_index]:
+            filenames.append(self.__datetime_filename_HashMap[index])
+
+        return filenames
+
+    @traced()
+    def compute_features(
+        self,
+        features: typing.List[str],
+        fundamentals: pd.DataFrame = None,
+        intraday: typing.Dict[str, pd.DataFrame] = None,
+    ) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :param features: rolling features to compute (i.e. "volatility_20")
+        :param fundamentals: reported values in long format (i.e. FundamentalsStore.read), when given
+            the latest value filed on or before each date is added as one column per concept
+        :param intraday: minute bars keyed by symbol (i.e. Data_Loader_Intraday.load_data), when given
+            the daily realized variance, bipower variation, realized range and VWAP are added
+
+        :return: Dict of Dataframes with the computed features
+        """
+        raw_data_dict = self.load_data()
+        data_dict = dict()
+        feature_map = _feature_map()
+
+        def compute_split_ratio(entry):
+            if isinstance(entry, str):
+                previous_ratio = np.float(entry.split(":")[0])
+                after_ratio = np.float(entry.split(":")[1])
+                return previous_ratio / after_ratio
+            else:
+                return 1.0
+
+        for ticker, raw_df in raw_data_dict.items():
+            with span("features.adjust", loader="Data_Loader_CSV"):
+                # compute adjusted_close with roll forward method,
+                # which add the dividend back to the price
+                raw_df["div"] = raw_df["div"].fillna(0)
+                raw_df["adjust_cum"] = (
+                    raw_df["adjustment"].apply(compute_split_ratio).cumprod()
+                )
+                raw_df["adjust_div"] = raw_df["div"] * raw_df["adjust_cum"]
+                raw_df["adjust_close"] = (
+                    raw_df["close"] * raw_df["adjust_cum"] + raw_df["adjust_div"].cumsum()
+                )
+                # compute t-cost and return
+                raw_df["return"] = raw_df["adjust_close"].apply(lambda x: np.log(x)).diff(1)
+                raw_df["tcost"] = (raw_df["ask"] - raw_df["bid"]) / (
+                    raw_df["ask"] + raw_df["bid"]
+                )
+
+            with span("features.rolling", loader="Data_Loader_CSV"):
+                for f in features:
+                    f_funcstr = f.split("_")[0]
+                    f_lookback = np.int(f.split("_")[1])
+                    raw_df[f] = (
+                        raw_df["return"].rolling(f_lookback).apply(feature_map[f_funcstr])
+                    )
+
+            selected_features = ["return", "tcost"] + features
+            data_dict[ticker] = raw_df[selected_features]
+
+        if fundamentals is not None:
+            data_dict = self._attach_fundamentals(data_dict, fundamentals)
+        if intraday is not None:
+            data_dict = self._attach_realized(data_dict, intraday)
+        return data_dict
+
+
+# =============================================================================
+# MongoDB Data Loader
+# =============================================================================
+
+
+class Data_Loader_mongo(Data_Loader):
+    """
+    Data Loader from mongoDB
+    """
+
+    def __init__(
+        self,
+        datasource: str,
+        tickers: typing.List[str],
+        features: typing.List[str],
+        start: datetime,
+        end: datetime,
+    ):
+        """
+        :param datasource: name of database in mongoDB
+        :param tickers: symbols/tickers of the stocks you want to load
+        :param features: features you want to extract
+        :param start: start date
+        :param end: end date ( result includes ending date)
+        """
+        super().__init__(datasource, tickers, features, start, end)
+        with span("mongo.connect", loader=type(self).__name__):
+            client = _mongo_client()
+            self._db = client[datasource]
+            if len(self._db.list_collection_names()) == 0:
+                raise EmptyDatabase(f"{datasource} is an empty database")
+            self._features_list = self.return_features()
+        count("queries_issued", 2, source="mongo")
+
+    @traced()
+    def load_data(self) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :return: List of Dataframes (each df represents the time series for a particular stock)
+        :raise FeaturesMismatchException if feature does not exist in dataset
+        """
+        data_dict = {}
+        for ticker, records in self._find():
+            query_result = pd.DataFrame(records)
+            with span("mongo.append", loader="Data_Loader_mongo"):
+                query_result = query_result.set_index("datetime")
+
+                try:
+                    data_dict[ticker] = data_dict[ticker].append(
+                        query_result, verify_integrity=True
+                    )
+                except KeyError:
+                    data_dict[ticker] = query_result
+
+        return data_dict
+
+    @traced()
+    def load_panel(self, fill: str = "mask", dtype=np.float64) -> Panel:
+        """
+        Scatters the documents of all the tickers straight into the Panel (no per-ticker Dataframe)
+
+        :param fill: "mask" leaves missing sessions as NaN, "ffill" forward-fills them
+        :param dtype: dtype of the numeric values (np.float32 halves the memory)
+
+        :return: Panel of the tickers (the symbol is the ID axis)
+        :raise FeaturesMismatchException if feature does not exist in dataset
+        """
+        sessions = self.calendar.sessions_between(self.start, self.end)
+        return _records_panel(self._find(), sessions, fill, dtype, loader="Data_Loader_mongo")
+
+    def _find(self) -> typing.Iterator[typing.Tuple[str, typing.List[dict]]]:
+        """
+        :return: (ticker, documents sorted by datetime) of every ticker
+        :raise FeaturesMismatchException if feature does not exist in dataset
+        """
+        columns_dict = _projection(self.features, self._features_list)
+        for ticker in self.tickers:
+            collection = self._db[ticker]
+            with span("mongo.find", loader="Data_Loader_mongo"):
+                if collection.count_documents({}) == 0:
+                    raise Exception(f"{ticker} collection is empty (check ticker name)")
+
+                range_query_statement = {"datetime": {"$gte": self.start, "$lte": self.end}}
+                records = list(collection.find(range_query_statement, columns_dict).sort("datetime"))
+            count("queries_issued", 2, source="mongo")
+            count("rows_read", len(records), source="mongo")
+            yield ticker, records
+
+    def return_features(self) -> typing.List[str]:
+        """
+        :return: List of features found in dataset (column names)
+        """
+        collection = self._db[self._db.list_collection_names()[0]]
+        features = list(collection.find_one())
+        features.remove("_id")
+        return features
+
+    @traced()
+    def compute_features(
+        self,
+        features: typing.List[str],
+        fundamentals: pd.DataFrame = None,
+        intraday: typing.Dict[str, pd.DataFrame] = None,
+    ) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :param features: rolling features to compute (i.e. "volatility_20")
+        :param fundamentals: reported values in long format (i.e. FundamentalsStore.read), when given
+            the latest value filed on or before each date is added as one column per concept
+        :param intraday: minute bars keyed by symbol (i.e. Data_Loader_Intraday.load_data), when given
+            the daily realized variance, bipower variation, realized range and VWAP are added
+
+        :return: Dict of Dataframes with the computed features
+        """
+        raw_data_dict = self.load_data()
+        data_dict = dict()
+        feature_map = _feature_map()
+
+        def compute_split_ratio(entry):
+            try:
+                previous_ratio = np.float(entry.split(":")[0])
+                after_ratio = np.float(entry.split(":")[1])
+                return previous_ratio / after_ratio
+            except:
+                return 1.0
+
+        for ticker, raw_df in raw_data_dict.items():
+            with span("features.cast", loader="Data_Loader_mongo"):
+                raw_df = raw_df.astype(np.float, errors="ignore")
+                raw_df["div"] = raw_df["div"].replace("", 0.0).astype(np.float)
+                raw_df["ask"] = raw_df["ask"].replace("", 0.0).astype(np.float)
+                raw_df["bid"] = raw_df["bid"].replace("", 0.0).astype(np.float)
+
+            with span("features.adjust", loader="Data_Loader_mongo"):
+                # compute adjusted_close with roll forward method,
+                # which add the dividend back to the price
+                raw_df["adjust_cum"] = (
+                    raw_df["adjustment"].apply(compute_split_ratio).cumprod()
+                )
+
+                raw_df["adjust_div"] = raw_df["div"] * raw_df["adjust_cum"]
+                raw_df["adjust_close"] = (
+                    raw_df["close"].astype(np.float) * raw_df["adjust_cum"]
+                    + raw_df["adjust_div"].cumsum()
+                )
+                # compute t-cost and return
+                raw_df["return"] = raw_df["adjust_close"].apply(lambda x: np.log(x)).diff(1)
+                raw_df["tcost"] = (raw_df["ask"] - raw_df["bid"]) / (raw_df["ask"] + raw_df["bid"])
+
+            with span("features.rolling", loader="Data_Loader_mongo"):
+                for f in features:
+                    f_funcstr = f.split("_")[0]
+                    f_lookback = np.int(f.split("_")[1])
+                    raw_df[f] = (
+                        raw_df["return"].rolling(f_lookback).apply(feature_map[f_funcstr])
+                    )
+
+            selected_features = ["return", "tcost", "adjust_close"] + features
+            data_dict[ticker] = raw_df[selected_features]
+
+        if fundamentals is not None:
+            data_dict = self._attach_fundamentals(data_dict, fundamentals)
+        if intraday is not None:
+            data_dict = self._attach_realized(data_dict, intraday)
+        return data_dict
+
+
+# =============================================================================
+# MongoDB Data Loader V2 (Finnhub IDs are the collection name)
+# =============================================================================
+
+
+class Data_Loader_mongo_V2(Data_Loader):
+    """
+    Data Loader from mongoDB
+    """
+
+    def __init__(
+        self,
+        datasource: str,
+        tickers: typing.List[str],
+        features: typing.List[str],
+        start: datetime,
+        end: datetime,
+    ):
+        """
+        :param datasource: name of database in mongoDB
+        :param tickers: symbols/tickers of the stocks you want to load
+        :param features: features you want to extract
+        :param start: start date
+        :param end: end date ( result includes ending date)
+        """
+        super().__init__(datasource, tickers, features, start, end)
+        with span("mongo.connect", loader=type(self).__name__):
+            client = _mongo_client()
+            self._db = client[datasource]
+            if len(self._db.list_collection_names()) == 0:
+                raise EmptyDatabase(f"{datasource} is an empty database")
+            self._features_list = self.return_features()
+        count("queries_issued", 2, source="mongo")
+
+    @traced()
+    def load_data(self) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :return: List of Dataframes (each df represents the time series for a particular stock)
+        :raise FeaturesMismatchException if feature does not exist in dataset
+        """
+        data_dict = {}
+        for ticker_class, records in self._find():
+            query_result = pd.DataFrame(records)
+            with span("mongo.append", loader="Data_Loader_mongo_V2"):
+                query_result = query_result.set_index("datetime")
+
+                try:
+                    data_dict[ticker_class] = data_dict[ticker_class].append(
+                        query_result, verify_integrity=True
+                    )
+                except KeyError:
+                    data_dict[ticker_class] = query_result
+
+        return data_dict
+
+    @traced()
+    def load_panel(self, fill: str = "mask", dtype=np.float64) -> Panel:
+        """
+        Scatters the documents of all the finnhub IDs straight into the Panel (no per-ticker Dataframe)
+
+        :param fill: "mask" leaves missing sessions as NaN, "ffill" forward-fills them
+        :param dtype: dtype of the numeric values (np.float32 halves the memory)
+
+        :return: Panel of the tickers + class (the keys of load_data)
+        :raise FeaturesMismatchException if feature does not exist in dataset
+        """
+        sessions = self.calendar.sessions_between(self.start, self.end)
+        return _records_panel(self._find(), sessions, fill, dtype, loader="Data_Loader_mongo_V2")
+
+    def _find(self) -> typing.Iterator[typing.Tuple[str, typing.List[dict]]]:
+        """
+        :return: (ticker + class, documents sorted by datetime) of every finnhub ID of the tickers
+        :raise FeaturesMismatchException if feature does not exist in dataset
+        """
+        columns_dict = _projection(self.features, self._features_list)
+        tickers_new = self.__match_ticker_finnhub_id()
+
+        for ticker_class, values in tickers_new.items():
+            for id_start_end in values:
+                collection = self._db[id_start_end[0]]
+
+                with span("mongo.find", loader="Data_Loader_mongo_V2"):
+                    if collection.count_documents({}) == 0:
+                        raise Exception(
+                            f"{ticker_class} collection is empty (check ticker name)"
+                        )
+
+                    range_query_statement = {
+                        "datetime": {"$gte": id_start_end[1], "$lte": id_start_end[2]}
+                    }
+                    records = list(
+                        collection.find(range_query_statement, columns_dict).sort(
+                            "datetime"
+                        )
+                    )
+                count("queries_issued", 2, source="mongo")
+                count("rows_read", len(records), source="mongo")
+                yield ticker_class, records
+
+    def return_features(self) -> typing.List[str]:
+        """
+        :return: List of features found in dataset (column names)
+        """
+        collection = self._db[self._db.list_collection_names()[0]]
+        features = list(collection.find_one())
+        features.remove("_id")
+        return features
+
+    @traced()
+    def compute_features(
+        self,
+        features: typing.List[str],
+        fundamentals: pd.DataFrame = None,
+        intraday: typing.Dict[str, pd.DataFrame] = None,
+    ) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :param features: rolling features to compute (i.e. "volatility_20")
+        :param fundamentals: reported values in long format (i.e. FundamentalsStore.read), when given
+            the latest value filed on or before each date is added as one column per concept
+        :param intraday: minute bars keyed by symbol (i.e. Data_Loader_Intraday.load_data), when given
+            the daily realized variance, bipower variation, realized range and VWAP are added
+
+        :return: Dict of Dataframes with the computed features
+        """
+        raw_data_dict = self.load_data()
+        data_dict = dict()
+        feature_map = _feature_map()
+
+        def compute_split_ratio(entry):
+            try:
+                previous_ratio = np.float(entry.split(":")[0])
+                after_ratio = np.float(entry.split(":")[1])
+                return previous_ratio / after_ratio
+            except:
+                return 1.0
+
+        for ticker, raw_df in raw_data_dict.items():
+            with span("features.cast", loader="Data_Loader_mongo_V2"):
+                raw_df = raw_df.astype(np.float, errors="ignore")
+                raw_df["div"] = raw_df["div"].replace("", 0.0).astype(np.float)
+                raw_df["volume"] = raw_df["volume"].astype(np.float)
+                raw_df["ask"] = raw_df["ask"].replace("", 0.0).astype(np.float)
+                raw_df["bid"] = raw_df["bid"].replace("", 0.0).astype(np.float)
+
+            with span("features.adjust", loader="Data_Loader_mongo_V2"):
+                # compute adjusted_close with roll forward method,
+                # which add the dividend back to the price
+                raw_df["adjust_cum"] = (
+                    raw_df["adjustment"].apply(compute_split_ratio).cumprod()
+                )
+                raw_df["adjvolume"] = raw_df["volume"] / raw_df["adjust_cum"]
+                raw_df["adjvolumeratio"] = (
+                    raw_df["adjvolume"] / raw_df["adjvolume"].rolling(20).mean()
+                )
+                raw_df["adjust_div"] = raw_df["div"] * raw_df["adjust_cum"]
+                raw_df["adjclose"] = (
+                    raw_df["close"].astype(np.float) * raw_df["adjust_cum"]
+                    + raw_df["adjust_div"].cumsum()
+                )
+                # compute t-cost and return
+                raw_df["return"] = raw_df["adjclose"].apply(lambda x: np.log(x)).diff(1)
+                raw_df["tcost"] = (raw_df["ask"] - raw_df["bid"]) / (raw_df["ask"] + raw_df["bid"])
+
+            with span("features.rolling", loader="Data_Loader_mongo_V2"):
+                for f in features:
+                    f_field = f.split("_")[0]
+                    f_funcstr = f.split("_")[1]
+                    f_lookback = np.int(f.split("_")[2])
+                    raw_df[f] = (
+                        raw_df[f_field].rolling(f_lookback).apply(feature_map[f_funcstr])
+                    )
+
+            selected_features = [
+                "return",
+                "tcost",
+                "adjclose",
+                "adjvolume",
+                "adjvolumeratio",
+            ] + features
+            data_dict[ticker] = raw_df[selected_features]
+
+        if fundamentals is not None:
+            data_dict = self._attach_fundamentals(data_dict, fundamentals)
+        if intraday is not None:
+            data_dict = self._attach_realized(data_dict, intraday)
+        return data_dict
+
+    def symbol_of(self, key: str) -> str:
+        """
+        :param key: key of the output of load_data (symbol + "_" + class)
+
+        :return: symbol of the key
+        """
+        return key.rsplit("_", 1)[0]
+
+    def __match_ticker_finnhub_id(
+        self,
+    ) -> typing.Dict[str, typing.List[typing.Tuple[str, datetime, datetime]]]:
+        """
+        :return: A dictionary with the key being the ticker + class and the value being the finnhub id and start and end dates
+        """
+
+        collection = self._db["ticker_id_meta_data"]
+
+        tickers_new = {}
+        for ticker in self.tickers:
+            query_statement_ticker = {"symbol": ticker}
+
+            tickers_all_class = list(collection.find(query_statement_ticker, {"_id": 0}))
+            count("queries_issued", 1 + len(tickers_all_class), source="mongo")
+
+            for ticker_one_class in tickers_all_class:
+                ticker = ticker_one_class["symbol"]
+                class_of_ticker = ticker_one_class["class"]
+
+                query_statement = {
+                    "symbol": ticker,
+                    "class": class_of_ticker,
+                    # "start": {"$lte": self.start},
+                    "end": {"$gte": self.end},
+                }
+
+                result = collection.find_one(query_statement, {"_id": 0})
+                try:
+                    tickers_new[result["symbol"] + "_" + result["class"]] = [
+                        (result["finnhub_id"], self.start, self.end)
+                    ]
+                except:
+                    pass
+
+        return tickers_new
+
+    def __match_ticker_finnhub_id_advance(
+        self,
+    ) -> typing.Dict[str, typing.List[typing.Tuple[str, datetime, datetime]]]:
+        """
+        #WIP: maps start date and end date to a range of date (needs the trading calendar class)
+        :return: A dictionary with the key being the ticker + class and the value being the finnhub id and start and end dates
+        """
+        pass
+
+    def get_date_range(self):
+        raw_data_dict = self.load_data()
+        tickers = raw_data_dict.keys()
+        date_range = {}
+        for one_ticker in tickers:
+            df = raw_data_dict[one_ticker]
+            listing = df.index[0]
+            delisting = df.index[-1]
+            date_range[one_ticker] = [(listing, delisting)]
+
+        return date_range
+
+
+# =============================================================================
+# Intraday Data Loader
+# =============================================================================
+
+
+class Data_Loader_Intraday(Data_Loader):
+    """
+    Data Loader for the minute bars of an IntradayStore
+    """
+
+    def __init__(
+        self,
+        datasource: str,
+        tickers: typing.List[str],
+        features: typing.List[str],
+        start: datetime,
+        end: datetime,
+    ):
+        """
+        :param datasource: root directory of the IntradayStore
+        :param tickers: symbols/tickers of the stocks you want to load
+        :param features: features you want to extract (subset of open, high, low, close, volume)
+        :param start: start date
+        :param end: end date ( result includes all bars of the ending date)
+        """
+        super().__init__(datasource, tickers, features, start, end)
+        self._store = IntradayStore(datasource)
+        self._features_list = self.return_features()
+
+    @traced()
+    def load_data(self) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :return: List of Dataframes (each df represents the minute bars of a particular stock)
+        :raise FeaturesMismatchException if feature does not exist in dataset
+        """
+        if len(self.features) == 0:
+            columns = self._features_list
+        elif set(self.features).issubset(self._features_list):
+            columns = [f for f in self._features_list if f in self.features]
+        else:
+            raise Exception(
+                "FeaturesMismatchException: Some input features not present in dataset"
+            )
+
+        end = pd.Timestamp(self.end).normalize() + pd.Timedelta(days=1)
+        data_dict = {}
+        for ticker in self.tickers:
+            with span("intraday.read"):
+                df = self._store.read(ticker, self.start, end, columns)
+            count("rows_read", len(df), source="intraday")
+            if len(df) > 0:
+                df.insert(loc=0, column="symbol", value=ticker)
+                data_dict[ticker] = df
+        return data_dict
+
+    def return_features(self) -> typing.List[str]:
+        """
+        :return: List of features found in dataset (column names)
+        """
+        return list(INTRADAY_FIELDS)
+
+
+# =============================================================================
+# Panel helpers
+# =============================================================================
+
+
+def _primary_rows(symbols: np.ndarray, classes: pd.Series = None) -> np.ndarray:
+    """
+    :param symbols: symbol of every row of a daily file
+    :param classes: share class of every row (None if the column is not loaded)
+
+    :return: boolean mask keeping one row per symbol, the common share (empty class) if there is one
+        and otherwise the first row of the symbol
+    """
+    order = np.arange(len(symbols))
+    if classes is not None:
+        has_class = classes.notna().to_numpy() & (classes.astype(str).str.strip() != "").to_numpy()
+        order = np.lexsort((order, has_class))
+    keep = np.zeros(len(symbols), dtype=bool)
+    keep[order[~pd.Index(np.asarray(symbols)[order]).duplicated(keep="first")]] = True
+    return keep
+
+
+def _projection(features: typing.List[str], features_list: typing.List[str]) -> typing.Dict[str, int]:
+    """
+    :return: projection of a mongo query on the selected features (all if none is selected)
+    :raise FeaturesMismatchException if feature does not exist in dataset
+    """
+    if len(features) == 0:
+        columns = features_list
+    else:
+        if len(set(features).intersection(set(features_list))) == len(features):
+            columns = list(set(features) | {"symbol", "datetime"})
+        else:
+            raise Exception(
+                "FeaturesMismatchException: Some input features not present in dataset"
+            )
+
+    columns_dict = {column: 1 for column in columns}
+    columns_dict["_id"] = 0
+    return columns_dict
+
+
+def _records_panel(
+    found: typing.Iterable[typing.Tuple[str, typing.List[dict]]],
+    sessions: pd.DatetimeIndex,
+    fill: str,
+    dtype,
+    loader: str,
+) -> Panel:
+    """
+    :param found: (ID, documents) pairs, several pairs may share an ID
+
+    :return: Panel of the documents of all the IDs (stacked once, the symbol is dropped in favour of the ID axis)
+    """
+    position, column, records = {}, [], []  # ID -> column, in order of first appearance
+    for key, documents in found:
+        if len(documents) == 0:
+            continue
+        column.append(np.full(len(documents), position.setdefault(key, len(position))))
+        records.extend(documents)
+    ids = list(position)
+
+    with span("align", loader=loader):
+        rows = pd.DataFrame.from_records(records)
+        dates = rows.pop("datetime") if "datetime" in rows else pd.DatetimeIndex([])
+        rows = rows.drop(columns="symbol", errors="ignore")
+        column = np.concatenate(column) if len(column) else np.zeros(0, dtype=np.int64)
+        return build_panel(sessions, ids, dates, column, dict(rows.items()), fill=fill, dtype=dtype)
+
+
+def _present_diff(values: np.ndarray, presence: np.ndarray) -> np.ndarray:
+    """
+    :return: (sessions, IDs) difference between consecutive sessions with data of every ID
+        (NaN on the first session with data and where there is no data)
+    """
+    compressed, position, _ = _compress(values, presence)
+    diff = np.empty_like(compressed)
+    diff[1:] = compressed[1:] - compressed[:-1]
+    diff[position == 0] = np.nan
+    return _expand(diff, presence)
+
+
+def _present_rolling(values: np.ndarray, presence: np.ndarray, lookback: int, function: str) -> np.ndarray:
+    """
+    :return: (sessions, IDs) rolling function over the previous lookback sessions with data of every ID
+    """
+    compressed, position, _ = _compress(values, presence)
+    result = PANEL_FUNCTIONS[function](pd.Series(compressed).rolling(lookback, min_periods=lookback), lookback)
+    result = result.to_numpy(dtype=np.float64, copy=True)
+    result[position < lookback - 1] = np.nan  # windows must not cross two IDs
+    return _expand(result, presence)
+
+
+def _compress(values: np.ndarray, presence: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :return: values with data of every ID one after the other (ID major, in session order),
+        position of every value among the rows of its ID and number of rows of every ID
+    """
+    compressed = values.T[presence.T].astype(np.float64)
+    counts = presence.sum(axis=0)
+    position = np.arange(len(compressed)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return compressed, position, counts
+
+
+def _expand(compressed: np.ndarray, presence: np.ndarray) -> np.ndarray:
+    """
+    :return: (sessions, IDs) array of the output of _compress, NaN where there is no data
+    """
+    expanded = np.full(presence.T.shape, np.nan)
+    expanded[presence.T] = compressed
+    return expanded.T
+
+
+# rolling functions of compute_panel, same values as _feature_map (pandas skewness and kurtosis
+# are the adjusted estimators, scipy.stats the biased ones)
+PANEL_FUNCTIONS = {
+    "return": lambda rolling, n: rolling.sum(),
+    "volatility": lambda rolling, n: rolling.std(ddof=0),
+    "skewness": lambda rolling, n: rolling.skew() * (n - 2) / np.sqrt(n * (n - 1)),
+    "kurtosis": lambda rolling, n: (rolling.kurt() * (n - 2) * (n - 3) / (n - 1) - 6) / (n + 1),
+}
+
+# =============================================================================
+# Lazy dependencies
+# =============================================================================
+
+
+def _mongo_client():
+    """
+    :return: client of the local mongoDB (pymongo is imported on the first call)
+    """
+    from pymongo import MongoClient
+
+    return MongoClient()
+
+
+def _feature_map() -> typing.Dict[str, typing.Callable]:
+    """
+    :return: window function of every rolling feature (scipy is imported on the first call)
+    """
+    import scipy.stats
+
+    return {
+        "return": np.sum,
+        "volatility": np.std,
+        "skewness": scipy.stats.skew,
+        "kurtosis": scipy.stats.kurtosis,
+    }
+
+
+# =============================================================================
+# Exceptions
+# =============================================================================
+
+
+class TimeInvalid(Exception):
+    pass
+
+
+class EmptyDatabase(Exception):
+    pass
+
+
+# =============================================================================
+# Test
+# =============================================================================
+
+if __name__ == "__main__":
+
+    # Test MongoDB Loader
+    data_loader_mongo = Data_Loader_mongo_V2(
+        "kaggle_US_Equity_daily",
+        [
+            "T",
+            "GS",
+            "GE",
+            "AAPL",
+            "BRK",
+            "GOLD",
+            "TLT",
+        ],
+        [],
+        datetime(1992, 1, 2),
+        datetime(2019, 12, 31),
+    )
+
+    features = data_loader_mongo.compute_features(
+        [
+            "return_volatility_20",
+            "return_skewness_20",
+            "return_kurtosis_20",
+            "adjvolume_volatility_20",
+        ]
+    )
+    for key, df in features.items():
+        df = df.reset_index().dropna()
+        print(key, df)
+        df.to_csv("data/{}.csv".format(key), index=False)
@@ -0,0 +1,313 @@
+import os
+import json
+import uuid
+import typing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library parser is used without it
+    orjson = None
+
+
+"""
+NOTE:
+Columnar store for the Kaggle/Finnhub reported financials (one JSON file per report, in
+<source>/<year>.QTR<quarter>/ directories).
+Every report is parsed once (with orjson when installed) in a process pool, and the reports of one
+source directory parsed in the same run are written together as one parquet part in long format:
+    symbol, fiscal_year, fiscal_quarter, statement (bs/cf/ic), concept, unit, value, filed_date
+(plus the report key, used to replace its rows) under <root>/year=<year>/quarter=<quarter>/,
+the partition of the source directory.
+A manifest keeps the size and modification time of every source file and the part holding its rows,
+so a re-scan only parses new or changed files; the rows of changed and deleted files are removed from
+their parts. The manifest is written after every partition, and a report that fails to parse is
+recorded with its error (it is parsed again once the file changes) instead of stopping the ingest.
+You need pyarrow (pip install pyarrow) to read and write the parquet parts.
+"""
+
+STATEMENTS = ["bs", "cf", "ic"]
+
+COLUMNS = ["symbol", "fiscal_year", "fiscal_quarter", "statement", "concept", "unit", "value", "filed_date"]
+
+# =============================================================================
+# Fundamentals Store
+# =============================================================================
+
+
+class FundamentalsStore:
+    """
+    Long-format store of reported financials partitioned by year/quarter
+    """
+
+    def __init__(self, root: str):
+        """
+        :param root: directory of the store (created if missing)
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._manifest_path = os.path.join(root, "_manifest.json")
+
+    def ingest(
+        self, source: str = "D:/ReportedFinancials", start_year: int = 2009, end_year: int = 2020, workers: int = None
+    ) -> typing.Dict[str, int]:
+        """
+        :param source: directory with the <year>.QTR<quarter> report folders
+        :param start_year: first year scanned
+        :param end_year: last year scanned (inclusive)
+        :param workers: number of worker processes (defaults to the number of CPUs)
+
+        :return: counts of parsed, failed, unchanged and removed files and of rows written
+            (the errors of the failed files are in failures())
+        """
+        manifest = self._read_manifest()
+        scanned = {}
+        jobs = {}  # (year, quarter) -> [(key, path)]
+        for year in range(start_year, end_year + 1):
+            for quarter in range(1, 5):
+                folder = os.path.join(source, f"{year}.QTR{quarter}")
+                if not os.path.isdir(folder):
+                    continue
+                for entry in os.scandir(folder):
+                    if not entry.is_file():
+                        continue
+                    key = f"{year}.QTR{quarter}/{entry.name}"
+                    stat = entry.stat()
+                    signature = [stat.st_mtime_ns, stat.st_size]
+                    scanned[key] = signature
+                    if manifest.get(key, {}).get("signature") != signature:
+                        jobs.setdefault((year, quarter), []).append((key, entry.path))
+
+        removed = [key for key in manifest if key not in scanned and key.split("/")[0] in _folders(start_year, end_year)]
+        stale = removed + [key for batch in jobs.values() for key, _ in batch if key in manifest]
+        self._drop_reports(manifest, stale)
+        for key in removed:
+            del manifest[key]
+        if len(removed) > 0:
+            self._write_manifest(manifest)
+
+        counts = {"parsed": 0, "failed": 0, "unchanged": len(scanned) - sum(len(batch) for batch in jobs.values()), "removed": len(removed), "rows": 0}
+        if len(jobs) == 0:
+            return counts
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for (year, quarter), batch in sorted(jobs.items()):
+                results = executor.map(_parse_job, [path for _, path in batch], chunksize=32)
+                part = os.path.join(self.root, f"year={year}", f"quarter={quarter}", f"part-{uuid.uuid4().hex[:12]}.parquet")
+                frames = []
+                for (key, _), (df, error) in zip(batch, results):
+                    if error is not None:
+                        manifest[key] = {"signature": scanned[key], "error": error}
+                        counts["failed"] += 1
+                        continue
+                    frames.append(df.assign(report=key))
+                    manifest[key] = {"signature": scanned[key], "part": part}
+                    counts["parsed"] += 1
+                    counts["rows"] += len(df)
+                if len(frames) > 0:
+                    _write_part(pd.concat(frames, ignore_index=True), part)
+                # checkpoint: the reports of this partition are not parsed again by the next run
+                self._write_manifest(manifest)
+        return counts
+
+    def failures(self) -> typing.Dict[str, str]:
+        """
+        :return: report key -> error of the reports that failed to parse (until the file changes)
+        """
+        return {key: entry["error"] for key, entry in self._read_manifest().items() if "error" in entry}
+
+    def partitions(self) -> typing.List[typing.Tuple[int, int]]:
+        """
+        :return: sorted (year, quarter) partitions in the store
+        """
+        output = []
+        for year_dir in os.listdir(self.root):
+            if not year_dir.startswith("year="):
+                continue
+            for quarter_dir in os.listdir(os.path.join(self.root, year_dir)):
+                if quarter_dir.startswith("quarter="):
+                    output.append((int(year_dir[5:]), int(quarter_dir[8:])))
+        return sorted(output)
+
+    def read(
+        self,
+        years: typing.List[int] = None,
+        quarters: typing.List[int] = None,
+        symbols: typing.List[str] = None,
+        statements: typing.List[str] = None,
+        concepts: typing.List[str] = None,
+        columns: typing.List[str] = None,
+    ) -> pd.DataFrame:
+        """
+        :param years: partitions years to read (if None read all)
+        :param quarters: partitions quarters to read (if None read all)
+        :param symbols: symbols to keep (if None keep all)
+        :param statements: statements to keep, subset of bs/cf/ic (if None keep all)
+        :param concepts: concepts to keep (if None keep all)
+        :param columns: columns to read (if None read all)
+
+        :return: Dataframe in long format with year and quarter partition columns
+        """
+        filters = {"symbol": symbols, "statement": statements, "concept": concepts}
+        read_columns = COLUMNS
+        if columns is not None:
+            read_columns = list(columns) + [c for c, v in filters.items() if v is not None and c not in columns]
+
+        frames = []
+        for year, quarter in self.partitions():
+            if (years is not None and year not in years) or (quarters is not None and quarter not in quarters):
+                continue
+            folder = os.path.join(self.root, f"year={year}", f"quarter={quarter}")
+            parts = [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.endswith(".parquet")]
+            if len(parts) == 0:
+                continue
+            df = pd.concat([pd.read_parquet(part, columns=read_columns) for part in parts], ignore_index=True)
+            df = _select(df, symbols, statements, concepts)
+            if columns is not None:
+                df = df[list(columns)]
+            df["year"] = year
+            df["quarter"] = quarter
+            frames.append(df)
+
+        if len(frames) == 0:
+            return pd.DataFrame(columns=(COLUMNS if columns is None else columns) + ["year", "quarter"])
+        return pd.concat(frames, ignore_index=True)
+
+    def summary(self, year: int, quarter: int) -> typing.Dict[str, typing.Dict[str, typing.Set[str]]]:
+        """
+        Same output as RepSum in "Summary of Financial Reports.py", read from the store
+
+        :return: symbol -> statement -> set of concepts
+        """
+        df = self.read([year], [quarter], columns=["symbol", "statement", "concept"])
+        summary = {}
+        for (symbol, statement), concepts in df.groupby(["symbol", "statement"])["concept"]:
+            summary.setdefault(symbol, {s: set() for s in STATEMENTS})[statement] = set(concepts)
+        return summary
+
+    def concepts(self) -> typing.Dict[str, typing.Set[str]]:
+        """
+        Same output as CollateConcepts in "Summary of Financial Reports.py", read from the store
+
+        :return: statement -> set of all concepts
+        """
+        df = self.read(columns=["statement", "concept"]).drop_duplicates()
+        return {statement: set(df.loc[df["statement"] == statement, "concept"]) for statement in STATEMENTS}
+
+    def _drop_reports(self, manifest: dict, keys: typing.List[str]):
+        """
+        Removes the rows of the reports from their parts (a part left empty is deleted)
+        """
+        by_part = {}
+        for key in keys:
+            part = manifest[key].get("part")
+            if part is not None:
+                by_part.setdefault(part, set()).add(key)
+        for part, reports in by_part.items():
+            if not os.path.exists(part):
+                continue
+            df = pd.read_parquet(part)
+            # parts written before the report column held a single report
+            keep = ~df["report"].isin(reports) if "report" in df else np.zeros(len(df), dtype=bool)
+            if keep.all():
+                continue
+            if keep.any():
+                _write_part(df[keep], part)
+            else:
+                os.remove(part)
+
+    def _read_manifest(self) -> dict:
+        if not os.path.exists(self._manifest_path):
+            return {}
+        with open(self._manifest_path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: dict):
+        temporary = self._manifest_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(manifest, f)
+        os.replace(temporary, self._manifest_path)
+
+
+# =============================================================================
+# Worker
+# =============================================================================
+
+
+def parse_report(path: str) -> pd.DataFrame:
+    """
+    :param path: path of one reported financials JSON file
+
+    :return: Dataframe of the report in long format (see COLUMNS)
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    report = orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+    data = report.get("data") or {}
+    records = {column: [] for column in ["statement", "concept", "unit", "value"]}
+    for statement in STATEMENTS:
+        for item in data.get(statement) or []:
+            records["statement"].append(statement)
+            records["concept"].append(item.get("concept"))
+            records["unit"].append(item.get("unit"))
+            records["value"].append(item.get("value"))
+
+    df = pd.DataFrame(records)
+    df["value"] = pd.to_numeric(df["value"], errors="coerce").astype(np.float64)
+    df.insert(0, "symbol", report.get("symbol"))
+    df.insert(1, "fiscal_year", report.get("year"))
+    df.insert(2, "fiscal_quarter", report.get("quarter"))
+    df["filed_date"] = pd.to_datetime(report.get("filedDate"), errors="coerce")
+    df["fiscal_year"] = df["fiscal_year"].astype("Int64")
+    df["fiscal_quarter"] = df["fiscal_quarter"].astype("Int64")
+    return df[COLUMNS]
+
+
+def _parse_job(path: str) -> typing.Tuple[pd.DataFrame, str]:
+    """
+    :param path: path of the JSON report
+
+    :return: (report in long format, None) or (None, error) if the report cannot be parsed
+    """
+    try:
+        return parse_report(path), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _write_part(df: pd.DataFrame, part: str):
+    os.makedirs(os.path.dirname(part), exist_ok=True)
+    temporary = part + ".tmp"
+    df.to_parquet(temporary, index=False)
+    os.replace(temporary, part)
+
+
+def _folders(start_year: int, end_year: int) -> typing.Set[str]:
+    return {f"{year}.QTR{quarter}" for year in range(start_year, end_year + 1) for quarter in range(1, 5)}
+
+
+def _select(df: pd.DataFrame, symbols, statements, concepts) -> pd.DataFrame:
+    if symbols is not None:
+        df = df[df["symbol"].isin(symbols)]
+    if statements is not None:
+        df = df[df["statement"].isin(statements)]
+    if concepts is not None:
+        df = df[df["concept"].isin(concepts)]
+    return df
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    store = FundamentalsStore("data/fundamentals")
+
+    # the first run parses every report, later runs only the new or changed ones
+    print(store.ingest("D:/ReportedFinancials"))
+
+    revenues = store.read(years=[2018], concepts=["us-gaap_Revenues"])
+    print(revenues.head())
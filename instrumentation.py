@@ -0,0 +1,494 @@
+import os
+import re
+import json
+import time
+import typing
+import logging
+import functools
+import threading
+import tracemalloc
+import collections
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+"""
+NOTE:
+Instrumentation of the loaders: named spans (wall time of a stage, i.e. listing the directory, parsing
+a csv, a Mongo round trip, appending rows, casting dtypes, rolling features), counters (rows read,
+bytes read, queries issued, cache hits, ...) and peak memory while a span is open.
+Nothing is recorded until enable() is called: span() then returns a shared no-op context manager and
+count() returns immediately, so the hooks left in the loaders cost a function call each.
+Finished spans are sent to the sinks as they close; flush() (and disable()) sends the aggregated
+report (calls, total and max seconds, peak bytes per span, and the counter totals) to every sink.
+    LogSink         one JSON line per span and per report through the logging module
+    MemorySink      keeps the spans in memory, report() / counters() return Dataframes
+    PrometheusSink  writes the report in the Prometheus text format (for the node_exporter textfile collector)
+Peak memory is sampled by a background thread every `interval` seconds and when spans open or close:
+    "rss"           resident set size of the process (psutil, or /proc/self/statm on Linux)
+    "tracemalloc"   memory allocated through Python (numpy and pandas buffers included), exact high-water
+                    mark between two samples but slows the allocations down while enabled
+"""
+
+_recorder = None
+
+# =============================================================================
+# Spans and Counters
+# =============================================================================
+
+
+class _NullSpan:
+    """
+    Span returned while instrumentation is disabled
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """
+    Span of a running Recorder
+    """
+
+    __slots__ = ("recorder", "name", "labels", "parent", "started", "wall", "peak")
+
+    def __init__(self, recorder: "Recorder", name: str, labels: typing.Dict[str, str]):
+        self.recorder = recorder
+        self.name = name
+        self.labels = labels
+        self.peak = None
+
+    def __enter__(self):
+        self.parent = self.recorder._open(self)
+        self.wall = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        seconds = time.perf_counter() - self.started
+        self.recorder._close(self, seconds, None if exc_type is None else exc_type.__name__)
+        return False
+
+
+def span(name: str, **labels) -> typing.ContextManager:
+    """
+    :param name: name of the stage (i.e. "csv.read_csv")
+    :param labels: labels of the span (i.e. loader="Data_Loader_CSV"), spans are aggregated per name and labels
+
+    :return: context manager timing the block (a shared no-op when instrumentation is disabled)
+    """
+    recorder = _recorder
+    if recorder is None:
+        return _NULL_SPAN
+    return _Span(recorder, name, labels)
+
+
+def count(name: str, value: float = 1, **labels):
+    """
+    :param name: name of the counter (i.e. "rows_read")
+    :param value: increment
+    :param labels: labels of the counter (i.e. source="mongo"), counters are summed per name and labels
+    """
+    recorder = _recorder
+    if recorder is None:
+        return
+    recorder.count(name, value, labels)
+
+
+def traced(name: str = None, **labels) -> typing.Callable:
+    """
+    Decorator timing every call of a function as a span
+
+    :param name: name of the span (if None the qualified name of the function)
+    :param labels: labels of the span
+    """
+
+    def decorator(function):
+        span_name = function.__qualname__ if name is None else name
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder
+            if recorder is None:
+                return function(*args, **kwargs)
+            with _Span(recorder, span_name, labels):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def enabled() -> bool:
+    """
+    :return: True if a Recorder is running
+    """
+    return _recorder is not None
+
+
+# =============================================================================
+# Recorder
+# =============================================================================
+
+
+class Recorder:
+    """
+    Aggregates the spans and counters and forwards them to the sinks (created by enable)
+    """
+
+    def __init__(self, sinks: typing.List["Sink"], memory: str = None, interval: float = 0.01):
+        """
+        :param sinks: sinks receiving the spans and the reports
+        :param memory: peak memory sampling, "rss", "tracemalloc" or None (no sampling)
+        :param interval: seconds between two memory samples of the background thread
+        """
+        if memory not in (None, "rss", "tracemalloc"):
+            raise ValueError(f"unknown memory sampling {memory}, use 'rss', 'tracemalloc' or None")
+        if memory == "rss" and _rss() is None:
+            raise ValueError("rss sampling needs psutil or /proc/self/statm, use memory='tracemalloc'")
+        self.sinks = list(sinks)
+        self.memory = memory
+        self.interval = interval
+        self.peak = None
+        self._spans = {}
+        self._counters = collections.defaultdict(float)
+        self._active = set()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        if self.memory == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self.memory is not None:
+            self._sampler = threading.Thread(target=self._sample_loop, name="instrumentation-sampler", daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+    def count(self, name: str, value: float, labels: typing.Dict[str, str]):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def report(self) -> typing.Dict[str, typing.List[dict]]:
+        """
+        :return: {"spans": [{name, labels, calls, errors, seconds, max_seconds, peak_bytes}],
+            "counters": [{name, labels, value}], "peak_bytes": peak of the process}
+        """
+        with self._lock:
+            spans = [
+                dict(name=name, labels=dict(labels), **stats) for (name, labels), stats in sorted(self._spans.items())
+            ]
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+        return {"spans": spans, "counters": counters, "peak_bytes": self.peak}
+
+    def flush(self):
+        report = self.report()
+        for sink in self.sinks:
+            sink.flush(report)
+
+    def _open(self, span: _Span) -> str:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        parent = stack[-1].name if stack else None
+        stack.append(span)
+        if self.memory is not None:
+            with self._lock:
+                self._active.add(span)
+            self._sample()
+        return parent
+
+    def _close(self, span: _Span, seconds: float, error: str):
+        self._local.stack.pop()
+        if self.memory is not None:
+            self._sample()
+            with self._lock:
+                self._active.discard(span)
+
+        key = (span.name, tuple(sorted(span.labels.items())))
+        with self._lock:
+            stats = self._spans.get(key)
+            if stats is None:
+                stats = self._spans[key] = {"calls": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "peak_bytes": None}
+            stats["calls"] += 1
+            stats["errors"] += error is not None
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            if span.peak is not None:
+                stats["peak_bytes"] = max(stats["peak_bytes"] or 0, span.peak)
+
+        record = {
+            "span": span.name,
+            "labels": span.labels,
+            "parent": span.parent,
+            "thread": threading.current_thread().name,
+            "start": span.wall,
+            "seconds": seconds,
+            "peak_bytes": span.peak,
+            "error": error,
+        }
+        for sink in self.sinks:
+            sink.emit(record)
+
+    def _sample(self):
+        """
+        Reads the memory used since the last sample and raises the peak of every open span
+        """
+        if self.memory == "rss":
+            used = _rss()
+        else:
+            used = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        with self._lock:
+            self.peak = used if self.peak is None else max(self.peak, used)
+            for span in self._active:
+                span.peak = used if span.peak is None else max(span.peak, used)
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+
+def _rss() -> int:
+    """
+    :return: resident set size of the process in bytes (None if it cannot be read)
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def enable(*sinks: "Sink", memory: str = None, interval: float = 0.01) -> Recorder:
+    """
+    Starts recording (replaces the running Recorder, which is flushed)
+
+    :param sinks: sinks receiving the spans and the reports
+    :param memory: peak memory sampling, "rss", "tracemalloc" or None (no sampling)
+    :param interval: seconds between two memory samples of the background thread
+
+    :return: the running Recorder
+    """
+    global _recorder
+    recorder = Recorder(sinks, memory, interval)
+    disable()
+    recorder.start()
+    _recorder = recorder
+    return recorder
+
+
+def disable() -> typing.Dict[str, typing.List[dict]]:
+    """
+    Stops recording and flushes the sinks
+
+    :return: last report of the Recorder (None if instrumentation was not enabled)
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is None:
+        return None
+    recorder.stop()
+    recorder.flush()
+    return recorder.report()
+
+
+def flush():
+    """
+    Sends the current report to the sinks (the totals keep accumulating)
+    """
+    recorder = _recorder
+    if recorder is not None:
+        recorder.flush()
+
+
+# =============================================================================
+# Sinks
+# =============================================================================
+
+
+class Sink:
+    """
+    Receives the finished spans (emit) and the aggregated reports (flush)
+    """
+
+    def emit(self, record: dict):
+        pass
+
+    def flush(self, report: dict):
+        pass
+
+
+class LogSink(Sink):
+    """
+    Structured log: one JSON line per span and per report
+    """
+
+    def __init__(self, logger: typing.Union[str, logging.Logger] = "data_infrastructure", level: int = logging.INFO, spans: bool = True):
+        """
+        :param logger: logger (or its name) the lines are written to
+        :param level: level of the lines
+        :param spans: if False only the reports are logged
+        """
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        self.level = level
+        self.spans = spans
+
+    def emit(self, record: dict):
+        if self.spans:
+            self.logger.log(self.level, json.dumps({"event": "span", **record}, default=str))
+
+    def flush(self, report: dict):
+        self.logger.log(self.level, json.dumps({"event": "report", **report}, default=str))
+
+
+class MemorySink(Sink):
+    """
+    In-memory report (i.e. for notebooks and tests)
+    """
+
+    def __init__(self, max_spans: int = 100000):
+        """
+        :param max_spans: number of spans kept (the oldest are dropped)
+        """
+        self.spans = collections.deque(maxlen=max_spans)
+        self.last_report = None
+
+    def emit(self, record: dict):
+        self.spans.append(record)
+
+    def flush(self, report: dict):
+        self.last_report = report
+
+    def report(self) -> pd.DataFrame:
+        """
+        :return: Dataframe indexed by span name (calls, errors, seconds, mean_seconds, max_seconds, peak_bytes)
+            of the kept spans, sorted by total seconds
+        """
+        columns = ["calls", "errors", "seconds", "mean_seconds", "max_seconds", "peak_bytes"]
+        if len(self.spans) == 0:
+            return pd.DataFrame(columns=columns, index=pd.Index([], name="span"))
+        df = pd.DataFrame(list(self.spans))
+        df["failed"] = df["error"].notna()
+        df["peak_bytes"] = df["peak_bytes"].astype(float)
+        report = df.groupby("span").agg(
+            calls=("seconds", "size"),
+            errors=("failed", "sum"),
+            seconds=("seconds", "sum"),
+            mean_seconds=("seconds", "mean"),
+            max_seconds=("seconds", "max"),
+            peak_bytes=("peak_bytes", "max"),
+        )
+        return report.sort_values("seconds", ascending=False)[columns]
+
+    def counters(self) -> pd.DataFrame:
+        """
+        :return: Dataframe of the counters of the last flushed report (name, labels, value)
+        """
+        counters = [] if self.last_report is None else self.last_report["counters"]
+        df = pd.DataFrame(counters, columns=["name", "labels", "value"])
+        df["labels"] = df["labels"].apply(lambda labels: ",".join(f"{k}={v}" for k, v in labels.items()))
+        return df
+
+
+class PrometheusSink(Sink):
+    """
+    Prometheus text exposition file, rewritten atomically on every flush
+    """
+
+    def __init__(self, path: str, prefix: str = "data_infrastructure"):
+        """
+        :param path: file written (i.e. <textfile collector directory>/data_infrastructure.prom)
+        :param prefix: prefix of the metric names
+        """
+        self.path = path
+        self.prefix = prefix
+
+    def flush(self, report: dict):
+        metrics = collections.defaultdict(list)
+        for stats in report["spans"]:
+            labels = {"span": stats["name"], **stats["labels"]}
+            metrics[("span_calls_total", "counter")].append((labels, stats["calls"]))
+            metrics[("span_errors_total", "counter")].append((labels, stats["errors"]))
+            metrics[("span_seconds_total", "counter")].append((labels, stats["seconds"]))
+            metrics[("span_max_seconds", "gauge")].append((labels, stats["max_seconds"]))
+            if stats["peak_bytes"] is not None:
+                metrics[("span_peak_bytes", "gauge")].append((labels, stats["peak_bytes"]))
+        for counter in report["counters"]:
+            metrics[(_metric_name(counter["name"]) + "_total", "counter")].append((counter["labels"], counter["value"]))
+        if report["peak_bytes"] is not None:
+            metrics[("peak_bytes", "gauge")].append(({}, report["peak_bytes"]))
+
+        lines = []
+        for (name, kind), samples in metrics.items():
+            lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{self.prefix}_{name}{_format_labels(labels)} {float(value):.17g}")
+
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temporary, self.path)
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _format_labels(labels: typing.Dict[str, str]) -> str:
+    if len(labels) == 0:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{_metric_name(key)}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    from datetime import datetime
+    from dataloader import Data_Loader_CSV
+
+    logging.basicConfig(level=logging.INFO)
+    memory_sink = MemorySink()
+    enable(memory_sink, LogSink(spans=False), PrometheusSink("data_infrastructure.prom"), memory="rss")
+
+    loader = Data_Loader_CSV("data/kaggle", ["AAPL", "MSFT", "GS"], [], datetime(2020, 1, 2), datetime(2020, 6, 30))
+    loader.compute_features(["volatility_20", "skewness_20"])
+
+    disable()
+    print(memory_sink.report())
+    print(memory_sink.counters())
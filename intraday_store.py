@@ -0,0 +1,232 @@
+import io
+import os
+import typing
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+
+"""
+NOTE:
+Append-only store of intraday (minute) bars.
+Every symbol has one binary file per month, <root>/<SYMBOL>/<YYYYMM>.bars, laid out column by column:
+    header     int64[2]   format version, number of rows
+    day index  int64[32]  offset of the first row of every day of the month (entry d for day d + 1,
+                          the last entry is the number of rows), so a day is found without a search
+    time       int64[n]   timestamps in ns (exchange local time), sorted and unique
+    open, high, low, close, volume   float32[n] each
+Reads memory-map the files and only copy the rows of the requested range.
+New bars are merged into the month files: rows are deduplicated on the timestamp and the newest
+slice wins when slices overlap. Files are rewritten to a temporary file and swapped with os.replace,
+so readers never see a partly written month.
+"""
+
+FIELDS = ["open", "high", "low", "close", "volume"]
+
+VERSION = 1
+
+HEADER_SIZE = 2 + 32  # int64 words before the time column
+
+# =============================================================================
+# Intraday Store
+# =============================================================================
+
+
+class IntradayStore:
+    """
+    Per-symbol, per-month columnar minute bars
+    """
+
+    def __init__(self, root: str):
+        """
+        :param root: directory of the store (created if missing)
+        """
+        self.root = root
+        self._lock = threading.Lock()  # the sink is called from several download threads
+        os.makedirs(root, exist_ok=True)
+
+    def append(self, symbol: str, bars: pd.DataFrame) -> int:
+        """
+        :param symbol: ticker
+        :param bars: Dataframe indexed by datetime with the FIELDS columns
+
+        :return: number of rows added (rows replacing an existing timestamp are not counted)
+        """
+        if len(bars) == 0:
+            return 0
+        times = pd.DatetimeIndex(bars.index).values.astype("datetime64[ns]").astype(np.int64)
+        values = bars[FIELDS].to_numpy(dtype=np.float32)
+        months = times.astype("datetime64[ns]").astype("datetime64[M]")
+
+        added = 0
+        with self._lock:
+            for month in np.unique(months):
+                rows = months == month
+                added += self._merge_month(symbol, month, times[rows], values[rows])
+        return added
+
+    def ingest_csv(self, symbol: str, source: typing.Union[str, io.TextIOBase]) -> int:
+        """
+        :param symbol: ticker
+        :param source: path or text buffer of an Alpha Vantage csv slice (time, open, high, low, close, volume)
+
+        :return: number of rows added
+        """
+        df = pd.read_csv(source)
+        if "time" not in df.columns:
+            raise Exception(f"FormatException: {symbol} slice has no time column (columns: {list(df.columns)})")
+        df.index = pd.to_datetime(df.pop("time"))
+        return self.append(symbol, df)
+
+    def sink(self) -> typing.Callable[[str, str, str], int]:
+        """
+        :return: sink for AlphaVantageScheduler, every downloaded slice is merged into the store
+        """
+
+        def sink(symbol: str, s_slice: str, text: str) -> int:
+            return self.ingest_csv(symbol, io.StringIO(text))
+
+        return sink
+
+    def symbols(self) -> typing.List[str]:
+        """
+        :return: symbols in the store
+        """
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def months(self, symbol: str) -> typing.List[str]:
+        """
+        :return: sorted months (YYYYMM) stored for the symbol
+        """
+        folder = os.path.join(self.root, symbol)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(name[:6] for name in os.listdir(folder) if name.endswith(".bars"))
+
+    def day(self, symbol: str, date: datetime) -> pd.DataFrame:
+        """
+        :param symbol: ticker
+        :param date: day
+
+        :return: bars of that day (read through the day index, without searching the timestamps)
+        """
+        date = pd.Timestamp(date)
+        month = self._open(symbol, date.strftime("%Y%m"))
+        if month is None:
+            return _frame(np.array([], dtype=np.int64), {field: np.array([], dtype=np.float32) for field in FIELDS})
+        day_index, times, columns = month
+        lo, hi = day_index[date.day - 1], day_index[date.day]
+        return _frame(times[lo:hi], {field: column[lo:hi] for field, column in columns.items()})
+
+    def read(
+        self, symbol: str, start: datetime, end: datetime, fields: typing.List[str] = None
+    ) -> pd.DataFrame:
+        """
+        :param symbol: ticker
+        :param start: first timestamp (inclusive)
+        :param end: last timestamp (exclusive)
+        :param fields: columns returned (if None all FIELDS)
+
+        :return: Dataframe of the bars indexed by datetime
+        """
+        fields = FIELDS if fields is None else fields
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        start_ns, end_ns = start.value, end.value
+
+        times_parts, column_parts = [], {field: [] for field in fields}
+        for name in self.months(symbol):
+            month_start = pd.Timestamp(f"{name[:4]}-{name[4:]}-01")
+            if month_start >= end or month_start + pd.offsets.MonthBegin(1) <= start:
+                continue
+            day_index, times, columns = self._open(symbol, name)
+            # narrow to the days of the range with the day index, then search inside those days
+            lo_day = start.day - 1 if month_start <= start else 0
+            hi_day = end.day if month_start.month == end.month and month_start.year == end.year else 31
+            lo, hi = day_index[lo_day], day_index[hi_day]
+            lo += int(np.searchsorted(times[lo:hi], start_ns, side="left"))
+            hi = lo + int(np.searchsorted(times[lo:hi], end_ns, side="left"))
+            times_parts.append(np.array(times[lo:hi]))
+            for field in fields:
+                column_parts[field].append(np.array(columns[field][lo:hi]))
+
+        if len(times_parts) == 0:
+            return _frame(np.array([], dtype=np.int64), {field: np.array([], dtype=np.float32) for field in fields})
+        return _frame(np.concatenate(times_parts), {field: np.concatenate(column_parts[field]) for field in fields})
+
+    def _path(self, symbol: str, month: str) -> str:
+        return os.path.join(self.root, symbol, f"{month}.bars")
+
+    def _open(self, symbol: str, month: str):
+        """
+        :return: (day index, times, {field: column}) memory-mapped views of a month file (None if missing)
+        """
+        path = self._path(symbol, month)
+        if not os.path.exists(path):
+            return None
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+        header = raw[: HEADER_SIZE * 8].view(np.int64)
+        if header[0] != VERSION:
+            raise Exception(f"FormatException: {path} has version {header[0]}, expected {VERSION}")
+        n = int(header[1])
+        day_index = np.array(header[2:])
+        offset = HEADER_SIZE * 8
+        times = raw[offset : offset + n * 8].view(np.int64)
+        offset += n * 8
+        columns = {}
+        for field in FIELDS:
+            columns[field] = raw[offset : offset + n * 4].view(np.float32)
+            offset += n * 4
+        return day_index, times, columns
+
+    def _merge_month(self, symbol: str, month: np.datetime64, times: np.ndarray, values: np.ndarray) -> int:
+        name = str(month).replace("-", "")
+        existing = self._open(symbol, name)
+        n_before = 0
+        if existing is not None:
+            _, old_times, old_columns = existing
+            n_before = len(old_times)
+            times = np.concatenate((np.array(old_times), times))
+            values = np.vstack((np.column_stack([np.array(old_columns[field]) for field in FIELDS]), values))
+            del existing, old_times, old_columns  # release the memory maps before the file is replaced
+
+        # stable sort keeps the new rows after the old ones, the last row of every timestamp wins
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+        last = np.ones(len(times), dtype=bool)
+        last[:-1] = times[1:] != times[:-1]
+        times, values = times[last], values[last]
+
+        day_of_month = (times.astype("datetime64[ns]").astype("datetime64[D]") - month.astype("datetime64[D]")).astype(np.int64)
+        day_index = np.searchsorted(day_of_month, np.arange(32), side="left").astype(np.int64)
+
+        path = self._path(symbol, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            np.array([VERSION, len(times)], dtype=np.int64).tofile(f)
+            day_index.tofile(f)
+            times.astype(np.int64).tofile(f)
+            for k in range(len(FIELDS)):
+                np.ascontiguousarray(values[:, k], dtype=np.float32).tofile(f)
+        os.replace(path + ".tmp", path)
+        return len(times) - n_before
+
+
+def _frame(times: np.ndarray, columns: typing.Dict[str, np.ndarray]) -> pd.DataFrame:
+    return pd.DataFrame(columns, index=pd.DatetimeIndex(times.astype("datetime64[ns]"), name="datetime"))
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    store = IntradayStore("data/intraday")
+
+    # slices downloaded by AlphaVantageIntraMinuteCSVDownloader.py
+    for s_slice in ["year1month1", "year1month2"]:
+        print(store.ingest_csv("AAPL", f"data/alphavantage/AAPL_{s_slice}.csv"))
+
+    print(store.read("AAPL", datetime(2020, 11, 2, 9, 30), datetime(2020, 11, 2, 16, 0)).head())
+    print(store.day("AAPL", datetime(2020, 11, 3)).tail())
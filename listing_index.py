@@ -0,0 +1,199 @@
+import os
+import typing
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from alignment import Panel
+
+
+"""
+NOTE:
+Listing and delisting index for the whole universe.
+The daily snapshots are scanned once (only the ID column is parsed) into a presence bitmap of
+shape (IDs, dates), packed 8 dates per byte. Listing, delisting and relisting events of every ID
+are derived from that bitmap, and "is ID listed on date d" is a single bit lookup.
+"""
+
+# =============================================================================
+# Listing Index
+# =============================================================================
+
+
+class ListingIndex:
+    """
+    Compressed presence bitmap by ID and date
+    """
+
+    def __init__(self, ids: typing.List[str], dates: np.ndarray, bitmap: np.ndarray):
+        """
+        :param ids: finnhub IDs (or symbols) of the rows of the bitmap
+        :param dates: sorted dates of the snapshots (columns of the bitmap)
+        :param bitmap: uint8 array of shape (IDs, ceil(dates / 8)), packed with np.packbits along the dates
+        """
+        self.ids = pd.Index(ids)
+        self.dates = pd.DatetimeIndex(np.asarray(dates, dtype="datetime64[D]"))
+        self.bitmap = bitmap
+        self._id_code = {ticker: i for i, ticker in enumerate(self.ids)}
+        self._date_ordinal = {day: i for i, day in enumerate(self._days())}
+        self._events = None
+
+    @classmethod
+    def from_csv(cls, data_directory: str, id_column: str = "finnhub_id") -> "ListingIndex":
+        """
+        :param data_directory: path of directory with one csv per day (YYYYMMDD.csv)
+        :param id_column: column identifying a security ("finnhub_id" or "symbol")
+
+        :return: index built in one pass over the daily files
+        """
+        file_names = sorted(name for name in os.listdir(data_directory) if name.endswith(".csv"))
+        dates = [datetime.strptime(name[:-4], "%Y%m%d") for name in file_names]
+
+        ids_per_day = []
+        for name in file_names:
+            ids_per_day.append(
+                pd.read_csv(os.path.join(data_directory, name), usecols=[id_column], dtype=str)[id_column]
+                .dropna()
+                .to_numpy()
+            )
+
+        all_ids = np.concatenate(ids_per_day) if ids_per_day else np.array([], dtype=object)
+        date_of_row = np.repeat(np.arange(len(file_names)), [len(ids) for ids in ids_per_day])
+        codes, ids = pd.factorize(all_ids)
+        presence = np.zeros((len(ids), len(file_names)), dtype=bool)
+        presence[codes, date_of_row] = True
+        return cls(ids, np.array(dates, dtype="datetime64[D]"), np.packbits(presence, axis=1))
+
+    @classmethod
+    def from_panel(cls, panel: Panel) -> "ListingIndex":
+        """
+        :param panel: aligned Panel (the presence matrix is used)
+
+        :return: index over the sessions and IDs of the panel
+        """
+        return cls(panel.ids, panel.sessions.values, np.packbits(panel.presence.T, axis=1))
+
+    @classmethod
+    def load(cls, path: str) -> "ListingIndex":
+        """
+        :param path: file written with save
+
+        :return: index read from disk
+        """
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["ids"].tolist(), data["dates"], data["bitmap"])
+
+    def save(self, path: str):
+        """
+        :param path: .npz file the index is written to
+        """
+        np.savez_compressed(
+            path,
+            ids=np.asarray(self.ids, dtype=str),  # fixed-width unicode, loaded without pickle
+            dates=self.dates.values.astype("datetime64[D]"),
+            bitmap=self.bitmap,
+        )
+
+    def is_listed(self, ticker: str, date: datetime) -> bool:
+        """
+        :param ticker: ID of the security
+        :param date: snapshot date
+
+        :return: whether the ID is in the snapshot of that date
+        """
+        code = self._id_code.get(ticker)
+        ordinal = self._date_ordinal.get(_to_day(date))
+        if code is None or ordinal is None:
+            return False
+        return bool((self.bitmap[code, ordinal >> 3] >> (7 - (ordinal & 7))) & 1)
+
+    def listed_on(self, date: datetime) -> pd.Index:
+        """
+        :param date: snapshot date
+
+        :return: IDs listed on that date
+        """
+        return self.ids[self._column(date)]
+
+    def changes_between(self, day1: datetime, day2: datetime) -> typing.Tuple[pd.Index, pd.Index]:
+        """
+        :param day1: first snapshot date
+        :param day2: second snapshot date
+
+        :return: (delisted IDs, listed IDs), same output as ListingUpdate(day1, day2)
+        """
+        present1 = self._column(day1)
+        present2 = self._column(day2)
+        return self.ids[present1 & ~present2], self.ids[present2 & ~present1]
+
+    def events(self) -> pd.DataFrame:
+        """
+        :return: Dataframe of all listing, delisting and relisting events (columns: id, date, event)
+            a delisting is dated on the last snapshot the ID appears in, IDs in the last snapshot have no delisting
+        """
+        if self._events is None:
+            self._events = self._build_events()
+        return self._events
+
+    def listing_intervals(self) -> pd.DataFrame:
+        """
+        :return: Dataframe with the first and the last snapshot date of every ID
+        """
+        presence = self._presence()
+        first = presence.argmax(axis=1)
+        last = presence.shape[1] - 1 - presence[:, ::-1].argmax(axis=1)
+        return pd.DataFrame({"start": self.dates[first], "end": self.dates[last]}, index=self.ids)
+
+    def _build_events(self) -> pd.DataFrame:
+        presence = self._presence().astype(np.int8)
+        padded = np.zeros((presence.shape[0], presence.shape[1] + 2), dtype=np.int8)
+        padded[:, 1:-1] = presence
+        change = np.diff(padded, axis=1)
+        start_id, start_date = np.nonzero(change == 1)
+        end_id, end_date = np.nonzero(change == -1)
+        # IDs still present in the last snapshot are not delisted
+        still_listed = end_date == presence.shape[1]
+        end_id, end_date = end_id[~still_listed], end_date[~still_listed]
+        # a start that is not the first one of an ID is a relisting
+        relisting = np.zeros(len(start_id), dtype=bool)
+        relisting[1:] = start_id[1:] == start_id[:-1]
+
+        events = pd.DataFrame(
+            {
+                "id": np.concatenate((self.ids[start_id], self.ids[end_id])),
+                "date": np.concatenate((self.dates[start_date], self.dates[end_date - 1])),
+                "event": np.concatenate(
+                    (np.where(relisting, "relisting", "listing"), np.full(len(end_id), "delisting"))
+                ),
+            }
+        )
+        return events.sort_values(["date", "id"], kind="mergesort").reset_index(drop=True)
+
+    def _presence(self) -> np.ndarray:
+        return np.unpackbits(self.bitmap, axis=1, count=len(self.dates)).astype(bool)
+
+    def _column(self, date: datetime) -> np.ndarray:
+        ordinal = self._date_ordinal.get(_to_day(date))
+        if ordinal is None:
+            raise Exception(f"DateNoInvalidException: {pd.Timestamp(date).date()} is not in the index")
+        return ((self.bitmap[:, ordinal >> 3] >> (7 - (ordinal & 7))) & 1).astype(bool)
+
+    def _days(self) -> np.ndarray:
+        return self.dates.values.astype("datetime64[D]").astype(np.int64)
+
+
+def _to_day(date) -> int:
+    return int(np.datetime64(pd.Timestamp(date).date(), "D").astype(np.int64))
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    index = ListingIndex.from_csv("../data/kaggle_us_eod")
+    index.save("data/listing_index.npz")
+
+    print(index.events())
+    print(index.changes_between(datetime(1992, 6, 15), datetime(1992, 6, 19)))
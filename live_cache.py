@@ -0,0 +1,385 @@
+import json
+import time
+import typing
+import asyncio
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+
+try:
+    import websockets
+except ImportError:  # only needed by LiveCacheService.consume and replay_server
+    websockets = None
+
+from intraday_store import IntradayStore
+from bar_aggregator import BarAggregator, BAR_FIELDS as AGGREGATOR_FIELDS
+
+
+"""
+NOTE:
+Cache of live market data for Stage 2 (websocket feeds).
+Every finnhub ID has a fixed-size ring buffer of its latest ticks and of its latest minute bars.
+All buffers live in one preallocated shared memory block, column by column (one (IDs x capacity)
+array per field) followed by the write counter and the sequence number of every ID, so model processes
+attach to the cache by name and read snapshots without copying through the ingest process.
+Writes are vectorized over a batch of messages; nothing is allocated per message in the buffers.
+Every ID is guarded by a seqlock: the writer makes the sequence number odd before writing the rows of
+the ID and even again once the rows and the counter are written. A reader copies the last n rows and
+retries while the sequence number is odd or has changed during the copy.
+The ingest service consumes a Finnhub-style websocket feed:
+    {"type": "trade", "data": [{"s": symbol, "p": price, "v": volume, "t": time in ms}, ...]}
+    {"type": "quote", "data": [{"s": symbol, "b": bid, "a": ask, "t": time in ms}, ...]}
+and aggregates the ticks into minute bars with the BarAggregator; closed bars go to the bar buffers
+and are periodically flushed to the IntradayStore.
+Tick times are epoch ms (UTC), the cache and the aggregator keep them in UTC ns; the bars are
+converted to naive exchange local time (EXCHANGE_TIMEZONE) when flushed, as the IntradayStore
+holds local time like the Alpha Vantage slices.
+You need websockets (pip install websockets) for the feed and the replay server.
+"""
+
+TICK_FIELDS = {"time": np.int64, "price": np.float64, "volume": np.float64, "bid": np.float64, "ask": np.float64}
+
+BAR_FIELDS = {"time": np.int64, **{field: np.float64 for field in AGGREGATOR_FIELDS}}
+
+# time zone of the timestamps in the IntradayStore
+EXCHANGE_TIMEZONE = "America/New_York"
+
+# =============================================================================
+# Shared Ring Buffers
+# =============================================================================
+
+
+class RingBuffers:
+    """
+    One ring buffer per ID in a shared memory block
+    """
+
+    def __init__(
+        self,
+        name: str,
+        n_ids: int,
+        capacity: int,
+        fields: typing.Dict[str, type],
+        create: bool = True,
+    ):
+        """
+        :param name: name of the shared memory block
+        :param n_ids: number of ring buffers
+        :param capacity: rows kept per ring buffer
+        :param fields: name -> dtype of the columns
+        :param create: create the block (ingest process) or attach to an existing one (readers)
+        """
+        self.name = name
+        self.n_ids = n_ids
+        self.capacity = capacity
+        self.fields = dict(fields)
+        size = sum(np.dtype(dtype).itemsize for dtype in self.fields.values()) * n_ids * capacity + 16 * n_ids
+        if create:
+            self._memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+
+        offset = 0
+        self.columns = {}
+        for field, dtype in self.fields.items():
+            self.columns[field] = np.ndarray((n_ids, capacity), dtype=dtype, buffer=self._memory.buf, offset=offset)
+            offset += np.dtype(dtype).itemsize * n_ids * capacity
+        # total number of rows ever written to every ring buffer
+        self.counts = np.ndarray((n_ids,), dtype=np.int64, buffer=self._memory.buf, offset=offset)
+        # seqlock of every ring buffer, odd while the writer is updating it
+        self.sequences = np.ndarray((n_ids,), dtype=np.int64, buffer=self._memory.buf, offset=offset + 8 * n_ids)
+        if create:
+            self.counts[:] = 0
+            self.sequences[:] = 0
+
+    def append(self, codes: np.ndarray, columns: typing.Dict[str, np.ndarray]):
+        """
+        :param codes: ring buffer of every row (rows of the same code must be in time order)
+        :param columns: field -> values of the rows
+        """
+        if len(codes) == 0:
+            return
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        first = np.ones(len(codes), dtype=bool)
+        first[1:] = codes[1:] != codes[:-1]
+        run_start = np.flatnonzero(first)
+        # rank of every row within its code, added to the count of the code
+        rank = np.arange(len(codes)) - np.repeat(run_start, np.diff(np.append(run_start, len(codes))))
+        positions = (self.counts[codes] + rank) % self.capacity
+        written = codes[run_start]
+        self.sequences[written] += 1  # odd: readers of these IDs retry
+        for field, column in self.columns.items():
+            column[codes, positions] = np.asarray(columns[field])[order]
+        self.counts[written] += np.diff(np.append(run_start, len(codes)))
+        self.sequences[written] += 1
+
+    def snapshot(self, code: int, n: int = None) -> typing.Dict[str, np.ndarray]:
+        """
+        :param code: ring buffer read
+        :param n: number of latest rows (if None the whole buffer)
+
+        :return: field -> copy of the latest rows, oldest first
+        """
+        n = self.capacity if n is None else min(n, self.capacity)
+        while True:
+            sequence = int(self.sequences[code])
+            if sequence % 2 == 1:
+                time.sleep(0)  # the writer is updating this buffer
+                continue
+            count = int(self.counts[code])
+            rows = min(n, count)
+            positions = np.arange(count - rows, count) % self.capacity
+            output = {field: column[code, positions] for field, column in self.columns.items()}
+            # retry if the writer started updating the buffer during the copy
+            if int(self.sequences[code]) == sequence:
+                return output
+
+    def close(self):
+        # the views must be released before the memory is unmapped
+        self.columns, self.counts, self.sequences = {}, None, None
+        self._memory.close()
+
+    def unlink(self):
+        self._memory.unlink()
+
+
+# =============================================================================
+# Live Cache
+# =============================================================================
+
+
+class LiveCache:
+    """
+    Latest ticks and minute bars of every finnhub ID in shared memory
+    """
+
+    def __init__(self, ids: typing.List[str], tick_capacity: int = 4096, bar_capacity: int = 1024, name: str = "live_cache", create: bool = True):
+        """
+        :param ids: finnhub IDs cached (same list in the ingest process and in the readers)
+        :param tick_capacity: ticks kept per ID
+        :param bar_capacity: minute bars kept per ID
+        :param name: prefix of the shared memory blocks
+        :param create: create the cache (ingest process) or attach to it (readers)
+        """
+        self.ids = list(ids)
+        self._code = {finnhub_id: i for i, finnhub_id in enumerate(self.ids)}
+        self.ticks = RingBuffers(f"{name}_ticks", len(self.ids), tick_capacity, TICK_FIELDS, create)
+        self.bars = RingBuffers(f"{name}_bars", len(self.ids), bar_capacity, BAR_FIELDS, create)
+
+    @classmethod
+    def attach(cls, ids: typing.List[str], tick_capacity: int = 4096, bar_capacity: int = 1024, name: str = "live_cache") -> "LiveCache":
+        """
+        :return: cache created by another process (same ids, capacities and name)
+        """
+        return cls(ids, tick_capacity, bar_capacity, name, create=False)
+
+    def code(self, finnhub_id: str) -> int:
+        return self._code[finnhub_id]
+
+    def latest_ticks(self, finnhub_id: str, n: int = None) -> pd.DataFrame:
+        """
+        :return: latest n ticks of the ID, indexed by datetime
+        """
+        return _frame(self.ticks.snapshot(self._code[finnhub_id], n))
+
+    def latest_bars(self, finnhub_id: str, n: int = None) -> pd.DataFrame:
+        """
+        :return: latest n minute bars of the ID, indexed by datetime
+        """
+        return _frame(self.bars.snapshot(self._code[finnhub_id], n))
+
+    def close(self):
+        self.ticks.close()
+        self.bars.close()
+
+    def unlink(self):
+        self.ticks.unlink()
+        self.bars.unlink()
+
+
+def _frame(snapshot: typing.Dict[str, np.ndarray]) -> pd.DataFrame:
+    df = pd.DataFrame({field: column for field, column in snapshot.items() if field != "time"})
+    df.index = pd.DatetimeIndex(snapshot["time"].astype("datetime64[ns]"), name="datetime")
+    return df
+
+
+# =============================================================================
+# Ingest Service
+# =============================================================================
+
+
+class LiveCacheService:
+    """
+    Feeds a LiveCache from a websocket and flushes completed minute bars to an IntradayStore
+    """
+
+    def __init__(
+        self,
+        cache: LiveCache,
+        symbols: typing.Dict[str, str],
+        store: IntradayStore = None,
+        flush_interval: float = 5.0,
+        lateness: float = 2.0,
+    ):
+        """
+        :param cache: cache written by the service
+        :param symbols: symbol of the feed -> finnhub ID of the cache
+        :param store: historical store the completed bars are flushed to (if None bars are only cached)
+        :param flush_interval: seconds between two flushes
+        :param lateness: seconds after the end of a minute before its bar is closed
+        """
+        self.cache = cache
+        self.symbols = dict(symbols)
+        self.store = store
+        self.flush_interval = flush_interval
+        self.lateness = lateness
+        self.aggregator = BarAggregator(cache.ids, "1min", f"{lateness}s")
+        self._symbol_code = {symbol: cache.code(finnhub_id) for symbol, finnhub_id in self.symbols.items()}
+        self._id_symbol = {finnhub_id: symbol for symbol, finnhub_id in self.symbols.items()}
+        self._unflushed = []  # bars closed since the last flush to the store
+
+    def on_message(self, message: typing.Union[str, bytes]) -> int:
+        """
+        :param message: websocket message (trade or quote batch)
+
+        :return: number of ticks written to the cache
+        """
+        payload = json.loads(message)
+        if payload.get("type") not in ["trade", "quote"]:
+            return 0
+        data = [tick for tick in payload.get("data") or [] if tick.get("s") in self._symbol_code]
+        if len(data) == 0:
+            return 0
+
+        codes = np.fromiter((self._symbol_code[tick["s"]] for tick in data), dtype=np.int64, count=len(data))
+        columns = {"time": np.fromiter((tick["t"] for tick in data), dtype=np.int64, count=len(data)) * 1_000_000}
+        for field, key in [("price", "p"), ("volume", "v"), ("bid", "b"), ("ask", "a")]:
+            columns[field] = np.fromiter((tick.get(key, np.nan) for tick in data), dtype=np.float64, count=len(data))
+        self.cache.ticks.append(codes, columns)
+        self._publish(self.aggregator.push(codes, columns["time"], columns["price"], columns["volume"], columns["bid"], columns["ask"]))
+        return len(data)
+
+    def flush(self, now_ns: int = None, final: bool = False) -> int:
+        """
+        Closes the bars of every minute ended more than `lateness` seconds ago (also when no tick
+        arrived since) and writes the closed bars to the store in exchange local time
+
+        :param now_ns: current time in ns (defaults to the wall clock)
+        :param final: close all open bars (on shutdown)
+
+        :return: number of bars written to the store
+        """
+        now_ns = time.time_ns() if now_ns is None else now_ns
+        self._publish(self.aggregator.advance(now_ns - int(self.lateness * 1e9)))
+        if final:
+            self._publish(self.aggregator.emit())
+        if self.store is None or len(self._unflushed) == 0:
+            self._unflushed = []
+            return 0
+
+        bars = {field: np.concatenate([part[field] for part in self._unflushed]) for field in self._unflushed[0]}
+        self._unflushed = []
+        order = np.lexsort((bars["time"], bars["code"]))
+        bars = {field: column[order] for field, column in bars.items()}
+        written = 0
+        for finnhub_id, df in self.aggregator.to_frames(bars).items():
+            if finnhub_id in self._id_symbol:
+                df.index = df.index.tz_localize("UTC").tz_convert(EXCHANGE_TIMEZONE).tz_localize(None).rename("datetime")
+                written += self.store.append(self._id_symbol[finnhub_id], df)
+        return written
+
+    def _publish(self, bars: typing.Dict[str, np.ndarray]):
+        if len(bars["code"]) == 0:
+            return
+        self.cache.bars.append(bars["code"], bars)
+        self._unflushed.append(bars)
+
+    async def consume(self, url: str, stop: asyncio.Event = None):
+        """
+        :param url: websocket URL of the feed (i.e. wss://ws.finnhub.io?token=...)
+        :param stop: event ending the consumer (if None runs until the connection closes)
+        """
+        if websockets is None:
+            raise Exception("WebsocketException: install websockets (pip install websockets) to consume a feed")
+        async with websockets.connect(url) as connection:
+            for symbol in self.symbols:
+                await connection.send(json.dumps({"type": "subscribe", "symbol": symbol}))
+            flusher = asyncio.create_task(self._flush_periodically())
+            try:
+                async for message in connection:
+                    self.on_message(message)
+                    if stop is not None and stop.is_set():
+                        break
+            finally:
+                flusher.cancel()
+                self.flush(final=True)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+
+# =============================================================================
+# Replay Server
+# =============================================================================
+
+
+async def replay_server(ticks: pd.DataFrame, host: str = "127.0.0.1", port: int = 8765, speed: float = 0.0, batch: int = 100):
+    """
+    Local websocket server replaying recorded ticks in the Finnhub trade format (for testing)
+
+    :param ticks: Dataframe with symbol, time (datetime in UTC), price and volume columns, in time order
+    :param host: interface to listen on
+    :param port: port to listen on (0 for any free port)
+    :param speed: replay speed relative to real time (0 sends as fast as possible)
+    :param batch: ticks per message
+
+    :return: running server (server.sockets[0].getsockname() gives the port)
+    """
+    if websockets is None:
+        raise Exception("WebsocketException: install websockets (pip install websockets) to run the replay server")
+    times_ms = pd.DatetimeIndex(ticks["time"]).values.astype("datetime64[ms]").astype(np.int64)
+    messages = []
+    for lo in range(0, len(ticks), batch):
+        data = [
+            {"s": s, "p": float(p), "v": float(v), "t": int(t)}
+            for s, p, v, t in zip(ticks["symbol"].iloc[lo : lo + batch], ticks["price"].iloc[lo : lo + batch], ticks["volume"].iloc[lo : lo + batch], times_ms[lo : lo + batch])
+        ]
+        messages.append((times_ms[lo], json.dumps({"type": "trade", "data": data})))
+
+    async def handler(connection, *args):
+        async for request in connection:
+            if json.loads(request).get("type") == "subscribe":
+                break
+        previous = None
+        for t, message in messages:
+            if speed > 0 and previous is not None:
+                await asyncio.sleep((t - previous) / 1000 / speed)
+            previous = t
+            await connection.send(message)
+
+    return await websockets.serve(handler, host, port)
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    ids = pd.read_csv("FinnhubID.csv", keep_default_na=False)
+    ids = ids[(ids["class"] == "") & (ids["end"] == ids["end"].max())].drop_duplicates("symbol")
+    symbols = dict(zip(ids["symbol"], ids["finnhub_id"]))
+
+    # ingest process
+    cache = LiveCache(list(symbols.values()))
+    service = LiveCacheService(cache, {"AAPL": symbols["AAPL"], "MSFT": symbols["MSFT"]}, IntradayStore("data/intraday"))
+    try:
+        asyncio.run(service.consume("wss://ws.finnhub.io?token=YOUR_TOKEN"))
+    finally:
+        cache.close()
+        cache.unlink()
+
+    # model process: LiveCache.attach(list(symbols.values())).latest_bars(symbols["AAPL"], 30)
@@ -0,0 +1,343 @@
+import os
+import json
+import typing
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+
+"""
+NOTE:
+Compact store for option chains and volatility surfaces loaded with wrds_loader_option_metrics
+(opprcd, stdopd, vsurfd tables). Each (date, secid) is a key, and the rows of a key are held as
+contiguous arrays sorted by tenor (days to expiry) and moneyness (delta or strike), with an offsets
+array pointing at the first row of every key. The arrays are saved as .npy files in one directory
+and memory-mapped when opened, so a whole year of surfaces can be queried without loading it into RAM.
+"""
+
+# secids are packed in the lower 32 bits of the key, the date (days since epoch) in the upper bits
+_SECID_BITS = 32
+
+# =============================================================================
+# Option Chain Store
+# =============================================================================
+
+
+class OptionChainStore:
+    """
+    Array-backed option chain / volatility surface store keyed by (date, secid)
+    """
+
+    def __init__(self, path: str, mmap: bool = True):
+        """
+        :param path: directory of a store written with OptionChainStore.build
+        :param mmap: memory-map the arrays instead of reading them into RAM
+        """
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+
+        mmap_mode = "r" if mmap else None
+        self.path = path
+        self.tenor = meta["tenor"]
+        self.moneyness = meta["moneyness"]
+        self.columns = meta["columns"]
+        self._keys = np.load(os.path.join(path, "keys.npy"), mmap_mode=mmap_mode)
+        self._offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode=mmap_mode)
+        self._arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ["tenor", "moneyness", "cp_flag"] + self.columns
+        }
+
+    @classmethod
+    def build(
+        cls,
+        data: typing.Union[pd.DataFrame, typing.Dict[str, pd.DataFrame]],
+        path: str,
+        tenor: str = "days",
+        moneyness: str = "delta",
+        columns: typing.List[str] = ["impl_volatility"],
+    ) -> "OptionChainStore":
+        """
+        :param data: output of wrds_loader_option_metrics (Dict of Dataframes indexed by date) or one Dataframe
+        :param path: directory the store is written to
+        :param tenor: column with the days to expiry (computed from exdate if the column is missing)
+        :param moneyness: column with delta or strike of each row
+        :param columns: value columns to keep (i.e. impl_volatility, impl_strike, best_bid)
+
+        :return: the store opened from path
+        """
+        if isinstance(data, dict):
+            data = pd.concat(list(data.values()))
+        df = data.reset_index()
+        if "date" not in df.columns:
+            raise Exception("ColumnNotInDataError: 'date' is not in data")
+
+        date = df["date"].to_numpy().astype("datetime64[D]").astype(np.int64)
+        if tenor not in df.columns and tenor == "days":
+            days = df["exdate"].to_numpy().astype("datetime64[D]").astype(np.int64) - date
+        else:
+            days = df[tenor].to_numpy()
+        days = days.astype(np.int32)
+        money = df[moneyness].to_numpy(dtype=np.float64)
+        if "cp_flag" in df.columns:
+            cp_flag = np.where(df["cp_flag"] == "C", 1, np.where(df["cp_flag"] == "P", -1, 0))
+        else:
+            cp_flag = np.zeros(len(df))
+        cp_flag = cp_flag.astype(np.int8)
+
+        keys = (date << _SECID_BITS) | df["secid"].to_numpy().astype(np.int64)
+        order = np.lexsort((money, days, keys))
+        keys = keys[order]
+        boundaries = np.flatnonzero(np.diff(keys)) + 1
+        offsets = np.concatenate(([0], boundaries, [len(keys)])).astype(np.int64)
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "keys.npy"), keys[offsets[:-1]])
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+        np.save(os.path.join(path, "tenor.npy"), days[order])
+        np.save(os.path.join(path, "moneyness.npy"), money[order])
+        np.save(os.path.join(path, "cp_flag.npy"), cp_flag[order])
+        for column in columns:
+            np.save(
+                os.path.join(path, f"{column}.npy"),
+                df[column].to_numpy(dtype=np.float64)[order],
+            )
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"tenor": tenor, "moneyness": moneyness, "columns": list(columns)}, f)
+
+        return cls(path)
+
+    def dates(self) -> pd.DatetimeIndex:
+        """
+        :return: dates held in the store
+        """
+        days = np.unique(self._keys >> _SECID_BITS)
+        return pd.DatetimeIndex(days.astype("datetime64[D]"))
+
+    def secids(self, date: datetime) -> np.ndarray:
+        """
+        :param date: trading date
+
+        :return: secids with a chain on that date
+        """
+        lo, hi = self._key_range(date, date)
+        return self._keys[lo:hi] & ((1 << _SECID_BITS) - 1)
+
+    def chain(self, date: datetime, secid: int) -> pd.DataFrame:
+        """
+        :param date: trading date
+        :param secid: OptionMetrics security id
+
+        :return: rows of one key sorted by tenor and moneyness (empty if the key does not exist)
+        """
+        key = (_to_days(date) << _SECID_BITS) | int(secid)
+        index = np.searchsorted(self._keys, key)
+        if index == len(self._keys) or self._keys[index] != key:
+            return self._frame(np.array([], dtype=np.int64), 0, 0)
+        return self._frame(np.array([index]), self._offsets[index], self._offsets[index + 1])
+
+    def slice(
+        self,
+        start: datetime,
+        end: datetime = None,
+        secids: typing.List[int] = None,
+        tenor: typing.Tuple[float, float] = None,
+        moneyness: typing.Tuple[float, float] = None,
+        cp_flag: str = None,
+    ) -> pd.DataFrame:
+        """
+        :param start: start date
+        :param end: end date (includes ending date, defaults to start)
+        :param secids: securities to keep (if None keep all)
+        :param tenor: (min, max) days to expiry, inclusive
+        :param moneyness: (min, max) delta or strike, inclusive
+        :param cp_flag: "C" or "P" (if None keep both)
+
+        :return: Dataframe of the selected rows with date and secid columns
+        """
+        lo, hi = self._key_range(start, start if end is None else end)
+        key_index = np.arange(lo, hi)
+        if secids is not None:
+            key_secid = self._keys[lo:hi] & ((1 << _SECID_BITS) - 1)
+            key_index = key_index[np.isin(key_secid, np.asarray(secids, dtype=np.int64))]
+
+        row_lo = self._offsets[lo]
+        row_hi = self._offsets[hi]
+        starts = self._offsets[key_index] - row_lo
+        ends = self._offsets[key_index + 1] - row_lo
+        # mark the rows of the selected keys with a +1/-1 difference array
+        marks = np.zeros(row_hi - row_lo + 1, dtype=np.int64)
+        np.add.at(marks, starts, 1)
+        np.add.at(marks, ends, -1)
+        mask = np.cumsum(marks[:-1]) > 0
+
+        if tenor is not None:
+            t = self._arrays["tenor"][row_lo:row_hi]
+            mask &= (t >= tenor[0]) & (t <= tenor[1])
+        if moneyness is not None:
+            m = self._arrays["moneyness"][row_lo:row_hi]
+            mask &= (m >= moneyness[0]) & (m <= moneyness[1])
+        if cp_flag is not None:
+            mask &= self._arrays["cp_flag"][row_lo:row_hi] == _cp_code(cp_flag)
+
+        return self._frame(np.arange(lo, hi), row_lo, row_hi, mask)
+
+    def interpolate(
+        self,
+        date: datetime,
+        tenor: float,
+        moneyness: float,
+        column: str = "impl_volatility",
+        cp_flag: str = None,
+    ) -> pd.Series:
+        """
+        Bilinear interpolation of the surface of every secid on a date (i.e. the 30-day 50-delta IV).
+        Points outside the grid of a secid take the value at the nearest edge.
+
+        :param date: trading date
+        :param tenor: days to expiry
+        :param moneyness: delta or strike
+        :param column: value column to interpolate
+        :param cp_flag: only use "C" or "P" rows (if None use both)
+
+        :return: Series of interpolated values indexed by secid
+        """
+        lo, hi = self._key_range(date, date)
+        row_lo = self._offsets[lo]
+        row_hi = self._offsets[hi]
+        secids = self._keys[lo:hi] & ((1 << _SECID_BITS) - 1)
+
+        key_of_row = np.repeat(np.arange(hi - lo), np.diff(self._offsets[lo : hi + 1]))
+        t = np.asarray(self._arrays["tenor"][row_lo:row_hi], dtype=np.int64)
+        m = np.asarray(self._arrays["moneyness"][row_lo:row_hi])
+        v = np.asarray(self._arrays[column][row_lo:row_hi])
+        keep = ~np.isnan(v) & ~np.isnan(m)
+        if cp_flag is not None:
+            keep &= self._arrays["cp_flag"][row_lo:row_hi] == _cp_code(cp_flag)
+        key_of_row, t, m, v = key_of_row[keep], t[keep], m[keep], v[keep]
+
+        result = np.full(hi - lo, np.nan)
+        if len(v) == 0:
+            return pd.Series(result, index=secids, name=column)
+
+        # blocks of rows sharing (key, tenor), moneyness is sorted inside each block
+        new_block = np.ones(len(t), dtype=bool)
+        new_block[1:] = (key_of_row[1:] != key_of_row[:-1]) | (t[1:] != t[:-1])
+        block_start = np.flatnonzero(new_block)
+        block_end = np.append(block_start[1:], len(t))
+        block_key = key_of_row[block_start]
+        block_tenor = t[block_start]
+
+        # bracketing tenors of every key
+        has_rows = np.zeros(hi - lo, dtype=bool)
+        has_rows[block_key] = True
+        keys = np.flatnonzero(has_rows)
+        first_block = np.searchsorted(block_key, keys, side="left")
+        last_block = np.searchsorted(block_key, keys, side="right") - 1
+        tenor_base = max(int(t.max()), int(np.ceil(tenor))) + 1
+        block_comp = block_key * tenor_base + block_tenor
+        upper = np.searchsorted(block_comp, keys * tenor_base + tenor, side="left")
+        upper = np.clip(upper, first_block, last_block)
+        lower = np.clip(upper - 1, first_block, last_block)
+        lower = np.where(block_tenor[upper] <= tenor, upper, lower)
+        t_lo = block_tenor[lower].astype(np.float64)
+        t_hi = block_tenor[upper].astype(np.float64)
+        weight = np.where(t_hi > t_lo, (tenor - t_lo) / np.where(t_hi > t_lo, t_hi - t_lo, 1.0), 0.0)
+        weight = np.clip(weight, 0.0, 1.0)
+
+        value_lo = _interpolate_blocks(m, v, block_start, block_end, lower, moneyness)
+        value_hi = _interpolate_blocks(m, v, block_start, block_end, upper, moneyness)
+        result[keys] = value_lo + weight * (value_hi - value_lo)
+
+        return pd.Series(result, index=secids, name=column)
+
+    def _key_range(self, start: datetime, end: datetime) -> typing.Tuple[int, int]:
+        """
+        :return: [lo, hi) positions of the keys between start and end dates (inclusive)
+        """
+        lo = np.searchsorted(self._keys, _to_days(start) << _SECID_BITS, side="left")
+        hi = np.searchsorted(self._keys, (_to_days(end) + 1) << _SECID_BITS, side="left")
+        return int(lo), int(hi)
+
+    def _frame(self, key_index, row_lo, row_hi, mask=None) -> pd.DataFrame:
+        """
+        :return: Dataframe of rows [row_lo, row_hi) of the keys in key_index
+        """
+        counts = np.diff(self._offsets[key_index[0] : key_index[-1] + 2]) if len(key_index) else []
+        keys = np.repeat(self._keys[key_index[0] : key_index[-1] + 1], counts) if len(key_index) else np.array([], dtype=np.int64)
+        columns = {
+            "date": (keys >> _SECID_BITS).astype("datetime64[D]"),
+            "secid": keys & ((1 << _SECID_BITS) - 1),
+            self.tenor: self._arrays["tenor"][row_lo:row_hi],
+            self.moneyness: self._arrays["moneyness"][row_lo:row_hi],
+            "cp_flag": self._arrays["cp_flag"][row_lo:row_hi],
+        }
+        for column in self.columns:
+            columns[column] = self._arrays[column][row_lo:row_hi]
+        if mask is not None:
+            columns = {name: np.asarray(values)[mask] for name, values in columns.items()}
+        df = pd.DataFrame(columns)
+        df["cp_flag"] = df["cp_flag"].map({1: "C", -1: "P", 0: ""})
+        return df
+
+
+# =============================================================================
+# Helpers
+# =============================================================================
+
+
+def _to_days(date) -> int:
+    """
+    :return: days since epoch of a date
+    """
+    return int(np.datetime64(pd.Timestamp(date).date(), "D").astype(np.int64))
+
+
+def _cp_code(cp_flag: str) -> int:
+    return {"C": 1, "P": -1}[cp_flag]
+
+
+def _interpolate_blocks(m, v, block_start, block_end, blocks, target) -> np.ndarray:
+    """
+    Linear interpolation in moneyness inside each of the given blocks (vectorized over blocks)
+
+    :param m: moneyness of each row (sorted inside each block)
+    :param v: value of each row
+    :param block_start: first row of every block
+    :param block_end: one past the last row of every block
+    :param blocks: blocks to interpolate in
+    :param target: moneyness to interpolate at
+    """
+    m_min = m.min()
+    span = m.max() - m_min + 1.0
+    block_of_row = np.repeat(np.arange(len(block_start)), block_end - block_start)
+    comp = block_of_row * span + (m - m_min)
+    query = blocks * span + np.clip(target - m_min, 0.0, span - 1.0)
+    first = block_start[blocks]
+    last = block_end[blocks] - 1
+    upper = np.clip(np.searchsorted(comp, query, side="left"), first, last)
+    lower = np.clip(upper - 1, first, last)
+    lower = np.where(m[upper] <= target, upper, lower)
+    m_lo, m_hi = m[lower], m[upper]
+    weight = np.where(m_hi > m_lo, (target - m_lo) / np.where(m_hi > m_lo, m_hi - m_lo, 1.0), 0.0)
+    weight = np.clip(weight, 0.0, 1.0)
+    return v[lower] + weight * (v[upper] - v[lower])
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    from wrds_loader import wrds_loader_option_metrics
+
+    loader = wrds_loader_option_metrics()
+    surfaces = loader.load_table_multi_year("vsurfd", datetime(2015, 1, 1), datetime(2015, 12, 31))
+    loader.close_connection()
+
+    store = OptionChainStore.build(surfaces, "data/vsurfd2015", columns=["impl_volatility", "impl_strike"])
+
+    # 30-day 50-delta call implied volatility of every secid on a date
+    iv_30d_50d = store.interpolate(datetime(2015, 12, 10), 30, 50, cp_flag="C")
+    print(iv_30d_50d)
@@ -0,0 +1,382 @@
+import copy
+import json
+import time
+import typing
+import threading
+import urllib.error
+import urllib.request
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from datetime import datetime
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dataloader import (
+    Data_Loader,
+    Data_Loader_CSV,
+    Data_Loader_mongo,
+    Data_Loader_mongo_V2,
+    Data_Loader_Intraday,
+)
+
+
+"""
+NOTE:
+Local query service in front of the data loaders, so notebooks share one backend fetch instead of
+each building its own loader.
+    POST /load_data         {"backend", "datasource", "tickers", "features", "start", "end"}
+    POST /compute_features  same fields and "compute": rolling features (i.e. ["volatility_20"])
+    GET  /stats             number of requests, backend fetches, coalesced tickers and latency percentiles
+Every request is split by ticker. A ticker already being fetched by another request for the same
+backend, datasource and features over a covering date range waits for that fetch instead of starting
+its own, and the tickers left are loaded together by one loader. Nothing is cached once a fetch is done.
+The loaders (i.e. the MongoDB connection) are created once per backend and datasource and copied per request.
+Responses are Arrow IPC streams of one long table (ticker, datetime, features), decoded without a copy
+by QueryClient (or pyarrow.ipc.open_stream). The server latency is sent in the X-Latency-Ms header.
+You need pyarrow (pip install pyarrow).
+"""
+
+BACKENDS = {
+    "csv": Data_Loader_CSV,
+    "mongo": Data_Loader_mongo,
+    "mongo_v2": Data_Loader_mongo_V2,
+    "intraday": Data_Loader_Intraday,
+}
+
+# =============================================================================
+# Request Coalescing
+# =============================================================================
+
+
+class Coalescer:
+    """
+    Shares the in-flight backend fetches of every ticker between concurrent requests
+    """
+
+    def __init__(self):
+        self.fetches = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}  # (source key, ticker) -> [(start, end, future)]
+
+    def fetch(
+        self,
+        source: typing.Hashable,
+        tickers: typing.List[str],
+        start: datetime,
+        end: datetime,
+        load: typing.Callable[[typing.List[str]], typing.Dict[str, pd.DataFrame]],
+        symbol_of: typing.Callable[[str], str] = None,
+    ) -> typing.Tuple[typing.Dict[str, pd.DataFrame], int]:
+        """
+        :param source: backend, datasource and features of the request
+        :param tickers: tickers requested
+        :param start: first date
+        :param end: last date (inclusive)
+        :param load: load(tickers) fetches the tickers from the backend over [start, end]
+        :param symbol_of: requested ticker of a key of load (i.e. "AAPL" for the "AAPL_" key of
+            Data_Loader_mongo_V2), the keys are the tickers if None
+
+        :return: Dataframes keyed like the output of load over [start, end] (missing tickers are left out),
+            number of tickers served by the fetch of another request
+        """
+        futures, owned = {}, []
+        with self._lock:
+            for ticker in tickers:
+                for lo, hi, future in self._in_flight.get((source, ticker), []):
+                    if lo <= start and end <= hi:
+                        futures[ticker] = future
+                        break
+                else:
+                    future = Future()
+                    self._in_flight.setdefault((source, ticker), []).append((start, end, future))
+                    futures[ticker] = future
+                    owned.append(ticker)
+            self.coalesced += len(tickers) - len(owned)
+            if len(owned):
+                self.fetches += 1
+
+        if len(owned):
+            try:
+                # every key of the loader goes to the future of its requested ticker
+                results = {ticker: {} for ticker in owned}
+                for key, df in load(owned).items():
+                    ticker = key if (key in results or symbol_of is None) else symbol_of(key)
+                    if ticker in results:
+                        results[ticker][key] = df
+                for ticker in owned:
+                    futures[ticker].set_result(results[ticker])
+            except Exception as e:
+                for ticker in owned:
+                    futures[ticker].set_exception(e)
+            finally:
+                with self._lock:
+                    for ticker in owned:
+                        entries = self._in_flight[(source, ticker)]
+                        entries[:] = [entry for entry in entries if entry[2] is not futures[ticker]]
+                        if len(entries) == 0:
+                            del self._in_flight[(source, ticker)]
+
+        data_dict = {}
+        for ticker in tickers:
+            for key, df in futures[ticker].result().items():
+                # a covering fetch can be longer than the request
+                df = df[(df.index >= start) & (df.index < pd.Timestamp(end).normalize() + pd.Timedelta(days=1))]
+                data_dict[key] = df
+        return data_dict, len(tickers) - len(owned)
+
+
+# =============================================================================
+# Query Server
+# =============================================================================
+
+
+class QueryServer(ThreadingHTTPServer):
+    """
+    HTTP server exposing load_data / compute_features of the loaders, one thread per request
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8766,
+        backends: typing.Dict[str, typing.Type[Data_Loader]] = None,
+    ):
+        """
+        :param host: interface to listen on (keep it local, there is no authentication)
+        :param port: port to listen on (0 for any free port)
+        :param backends: backend name -> loader class (defaults to BACKENDS)
+        """
+        super().__init__((host, port), _QueryHandler)
+        self.backends = dict(BACKENDS if backends is None else backends)
+        self.coalescer = Coalescer()
+        self.latencies = []
+        self._loaders = {}
+        self._lock = threading.Lock()
+
+    def start(self) -> "QueryServer":
+        """
+        :return: the server, serving from a background thread
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def query(self, operation: str, request: typing.Dict) -> typing.Tuple[pd.DataFrame, int]:
+        """
+        :param operation: "load_data" or "compute_features"
+        :param request: JSON body of the request
+
+        :return: long Dataframe (ticker, datetime, features), number of coalesced tickers
+        """
+        if operation not in ["load_data", "compute_features"]:
+            raise ValueError(f"unknown operation {operation}")
+        if request.get("backend") not in self.backends:
+            raise ValueError(f"unknown backend {request.get('backend')}, expected one of {list(self.backends)}")
+        tickers = sorted(set(request.get("tickers") or []))
+        features = sorted(set(request.get("features") or []))
+        loader = self._loader(request["backend"], request["datasource"], tickers, features, request["start"], request["end"])
+
+        def load(owned: typing.List[str]) -> typing.Dict[str, pd.DataFrame]:
+            fetcher = copy.copy(loader)
+            fetcher.tickers = owned
+            return fetcher.load_data()
+
+        source = (request["backend"], request["datasource"], tuple(features))
+        data_dict, coalesced = self.coalescer.fetch(source, tickers, loader.start, loader.end, load, loader.symbol_of)
+
+        if operation == "compute_features":
+            # the loader computes on the shared fetch (copied, compute_features adds columns in place)
+            loader.load_data = lambda: {ticker: df.copy() for ticker, df in data_dict.items()}
+            data_dict = loader.compute_features(list(request.get("compute") or []))
+        return _long_frame(data_dict), coalesced
+
+    def stats(self) -> typing.Dict[str, float]:
+        """
+        :return: number of requests, backend fetches, coalesced tickers and latency percentiles (ms)
+        """
+        with self._lock:
+            latencies = np.array(self.latencies)
+        output = {"requests": len(latencies), "fetches": self.coalescer.fetches, "coalesced": self.coalescer.coalesced}
+        if len(latencies):
+            output.update({f"p{q}_ms": float(np.percentile(latencies, q)) for q in [50, 90, 99]})
+        return output
+
+    def _loader(self, backend: str, datasource: str, tickers, features, start: str, end: str) -> Data_Loader:
+        """
+        :return: copy of the loader of the backend and datasource, set to the tickers, features and dates
+        """
+        start, end = pd.Timestamp(start).to_pydatetime(), pd.Timestamp(end).to_pydatetime()
+        if end < start:
+            raise ValueError("The end date cannot be before the start date")
+        with self._lock:
+            prototype = self._loaders.get((backend, datasource))
+            if prototype is None:
+                prototype = self.backends[backend](datasource, tickers, features, start, end)
+                self._loaders[(backend, datasource)] = prototype
+        loader = copy.copy(prototype)
+        start, end = loader.calendar.resolve_range(start, end)
+        loader.tickers, loader.features = list(tickers), list(features)
+        loader.start, loader.end = start.to_pydatetime(), end.to_pydatetime()
+        return loader
+
+    def _record(self, latency_ms: float):
+        with self._lock:
+            self.latencies.append(latency_ms)
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._reply(200, json.dumps(self.server.stats()).encode(), "application/json")
+        else:
+            self._reply(404, b'{"error": "not found"}', "application/json")
+
+    def do_POST(self):
+        began = time.perf_counter()
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            df, coalesced = self.server.query(self.path.strip("/"), request)
+            body = _to_ipc(df)
+        except (ValueError, KeyError) as e:
+            self._reply(400, json.dumps({"error": f"{type(e).__name__}: {e}"}).encode(), "application/json", began)
+            return
+        except Exception as e:
+            self._reply(500, json.dumps({"error": f"{type(e).__name__}: {e}"}).encode(), "application/json", began)
+            return
+        self._reply(200, body, "application/vnd.apache.arrow.stream", began, {"X-Coalesced-Tickers": str(coalesced)})
+
+    def _reply(self, status: int, body: bytes, content_type: str, began: float = None, headers: typing.Dict[str, str] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if began is not None:
+            latency_ms = (time.perf_counter() - began) * 1000
+            self.server._record(latency_ms)
+            self.send_header("X-Latency-Ms", f"{latency_ms:.3f}")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # latencies are collected in /stats
+
+
+def _long_frame(data_dict: typing.Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    frames = []
+    for ticker, df in data_dict.items():
+        df = df.drop(columns=["symbol"], errors="ignore").infer_objects()
+        df.index = pd.DatetimeIndex(df.index, name="datetime")
+        df = df.reset_index()
+        df.insert(0, "ticker", ticker)
+        frames.append(df)
+    if len(frames) == 0:
+        return pd.DataFrame({"ticker": pd.Series(dtype=object), "datetime": pd.Series(dtype="datetime64[ns]")})
+    return pd.concat(frames, ignore_index=True)
+
+
+def _to_ipc(df: pd.DataFrame) -> bytes:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# =============================================================================
+# Client
+# =============================================================================
+
+
+class QueryClient:
+    """
+    Client of a QueryServer
+    """
+
+    def __init__(self, url: str = "http://127.0.0.1:8766", timeout: float = 600):
+        """
+        :param url: address of the server
+        :param timeout: timeout of a request in seconds
+        """
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.last_latency_ms = None  # server latency of the last request
+
+    def load_data(
+        self, backend: str, datasource: str, tickers: typing.List[str], features: typing.List[str], start: datetime, end: datetime
+    ) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :return: same as the load_data of the backend loader
+        """
+        return self._post("load_data", backend, datasource, tickers, features, start, end)
+
+    def compute_features(
+        self,
+        backend: str,
+        datasource: str,
+        tickers: typing.List[str],
+        features: typing.List[str],
+        start: datetime,
+        end: datetime,
+        compute: typing.List[str],
+    ) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :param compute: rolling features to compute (i.e. "volatility_20")
+
+        :return: same as the compute_features of the backend loader
+        """
+        return self._post("compute_features", backend, datasource, tickers, features, start, end, compute)
+
+    def table(self, operation: str, request: typing.Dict) -> pa.Table:
+        """
+        :return: Arrow table of the response (no copy of the columns)
+        :raise QueryException if the server returns an error
+        """
+        data = json.dumps(request, default=str).encode()
+        http_request = urllib.request.Request(f"{self.url}/{operation}", data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+                self.last_latency_ms = float(response.headers.get("X-Latency-Ms", "nan"))
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            raise Exception(f"QueryException: {e.code} {e.read().decode()}")
+        return pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+
+    def _post(self, operation: str, backend, datasource, tickers, features, start, end, compute=None):
+        request = {
+            "backend": backend,
+            "datasource": datasource,
+            "tickers": list(tickers),
+            "features": list(features),
+            "start": pd.Timestamp(start).isoformat(),
+            "end": pd.Timestamp(end).isoformat(),
+        }
+        if compute is not None:
+            request["compute"] = list(compute)
+        df = self.table(operation, request).to_pandas()
+        data_dict = {}
+        for ticker, group in df.groupby("ticker", sort=False):
+            data_dict[ticker] = group.drop(columns="ticker").set_index("datetime")
+        return data_dict
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    # long running process (QueryServer().serve_forever() blocks)
+    server = QueryServer(port=8766).start()
+
+    # in the notebooks
+    client = QueryClient("http://127.0.0.1:8766")
+    data = client.compute_features(
+        "mongo_v2", "kaggle_US_Equity_daily", ["AAPL", "MSFT"], [], datetime(2020, 1, 2), datetime(2020, 6, 30), ["volatility_20"]
+    )
+    print(data["AAPL"].tail(), client.last_latency_ms)
+    print(QueryClient().table("load_data", {"backend": "intraday", "datasource": "data/intraday", "tickers": ["AAPL"], "start": "2020-11-02", "end": "2020-11-02"}))
+    print(server.stats())
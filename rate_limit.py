@@ -0,0 +1,75 @@
+import time
+import asyncio
+import threading
+
+
+"""
+NOTE:
+Token bucket shared by the downloaders to stay within the request quotas of the data vendors.
+Tokens are added continuously at `rate` per second up to `capacity`, every request takes one.
+A capacity of 1 spaces requests evenly (i.e. 5 requests per minute -> one every 12 seconds), a
+larger capacity allows bursts after idle periods.
+The same bucket can be used from threads (acquire) and from asyncio tasks (acquire_async).
+"""
+
+# =============================================================================
+# Token Bucket
+# =============================================================================
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0, clock=time.monotonic):
+        """
+        :param rate: tokens added per second (i.e. 5 / 60 for 5 requests per minute)
+        :param capacity: maximum number of tokens kept (size of the bursts)
+        :param clock: function returning the current time in seconds
+        """
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate and capacity of the token bucket must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        :param tokens: number of tokens taken
+
+        :return: 0 if the tokens were taken, otherwise the number of seconds to wait before trying again
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0):
+        """
+        Blocks the calling thread until the tokens are taken
+
+        :param tokens: number of tokens taken
+        """
+        wait = self.try_acquire(tokens)
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.try_acquire(tokens)
+
+    async def acquire_async(self, tokens: float = 1.0):
+        """
+        Waits (without blocking the event loop) until the tokens are taken
+
+        :param tokens: number of tokens taken
+        """
+        wait = self.try_acquire(tokens)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.try_acquire(tokens)
@@ -0,0 +1,309 @@
+import ast
+import typing
+import numpy as np
+import pandas as pd
+
+
+"""
+NOTE:
+Financial ratios over the reported financials of the whole universe.
+The long format of FundamentalsStore.read is pivoted once into one (symbols x quarters) float matrix
+per concept, the quarters being contiguous fiscal periods so that lag(x, 4) is the same quarter of
+the previous year.
+Ratios are declared as formulas over names (i.e. "net_income / equity") and evaluated as numpy
+expressions over the whole matrix. A name is either another ratio or an alias of ALIASES, which
+takes the first concept reported among its list (a missing concept is a matrix of NaN).
+Formulas only support + - * / **, numbers and the functions of FUNCTIONS, they are parsed with ast
+and never executed with eval. Every matrix computed is cached for the other formulas, keyed on the
+definition it was computed from (formula text, referenced ratios and alias concepts), so redefining a
+ratio or an alias in the tables is picked up by the next call.
+"""
+
+# alias -> concepts in order of preference
+ALIASES = {
+    "revenue": [
+        "us-gaap_Revenues",
+        "us-gaap_RevenueFromContractWithCustomerExcludingAssessedTax",
+        "us-gaap_SalesRevenueNet",
+    ],
+    "cost_of_revenue": ["us-gaap_CostOfRevenue", "us-gaap_CostOfGoodsAndServicesSold", "us-gaap_CostOfGoodsSold"],
+    "gross_profit": ["us-gaap_GrossProfit"],
+    "operating_income": ["us-gaap_OperatingIncomeLoss"],
+    "net_income": ["us-gaap_NetIncomeLoss", "us-gaap_ProfitLoss"],
+    "eps_diluted": ["us-gaap_EarningsPerShareDiluted", "us-gaap_EarningsPerShareBasicAndDiluted"],
+    "assets": ["us-gaap_Assets"],
+    "current_assets": ["us-gaap_AssetsCurrent"],
+    "liabilities": ["us-gaap_Liabilities"],
+    "current_liabilities": ["us-gaap_LiabilitiesCurrent"],
+    "equity": [
+        "us-gaap_StockholdersEquity",
+        "us-gaap_StockholdersEquityIncludingPortionAttributableToNoncontrollingInterest",
+    ],
+    "long_term_debt": ["us-gaap_LongTermDebtNoncurrent", "us-gaap_LongTermDebt"],
+    "cash": ["us-gaap_CashAndCashEquivalentsAtCarryingValue"],
+    "operating_cash_flow": [
+        "us-gaap_NetCashProvidedByUsedInOperatingActivities",
+        "us-gaap_NetCashProvidedByUsedInOperatingActivitiesContinuingOperations",
+    ],
+    "capex": ["us-gaap_PaymentsToAcquirePropertyPlantAndEquipment"],
+}
+
+# ratio -> formula over aliases and other ratios
+RATIOS = {
+    "gross_margin": "gross_profit / revenue",
+    "operating_margin": "operating_income / revenue",
+    "net_margin": "net_income / revenue",
+    "roe": "net_income / equity",
+    "roa": "net_income / assets",
+    "leverage": "liabilities / assets",
+    "debt_to_equity": "long_term_debt / equity",
+    "current_ratio": "current_assets / current_liabilities",
+    "accruals": "(net_income - operating_cash_flow) / assets",
+    "free_cash_flow": "operating_cash_flow - capex",
+    "revenue_growth": "revenue / lag(revenue, 4) - 1",
+    "eps_growth": "(eps_diluted - lag(eps_diluted, 4)) / abs(lag(eps_diluted, 4))",
+}
+
+# =============================================================================
+# Ratio Engine
+# =============================================================================
+
+
+class RatioEngine:
+    """
+    Evaluates ratio formulas over (symbols x quarters) matrices of reported concepts
+    """
+
+    def __init__(
+        self,
+        fundamentals: pd.DataFrame,
+        aliases: typing.Dict[str, typing.List[str]] = None,
+        ratios: typing.Dict[str, str] = None,
+    ):
+        """
+        :param fundamentals: reported values in long format (i.e. FundamentalsStore.read), only fiscal
+            quarters 1 to 4 with a fiscal year are used, the value of the latest filing is kept when a period is restated
+        :param aliases: alias -> concepts in order of preference (defaults to ALIASES)
+        :param ratios: ratio -> formula (defaults to RATIOS)
+        """
+        self.aliases = dict(ALIASES if aliases is None else aliases)
+        self.ratios = dict(RATIOS if ratios is None else ratios)
+
+        df = fundamentals[
+            fundamentals["fiscal_quarter"].isin([1, 2, 3, 4])
+            & fundamentals["fiscal_year"].notna()
+            & fundamentals["symbol"].notna()
+        ]
+        if "filed_date" in df:
+            df = df.sort_values("filed_date", kind="mergesort")
+        period = df["fiscal_year"].to_numpy(dtype=np.int64) * 4 + df["fiscal_quarter"].to_numpy(dtype=np.int64) - 1
+        first = period.min() if len(period) else 0
+        last = period.max() if len(period) else -1
+
+        self._row, symbols = pd.factorize(df["symbol"])
+        self._column = period - first
+        self._concept, concepts = pd.factorize(df["concept"])
+        self._values = pd.to_numeric(df["value"], errors="coerce").to_numpy(dtype=np.float64)
+        self._concept_code = {concept: i for i, concept in enumerate(concepts)}
+        self._concept_rows = None
+
+        self.symbols = pd.Index(symbols)
+        self.periods = pd.MultiIndex.from_arrays(
+            [np.arange(first, last + 1) // 4, np.arange(first, last + 1) % 4 + 1], names=["year", "quarter"]
+        )
+        self._cache = {}
+
+    def concept(self, name: str) -> np.ndarray:
+        """
+        :param name: reported concept (i.e. "us-gaap_Assets")
+
+        :return: (symbols x quarters) matrix of the concept (NaN where not reported)
+        """
+        key = ("concept", name)
+        if key not in self._cache:
+            matrix = np.full((len(self.symbols), len(self.periods)), np.nan)
+            code = self._concept_code.get(name)
+            if code is not None:
+                rows = self._rows_of(code)
+                # rows are sorted by filing date, so the latest filing is written last
+                matrix[self._row[rows], self._column[rows]] = self._values[rows]
+            self._cache[key] = matrix
+        return self._cache[key]
+
+    def alias(self, name: str) -> np.ndarray:
+        """
+        :param name: alias of ALIASES
+
+        :return: (symbols x quarters) matrix of the first concept reported among the concepts of the alias
+        """
+        key = ("alias", name, tuple(self.aliases[name]))
+        if key not in self._cache:
+            matrix = np.full((len(self.symbols), len(self.periods)), np.nan)
+            for concept in self.aliases[name]:
+                values = self.concept(concept)
+                missing = np.isnan(matrix)
+                matrix[missing] = values[missing]
+            self._cache[key] = matrix
+        return self._cache[key]
+
+    def ratio(self, name: str) -> np.ndarray:
+        """
+        :param name: ratio of the ratios table
+
+        :return: (symbols x quarters) matrix of the ratio (NaN where an input is missing or a denominator is 0)
+        """
+        if name not in self.ratios:
+            raise ValueError(f"unknown ratio {name}")
+        return self._ratio(name, ())
+
+    def evaluate(self, formula: str, _stack: typing.Tuple[str, ...] = ()) -> np.ndarray:
+        """
+        :param formula: expression over aliases, ratios, numbers, + - * / ** and FUNCTIONS
+
+        :return: (symbols x quarters) matrix of the formula
+        """
+        try:
+            tree = ast.parse(formula, mode="eval")
+        except SyntaxError:
+            raise ValueError(f"invalid formula {formula}")
+        return np.asarray(self._evaluate(tree.body, formula, _stack), dtype=np.float64)
+
+    def compute(self, names: typing.List[str] = None) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :param names: ratios to compute (if None all ratios)
+
+        :return: Dict of Dataframes (index: symbols, columns: (year, quarter))
+        """
+        names = list(self.ratios) if names is None else names
+        return {name: pd.DataFrame(self.ratio(name), index=self.symbols, columns=self.periods) for name in names}
+
+    def to_frame(self, names: typing.List[str] = None) -> pd.DataFrame:
+        """
+        :param names: ratios to compute (if None all ratios)
+
+        :return: Dataframe in long format (symbol, year, quarter, one column per ratio), rows without any ratio are dropped
+        """
+        names = list(self.ratios) if names is None else names
+        index = pd.MultiIndex.from_product([self.symbols, range(len(self.periods))], names=["symbol", "period"])
+        df = pd.DataFrame({name: self.ratio(name).ravel() for name in names}, index=index).dropna(how="all")
+        period = df.index.get_level_values("period").to_numpy()
+        df.insert(0, "quarter", self.periods.get_level_values("quarter")[period])
+        df.insert(0, "year", self.periods.get_level_values("year")[period])
+        return df.droplevel("period").reset_index()
+
+    def _rows_of(self, code: int) -> np.ndarray:
+        """
+        :return: rows of the input holding the concept code, in filing order
+        """
+        if self._concept_rows is None:
+            order = np.argsort(self._concept, kind="stable")
+            bounds = np.searchsorted(self._concept[order], np.arange(len(self._concept_code) + 1))
+            self._concept_rows = (order, bounds)
+        order, bounds = self._concept_rows
+        return order[bounds[code] : bounds[code + 1]]
+
+    def _evaluate(self, node: ast.AST, formula: str, stack: typing.Tuple[str, ...]):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+        if isinstance(node, ast.Name):
+            return self._name(node.id, stack)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self._evaluate(node.operand, formula, stack)
+            return -operand if isinstance(node.op, ast.USub) else operand
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            left = self._evaluate(node.left, formula, stack)
+            right = self._evaluate(node.right, formula, stack)
+            with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+                result = OPERATORS[type(node.op)](left, right)
+            return np.where(np.isinf(result), np.nan, result) if isinstance(result, np.ndarray) else result
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS:
+            arguments = [self._evaluate(argument, formula, stack) for argument in node.args]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return FUNCTIONS[node.func.id](*arguments)
+        raise ValueError(f"unsupported expression {ast.dump(node)} in formula {formula}")
+
+    def _ratio(self, name: str, stack: typing.Tuple[str, ...]) -> np.ndarray:
+        key = ("ratio", name, self._definition(name, stack))
+        if key not in self._cache:
+            self._cache[key] = self.evaluate(self.ratios[name], stack + (name,))
+        return self._cache[key]
+
+    def _definition(self, name: str, stack: typing.Tuple[str, ...]) -> tuple:
+        """
+        :return: formula of the ratio with the definitions of the ratios and aliases it references (cache key)
+        :raise ValueError if the definition is circular
+        """
+        if name in stack:
+            raise ValueError(f"circular ratio definition {' -> '.join(stack + (name,))}")
+        formula = self.ratios[name]
+        try:
+            names = sorted({node.id for node in ast.walk(ast.parse(formula, mode="eval")) if isinstance(node, ast.Name)})
+        except SyntaxError:
+            raise ValueError(f"invalid formula {formula}")
+        references = []
+        for reference in names:
+            if reference in self.ratios:
+                references.append(self._definition(reference, stack + (name,)))
+            elif reference in self.aliases:
+                references.append((reference, tuple(self.aliases[reference])))
+        return (formula, tuple(references))
+
+    def _name(self, name: str, stack: typing.Tuple[str, ...]) -> np.ndarray:
+        if name in self.ratios:
+            return self._ratio(name, stack)
+        if name in self.aliases:
+            return self.alias(name)
+        if name in self._concept_code:
+            return self.concept(name)
+        raise ValueError(f"unknown name {name}, add it to the aliases or the ratios")
+
+
+def _lag(matrix: np.ndarray, periods: int) -> np.ndarray:
+    """
+    :return: matrix shifted by `periods` quarters along the periods axis (NaN where there is no earlier quarter)
+    """
+    periods = int(periods)
+    output = np.full(np.shape(matrix), np.nan)
+    if abs(periods) >= output.shape[1]:
+        return output
+    if periods >= 0:
+        output[:, periods:] = matrix[:, : matrix.shape[1] - periods]
+    else:
+        output[:, :periods] = matrix[:, -periods:]
+    return output
+
+
+OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+}
+
+FUNCTIONS = {
+    "lag": _lag,
+    "abs": np.abs,
+    "log": np.log,
+    "sqrt": np.sqrt,
+    "min": np.fmin,
+    "max": np.fmax,
+}
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    from fundamentals_store import FundamentalsStore
+
+    concepts = sorted({concept for names in ALIASES.values() for concept in names})
+    engine = RatioEngine(FundamentalsStore("data/fundamentals").read(concepts=concepts))
+
+    print(engine.compute(["roe", "revenue_growth"])["roe"].tail())
+
+    # formulas can also be evaluated directly, or added to the ratios table
+    engine.ratios["asset_turnover"] = "revenue / assets"
+    print(engine.to_frame(["asset_turnover", "accruals"]).head())
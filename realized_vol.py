@@ -0,0 +1,209 @@
+import typing
+import numpy as np
+import pandas as pd
+
+from user_manual.USCalendar import USTradingCalendar
+
+
+"""
+NOTE:
+Resampling and realized volatility measures from minute bars.
+The bars of all symbols are stacked once into flat arrays sorted by (symbol, time). Every bar falls in a
+group (symbol, session day, bucket), and since the rows are sorted every group is a contiguous
+run of rows: open/close are the first/last row of a run and high/low/volume/VWAP come
+from np.maximum/np.minimum/np.add.reduceat over the runs, so no Python loop runs per symbol or per day.
+Only bars of trading sessions (USTradingCalendar) inside the regular hours are used, and returns
+are never taken across two sessions (no overnight return).
+Daily measures of a session (on bars resampled to `interval`, log returns r_i):
+    rv     realized variance        sum r_i^2
+    bv     bipower variation        pi / 2 * sum |r_i| |r_i-1|
+    rr     realized range           sum (log high - log low)^2 / (4 log 2)
+    vwap   volume weighted average price of the session (typical price (h + l + c) / 3 per minute bar,
+           the same value as resample(data_dict, "1D"))
+"""
+
+MEASURES = ["rv", "bv", "rr", "vwap", "n_bars"]
+
+# =============================================================================
+# Resampling
+# =============================================================================
+
+
+def resample(
+    data_dict: typing.Dict[str, pd.DataFrame],
+    interval: str = "5min",
+    session_open: str = "09:30",
+    session_close: str = "16:00",
+) -> typing.Dict[str, pd.DataFrame]:
+    """
+    :param data_dict: minute bars of every symbol (index: datetime, columns: open, high, low, close, volume)
+    :param interval: bar size (i.e. "5min", "30min", "1h") or "1D" for one bar per session
+    :param session_open: start of the regular hours (exchange local time)
+    :param session_close: end of the regular hours
+
+    :return: Dict of Dataframes with open, high, low, close, volume, vwap bars, indexed by the start of every bar
+    """
+    bars = _Bars(data_dict, session_open, session_close)
+    starts, output, codes, _ = bars.resample(interval)
+    return bars.split(starts, output, codes)
+
+
+def realized_measures(
+    data_dict: typing.Dict[str, pd.DataFrame],
+    interval: str = "5min",
+    session_open: str = "09:30",
+    session_close: str = "16:00",
+) -> typing.Dict[str, pd.DataFrame]:
+    """
+    :param data_dict: minute bars of every symbol (index: datetime, columns: open, high, low, close, volume)
+    :param interval: sampling interval of the returns (5 minutes limits the microstructure noise)
+    :param session_open: start of the regular hours (exchange local time)
+    :param session_close: end of the regular hours
+
+    :return: Dict of Dataframes indexed by session date with the MEASURES columns
+    """
+    bars = _Bars(data_dict, session_open, session_close)
+    _, sampled, codes, days = bars.resample(interval)
+
+    # runs of the resampled bars of the same (symbol, session)
+    new_session = np.ones(len(codes), dtype=bool)
+    new_session[1:] = (codes[1:] != codes[:-1]) | (days[1:] != days[:-1])
+    session_start = np.flatnonzero(new_session)
+
+    log_close = np.log(sampled["close"])
+    returns = np.diff(log_close, prepend=np.nan)
+    returns[new_session] = np.nan
+    previous = np.roll(returns, 1)
+    previous[new_session] = np.nan
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_range = np.log(sampled["high"]) - np.log(sampled["low"])
+
+    rv = _session_sum(returns ** 2, session_start)
+    bv = np.pi / 2 * _session_sum(np.abs(returns) * np.abs(previous), session_start)
+    rr = _session_sum(log_range ** 2, session_start) / (4 * np.log(2))
+    # the VWAP of every resampled bar weighted by its volume is the VWAP of the minute bars
+    volume = _session_sum(sampled["volume"], session_start)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vwap = _session_sum(sampled["vwap"] * sampled["volume"], session_start) / volume
+    n_bars = np.diff(np.append(session_start, len(codes)))
+
+    output = {"rv": rv, "bv": bv, "rr": rr, "vwap": vwap, "n_bars": n_bars}
+    session_dates = days[session_start].astype("datetime64[D]").astype("datetime64[ns]")
+    return bars.split(session_dates, output, codes[session_start])
+
+
+# =============================================================================
+# Helpers
+# =============================================================================
+
+
+class _Bars:
+    """
+    Minute bars of all symbols stacked into arrays sorted by (symbol, time), regular hours of sessions only
+    """
+
+    def __init__(self, data_dict: typing.Dict[str, pd.DataFrame], session_open: str, session_close: str):
+        self.ids = list(data_dict)
+        frames = [data_dict[ticker] for ticker in self.ids]
+        lengths = [len(df) for df in frames]
+        codes = np.repeat(np.arange(len(self.ids), dtype=np.int64), lengths)
+        if len(frames):
+            times = np.concatenate([pd.DatetimeIndex(df.index).values.astype("datetime64[ns]").astype(np.int64) for df in frames])
+        else:
+            times = np.array([], dtype=np.int64)
+        values = {
+            field: np.concatenate([df[field].to_numpy(dtype=np.float64) for df in frames] + [np.array([])])
+            for field in ["open", "high", "low", "close", "volume"]
+        }
+
+        day_ns = 86400 * 10 ** 9
+        days = times // day_ns
+        time_of_day = times - days * day_ns
+        open_ns = pd.Timedelta(session_open + ":00").value
+        close_ns = pd.Timedelta(session_close + ":00").value
+        sessions = USTradingCalendar().sessions
+        keep = (time_of_day >= open_ns) & (time_of_day < close_ns) & np.isin(days, sessions)
+        keep &= ~np.isnan(values["close"])
+
+        order = np.lexsort((times[keep], codes[keep]))
+        self.codes = codes[keep][order]
+        self.times = times[keep][order]
+        self.days = days[keep][order]
+        self.values = {field: column[keep][order] for field, column in values.items()}
+        self.open_ns = open_ns
+
+    def resample(self, interval: str) -> typing.Tuple[np.ndarray, typing.Dict[str, np.ndarray], np.ndarray, np.ndarray]:
+        """
+        :return: start time (datetime64[ns]), columns (open, high, low, close, volume, vwap),
+            symbol code and session day of every bar
+        """
+        day_ns = 86400 * 10 ** 9
+        if interval.upper() in ["1D", "D"]:
+            bucket = np.zeros(len(self.times), dtype=np.int64)
+            width = day_ns
+        else:
+            width = pd.Timedelta(interval).value
+            bucket = (self.times - self.days * day_ns - self.open_ns) // width
+
+        # rows are sorted by (symbol, time), so a bar starts wherever the symbol, the day or the bucket changes
+        first = np.ones(len(bucket), dtype=bool)
+        first[1:] = (self.codes[1:] != self.codes[:-1]) | (self.days[1:] != self.days[:-1]) | (bucket[1:] != bucket[:-1])
+        start = np.flatnonzero(first)
+        end = np.append(start[1:], len(bucket)) - 1
+
+        v = self.values
+        volume = np.add.reduceat(v["volume"], start) if len(start) else np.array([])
+        typical = (v["high"] + v["low"] + v["close"]) / 3
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vwap = (np.add.reduceat(typical * v["volume"], start) / volume) if len(start) else np.array([])
+        output = {
+            "open": v["open"][start],
+            "high": np.maximum.reduceat(v["high"], start) if len(start) else np.array([]),
+            "low": np.minimum.reduceat(v["low"], start) if len(start) else np.array([]),
+            "close": v["close"][end],
+            "volume": volume,
+            "vwap": vwap,
+        }
+        if width == day_ns:
+            starts = self.days[start] * day_ns
+        else:
+            starts = self.days[start] * day_ns + self.open_ns + bucket[start] * width
+        return starts.astype("datetime64[ns]"), output, self.codes[start], self.days[start]
+
+    def split(self, index: np.ndarray, columns: typing.Dict[str, np.ndarray], codes: np.ndarray) -> typing.Dict[str, pd.DataFrame]:
+        """
+        :return: Dict of Dataframes, one per symbol, from rows sorted by symbol code
+        """
+        bounds = np.searchsorted(codes, np.arange(len(self.ids) + 1))
+        data_dict = {}
+        for i, ticker in enumerate(self.ids):
+            lo, hi = bounds[i], bounds[i + 1]
+            if hi > lo:
+                df = pd.DataFrame({name: column[lo:hi] for name, column in columns.items()}, index=index[lo:hi])
+                df.index.name = "datetime"
+                data_dict[ticker] = df
+        return data_dict
+
+
+def _session_sum(values: np.ndarray, session_start: np.ndarray) -> np.ndarray:
+    """
+    :return: sum of every session run, ignoring NaN
+    """
+    if len(session_start) == 0:
+        return np.array([])
+    return np.add.reduceat(np.nan_to_num(values, nan=0.0), session_start)
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    from datetime import datetime
+    from dataloader import Data_Loader_Intraday
+
+    minute_bars = Data_Loader_Intraday("data/intraday", ["AAPL", "MSFT"], [], datetime(2020, 11, 2), datetime(2020, 11, 30)).load_data()
+
+    print(resample(minute_bars, "30min")["AAPL"].head())
+    print(realized_measures(minute_bars, "5min")["AAPL"])
@@ -0,0 +1,191 @@
+import sys
+import json
+import uuid
+import weakref
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+
+from alignment import Panel
+
+
+"""
+NOTE:
+Publication of a Panel in shared memory, so the workers of a multiprocessing pool read the panel
+loaded once by the parent instead of loading it again or unpickling their own copy.
+The arrays of the panel (values, sessions, presence, listed interval and label codes) are copied once
+into one shared memory block <name>; the IDs, fields, label categories and the layout of the
+arrays are kept as JSON in a second block <name>_meta.
+Workers attach by name and get a read-only Panel whose arrays are views of the shared block (no copy).
+The publisher owns the blocks: they are unlinked by close(), at the end of a with block, or when
+the SharedPanel is garbage collected / the parent exits.
+On Python < 3.13 a process that attaches without being a child of the publisher also registers the
+blocks with its own resource tracker, which unlinks them when it exits; attach from pool workers
+(children) or keep the publisher alive longer than the readers.
+"""
+
+_ALIGNMENT = 64  # bytes, start of every array in the block
+
+# =============================================================================
+# Publisher
+# =============================================================================
+
+
+class SharedPanel:
+    """
+    Panel published in shared memory (owner side)
+    """
+
+    def __init__(self, panel: Panel, name: str = None):
+        """
+        :param panel: panel to publish
+        :param name: name of the shared memory blocks (if None a unique name is generated)
+        """
+        self.name = f"panel_{uuid.uuid4().hex[:12]}" if name is None else name
+
+        arrays = {
+            "values": panel.values,
+            "sessions": panel.sessions.values.astype("datetime64[ns]").view(np.int64),
+            "presence": panel.presence,
+            "listed": panel.listed,
+        }
+        for label, (codes, _) in panel.labels.items():
+            arrays[f"label:{label}"] = codes
+
+        layout, offset = {}, 0
+        for key, array in arrays.items():
+            layout[key] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+        meta = json.dumps(
+            {
+                "layout": layout,
+                "ids": panel.ids.tolist(),
+                "fields": list(panel.fields),
+                "labels": {label: [str(c) for c in categories] for label, (_, categories) in panel.labels.items()},
+            }
+        ).encode()
+
+        self._block = shared_memory.SharedMemory(name=self.name, create=True, size=max(offset, 1))
+        try:
+            self._meta = shared_memory.SharedMemory(name=f"{self.name}_meta", create=True, size=len(meta))
+        except Exception:
+            self._block.close()
+            self._block.unlink()
+            raise
+        self._meta.buf[: len(meta)] = meta
+        for key, array in arrays.items():
+            entry = layout[key]
+            view = np.ndarray(array.shape, dtype=array.dtype, buffer=self._block.buf, offset=entry["offset"])
+            view[...] = array
+            del view
+        self._finalizer = weakref.finalize(self, _release, self._block, self._meta)
+
+    def close(self):
+        """
+        Unlinks the blocks (attached workers keep their mapping until they detach)
+        """
+        self._finalizer()
+
+    def __enter__(self) -> "SharedPanel":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _release(*blocks: shared_memory.SharedMemory):
+    for block in blocks:
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# =============================================================================
+# Workers
+# =============================================================================
+
+
+def attach_panel(name: str) -> Panel:
+    """
+    :param name: name of a published panel
+
+    :return: read-only Panel whose arrays are views of the shared memory (the blocks stay mapped
+        as long as the Panel is alive, see detach_panel)
+    :raise FileNotFoundError if no panel is published under this name
+    """
+    meta_block = _attach(f"{name}_meta")
+    meta = json.loads(bytes(meta_block.buf).rstrip(b"\x00"))
+    meta_block.close()
+    block = _attach(name)
+
+    arrays = {}
+    for key, entry in meta["layout"].items():
+        array = np.ndarray(entry["shape"], dtype=np.dtype(entry["dtype"]), buffer=block.buf, offset=entry["offset"])
+        array.flags.writeable = False
+        arrays[key] = array
+
+    labels = {
+        label: (arrays[f"label:{label}"], np.array(categories, dtype=object))
+        for label, categories in meta["labels"].items()
+    }
+    sessions = pd.DatetimeIndex(arrays["sessions"].view("datetime64[ns]"))
+    panel = Panel(arrays["values"], sessions, meta["ids"], meta["fields"], arrays["presence"], labels, arrays["listed"])
+    panel._shared_memory = block
+    return panel
+
+
+def detach_panel(panel: Panel):
+    """
+    Unmaps the shared memory of an attached panel (its arrays must not be used afterwards)
+    """
+    block = getattr(panel, "_shared_memory", None)
+    if block is None:
+        return
+    panel.values = panel.presence = panel.listed = None
+    panel.labels = {}
+    del panel._shared_memory
+    try:
+        block.close()
+    except BufferError:
+        pass  # views are still referenced elsewhere, the mapping is released with them
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+
+def _sweep(args: tuple) -> tuple:
+    """
+    Worker of the tutorial, defined at module level so that workers started with spawn can import it
+
+    :param args: (name of the published panel, lookback)
+
+    :return: (lookback, mean rolling volatility of the close over all IDs)
+    """
+    name, lookback = args
+    panel = attach_panel(name)
+    close = panel.field("close")
+    volatility = float(np.log(close).diff().rolling(lookback).std().mean().mean())
+    detach_panel(panel)
+    return lookback, volatility
+
+
+if __name__ == "__main__":
+
+    from datetime import datetime
+    from multiprocessing import Pool
+    from dataloader import Data_Loader_CSV
+
+    loader = Data_Loader_CSV("data/kaggle", ["AAPL", "MSFT", "GS"], [], datetime(2020, 1, 2), datetime(2020, 6, 30))
+    with SharedPanel(loader.load_aligned(fill="ffill"), "sweep_panel") as shared:
+        with Pool(4) as pool:
+            print(pool.map(_sweep, [(shared.name, lookback) for lookback in [5, 10, 20, 60]]))
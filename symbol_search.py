@@ -0,0 +1,310 @@
+import os
+import csv
+import typing
+import numpy as np
+from datetime import datetime
+from itertools import combinations
+
+
+"""
+NOTE:
+Search index over the symbol metadata in FinnhubID.csv (symbol, class, finnhub_id, start, end).
+The index is built once and saved as fixed-width numpy arrays next to the csv, so later loads are a
+single np.load. Rows are sorted by symbol, so every lookup is a searchsorted over sorted arrays:
+- exact and prefix lookup: searchsorted over the unique symbols
+- fuzzy lookup: precomputed deletion neighbourhood of every symbol (symmetric delete), so a query
+  only looks up its own deletions and checks the edit distance of a handful of candidates
+The csv has no company names, so searching by name is not possible from this file.
+"""
+
+COLUMNS = ["symbol", "class", "finnhub_id", "start", "end"]
+
+# =============================================================================
+# Symbol Record
+# =============================================================================
+
+
+class SymbolRecord(typing.NamedTuple):
+    symbol: str
+    symbol_class: str
+    finnhub_id: str
+    start: str
+    end: str
+
+
+# =============================================================================
+# Symbol Index
+# =============================================================================
+
+
+class SymbolIndex:
+    """
+    Exact, prefix and fuzzy symbol lookup over FinnhubID.csv
+    """
+
+    def __init__(self, arrays: typing.Dict[str, np.ndarray], max_distance: int = 1):
+        """
+        :param arrays: columns of FinnhubID.csv (see COLUMNS) as string arrays sorted by symbol,
+            plus the lookup arrays built by from_csv
+        :param max_distance: largest edit distance supported by fuzzy lookups
+        """
+        self.max_distance = max_distance
+        self._columns = [arrays[column] for column in COLUMNS]
+        self._symbols = arrays["symbols"]
+        self._symbol_start = arrays["symbol_start"]
+        self._deletion_variant = arrays["deletion_variant"]
+        self._deletion_symbol = arrays["deletion_symbol"]
+        self._width = self._symbols.dtype.itemsize // np.dtype("U1").itemsize
+
+    @classmethod
+    def from_csv(cls, path: str = "FinnhubID.csv", max_distance: int = 1) -> "SymbolIndex":
+        """
+        :param path: path of FinnhubID.csv
+        :param max_distance: largest edit distance supported by fuzzy lookups
+
+        :return: index built from the csv
+        """
+        with open(path, newline="") as file:
+            rows = sorted(tuple(row[column] for column in COLUMNS) for row in csv.DictReader(file))
+
+        arrays = {column: np.array([row[i] for row in rows], dtype=str) for i, column in enumerate(COLUMNS)}
+        # room for one extra character, used as the upper bound of prefix searches
+        width = max(len(row[0]) for row in rows) + 1 if rows else 1
+        arrays["symbol"] = arrays["symbol"].astype(f"U{width}")
+        symbols, symbol_start = np.unique(arrays["symbol"], return_index=True)
+        arrays["symbols"] = symbols
+        arrays["symbol_start"] = np.append(symbol_start, len(rows)).astype(np.int32)
+
+        variants = [(variant, i) for i, symbol in enumerate(symbols) for variant in _deletions(symbol, max_distance)]
+        variants.sort()
+        arrays["deletion_variant"] = np.array([variant for variant, _ in variants], dtype=f"U{width}")
+        arrays["deletion_symbol"] = np.array([i for _, i in variants], dtype=np.int32)
+        return cls(arrays, max_distance)
+
+    @classmethod
+    def load(cls, path: str = "FinnhubID.csv", cache_path: str = None) -> "SymbolIndex":
+        """
+        :param path: path of FinnhubID.csv
+        :param cache_path: saved index (defaults to .symbol_index.npz next to the csv),
+            rebuilt when it is older than the csv
+
+        :return: index read from the cache
+        """
+        if cache_path is None:
+            cache_path = os.path.join(os.path.dirname(os.path.abspath(path)), ".symbol_index.npz")
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+            with np.load(cache_path) as data:
+                arrays = {name: data[name] for name in data.files}
+            return cls(arrays, int(arrays.pop("max_distance")))
+
+        index = cls.from_csv(path)
+        try:
+            index.save(cache_path)
+        except OSError:
+            pass  # read-only location, keep the in-memory index only
+        return index
+
+    def save(self, path: str):
+        """
+        :param path: .npz file the index is written to
+        """
+        arrays = dict(zip(COLUMNS, self._columns))
+        with open(path, "wb") as file:
+            np.savez(
+                file,
+                symbols=self._symbols,
+                symbol_start=self._symbol_start,
+                deletion_variant=self._deletion_variant,
+                deletion_symbol=self._deletion_symbol,
+                max_distance=self.max_distance,
+                **arrays,
+            )
+
+    def records(self, symbol_class: str = None, active: typing.Tuple[datetime, datetime] = None) -> typing.List[SymbolRecord]:
+        """
+        :param symbol_class: only keep this class ("" for no class)
+        :param active: (start, end) range the symbol must have traded in
+
+        :return: all records matching the filters
+        """
+        return self._records(0, len(self._columns[0]), symbol_class, active)
+
+    def exact(self, symbol: str, symbol_class: str = None, active: typing.Tuple[datetime, datetime] = None) -> typing.List[SymbolRecord]:
+        """
+        :param symbol: ticker
+        :param symbol_class: only keep this class ("" for no class)
+        :param active: (start, end) range the symbol must have traded in
+
+        :return: records of that symbol (one per class and listing period)
+        """
+        symbol = symbol.upper()
+        if not self._fits(symbol):
+            return []
+        i = int(np.searchsorted(self._symbols, symbol))
+        if i == len(self._symbols) or self._symbols[i] != symbol:
+            return []
+        return self._records(self._symbol_start[i], self._symbol_start[i + 1], symbol_class, active)
+
+    def prefix(self, prefix: str, limit: int = 20, symbol_class: str = None, active: typing.Tuple[datetime, datetime] = None) -> typing.List[SymbolRecord]:
+        """
+        :param prefix: beginning of the ticker
+        :param limit: maximum number of records returned
+        :param symbol_class: only keep this class ("" for no class)
+        :param active: (start, end) range the symbol must have traded in
+
+        :return: records of the symbols starting with prefix, in alphabetical order
+        """
+        prefix = prefix.upper()
+        if not self._fits(prefix + "\uffff"):
+            return self.exact(prefix, symbol_class, active)[:limit]
+        lo = int(np.searchsorted(self._symbols, prefix, side="left"))
+        hi = int(np.searchsorted(self._symbols, prefix + "\uffff", side="left"))
+        return self._records(self._symbol_start[lo], self._symbol_start[hi], symbol_class, active, limit)
+
+    def fuzzy(self, query: str, max_distance: int = None, limit: int = 20, symbol_class: str = None, active: typing.Tuple[datetime, datetime] = None) -> typing.List[SymbolRecord]:
+        """
+        :param query: misspelt ticker
+        :param max_distance: largest edit distance accepted (at most the one of the index)
+        :param limit: maximum number of records returned
+        :param symbol_class: only keep this class ("" for no class)
+        :param active: (start, end) range the symbol must have traded in
+
+        :return: records of the symbols within max_distance edits, closest first
+        """
+        query = query.upper()
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+
+        variants = sorted(variant for variant in _deletions(query, max_distance) if self._fits(variant))
+        lo = np.searchsorted(self._deletion_variant, variants, side="left")
+        hi = np.searchsorted(self._deletion_variant, variants, side="right")
+        candidates = np.unique(np.concatenate([self._deletion_symbol[a:b] for a, b in zip(lo, hi)] + [[]]).astype(np.int64))
+
+        scored = []
+        for i, symbol in zip(candidates.tolist(), self._symbols[candidates].tolist()):
+            if symbol == query:
+                scored.append((0, symbol, i))
+            elif max_distance == 1:
+                if _within_one_edit(query, symbol):
+                    scored.append((1, symbol, i))
+            else:
+                distance = _edit_distance(query, symbol)
+                if distance <= max_distance:
+                    scored.append((distance, symbol, i))
+
+        symbols = np.array([i for _, _, i in sorted(scored)], dtype=np.int64)
+        counts = self._symbol_start[symbols + 1] - self._symbol_start[symbols]
+        # rows of all matched symbols, closest symbols first
+        rows = np.repeat(self._symbol_start[symbols] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return self._filter(rows, symbol_class, active, limit)
+
+    def search(self, query: str, limit: int = 20, symbol_class: str = None, active: typing.Tuple[datetime, datetime] = None) -> typing.List[SymbolRecord]:
+        """
+        Lookup for interactive tools (called on every keystroke): exact matches first,
+        then prefix matches, then fuzzy matches
+
+        :param query: ticker or beginning of the ticker
+        :param limit: maximum number of records returned
+        :param symbol_class: only keep this class ("" for no class)
+        :param active: (start, end) range the symbol must have traded in
+
+        :return: records without duplicates
+        """
+        output = self.exact(query, symbol_class, active)
+        for lookup in [self.prefix, self.fuzzy]:
+            if len(output) >= limit:
+                break
+            for record in lookup(query, limit=limit, symbol_class=symbol_class, active=active):
+                if record not in output:
+                    output.append(record)
+        return output[:limit]
+
+    def _records(self, lo: int, hi: int, symbol_class: str, active, limit: int = None) -> typing.List[SymbolRecord]:
+        """
+        :return: records of rows [lo, hi) that pass the filters
+        """
+        return self._filter(np.arange(lo, hi), symbol_class, active, limit)
+
+    def _filter(self, rows: np.ndarray, symbol_class: str, active, limit: int = None) -> typing.List[SymbolRecord]:
+        """
+        :return: records of the rows that pass the filters (in the order of rows)
+        """
+        if symbol_class is not None:
+            rows = rows[self._columns[1][rows] == symbol_class]
+        if active is not None:
+            start, end = [_to_iso(date) for date in active]
+            rows = rows[(self._columns[3][rows] <= end) & (self._columns[4][rows] >= start)]
+        if limit is not None:
+            rows = rows[:limit]
+        return list(map(SymbolRecord._make, zip(*[column[rows].tolist() for column in self._columns])))
+
+    def _fits(self, text: str) -> bool:
+        """
+        :return: whether text fits in the fixed-width string arrays (searchsorted would otherwise copy them)
+        """
+        return len(text) <= self._width
+
+
+# =============================================================================
+# Helpers
+# =============================================================================
+
+
+def _to_iso(date) -> str:
+    if isinstance(date, str):
+        return date
+    return date.strftime("%Y-%m-%d")
+
+
+def _deletions(word: str, max_distance: int) -> typing.Set[str]:
+    """
+    :return: word and every string obtained by deleting up to max_distance characters
+    """
+    variants = {word}
+    for n in range(1, min(max_distance, len(word)) + 1):
+        for positions in combinations(range(len(word)), n):
+            variants.add("".join(c for i, c in enumerate(word) if i not in positions))
+    return variants
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """
+    :return: whether a and b differ by exactly one insertion, deletion or substitution
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > 1:
+        return False
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1 :] == b[i + 1 :]
+    return a[i:] == b[i + 1 :]
+
+
+def _edit_distance(a: str, b: str) -> int:
+    """
+    :return: Levenshtein distance between a and b
+    """
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    index = SymbolIndex.load("FinnhubID.csv")
+
+    print(index.exact("AAPL"))
+    print(index.prefix("GO", limit=5))
+    print(index.fuzzy("APPL", limit=5))
+    print(index.search("BRK", symbol_class="B", active=(datetime(2019, 1, 2), datetime(2019, 12, 31))))
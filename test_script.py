@@ -1,49 +1,1440 @@
-import unittest
-
-from datetime import datetime
-from dataloader import Data_Loader_CSV
-
-
-class Test_Data_Loader(unittest.TestCase):
-    def test_csv_loader(self):
-        """
-        test script testing whether the csv loader works
-        """
-
-        data_directory = "../data/kaggle_us_eod"  # "../data/kaggle_us_eod"
-        tickers = ["DIS", "GE", "AAPL"]
-        features = []
-        start = datetime(2016, 10, 13)
-        end = datetime(2016, 11, 7)
-
-        data_loader_csv = Data_Loader_CSV(data_directory, tickers, features, start, end)
-        data = data_loader_csv.load_data()
-
-        if features == []:
-            no_features = 12
-        else:
-            no_features = len(features)
-
-        tickers_match = len(tickers) == len(data)
-
-        # no_working_days = number of working days between start and end date (CALENDAR person please implement)
-
-        features_match = True
-        days_match = True
-        for df in data.values():
-            shape_temp = df.shape
-            if shape_temp[1] != no_features:
-                features_match = False
-
-            # if shape_temp[0] != no_working_days:
-            #     days_match = False
-
-        self.assertTrue(tickers_match and features_match and days_match)
-
-
-if __name__ == "__main__":
-    unittest.main()
-
-    # If you are wondering how to implement a test function: Google unittest. There are a lot of tutorials online about this.
-
+import os
+import sys
+import json
+import asyncio
+import time
+import tempfile
+import subprocess
+import threading
+import unittest
+import multiprocessing
+import typing
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+import dataloader
+from dataloader import Data_Loader_CSV, Data_Loader_Intraday, Data_Loader_mongo_V2
+from alignment import Panel, align_to_sessions
+from asof_join import asof_panel
+from fundamentals_store import FundamentalsStore
+from ratio_engine import RatioEngine
+from concept_index import ConceptIndex
+from option_store import OptionChainStore
+import wrds_loader
+from listing_index import ListingIndex
+from universe import TopKUniverse
+import symbol_search
+from symbol_search import SymbolIndex
+from realized_vol import realized_measures, resample
+from AlphaVantageIntraMinuteCSVDownloader import AlphaVantageScheduler
+from Quandl_Data_Download_CSV import ShortVolumeFetcher, read_short_volume
+from intraday_store import IntradayStore
+from bar_aggregator import BarAggregator
+import live_cache
+from query_server import QueryClient, QueryServer
+from shared_panel import SharedPanel, attach_panel, detach_panel
+from window_sampler import WindowSampler
+import instrumentation
+
+try:
+    import dask_loader
+except ImportError:
+    dask_loader = None
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+from user_manual.USCalendar import USTradingCalendar
+
+
+class Test_Data_Loader(unittest.TestCase):
+    def test_csv_loader(self):
+        """
+        test script testing whether the csv loader works
+        """
+
+        data_directory = "../data/kaggle_us_eod"  # "../data/kaggle_us_eod"
+        tickers = ["DIS", "GE", "AAPL"]
+        features = []
+        start = datetime(2016, 10, 13)
+        end = datetime(2016, 11, 7)
+
+        data_loader_csv = Data_Loader_CSV(data_directory, tickers, features, start, end)
+        data = data_loader_csv.load_data()
+
+        if features == []:
+            no_features = 12
+        else:
+            no_features = len(features)
+
+        tickers_match = len(tickers) == len(data)
+
+        no_working_days = len(USTradingCalendar().sessions_between(start, end))
+
+        features_match = True
+        days_match = True
+        for df in data.values():
+            shape_temp = df.shape
+            if shape_temp[1] != no_features:
+                features_match = False
+
+            if shape_temp[0] != no_working_days:
+                days_match = False
+
+        self.assertTrue(tickers_match and features_match and days_match)
+
+    def test_duplicated_symbol(self):
+        """
+        test that a symbol listed twice in a daily file (two share classes) keeps the common share row
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "20161013.csv"), "w") as file:
+                file.write("symbol,class,close\nBRK,A,210000.0\nBRK,,140.5\nGE,,29.1\nGE,,29.3\n")
+            loader = Data_Loader_CSV(directory, ["BRK", "GE"], [], datetime(2016, 10, 13), datetime(2016, 10, 13))
+            data = loader.load_data()
+            panel = loader.load_panel()
+
+        self.assertEqual(data["BRK"]["close"].tolist(), [140.5])
+        self.assertEqual(data["GE"]["close"].tolist(), [29.1])
+        np.testing.assert_array_equal(panel.field("close").to_numpy()[0], [140.5, 29.1])
+
+
+class _ExtraClosingCalendar(USTradingCalendar):
+    @property
+    def adhoc_holidays(self):
+        return super().adhoc_holidays + [pd.Timestamp("2016-10-14")]
+
+
+class Test_Calendar(unittest.TestCase):
+    def test_resolve_range_outside(self):
+        """
+        test that a range entirely before or after the session index raises instead of collapsing on its bounds
+        """
+
+        calendar = USTradingCalendar(cache_dir=None)
+        self.assertEqual(calendar.resolve_range(datetime(1990, 1, 1), datetime(1992, 6, 20))[0], pd.Timestamp("1992-06-15"))
+        for start, end in [(datetime(1980, 1, 2), datetime(1990, 1, 2)), (datetime(2031, 1, 2), datetime(2031, 6, 2))]:
+            with self.assertRaises(ValueError):
+                calendar.resolve_range(start, end)
+
+    def test_cache_follows_rules(self):
+        """
+        test that editing the holidays writes and reads another cache file instead of the stale one
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            regular = USTradingCalendar("2016-01-01", "2016-12-31", cache_dir=directory)
+            edited = _ExtraClosingCalendar("2016-01-01", "2016-12-31", cache_dir=directory)
+            self.assertTrue(regular.is_session("2016-10-14")[0])
+            self.assertFalse(edited.is_session("2016-10-14")[0])
+            self.assertEqual(len([name for name in os.listdir(directory) if name.endswith(".npy")]), 2)
+            self.assertNotEqual(regular.rules_fingerprint, edited.rules_fingerprint)
+
+
+class Test_Alignment(unittest.TestCase):
+    def test_align_to_sessions(self):
+        """
+        test whether missing sessions inside the listed interval are flagged and forward-filled
+        """
+
+        sessions = USTradingCalendar().sessions_between(datetime(2016, 10, 13), datetime(2016, 10, 19))
+        data = {
+            "A": pd.DataFrame({"close": [1.0, 2.0, 4.0]}, index=sessions[[0, 1, 3]]),
+            "B": pd.DataFrame({"close": [5.0, 6.0]}, index=sessions[[2, 3]]),
+        }
+
+        panel = align_to_sessions(data, sessions, fill="ffill")
+
+        self.assertEqual(panel.values.shape, (5, 2, 1))
+        self.assertEqual(panel.gaps.sum(), 1)
+        self.assertTrue(panel.gaps[2, 0])
+        self.assertFalse(panel.listed[0, 1])
+        np.testing.assert_array_equal(panel.field("close")["A"].to_numpy()[:4], [1.0, 2.0, 2.0, 4.0])
+
+
+def _mongo_v2_client(sessions: pd.DatetimeIndex):
+    """
+    :return: mongomock client with a "kaggle_test" database in the Data_Loader_mongo_V2 layout
+        (one collection per finnhub ID and the ticker_id_meta_data collection), AAPL and GS
+    """
+    client = mongomock.MongoClient()
+    db = client["kaggle_test"]
+    for symbol, finnhub_id, close in [("AAPL", "FH000000001", 100.0), ("GS", "FH000000002", 200.0)]:
+        db[finnhub_id].insert_many(
+            [
+                {"datetime": session.to_pydatetime(), "symbol": symbol, "class": "", "finnhub_id": finnhub_id,
+                 "close": close + day, "volume": 1000.0, "div": "", "adjustment": "", "bid": close + day - 0.01, "ask": close + day + 0.01}
+                for day, session in enumerate(sessions)
+            ]
+        )
+    # created last, return_features reads the fields of the first collection
+    for symbol, finnhub_id in [("AAPL", "FH000000001"), ("GS", "FH000000002")]:
+        db["ticker_id_meta_data"].insert_one(
+            {"symbol": symbol, "class": "", "finnhub_id": finnhub_id, "start": datetime(2000, 1, 3), "end": datetime(2030, 12, 31)}
+        )
+    return client
+
+
+class Test_AsOfJoin(unittest.TestCase):
+    def test_asof_panel(self):
+        """
+        test that a reported value is only used from its filing date on (no look-ahead)
+        """
+
+        sessions = USTradingCalendar().sessions_between(datetime(2018, 4, 30), datetime(2018, 5, 4))
+        fundamentals = pd.DataFrame(
+            {
+                "symbol": ["A", "A", "B"],
+                "concept": ["eps", "eps", "eps"],
+                "value": [1.0, 2.0, 3.0],
+                "filed_date": pd.to_datetime(["2018-02-01", "2018-05-02", "2018-05-05"]),
+            }
+        )
+
+        eps = asof_panel(fundamentals, sessions, ["A", "B"]).field("eps")
+
+        np.testing.assert_array_equal(eps["A"].to_numpy(), [1.0, 1.0, 2.0, 2.0, 2.0])
+        self.assertTrue(eps["B"].isna().all())
+
+
+    @unittest.skipIf(mongomock is None, "mongomock is not installed")
+    def test_mongo_v2_fundamentals(self):
+        """
+        test that the fundamentals are joined on the symbol of the Data_Loader_mongo_V2 keys ("AAPL_")
+        """
+
+        sessions = USTradingCalendar().sessions_between(datetime(2018, 4, 30), datetime(2018, 5, 4))
+        fundamentals = pd.DataFrame(
+            {
+                "symbol": ["AAPL", "AAPL", "GS"],
+                "concept": ["eps", "eps", "eps"],
+                "value": [1.0, 2.0, 3.0],
+                "filed_date": pd.to_datetime(["2018-02-01", "2018-05-02", "2018-05-05"]),
+            }
+        )
+        client = _mongo_v2_client(sessions)
+        with mock.patch.object(dataloader, "_mongo_client", lambda: client):
+            loader = Data_Loader_mongo_V2("kaggle_test", ["AAPL", "GS"], [], sessions[0], sessions[-1])
+            data = loader._attach_fundamentals(loader.load_data(), fundamentals)
+
+        np.testing.assert_array_equal(data["AAPL_"]["eps"].to_numpy(), [1.0, 1.0, 2.0, 2.0, 2.0])
+        self.assertTrue(data["GS_"]["eps"].isna().all())
+
+
+def _minute_bars(days: typing.List[str], seed: int) -> pd.DataFrame:
+    """
+    :return: minute bars from 09:00 to 16:29 of the days (regular hours and outside), rows shuffled
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.DatetimeIndex(np.concatenate([pd.date_range(f"{day} 09:00", f"{day} 16:29", freq="1min").values for day in days]))
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, len(index))))
+    spread = np.abs(rng.normal(0, 0.05, len(index)))
+    df = pd.DataFrame(
+        {"open": close + rng.normal(0, 0.02, len(index)), "high": close + spread, "low": close - spread,
+         "close": close, "volume": rng.integers(1, 1000, len(index)).astype(np.float64)},
+        index=index,
+    )
+    return df.iloc[rng.permutation(len(df))]
+
+
+class Test_RealizedVol(unittest.TestCase):
+    def setUp(self):
+        # 2020-11-26 is Thanksgiving, its bars are not used
+        days = ["2020-11-24", "2020-11-25", "2020-11-26", "2020-11-27"]
+        self.bars = {"AAPL": _minute_bars(days, 0), "MSFT": _minute_bars(days[1:], 1)}
+
+    def _regular(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.sort_index()
+        minutes = df.index.hour * 60 + df.index.minute
+        keep = (minutes >= 9 * 60 + 30) & (minutes < 16 * 60) & (df.index.normalize() != pd.Timestamp("2020-11-26"))
+        return df[keep]
+
+    def _reference(self, df: pd.DataFrame, interval: str) -> pd.DataFrame:
+        df = self._regular(df)
+        day = df.index.normalize()
+        start = day + pd.Timedelta("09:30:00") + (df.index - day - pd.Timedelta("09:30:00")).floor(interval)
+        typical = (df["high"] + df["low"] + df["close"]) / 3
+        grouped = df.assign(pv=typical * df["volume"]).groupby(start)
+        reference = grouped.agg(open=("open", "first"), high=("high", "max"), low=("low", "min"), close=("close", "last"), volume=("volume", "sum"))
+        reference["vwap"] = grouped["pv"].sum() / reference["volume"]
+        reference.index.name = "datetime"
+        return reference
+
+    def test_resample(self):
+        """
+        test the bars of every symbol against a pandas groupby of the regular hours of the sessions
+        """
+
+        output = resample(self.bars, "30min")
+        self.assertEqual(set(output), {"AAPL", "MSFT"})
+        for ticker, df in self.bars.items():
+            pd.testing.assert_frame_equal(output[ticker], self._reference(df, "30min"), check_freq=False, check_index_type=False)
+        self.assertEqual(len(output["AAPL"]), 3 * 13)
+
+    def test_realized_measures(self):
+        """
+        test the daily measures against the 5 minute bars (no overnight return) and the VWAP against resample "1D"
+        """
+
+        measures = realized_measures(self.bars, "5min")
+        daily = resample(self.bars, "1D")
+        for ticker, df in self.bars.items():
+            bars = self._reference(df, "5min")
+            returns = np.log(bars["close"]).groupby(bars.index.normalize()).diff()
+            rv = (returns ** 2).groupby(bars.index.normalize()).sum()
+            np.testing.assert_allclose(measures[ticker]["rv"].to_numpy(), rv.to_numpy(), rtol=1e-10)
+            np.testing.assert_array_equal(measures[ticker]["n_bars"].to_numpy(), np.full(len(rv), 78))
+            np.testing.assert_allclose(measures[ticker]["vwap"].to_numpy(), daily[ticker]["vwap"].to_numpy(), rtol=1e-12)
+
+    @unittest.skipIf(mongomock is None, "mongomock is not installed")
+    def test_mongo_v2_realized(self):
+        """
+        test that the measures are attached on the symbol of the Data_Loader_mongo_V2 keys ("AAPL_")
+        """
+
+        sessions = USTradingCalendar().sessions_between(datetime(2020, 11, 24), datetime(2020, 11, 27))
+        client = _mongo_v2_client(sessions)
+        with mock.patch.object(dataloader, "_mongo_client", lambda: client):
+            loader = Data_Loader_mongo_V2("kaggle_test", ["AAPL"], [], sessions[0], sessions[-1])
+            data = loader._attach_realized(loader.load_data(), self.bars)
+
+        expected = realized_measures(self.bars)["AAPL"]["rv"]
+        np.testing.assert_array_equal(data["AAPL_"]["realized_rv"].to_numpy(), expected.to_numpy())
+
+
+def _write_report(source: str, folder: str, symbol: str, value: float, mtime: int, revenues: bool = True):
+    """
+    writes one reported financials JSON file (Kaggle/Finnhub layout) with a fixed modification time,
+    Assets on the balance sheet and Revenues on the income statement unless revenues is False
+    """
+    path = os.path.join(source, folder, f"{symbol}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    report = {
+        "symbol": symbol, "year": 2018, "quarter": 1, "filedDate": "2018-05-01",
+        "data": {"bs": [{"concept": "Assets", "unit": "USD", "value": value}], "cf": [], "ic": [{"concept": "Revenues", "unit": "USD", "value": value / 10}] if revenues else []},
+    }
+    with open(path, "w") as file:
+        json.dump(report, file)
+    os.utime(path, ns=(mtime, mtime))
+
+
+class Test_FundamentalsStore(unittest.TestCase):
+    def test_incremental_ingest(self):
+        """
+        test that a malformed report is recorded without stopping the ingest, that a re-scan only parses
+        the changed files, and that changed and removed reports replace / drop their rows
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "source")
+            for i, symbol in enumerate(["AAA", "BBB", "CCC"]):
+                _write_report(source, "2018.QTR2", symbol, 100.0 * (i + 1), 10 ** 18)
+            _write_report(source, "2018.QTR3", "DDD", 400.0, 10 ** 18)
+            with open(os.path.join(source, "2018.QTR2", "BAD.json"), "w") as file:
+                file.write("{not json")
+            store = FundamentalsStore(os.path.join(directory, "store"))
+
+            first = store.ingest(source, 2018, 2018, workers=1)
+            parts = os.listdir(os.path.join(directory, "store", "year=2018", "quarter=2"))
+            second = store.ingest(source, 2018, 2018, workers=1)
+            _write_report(source, "2018.QTR2", "BBB", 250.0, 2 * 10 ** 18)
+            os.remove(os.path.join(source, "2018.QTR2", "CCC.json"))
+            third = store.ingest(source, 2018, 2018, workers=1)
+            assets = store.read(concepts=["Assets"]).set_index("symbol")["value"]
+            failures = store.failures()
+
+        self.assertEqual((first["parsed"], first["failed"], first["rows"]), (4, 1, 8))
+        self.assertEqual(len(parts), 1)  # one part per (year, quarter) batch
+        self.assertEqual((second["parsed"], second["failed"], second["unchanged"]), (0, 0, 5))
+        self.assertEqual((third["parsed"], third["removed"], third["unchanged"]), (1, 1, 3))
+        self.assertEqual(assets.sort_index().to_dict(), {"AAA": 100.0, "BBB": 250.0, "DDD": 400.0})
+        self.assertEqual(list(failures), ["2018.QTR2/BAD.json"])
+
+
+class Test_RatioEngine(unittest.TestCase):
+    def setUp(self):
+        # AAA reports 8 quarters of 2017-2018 with the second revenue concept, BBB one restated quarter
+        rows = []
+        for k in range(8):
+            year, quarter = 2017 + k // 4, k % 4 + 1
+            rows.append(["AAA", year, quarter, "us-gaap_SalesRevenueNet", 100.0 + 10 * k, "2019-01-01"])
+            rows.append(["AAA", year, quarter, "us-gaap_NetIncomeLoss", 10.0 + k, "2019-01-01"])
+            rows.append(["AAA", year, quarter, "us-gaap_StockholdersEquity", 200.0, "2019-01-01"])
+        rows.append(["BBB", 2018, 1, "us-gaap_Revenues", 50.0, "2018-05-01"])
+        rows.append(["BBB", 2018, 1, "us-gaap_Revenues", 60.0, "2018-08-01"])  # restated
+        rows.append(["BBB", 2018, 1, "us-gaap_SalesRevenueNet", 999.0, "2018-05-01"])  # less preferred concept
+        rows.append(["BBB", None, 2, "us-gaap_Revenues", 70.0, "2018-08-01"])  # no fiscal year
+        self.fundamentals = pd.DataFrame(rows, columns=["symbol", "fiscal_year", "fiscal_quarter", "concept", "value", "filed_date"])
+        self.fundamentals["fiscal_year"] = self.fundamentals["fiscal_year"].astype("Int64")
+
+    def test_aliases_and_lag(self):
+        """
+        test that an alias takes the first reported concept and the latest filing, that a missing concept
+        gives NaN, and that lag / growth look 4 quarters back
+        """
+
+        engine = RatioEngine(self.fundamentals)
+        revenue = pd.DataFrame(engine.alias("revenue"), index=engine.symbols, columns=engine.periods)
+
+        self.assertEqual(len(engine.periods), 8)
+        np.testing.assert_array_equal(revenue.loc["AAA"].to_numpy(), 100.0 + 10 * np.arange(8))
+        self.assertEqual(revenue.loc["BBB", (2018, 1)], 60.0)
+        self.assertEqual(int(revenue.loc["BBB"].notna().sum()), 1)
+        self.assertTrue(np.isnan(engine.alias("assets")).all())
+        self.assertTrue(np.isnan(engine.ratio("roa")).all())
+
+        ratios = engine.compute(["roe", "revenue_growth"])
+        np.testing.assert_allclose(ratios["roe"].loc["AAA"].to_numpy(), (10.0 + np.arange(8)) / 200.0)
+        growth = ratios["revenue_growth"].loc["AAA"].to_numpy()
+        self.assertTrue(np.isnan(growth[:4]).all())
+        np.testing.assert_allclose(growth[4:], (140.0 + 10 * np.arange(4)) / (100.0 + 10 * np.arange(4)) - 1)
+        self.assertTrue(np.isnan(ratios["revenue_growth"].loc["BBB"]).all())  # no 2017 quarter
+
+    def test_cache(self):
+        """
+        test that computed matrices are reused, and that redefining a ratio or an alias it references
+        recomputes it
+        """
+
+        engine = RatioEngine(self.fundamentals, ratios={"margin": "net_income / revenue", "double": "2 * margin"})
+        first = engine.ratio("double")
+        self.assertIs(engine.ratio("double"), first)
+        self.assertIs(engine.ratio("margin"), engine.ratio("margin"))
+
+        aaa = engine.symbols.get_loc("AAA")
+        engine.ratios["margin"] = "net_income / equity"
+        np.testing.assert_allclose(engine.ratio("double")[aaa], 2 * (10.0 + np.arange(8)) / 200.0)
+        engine.aliases["equity"] = ["us-gaap_SalesRevenueNet"]
+        np.testing.assert_allclose(engine.ratio("double")[aaa], 2 * (10.0 + np.arange(8)) / (100.0 + 10 * np.arange(8)))
+
+        engine.ratios["margin"] = "double / 2"
+        with self.assertRaises(ValueError):
+            engine.ratio("double")
+
+
+class Test_ConceptIndex(unittest.TestCase):
+    def test_queries_and_update(self):
+        """
+        test lookup / intersect / union / covering over a small store, and that indexing a new quarter
+        incrementally gives the same pairs as a full rebuild and survives save / load
+        """
+
+        def pairs(index, keys):
+            return set(index.to_frame(keys).itertuples(index=False, name=None))
+
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "source")
+            for folder, without_revenues in [("2018.QTR1", ["BBB"]), ("2018.QTR2", ["CCC"])]:
+                for symbol in ["AAA", "BBB", "CCC"]:
+                    _write_report(source, folder, symbol, 100.0, 10 ** 18, revenues=symbol not in without_revenues)
+            store = FundamentalsStore(os.path.join(directory, "store"))
+            store.ingest(source, 2018, 2018, workers=1)
+            index = ConceptIndex.from_store(store)
+
+            revenues = {("AAA", 2018, 1), ("CCC", 2018, 1), ("AAA", 2018, 2), ("BBB", 2018, 2)}
+            self.assertEqual(pairs(index, index.lookup("Revenues")), revenues)
+            self.assertEqual(len(index.lookup("Revenues", statement="bs")), 0)
+            self.assertEqual(pairs(index, index.intersect(["Assets", "Revenues"])), revenues)
+            self.assertEqual(len(index.union(["Assets", "Revenues"])), 6)
+            self.assertTrue((np.diff(index.union(["Assets", "Revenues"])) > 0).all())
+            self.assertEqual(index.covering(["Assets", "Revenues"], (2018, 1), (2018, 2)), ["AAA"])
+            self.assertEqual(sorted(index.covering(["Assets"], (2018, 1), (2018, 2), statement="bs")), ["AAA", "BBB", "CCC"])
+            self.assertEqual(index.summary(2018, 1)["BBB"], {"bs": {"Assets"}, "cf": set(), "ic": set()})
+
+            _write_report(source, "2018.QTR3", "DDD", 100.0, 10 ** 18)
+            _write_report(source, "2018.QTR3", "AAA", 100.0, 10 ** 18, revenues=False)
+            store.ingest(source, 2018, 2018, workers=1)
+            index.update(store, years=[2018], quarters=[3])
+            rebuilt = ConceptIndex.from_store(store)
+            path = os.path.join(directory, "index.npz")
+            index.save(path)
+            loaded = ConceptIndex.load(path)
+
+        for concept in ["Assets", "Revenues"]:
+            self.assertEqual(pairs(index, index.lookup(concept)), pairs(rebuilt, rebuilt.lookup(concept)))
+            np.testing.assert_array_equal(loaded.lookup(concept), index.lookup(concept))
+        self.assertEqual(pairs(index, index.lookup("Revenues")), revenues | {("DDD", 2018, 3)})
+        self.assertEqual(index.covering(["Assets"], (2018, 1), (2018, 3)), ["AAA"])
+        self.assertEqual(loaded.symbols, index.symbols)
+        np.testing.assert_array_equal(loaded.periods, [2018 * 4, 2018 * 4 + 1, 2018 * 4 + 2])
+
+
+def _surface_value(secid: int, days: float, delta: float, put: bool) -> float:
+    """
+    implied volatility of the synthetic surface, bilinear in (days, delta) so interpolation is exact
+    """
+    return 0.1 * secid + 0.001 * days + 0.002 * delta + 0.00001 * days * delta + (0.05 if put else 0.0)
+
+
+class Test_OptionStore(unittest.TestCase):
+    def setUp(self):
+        rows = []
+        for date in [datetime(2015, 12, 10), datetime(2015, 12, 11)]:
+            for secid in [101, 102]:
+                for days in [30, 60, 91]:
+                    for delta in [25.0, 50.0, 75.0]:
+                        for cp_flag in ["C", "P"]:
+                            value = _surface_value(secid, days, delta, cp_flag == "P") + (0.5 if date.day == 11 else 0.0)
+                            rows.append([date, secid, days, delta, cp_flag, value])
+        df = pd.DataFrame(rows, columns=["date", "secid", "days", "delta", "cp_flag", "impl_volatility"])
+        df = df.sample(frac=1.0, random_state=0)  # the store sorts the rows itself
+        # same layout as wrds_loader_option_metrics: one Dataframe per secid indexed by date
+        self.data = {secid: group.set_index("date") for secid, group in df.groupby("secid")}
+        self.df = df
+
+    def test_build_and_slice(self):
+        """
+        test that chains come back sorted by tenor and moneyness, that slice filters match pandas, and
+        that the memory-mapped and in-memory stores read the same rows
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = OptionChainStore.build(self.data, directory)
+            self.assertIsInstance(store._arrays["impl_volatility"], np.memmap)
+            loaded = OptionChainStore(directory, mmap=False)
+
+            self.assertEqual(list(store.dates()), [pd.Timestamp(2015, 12, 10), pd.Timestamp(2015, 12, 11)])
+            self.assertEqual(store.secids(datetime(2015, 12, 10)).tolist(), [101, 102])
+            chain = store.chain(datetime(2015, 12, 11), 102)
+            self.assertEqual(len(chain), 18)
+            self.assertTrue(chain[["days", "delta"]].apply(tuple, axis=1).is_monotonic_increasing)
+            self.assertEqual(len(store.chain(datetime(2015, 12, 12), 102)), 0)
+
+            sliced = store.slice(datetime(2015, 12, 10), datetime(2015, 12, 11), secids=[102], tenor=(40, 100), moneyness=(50, 75), cp_flag="P")
+            expected = self.df[
+                (self.df["secid"] == 102) & (self.df["days"] >= 40) & (self.df["delta"] >= 50) & (self.df["cp_flag"] == "P")
+            ].sort_values(["date", "days", "delta"])
+            self.assertEqual(len(sliced), 8)
+            np.testing.assert_allclose(sliced["impl_volatility"].to_numpy(), expected["impl_volatility"].to_numpy())
+            self.assertTrue((sliced["cp_flag"] == "P").all())
+
+            everything = store.slice(datetime(2015, 12, 10), datetime(2015, 12, 11))
+            pd.testing.assert_frame_equal(everything, loaded.slice(datetime(2015, 12, 10), datetime(2015, 12, 11)))
+            self.assertEqual(len(everything), len(self.df))
+            del store, loaded, everything, chain, sliced  # release the memory maps before the directory is removed
+
+    def test_interpolate(self):
+        """
+        test the bilinear interpolation against the grid values, between grid points, and clamped to the edges
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = OptionChainStore.build(self.data, directory)
+            date = datetime(2015, 12, 10)
+            for days, delta in [(30, 25.0), (60, 50.0), (91, 75.0), (45, 50.0), (60, 37.5), (75.5, 62.5)]:
+                for cp_flag in ["C", "P"]:
+                    values = store.interpolate(date, days, delta, cp_flag=cp_flag)
+                    expected = [_surface_value(secid, days, delta, cp_flag == "P") for secid in [101, 102]]
+                    self.assertEqual(values.index.tolist(), [101, 102])
+                    np.testing.assert_allclose(values.to_numpy(), expected)
+            # outside the grid the value at the nearest edge is taken
+            np.testing.assert_allclose(store.interpolate(date, 10, 90.0, cp_flag="C").to_numpy(), [_surface_value(secid, 30, 75.0, False) for secid in [101, 102]])
+            np.testing.assert_allclose(store.interpolate(datetime(2015, 12, 11), 60, 50.0, cp_flag="C").to_numpy(), [_surface_value(secid, 60, 50.0, False) + 0.5 for secid in [101, 102]])
+            self.assertEqual(len(store.interpolate(datetime(2015, 12, 12), 60, 50.0)), 0)
+            del store
+
+
+class _StubWRDS:
+    """
+    stand-in for wrds.Connection, the yearly tables answer in reverse year order (earlier years are slower)
+    """
+
+    tables = ["securd1", "stdopd2014", "stdopd2015", "stdopd2017", "stdopd2018"]
+
+    def __init__(self, queries: list):
+        self.queries = queries
+        self.closed = False
+
+    def list_tables(self, library):
+        return list(self.tables)
+
+    def raw_sql(self, query, date_cols=None, index_col=None):
+        table = query.split(" join optionm.")[1].split(" ")[0]
+        self.queries.append((self, table, query))
+        year = int(table[-4:])
+        time.sleep(0.1 * (2018 - year))
+        dates = pd.to_datetime([f"{year}-12-15", f"{year}-06-01", f"{year}-12-15"])
+        df = pd.DataFrame({"date": dates, "ticker": ["AAPL", "AAPL", "GS"], "secid": [101, 101, 102], "days": [30, 30, 30]})
+        return df.set_index("date")
+
+    def close(self):
+        self.closed = True
+
+
+class Test_WRDSLoader(unittest.TestCase):
+    def test_load_table_multi_year(self):
+        """
+        test that only the yearly tables of the range that exist are queried, with the dates clipped to
+        each year, on pooled connections other than the main one, and that the result is in date order
+        """
+
+        queries = []
+        connections = []
+
+        def connect():
+            connections.append(_StubWRDS(queries))
+            return connections[-1]
+
+        with mock.patch.object(wrds_loader, "_connect", connect):
+            loader = wrds_loader.wrds_loader_option_metrics(pool_size=4)
+            output = loader.load_table_multi_year("stdopd", datetime(2015, 6, 1), datetime(2017, 3, 31))
+            main = loader.db
+            loader.close_connection()
+
+        self.assertEqual(sorted(table for _, table, _ in queries), ["stdopd2015", "stdopd2017"])
+        by_table = {table: query for _, table, query in queries}
+        self.assertIn("'2015-06-01'", by_table["stdopd2015"])
+        self.assertIn("'2015-12-31'", by_table["stdopd2015"])
+        self.assertIn("'2017-01-01'", by_table["stdopd2017"])
+        self.assertIn("'2017-03-31'", by_table["stdopd2017"])
+        self.assertTrue(all(connection is not main for connection, _, _ in queries))
+        self.assertTrue(all(connection.closed for connection in connections))
+
+        self.assertEqual(sorted(output), ["AAPL", "GS"])
+        self.assertTrue(output["AAPL"].index.is_monotonic_increasing)
+        self.assertEqual(list(output["AAPL"].index.year), [2015, 2015, 2017, 2017])
+        self.assertEqual(list(output["GS"].index), [pd.Timestamp(2015, 12, 15), pd.Timestamp(2017, 12, 15)])
+
+
+class Test_ListingIndex(unittest.TestCase):
+    def test_snapshots(self):
+        """
+        test is_listed / changes_between / events against the daily snapshots they are built from,
+        over more than 8 dates so the packed bitmap spans two bytes, with one ID delisted and relisted
+        """
+
+        dates = pd.bdate_range("2020-01-02", periods=10)
+        presence = {
+            "FH1": [1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+            "FH2": [1, 1, 1, 0, 0, 0, 1, 1, 1, 1],  # delisted after day 2, relisted on day 6
+            "FH3": [0, 0, 0, 0, 1, 1, 1, 1, 0, 0],
+            "FH4": [0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            for k, date in enumerate(dates):
+                ids = [ticker for ticker, flags in presence.items() if flags[k]]
+                pd.DataFrame({"symbol": [t.lower() for t in ids], "finnhub_id": ids}).to_csv(os.path.join(directory, date.strftime("%Y%m%d.csv")), index=False)
+            index = ListingIndex.from_csv(directory)
+            path = os.path.join(directory, "index.npz")
+            index.save(path)
+            loaded = ListingIndex.load(path)
+
+        for ticker, flags in presence.items():
+            self.assertEqual([index.is_listed(ticker, date) for date in dates], [bool(flag) for flag in flags])
+            self.assertEqual([loaded.is_listed(ticker, date) for date in dates], [bool(flag) for flag in flags])
+        self.assertEqual(list(loaded.ids), list(index.ids))  # saved as unicode, loaded without pickle
+        self.assertFalse(index.is_listed("FH9", dates[0]))
+        self.assertFalse(index.is_listed("FH1", datetime(2020, 1, 4)))  # no snapshot on that date
+
+        delisted, listed = index.changes_between(dates[2], dates[4])
+        self.assertEqual((list(delisted), list(listed)), (["FH2"], ["FH3"]))
+        delisted, listed = index.changes_between(dates[5], dates[9])
+        self.assertEqual((sorted(delisted), sorted(listed)), (["FH3"], ["FH2", "FH4"]))
+        with self.assertRaises(Exception):
+            index.changes_between(dates[0], datetime(2020, 1, 4))
+
+        expected = pd.DataFrame(
+            [
+                ["FH1", dates[0], "listing"],
+                ["FH2", dates[0], "listing"],
+                ["FH2", dates[2], "delisting"],
+                ["FH3", dates[4], "listing"],
+                ["FH2", dates[6], "relisting"],
+                ["FH3", dates[7], "delisting"],
+                ["FH4", dates[9], "listing"],
+            ],
+            columns=["id", "date", "event"],
+        )
+        events = index.events()
+        self.assertEqual(events.astype(str).values.tolist(), expected.astype(str).values.tolist())
+        intervals = index.listing_intervals()
+        self.assertEqual((intervals.loc["FH2", "start"], intervals.loc["FH2", "end"]), (dates[0], dates[9]))
+        self.assertEqual((intervals.loc["FH3", "start"], intervals.loc["FH3", "end"]), (dates[4], dates[7]))
+
+
+class Test_Universe(unittest.TestCase):
+    def test_top_k(self):
+        """
+        test the daily top-K members against a brute-force sort of the windowed, lagged measure,
+        with missing data, a split for the adjusted volume, and K above the number of traded IDs
+        """
+
+        rng = np.random.default_rng(5)
+        n_sessions, n_ids = 40, 12
+        values = np.stack([rng.uniform(1e5, 1e6, (n_sessions, n_ids)), rng.uniform(10, 100, (n_sessions, n_ids))], axis=2)
+        presence = rng.random((n_sessions, n_ids)) > 0.15
+        presence[:, 11] = False  # never traded
+        codes = np.full((n_sessions, n_ids), -1, dtype=np.int32)
+        codes[20, 3] = 0  # 2:1 split of the fourth ID
+        sessions = USTradingCalendar().sessions_between(datetime(2016, 1, 4), datetime(2016, 12, 30))[:n_sessions]
+        ids = [f"ID{i}" for i in range(n_ids)]
+        panel = Panel(values, sessions, ids, ["volume", "close"], presence, {"adjustment": (codes, np.array(["2:1"], dtype=object))})
+
+        def brute_force(measure, k, window, lag):
+            score = values[:, :, 0].copy()
+            if measure == "dollar_volume":
+                score = score * values[:, :, 1]
+            elif measure == "adjvolume":
+                score[20:, 3] = score[20:, 3] / 2
+            expected = []
+            for s in range(n_sessions):
+                rows = range(max(0, s - lag - window + 1), s - lag + 1)
+                ranked = []
+                for i in range(n_ids):
+                    window_values = [score[r, i] for r in rows if presence[r, i]]
+                    if len(window_values) > 0:
+                        ranked.append((-np.mean(window_values), ids[i]))
+                expected.append([ticker for _, ticker in sorted(ranked)[:k]])
+            return expected
+
+        for measure, k, window, lag in [("dollar_volume", 5, 1, 0), ("volume", 5, 5, 1), ("adjvolume", 4, 3, 2), ("volume", 20, 2, 0)]:
+            universe = TopKUniverse.from_panel(panel, k=k, measure=measure, window=window, lag=lag)
+            expected = brute_force(measure, k, window, lag)
+            membership = universe.membership()
+            for s, session in enumerate(sessions):
+                self.assertEqual(list(universe.on(session)), expected[s], (measure, window, lag, s))
+                self.assertEqual(sorted(membership.columns[membership.iloc[s].to_numpy()]), sorted(expected[s]))
+
+        # k is clamped to the number of IDs, and must be at least 1
+        self.assertEqual(TopKUniverse.from_panel(panel, k=100, measure="volume").members.shape, (n_sessions, n_ids))
+        for k in [0, -1]:
+            with self.assertRaises(Exception):
+                TopKUniverse.from_panel(panel, k=k)
+
+
+_FINNHUB_ROWS = [
+    ["AAPL", "", "FH1", "1992-06-15", "2019-12-31"],
+    ["AAP", "", "FH2", "2001-11-29", "2019-12-31"],
+    ["AAPX", "", "FH3", "2010-01-04", "2012-06-29"],
+    ["BRK", "A", "FH4", "1992-06-15", "2019-12-31"],
+    ["BRK", "B", "FH5", "1996-05-09", "2019-12-31"],
+    ["APPN", "", "FH6", "2018-07-27", "2019-12-31"],
+    ["ABC", "", "FH7", "1994-01-03", "2001-12-31"],
+    ["ABC", "", "FH8", "2005-01-03", "2019-12-31"],  # symbol reused after a delisting
+]
+
+
+class Test_SymbolSearch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "FinnhubID.csv")
+        pd.DataFrame(_FINNHUB_ROWS, columns=symbol_search.COLUMNS).to_csv(self.path, index=False)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lookups(self):
+        """
+        test exact / prefix / fuzzy lookups with the class and date filters, fuzzy against a brute-force edit distance
+        """
+
+        index = SymbolIndex.from_csv(self.path, max_distance=2)
+        ids = lambda records: [record.finnhub_id for record in records]
+
+        self.assertEqual(ids(index.exact("aapl")), ["FH1"])
+        self.assertEqual(ids(index.exact("AAPLX")), [])
+        self.assertEqual(ids(index.exact("BRK")), ["FH4", "FH5"])
+        self.assertEqual(ids(index.exact("BRK", symbol_class="B")), ["FH5"])
+        self.assertEqual(ids(index.exact("ABC", active=(datetime(2002, 1, 2), datetime(2004, 12, 31)))), [])
+        self.assertEqual(ids(index.exact("ABC", active=(datetime(2001, 6, 1), datetime(2005, 6, 1)))), ["FH7", "FH8"])
+
+        self.assertEqual(ids(index.prefix("AAP")), ["FH2", "FH1", "FH3"])
+        self.assertEqual(ids(index.prefix("AAP", limit=2)), ["FH2", "FH1"])
+        self.assertEqual(ids(index.prefix("AAP", active=(datetime(2015, 1, 2), datetime(2015, 12, 31)))), ["FH2", "FH1"])
+        self.assertEqual(ids(index.prefix("B", symbol_class="A")), ["FH4"])
+
+        symbols = sorted({row[0] for row in _FINNHUB_ROWS})
+        for query in ["APPL", "AAPL", "BRKK", "AB", "XYZ"]:
+            for max_distance in [1, 2]:
+                expected = sorted((symbol_search._edit_distance(query, symbol), symbol) for symbol in symbols)
+                expected = [symbol for distance, symbol in expected if distance <= max_distance]
+                found = [record.symbol for record in index.fuzzy(query, max_distance=max_distance)]
+                self.assertEqual(list(dict.fromkeys(found)), expected, (query, max_distance))
+        self.assertEqual(ids(index.fuzzy("BRKK", symbol_class="B")), ["FH5"])
+        self.assertEqual(ids(index.search("AAP", limit=4)), ["FH2", "FH1", "FH3", "FH7"])  # then ABC, 2 edits away
+
+    def test_cache(self):
+        """
+        test that load reuses the saved index, and rebuilds it once FinnhubID.csv is newer
+        """
+
+        cache = os.path.join(self.directory.name, ".symbol_index.npz")
+        self.assertEqual(len(SymbolIndex.load(self.path).records()), len(_FINNHUB_ROWS))
+        self.assertTrue(os.path.exists(cache))
+
+        with mock.patch.object(SymbolIndex, "from_csv", side_effect=AssertionError("index rebuilt")):
+            self.assertEqual(len(SymbolIndex.load(self.path).exact("BRK")), 2)
+
+        pd.DataFrame(_FINNHUB_ROWS + [["MSFT", "", "FH9", "1992-06-15", "2019-12-31"]], columns=symbol_search.COLUMNS).to_csv(self.path, index=False)
+        newer = os.path.getmtime(cache) + 10
+        os.utime(self.path, (newer, newer))
+        self.assertEqual([record.finnhub_id for record in SymbolIndex.load(self.path).exact("MSFT")], ["FH9"])
+        self.assertGreaterEqual(os.path.getmtime(cache), newer - 10)
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """
+    local stand-in for the Alpha Vantage API, the first request of every slice fails with a 503
+    """
+
+    seen = set()
+
+    def do_GET(self):
+        query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        job = (query["symbol"], query["slice"])
+        if job not in self.seen:
+            self.seen.add(job)
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = f"time,open,high,low,close,volume\n2020-01-02 09:31:00,1,1,1,1,{len(self.seen)}\n".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Test_AlphaVantageScheduler(unittest.TestCase):
+    def test_retry_and_resume(self):
+        """
+        test that failed slices are retried and that a second run resumes from the ledger
+        """
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        written = []
+
+        with tempfile.TemporaryDirectory() as directory:
+            arguments = dict(
+                slices=["year1month1", "year1month2"],
+                sink=lambda symbol, s_slice, text: written.append((symbol, s_slice)) or 1,
+                ledger_path=os.path.join(directory, "ledger.json"),
+                requests_per_minute=6000,
+                backoff=0.01,
+                api_base=f"http://127.0.0.1:{server.server_address[1]}/query",
+            )
+            first = AlphaVantageScheduler("test", ["AAPL", "MSFT"], **arguments).run()
+            second = AlphaVantageScheduler("test", ["AAPL", "MSFT"], **arguments).run()
+        server.shutdown()
+
+        self.assertEqual(first, {"done": 4, "failed": 0, "skipped": 0})
+        self.assertEqual(second, {"done": 0, "failed": 0, "skipped": 4})
+        self.assertEqual(len(written), 4)
+
+
+def _bars(times: typing.List[str], close: float) -> pd.DataFrame:
+    """
+    :return: minute bars at the times, close increasing by 1 from close (values exact in float32)
+    """
+    close = close + np.arange(len(times), dtype=np.float64)
+    return pd.DataFrame(
+        {"open": close, "high": close + 0.5, "low": close - 0.5, "close": close, "volume": np.full(len(times), 100.0)},
+        index=pd.DatetimeIndex(np.array(times, dtype="datetime64[ns]"), name="datetime"),
+    )
+
+
+class Test_IntradayStore(unittest.TestCase):
+    def test_append_read_day(self):
+        """
+        test that overlapping appends keep one bar per timestamp (the newest), that the day index and
+        read agree across a month boundary, and that a day without bars is empty
+        """
+
+        days = ["2020-01-30", "2020-01-31", "2020-02-03", "2020-02-04"]
+        first = _bars([f"{day} 09:{30 + m}" for day in days for m in range(5)], 100.0)
+        second = _bars(["2020-01-31 09:33", "2020-01-31 09:34", "2020-02-03 09:30", "2020-02-03 09:31", "2020-02-03 09:45"], 500.0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = IntradayStore(directory)
+            added = [store.append("AAPL", first), store.append("AAPL", second), store.append("AAPL", second)]
+            months = store.months("AAPL")
+            spanning = store.read("AAPL", datetime(2020, 1, 31, 9, 32), datetime(2020, 2, 3, 9, 33))
+            everything = store.read("AAPL", datetime(2020, 1, 1), datetime(2020, 3, 1))
+            by_day = {day: store.day("AAPL", day) for day in days}
+            weekend = store.day("AAPL", datetime(2020, 2, 1))
+            no_file = store.day("AAPL", datetime(2020, 3, 2))
+            unknown = store.read("MSFT", datetime(2020, 1, 1), datetime(2020, 3, 1))
+
+        expected = pd.concat([first, second])
+        expected = expected[~expected.index.duplicated(keep="last")].sort_index()
+        self.assertEqual(added, [20, 1, 0])  # only 09:45 is a new timestamp in the second slice
+        self.assertEqual(months, ["202001", "202002"])
+        pd.testing.assert_frame_equal(everything, expected.astype(np.float32), check_freq=False)
+        self.assertEqual(everything.loc["2020-02-03 09:30", "close"], 502.0)
+        pd.testing.assert_frame_equal(spanning, everything.loc["2020-01-31 09:32":"2020-02-03 09:32"], check_freq=False)
+        self.assertEqual(spanning.index[0], pd.Timestamp("2020-01-31 09:32"))
+        self.assertEqual(spanning.index[-1], pd.Timestamp("2020-02-03 09:32"))
+        for day, df in by_day.items():
+            pd.testing.assert_frame_equal(df, everything.loc[day], check_freq=False)
+        self.assertEqual(len(by_day["2020-02-03"]), 6)
+        self.assertEqual((len(weekend), len(no_file), len(unknown)), (0, 0, 0))
+        self.assertEqual(list(weekend.columns), list(everything.columns))
+
+
+class _ShortVolumeHandler(BaseHTTPRequestHandler):
+    """
+    local stand-in for the Quandl FINRA datasets, serves the rows after start_date
+    """
+
+    rows = [("2019-12-30", 10), ("2019-12-31", 20), ("2020-01-02", 30)]
+    requests = []
+
+    def do_GET(self):
+        query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        self.requests.append(query.get("start_date"))
+        lines = ["Date,ShortVolume,ShortExemptVolume,TotalVolume"]
+        lines += [f"{d},{v},0,{2 * v}" for d, v in self.rows if d >= query.get("start_date", "")]
+        body = "\n".join(lines).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _FailingShortVolumeHandler(_ShortVolumeHandler):
+    """
+    same stand-in, BAD answers with a 400 and JUNK with a csv without a date column
+    """
+
+    requests = []
+
+    def do_GET(self):
+        if "FNSQ_BAD" in self.path:
+            self.send_response(400)
+            self.end_headers()
+            return
+        if "FNSQ_JUNK" in self.path:
+            body = b"Symbol,Volume\nJUNK,1\n"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        super().do_GET()
+
+
+class Test_ShortVolumeFetcher(unittest.TestCase):
+    def test_failing_symbols(self):
+        """
+        test that HTTP and csv errors of one symbol are reported in failures without stopping the others,
+        and that unexpected errors propagate
+        """
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _FailingShortVolumeHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api_base = f"http://127.0.0.1:{server.server_address[1]}/api/v3"
+
+        with tempfile.TemporaryDirectory() as directory:
+            id_file = os.path.join(directory, "ids.csv")
+            with open(id_file, "w") as f:
+                f.write("symbol,class,finnhub_id,start,end\nAAPL,,FH1,1992-06-15,2019-12-31\n")
+            fetcher = ShortVolumeFetcher(os.path.join(directory, "short_volume"), "key", id_file=id_file, api_base=api_base, backoff=0)
+            counts = fetcher.update(["AAPL", "BAD", "JUNK"])
+            failures = dict(fetcher.failures)
+            high_water = dict(fetcher.high_water)
+
+            other = ShortVolumeFetcher(os.path.join(directory, "other"), "key", id_file=id_file, api_base=api_base, backoff=0)
+            with mock.patch.object(other, "_finnhub_ids", side_effect=RuntimeError("bug")):
+                with self.assertRaises(RuntimeError):
+                    other.update(["AAPL"])
+        server.shutdown()
+
+        self.assertEqual(counts, {"AAPL": 3, "BAD": -1, "JUNK": -1})
+        self.assertEqual(sorted(failures), ["BAD", "JUNK"])
+        self.assertIn("400", failures["BAD"])
+        self.assertTrue(failures["JUNK"].startswith("KeyError"))
+        self.assertEqual(list(high_water), ["AAPL"])
+
+    def test_incremental_update(self):
+        """
+        test that a second run only requests and appends the dates after the high-water mark
+        """
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _ShortVolumeHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api_base = f"http://127.0.0.1:{server.server_address[1]}/api/v3"
+
+        with tempfile.TemporaryDirectory() as directory:
+            id_file = os.path.join(directory, "ids.csv")
+            with open(id_file, "w") as f:
+                f.write("symbol,class,finnhub_id,start,end\nAAPL,,FH1,1992-06-15,2019-12-31\n")
+            root = os.path.join(directory, "short_volume")
+
+            first = ShortVolumeFetcher(root, "key", id_file=id_file, api_base=api_base).update(["AAPL"])
+            _ShortVolumeHandler.rows.append(("2020-01-03", 40))
+            second = ShortVolumeFetcher(root, "key", id_file=id_file, api_base=api_base).update(["AAPL"])
+            df = read_short_volume(root)
+        server.shutdown()
+
+        self.assertEqual((first, second), ({"AAPL": 3}, {"AAPL": 1}))
+        self.assertEqual(_ShortVolumeHandler.requests, [None, "2020-01-03"])
+        self.assertEqual(list(df["short_volume"]), [10, 20, 30, 40])
+        self.assertEqual(set(df["finnhub_id"]), {"FH1"})
+
+
+class Test_LiveCache(unittest.TestCase):
+    @unittest.skipIf(live_cache.websockets is None, "websockets is not installed")
+    def test_replay_to_bars(self):
+        """
+        test that replayed trades reach the ring buffers and are rolled into minute bars in the store,
+        in exchange local time (a 14:30Z trade is stored at 09:30)
+        """
+
+        n = 600
+        ticks = pd.DataFrame(
+            {
+                "symbol": np.where(np.arange(n) % 2 == 0, "AAPL", "MSFT"),
+                "time": pd.Timestamp("2021-03-01 14:30") + pd.to_timedelta(np.arange(n) * 500, "ms"),
+                "price": 100 + np.arange(n) * 0.01,
+                "volume": np.ones(n),
+            }
+        )
+
+        async def replay(cache, service):
+            server = await live_cache.replay_server(ticks, port=0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                await asyncio.wait_for(service.consume(f"ws://127.0.0.1:{port}"), 1)
+            except asyncio.TimeoutError:
+                pass
+            server.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = live_cache.LiveCache(["FH1", "FH2"], name=f"test_live_cache_{os.getpid()}")
+            store = IntradayStore(directory)
+            service = live_cache.LiveCacheService(cache, {"AAPL": "FH1", "MSFT": "FH2"}, store, flush_interval=60)
+            try:
+                asyncio.run(replay(cache, service))
+                reader = live_cache.LiveCache.attach(["FH1", "FH2"], name=f"test_live_cache_{os.getpid()}")
+                bars = reader.latest_bars("FH2")
+                last_ticks = reader.latest_ticks("FH1", 2)
+                reader.close()
+                counts = list(cache.ticks.counts)
+                stored = store.read("MSFT", datetime(2021, 3, 1), datetime(2021, 3, 2))
+            finally:
+                cache.close()
+                cache.unlink()
+
+        self.assertEqual(counts, [300, 300])
+        self.assertEqual(list(bars["volume"]), [60.0] * 5)
+        self.assertAlmostEqual(bars["close"].iloc[-1], 105.99)
+        self.assertEqual(list(last_ticks["price"].round(2)), [105.96, 105.98])
+        self.assertEqual(len(stored), 5)
+        self.assertEqual(stored.index[0], pd.Timestamp("2021-03-01 09:30"))
+        self.assertEqual(list(stored["volume"]), [60.0] * 5)
+
+    def test_snapshot_during_append(self):
+        """
+        test that a snapshot taken while the writer appends is never torn (seqlock)
+        """
+
+        buffers = live_cache.RingBuffers(f"test_ring_{os.getpid()}", 2, 4, {"time": np.int64, "price": np.float64})
+        stop = threading.Event()
+
+        def write():
+            k = 0
+            while not stop.is_set():
+                rows = np.arange(k, k + 3)
+                buffers.append(np.array([0, 0, 0, 1]), {"time": np.append(rows, k), "price": np.append(rows, k).astype(np.float64)})
+                k += 3
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            snapshots = [buffers.snapshot(0) for _ in range(3000)]
+        finally:
+            stop.set()
+            writer.join()
+            buffers.close()
+            buffers.unlink()
+
+        for snapshot in snapshots:
+            np.testing.assert_array_equal(snapshot["price"], snapshot["time"])
+            self.assertTrue((np.diff(snapshot["time"]) == 1).all())
+
+
+class Test_BarAggregator(unittest.TestCase):
+    def test_out_of_order_trades(self):
+        """
+        test OHLCV/VWAP of trades pushed out of order in several batches against a pandas groupby
+        """
+
+        rng = np.random.default_rng(4)
+        n = 5000
+        ticks = pd.DataFrame(
+            {
+                "code": rng.integers(0, 3, n),
+                "time": pd.Timestamp("2021-03-01 14:30").value + rng.choice(30 * 60 * 10 ** 9, n, replace=False),
+                "price": 100 + rng.standard_normal(n).cumsum() * 0.01,
+                "volume": rng.integers(1, 100, n).astype(np.float64),
+            }
+        ).sample(frac=1, random_state=0)
+        aggregator = BarAggregator(["A", "B", "C"], "1min", lateness="1h")
+        batches = []
+        for lo in range(0, n, 800):
+            df = ticks.iloc[lo : lo + 800]
+            batches.append(aggregator.push(df["code"].to_numpy(), df["time"].to_numpy(), df["price"].to_numpy(), df["volume"].to_numpy()))
+        batches.append(aggregator.emit())
+        bars = pd.concat([pd.DataFrame(batch) for batch in batches]).set_index(["code", "time"]).sort_index()
+
+        ticks = ticks.sort_values("time")
+        grouped = ticks.assign(turnover=ticks["price"] * ticks["volume"]).groupby(["code", ticks["time"] // 60_000_000_000 * 60_000_000_000])
+        reference = grouped.agg(open=("price", "first"), high=("price", "max"), low=("price", "min"), close=("price", "last"), volume=("volume", "sum"))
+        reference["vwap"] = grouped["turnover"].sum() / reference["volume"]
+        reference.index.names = ["code", "time"]
+
+        self.assertEqual(aggregator.late, 0)
+        pd.testing.assert_frame_equal(bars[reference.columns], reference, check_index_type=False)
+
+    def test_late_events_and_quotes(self):
+        """
+        test that events of an emitted bar are dropped and counted, and that bid/ask carry forward over bars without quotes
+        """
+
+        minute = 60 * 10 ** 9
+        aggregator = BarAggregator(["A"], "1min", lateness="0s")
+        emitted = [aggregator.push([0, 0], [10, 20], bid=[99.0, 99.5], ask=[100.5, 101.0])]
+        emitted.append(aggregator.push([0, 0], [minute + 5, 2 * minute + 5], price=[100.0, 101.0], volume=[1.0, 1.0]))
+        late = aggregator.push([0], [minute + 30], price=[50.0], volume=[10.0])  # the bar of minute 1 is emitted
+        emitted.append(aggregator.push([0], [3 * minute + 1], bid=[100.0], ask=[102.0]))
+        emitted.append(aggregator.emit())
+        bars = pd.concat([pd.DataFrame(batch) for batch in emitted], ignore_index=True)
+
+        self.assertEqual(aggregator.late, 1)
+        self.assertEqual(len(late["code"]), 0)
+        np.testing.assert_array_equal(bars["time"], np.arange(4) * minute)
+        np.testing.assert_array_equal(bars["close"], [np.nan, 100.0, 101.0, np.nan])
+        np.testing.assert_array_equal(bars["volume"], [0.0, 1.0, 1.0, 0.0])
+        np.testing.assert_array_equal(bars["bid"], [99.5, 99.5, 99.5, 100.0])
+        np.testing.assert_array_equal(bars["ask"], [101.0, 101.0, 101.0, 102.0])
+
+
+class _SlowIntradayLoader(Data_Loader_Intraday):
+    def load_data(self):
+        time.sleep(0.3)  # keeps the first fetch in flight while the other requests arrive
+        return super().load_data()
+
+
+class Test_QueryServer(unittest.TestCase):
+    def test_coalescing(self):
+        """
+        test that concurrent requests covered by an in-flight fetch share it and get their own date range
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = IntradayStore(directory)
+            index = pd.date_range("2020-11-02 09:30", "2020-11-30 16:00", freq="1min")
+            for ticker in ["AAPL", "MSFT"]:
+                store.append(ticker, pd.DataFrame({field: np.ones(len(index)) for field in ["open", "high", "low", "close", "volume"]}, index=index))
+
+            server = QueryServer(port=0, backends={"intraday": _SlowIntradayLoader}).start()
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+            results = {}
+
+            def request(i, tickers, start, end):
+                results[i] = QueryClient(url).load_data("intraday", directory, tickers, [], start, end)
+
+            threads = [threading.Thread(target=request, args=(0, ["AAPL", "MSFT"], datetime(2020, 11, 2), datetime(2020, 11, 30)))]
+            threads += [threading.Thread(target=request, args=(i, ["AAPL"], datetime(2020, 11, 5), datetime(2020, 11, 10))) for i in range(1, 4)]
+            threads[0].start()
+            time.sleep(0.1)
+            for thread in threads[1:]:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            stats = server.stats()
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual((stats["requests"], stats["fetches"], stats["coalesced"]), (4, 1, 3))
+        self.assertEqual(set(results[0]), {"AAPL", "MSFT"})
+        self.assertEqual(results[1]["AAPL"].index.min(), pd.Timestamp("2020-11-05 00:00"))
+        self.assertEqual(results[1]["AAPL"].index.max(), pd.Timestamp("2020-11-10 23:59"))
+
+    @unittest.skipIf(mongomock is None, "mongomock is not installed")
+    def test_mongo_v2(self):
+        """
+        test that the keys of Data_Loader_mongo_V2 (symbol + "_" + class) are served for the requested symbols
+        """
+
+        sessions = USTradingCalendar().sessions_between(datetime(2020, 11, 2), datetime(2020, 11, 30))
+        client = _mongo_v2_client(sessions)
+        with mock.patch.object(dataloader, "_mongo_client", lambda: client):
+            start, end = datetime(2020, 11, 2), datetime(2020, 11, 30)
+            direct = Data_Loader_mongo_V2("kaggle_test", ["AAPL"], [], start, end).load_data()
+            server = QueryServer(port=0).start()
+            try:
+                url = f"http://127.0.0.1:{server.server_address[1]}"
+                served = QueryClient(url).load_data("mongo_v2", "kaggle_test", ["AAPL"], [], start, end)
+            finally:
+                server.shutdown()
+                server.server_close()
+
+        self.assertEqual(set(served), {"AAPL_"})
+        self.assertEqual(set(served), set(direct))
+        np.testing.assert_array_equal(served["AAPL_"]["close"].to_numpy(), direct["AAPL_"]["close"].to_numpy())
+
+
+def _attached_close_sum(name):
+    panel = attach_panel(name)
+    total = float(np.nansum(panel.field("close").to_numpy()))
+    detach_panel(panel)
+    return total
+
+
+class Test_SharedPanel(unittest.TestCase):
+    def test_publish_attach(self):
+        """
+        test that pool workers read the published panel and that closing the publisher unlinks it
+        """
+
+        sessions = USTradingCalendar().sessions_between(datetime(2016, 10, 13), datetime(2016, 10, 19))
+        data = {
+            "A": pd.DataFrame({"close": [1.0, 2.0, 4.0], "symbol": "A"}, index=sessions[[0, 1, 3]]),
+            "B": pd.DataFrame({"close": [5.0, 6.0], "symbol": "B"}, index=sessions[[2, 3]]),
+        }
+        panel = align_to_sessions(data, sessions)
+
+        with SharedPanel(panel) as shared:
+            with multiprocessing.Pool(2) as pool:
+                totals = pool.map(_attached_close_sum, [shared.name] * 2)
+            attached = attach_panel(shared.name)
+            self.assertFalse(attached.values.flags.writeable)
+            self.assertTrue(attached.sessions.equals(panel.sessions))
+            self.assertEqual(list(attached.field("symbol")["B"].iloc[2:4]), ["B", "B"])
+            np.testing.assert_array_equal(attached.gaps, panel.gaps)
+            detach_panel(attached)
+
+        self.assertEqual(totals, [18.0, 18.0])
+        with self.assertRaises(FileNotFoundError):
+            attach_panel(shared.name)
+
+
+class Test_Instrumentation(unittest.TestCase):
+    def test_spans_and_counters(self):
+        """
+        test that spans and counters reach the sinks and that nothing is recorded once disabled
+        """
+
+        memory_sink = instrumentation.MemorySink()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "loader.prom")
+            instrumentation.enable(memory_sink, instrumentation.PrometheusSink(path), memory="tracemalloc")
+            try:
+                with instrumentation.span("load", loader="csv"):
+                    for _ in range(3):
+                        with instrumentation.span("read"):
+                            buffer = np.ones(1 << 20)
+                            instrumentation.count("rows_read", len(buffer), source="csv")
+                    del buffer
+            finally:
+                report = instrumentation.disable()
+            with open(path) as file:
+                prometheus = file.read()
+
+        self.assertEqual(len(memory_sink.spans), 4)
+        self.assertEqual(memory_sink.spans[0]["parent"], "load")
+        table = memory_sink.report()
+        self.assertEqual(table.loc["read", "calls"], 3)
+        self.assertGreaterEqual(table.loc["read", "peak_bytes"], 8 << 20)
+        self.assertEqual(report["counters"], [{"name": "rows_read", "labels": {"source": "csv"}, "value": 3 << 20}])
+        self.assertIn('data_infrastructure_span_calls_total{span="load",loader="csv"} 1', prometheus)
+        self.assertIn('data_infrastructure_rows_read_total{source="csv"} 3145728', prometheus)
+
+        self.assertIs(instrumentation.span("read"), instrumentation.span("other"))
+        instrumentation.count("rows_read")
+        self.assertIsNone(instrumentation.disable())
+
+
+class Test_DaskLoader(unittest.TestCase):
+    @unittest.skipIf(dask_loader is None, "dask is not installed")
+    def test_partition_boundaries(self):
+        """
+        test that the features computed partition by partition match a single partition
+        (split and dividend carries, halo of the rolling windows)
+        """
+
+        sessions = USTradingCalendar().sessions_between(datetime(2016, 1, 4), datetime(2016, 3, 31))
+        rng = np.random.default_rng(1)
+        with tempfile.TemporaryDirectory() as directory:
+            for day, session in enumerate(sessions):
+                rows = []
+                for symbol in ["AA", "BB", "CC"]:
+                    if symbol == "CC" and day % 7 == 3:
+                        continue  # missing rows
+                    close = (25 if (symbol == "AA" and day >= 17) else 50) + rng.normal()
+                    split = "2:1" if (symbol == "AA" and day == 17) else ""
+                    div = 0.5 if (symbol == "BB" and day in (9, 30)) else ""
+                    rows.append(f"{symbol},{close:.2f},{div},{split},{close - 0.01:.2f},{close + 0.01:.2f}")
+                with open(os.path.join(directory, f"{session:%Y%m%d}.csv"), "w") as file:
+                    file.write("symbol,close,div,adjustment,bid,ask\n" + "\n".join(rows) + "\n")
+
+            features = ["volatility_10", "skewness_5", "kurtosis_12", "return_3"]
+            start, end = sessions[0].to_pydatetime(), sessions[-1].to_pydatetime()
+            whole = dask_loader.Data_Loader_Dask(directory, [], [], start, end, partition_sessions=len(sessions))
+            split = dask_loader.Data_Loader_Dask(directory, [], [], start, end, partition_sessions=4)
+            expected = whole.compute_features(features).compute(scheduler="sync")
+            result = split.compute_features(features).compute(scheduler="sync")
+
+        self.assertEqual(split.compute_features(features).npartitions, -(-len(sessions) // 4))
+        pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-9)
+        aa = expected[expected["symbol"] == "AA"]
+        self.assertLess(aa["return"].abs().max(), 0.2)  # the 2:1 split is adjusted away
+        self.assertEqual(aa["volatility_10"].isna().sum(), 10)
+
+
+class Test_Panel(unittest.TestCase):
+    def test_csv_panel(self):
+        """
+        test that the panel read straight from the files matches the per-ticker rows,
+        in float32 and with the rolling windows skipping the missing rows
+        """
+
+        sessions = USTradingCalendar().sessions_between(datetime(2016, 1, 4), datetime(2016, 2, 29))
+        rng = np.random.default_rng(2)
+        with tempfile.TemporaryDirectory() as directory:
+            for day, session in enumerate(sessions):
+                rows = []
+                for symbol in ["AA", "BB", "CC"]:
+                    if symbol == "CC" and day % 5 == 2:
+                        continue  # missing rows
+                    close = (25 if (symbol == "AA" and day >= 11) else 50) + rng.normal()
+                    split = "2:1" if (symbol == "AA" and day == 11) else ""
+                    rows.append(f"{symbol},{close:.2f},,{split},{close - 0.01:.2f},{close + 0.01:.2f}")
+                with open(os.path.join(directory, f"{session:%Y%m%d}.csv"), "w") as file:
+                    file.write("symbol,close,div,adjustment,bid,ask\n" + "\n".join(rows) + "\n")
+
+            start, end = sessions[0].to_pydatetime(), sessions[-1].to_pydatetime()
+            loader = Data_Loader_CSV(directory, ["AA", "BB", "CC", "ZZ"], [], start, end)
+            panel = loader.load_panel(dtype=np.float32)
+            features = loader.compute_panel(["volatility_5"])
+
+        self.assertEqual(panel.ids.tolist(), ["AA", "BB", "CC"])
+        self.assertEqual(panel.values.dtype, np.float32)
+        self.assertEqual(int(panel.gaps[:, 2].sum()), len(range(2, len(sessions), 5)))
+        frame = panel.to_frame()
+        self.assertEqual(len(frame), int(panel.presence.sum()))
+        self.assertIsInstance(frame.index.get_level_values("symbol").dtype, pd.CategoricalDtype)
+
+        cc = features.field("return")["CC"].dropna()
+        close = panel.field("close")["CC"].dropna().astype(np.float64)  # float32 in the panel
+        np.testing.assert_allclose(cc.to_numpy(), np.diff(np.log(close.to_numpy())), atol=1e-6)
+        expected = cc.rolling(5).std(ddof=0)
+        pd.testing.assert_series_equal(features.field("volatility_5")["CC"].dropna(), expected.dropna())
+        self.assertLess(features.field("return")["AA"].abs().max(), 0.2)  # the 2:1 split is adjusted away
+
+    @unittest.skipIf(mongomock is None, "mongomock is not installed")
+    def test_mongo_v2_panel(self):
+        """
+        test that the panel scattered from the documents matches load_data, one column per key
+        """
+
+        sessions = USTradingCalendar().sessions_between(datetime(2018, 4, 30), datetime(2018, 5, 4))
+        client = _mongo_v2_client(sessions)
+        with mock.patch.object(dataloader, "_mongo_client", lambda: client):
+            loader = Data_Loader_mongo_V2("kaggle_test", ["AAPL", "GS"], ["close", "volume"], sessions[0], sessions[-1])
+            panel = loader.load_panel(dtype=np.float32)
+            data = loader.load_data()
+
+        self.assertEqual(sorted(panel.ids), sorted(data))
+        self.assertTrue(panel.presence.all())
+        for key, df in data.items():
+            for field in ["close", "volume"]:
+                np.testing.assert_array_equal(panel.field(field)[key].to_numpy(), df[field].to_numpy(dtype=np.float32))
+
+class Test_WindowSampler(unittest.TestCase):
+    def test_windows(self):
+        """
+        test that the windows are views of the panel, the cumulative-sum validity matches a direct
+        check, and every valid window is sampled once in random order with prefetch
+        """
+
+        rng = np.random.default_rng(3)
+        values = rng.normal(size=(80, 6, 3)).astype(np.float32)
+        values[rng.random(values.shape) < 0.02] = np.nan
+        listed = np.ones((80, 6), dtype=bool)
+        listed[:30, 2] = False
+        sessions = USTradingCalendar().sessions_between(datetime(2016, 1, 4), datetime(2016, 12, 30))[:80]
+        panel = Panel(values, sessions, list("ABCDEF"), ["return", "volatility_5", "tcost"], listed=listed)
+        sampler = WindowSampler(panel, 10, fields=["return", "tcost"], target="return")
+
+        self.assertTrue(np.shares_memory(sampler.windows, values))
+        expected = np.zeros(sampler.valid.shape, dtype=bool)
+        for k in range(len(expected) - 1):  # the last window has no target
+            window = values[k : k + 10][:, :, [0, 2]]
+            expected[k] = np.isfinite(window).all(axis=(0, 2)) & listed[k : k + 10].all(axis=0)
+            expected[k] &= np.isfinite(values[k + 10, :, 0])
+        np.testing.assert_array_equal(sampler.valid, expected)
+
+        seen = set()
+        for batch in sampler.batches(16, order="random", seed=0, prefetch=2):
+            self.assertTrue(batch.mask.all())
+            for x, y, session, ticker in zip(batch.x, batch.y, batch.sessions, batch.ids):
+                k, i = sessions.get_loc(session) - 9, panel.ids.get_loc(ticker)
+                np.testing.assert_array_equal(x, values[k : k + 10, i][:, [0, 2]])
+                self.assertEqual(y, values[k + 10, i, 0])
+                seen.add((k, i))
+        self.assertEqual(len(seen), len(sampler))
+
+        ordered = np.concatenate([batch.sessions.values for batch in sampler.batches(16, end=sessions[40])])
+        self.assertTrue((np.diff(ordered) >= np.timedelta64(0)).all())
+        self.assertLessEqual(ordered.max(), sessions[40].to_datetime64())
+
+        # a target on the last session of the window (or before it) would leak into the inputs
+        for horizon in [0, -1]:
+            with self.assertRaises(ValueError):
+                WindowSampler(panel, 10, target="return", horizon=horizon)
+
+
+# seconds allowed for "import dataloader" once numpy and pandas are imported
+IMPORT_BUDGET = 0.3
+
+_IMPORT_PROBE = """
+import sys, json, time
+import numpy, pandas
+began = time.perf_counter()
+import dataloader
+seconds = time.perf_counter() - began
+import wrds_loader
+heavy = [name for name in ("pymongo", "scipy", "wrds") if name in sys.modules]
+import mongoDB_initialize
+print(json.dumps({"seconds": seconds, "heavy": heavy, "client": mongoDB_initialize._client is not None}))
+"""
+
+
+class Test_Import(unittest.TestCase):
+    def test_import_is_cheap(self):
+        """
+        test that importing the loaders does not load the optional backends nor connect, within the time budget
+        """
+
+        directory = os.path.dirname(os.path.abspath(__file__))
+        timings = []
+        for _ in range(3):
+            output = subprocess.run(
+                [sys.executable, "-c", _IMPORT_PROBE], cwd=directory, capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            self.assertEqual(result["heavy"], [])
+            self.assertFalse(result["client"])
+            timings.append(result["seconds"])
+        self.assertLess(min(timings), IMPORT_BUDGET)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+    # If you are wondering how to implement a test function: Google unittest. There are a lot of tutorials online about this.
+
     pass
\ No newline at end of file
@@ -0,0 +1,172 @@
+import typing
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from alignment import Panel
+
+
+"""
+NOTE:
+Point-in-time universe selection.
+For every session at once, the top-K IDs by volume (raw or split adjusted) or dollar volume are
+picked with np.argpartition over the (sessions x IDs) matrix of the aligned Panel. The daily
+membership is kept as a (sessions x K) array of ID codes, so the universe of any date is one row lookup.
+"""
+
+MEASURES = ["volume", "adjvolume", "dollar_volume"]
+
+# =============================================================================
+# Top-K Universe
+# =============================================================================
+
+
+class TopKUniverse:
+    """
+    Daily top-K universe by trading volume
+    """
+
+    def __init__(self, sessions: pd.DatetimeIndex, ids: typing.List[str], members: np.ndarray):
+        """
+        :param sessions: trading sessions (rows of members)
+        :param ids: IDs that member codes refer to
+        :param members: int32 array of shape (sessions, K), ID codes ranked by the measure (-1 when fewer than K IDs traded)
+        """
+        self.sessions = pd.DatetimeIndex(sessions)
+        self.ids = pd.Index(ids)
+        self.members = members
+        self._ordinal = {day: i for i, day in enumerate(_days(self.sessions))}
+
+    @classmethod
+    def from_panel(
+        cls, panel: Panel, k: int = 500, measure: str = "dollar_volume", window: int = 1, lag: int = 0
+    ) -> "TopKUniverse":
+        """
+        :param panel: aligned Panel with volume (and close for dollar volume) fields
+        :param k: number of IDs in the universe (at least 1, clamped to the number of IDs of the panel)
+        :param measure: "volume", "adjvolume" (split adjusted volume) or "dollar_volume"
+        :param window: number of sessions the measure is averaged over
+        :param lag: number of sessions between the data used and the session of the universe
+            (lag=1 selects on the previous session, for trading at today's open without look-ahead)
+
+        :return: universe of every session of the panel
+        :raise KInvalidException if k is below 1
+        """
+        if k < 1:
+            raise Exception(f"KInvalidException: k must be at least 1, got {k}")
+        if measure not in MEASURES:
+            raise ValueError(f"unknown measure {measure}, choose from {MEASURES}")
+
+        volume = panel.values[:, :, panel.fields.index("volume")]
+        if measure == "adjvolume":
+            score = volume / panel.split_factor()
+        elif measure == "dollar_volume":
+            score = volume * panel.values[:, :, panel.fields.index("close")]
+        else:
+            score = volume.copy()
+        score[~panel.presence] = np.nan
+
+        score = _rolling_mean(score, window)
+        if lag > 0:
+            score = np.vstack((np.full((lag, score.shape[1]), np.nan), score[:-lag]))
+
+        return cls(panel.sessions, panel.ids, _top_k(score, k))
+
+    @classmethod
+    def load(cls, path: str) -> "TopKUniverse":
+        """
+        :param path: file written with save
+
+        :return: universe read from disk
+        """
+        with np.load(path, allow_pickle=True) as data:
+            return cls(data["sessions"], data["ids"], data["members"])
+
+    def save(self, path: str):
+        """
+        :param path: .npz file the universe is written to
+        """
+        np.savez_compressed(
+            path,
+            sessions=self.sessions.values.astype("datetime64[D]"),
+            ids=np.asarray(self.ids, dtype=object),
+            members=self.members,
+        )
+
+    def on(self, date: datetime) -> pd.Index:
+        """
+        :param date: trading session
+
+        :return: IDs in the universe on that session, ranked by the measure
+        """
+        ordinal = self._ordinal.get(_days(pd.DatetimeIndex([date]))[0])
+        if ordinal is None:
+            raise Exception(f"DateNoInvalidException: {pd.Timestamp(date).date()} is not in the universe")
+        codes = self.members[ordinal]
+        return self.ids[codes[codes >= 0]]
+
+    def membership(self) -> pd.DataFrame:
+        """
+        :return: boolean Dataframe (index: sessions, columns: IDs), True when the ID is in the universe
+        """
+        mask = np.zeros((len(self.sessions), len(self.ids)), dtype=bool)
+        rows = np.repeat(np.arange(len(self.sessions)), self.members.shape[1])
+        codes = self.members.ravel()
+        mask[rows[codes >= 0], codes[codes >= 0]] = True
+        return pd.DataFrame(mask, index=self.sessions, columns=self.ids)
+
+
+# =============================================================================
+# Helpers
+# =============================================================================
+
+
+def _rolling_mean(score: np.ndarray, window: int) -> np.ndarray:
+    """
+    :return: mean over the last `window` sessions along axis 0, ignoring NaN (NaN when no value in the window)
+    """
+    if window <= 1:
+        return score
+    valid = ~np.isnan(score)
+    total = np.cumsum(np.where(valid, score, 0.0), axis=0)
+    count = np.cumsum(valid, axis=0)
+    total[window:] = total[window:] - total[:-window]
+    count[window:] = count[window:] - count[:-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def _top_k(score: np.ndarray, k: int) -> np.ndarray:
+    """
+    :return: int32 (rows, k) array of the columns with the k largest scores of each row, ranked (-1 for NaN)
+    """
+    k = min(k, score.shape[1])
+    if k == 0:
+        return np.zeros((score.shape[0], 0), dtype=np.int32)
+    # ascending ranks, NaN last so missing IDs never take the place of traded ones
+    ranked = np.where(np.isnan(score), np.inf, -score)
+    top = np.argpartition(ranked, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(ranked, top, axis=1), axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    valid = np.isfinite(np.take_along_axis(ranked, top, axis=1))
+    return np.where(valid, top, -1).astype(np.int32)
+
+
+def _days(sessions: pd.DatetimeIndex) -> np.ndarray:
+    return sessions.values.astype("datetime64[D]").astype(np.int64)
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    from dataloader import Data_Loader_CSV
+
+    tickers = list(pd.read_csv("FinnhubID.csv")["symbol"].dropna().unique())
+    loader = Data_Loader_CSV("../data/kaggle_us_eod", tickers, [], datetime(2019, 1, 2), datetime(2019, 12, 31))
+    universe = TopKUniverse.from_panel(loader.load_aligned(), k=500, measure="dollar_volume", window=20, lag=1)
+    universe.save("data/top500_dollar_volume.npz")
+
+    print(universe.on(datetime(2019, 6, 3))[:10])
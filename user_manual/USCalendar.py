@@ -1,18 +1,35 @@
 
+import os
+import typing
+import hashlib
+import numpy as np
 from datetime import time
+from functools import cached_property
 from itertools import chain
 from pandas.tseries.holiday import AbstractHolidayCalendar, GoodFriday, USLaborDay
 
 from dateutil.relativedelta import (MO, TH)
-from pandas import (DateOffset, Timestamp, date_range)
+from pandas import (DateOffset, DatetimeIndex, Timestamp, date_range)
 from pandas.tseries.holiday import (Holiday, nearest_workday, sunday_to_monday)
 from pandas.tseries.offsets import Day
 from abc import ABC
 
+from instrumentation import count
+
 MONDAY, TUESDAY, WEDNESDAY, THURSDAY, FRIDAY, SATURDAY, SUNDAY = range(7)
 
 AbstractHolidayCalendar.start_date = '1992-06-15'
 
+# Range covered by the precomputed session index
+SESSIONS_START = '1992-06-15'
+SESSIONS_END = '2030-12-31'
+
+# Sessions are cached (as int64 days since epoch) in the user cache directory, the file name holds a
+# fingerprint of the holiday rules so editing them builds a new index
+SESSIONS_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "data_infrastructure"
+)
+
 USNewYearsDay = Holiday(
     'New Years Day',
     month=1,
@@ -151,7 +168,20 @@ class USTradingCalendar(ABC):
 #     def close_time_default(self):
 #         return time(16, tzinfo=self.tz)
 
-    @property
+    # session arrays already built in this process, by (start, end)
+    _sessions_memo = {}
+
+    def __init__(self, start: str = SESSIONS_START, end: str = SESSIONS_END, cache_dir: str = SESSIONS_CACHE_DIR):
+        """
+        :param start: first date of the session index
+        :param end: last date of the session index
+        :param cache_dir: directory where the session index is cached (if None never cache to disk)
+        """
+        self.start = Timestamp(start)
+        self.end = Timestamp(end)
+        self.cache_dir = cache_dir
+
+    @cached_property
     def regular_holidays(self):
         return AbstractHolidayCalendar(rules=[
             USNewYearsDay,
@@ -172,3 +202,200 @@ class USTradingCalendar(ABC):
             HurricaneSandyClosings,
             USNationalDaysofMourning,
         ))
+
+    # =========================================================================
+    # Session index
+    # =========================================================================
+
+    @property
+    def sessions(self) -> np.ndarray:
+        """
+        :return: sorted int64 array of trading sessions (days since epoch)
+        """
+        key = (self.start, self.end, self.rules_fingerprint)
+        if key not in self._sessions_memo:
+            self._sessions_memo[key] = self._load_sessions()
+        return self._sessions_memo[key]
+
+    @cached_property
+    def rules_fingerprint(self) -> str:
+        """
+        :return: hash of the regular and adhoc holidays (part of the name of the disk cache)
+        """
+        lines = []
+        for rule in self.regular_holidays.rules:
+            observance = getattr(rule.observance, "__name__", rule.observance)
+            lines.append(
+                f"{rule.name}|{rule.year}|{rule.month}|{rule.day}|{rule.offset}|{observance}"
+                f"|{rule.start_date}|{rule.end_date}|{rule.days_of_week}"
+            )
+        lines += sorted(str(Timestamp(holiday).date()) for holiday in self.adhoc_holidays)
+        return hashlib.sha1("\n".join(lines).encode()).hexdigest()[:12]
+
+    @property
+    def session_index(self) -> DatetimeIndex:
+        """
+        :return: DatetimeIndex of all trading sessions
+        """
+        return _to_index(self.sessions)
+
+    def is_session(self, dates) -> np.ndarray:
+        """
+        :param dates: date or array-like of dates
+
+        :return: boolean array, True where the date is a trading session
+        """
+        days = _to_days(dates)
+        position = np.searchsorted(self.sessions, days)
+        position = np.minimum(position, len(self.sessions) - 1)
+        return self.sessions[position] == days
+
+    def date_to_ordinal(self, dates, direction: str = "exact") -> np.ndarray:
+        """
+        :param dates: date or array-like of dates
+        :param direction: how to treat dates that are not sessions
+            "exact": ordinal is -1, "next": use the next session, "previous": use the previous session
+
+        :return: int64 array of session ordinals (position in the session index)
+        """
+        days = _to_days(dates)
+        if direction == "next":
+            ordinal = np.searchsorted(self.sessions, days, side="left")
+        elif direction == "previous":
+            ordinal = np.searchsorted(self.sessions, days, side="right") - 1
+        elif direction == "exact":
+            ordinal = np.searchsorted(self.sessions, days, side="left")
+            found = ordinal < len(self.sessions)
+            found[found] = self.sessions[ordinal[found]] == days[found]
+            ordinal = np.where(found, ordinal, -1)
+        else:
+            raise ValueError(f"unknown direction {direction}")
+        self._check_bounds(ordinal, direction)
+        return ordinal.astype(np.int64)
+
+    def ordinal_to_date(self, ordinals) -> DatetimeIndex:
+        """
+        :param ordinals: int or array-like of session ordinals
+
+        :return: DatetimeIndex of the sessions
+        """
+        return _to_index(self.sessions[np.atleast_1d(ordinals)])
+
+    def next_session(self, dates) -> DatetimeIndex:
+        """
+        :param dates: date or array-like of dates
+
+        :return: DatetimeIndex of the first session strictly after each date
+        """
+        return self.offset(dates, 1)
+
+    def previous_session(self, dates) -> DatetimeIndex:
+        """
+        :param dates: date or array-like of dates
+
+        :return: DatetimeIndex of the last session strictly before each date
+        """
+        return self.offset(dates, -1)
+
+    def offset(self, dates, n: int) -> DatetimeIndex:
+        """
+        :param dates: date or array-like of dates
+        :param n: number of sessions to move (a date that is not a session counts as
+            lying between the previous and the next session, n=0 snaps to the next session)
+
+        :return: DatetimeIndex of the sessions n sessions away
+        """
+        days = _to_days(dates)
+        if n > 0:
+            ordinal = np.searchsorted(self.sessions, days, side="right") - 1 + n
+        else:
+            ordinal = np.searchsorted(self.sessions, days, side="left") + n
+        self._check_bounds(ordinal, "offset")
+        return _to_index(self.sessions[ordinal])
+
+    def sessions_between(self, start, end) -> DatetimeIndex:
+        """
+        :param start: start date
+        :param end: end date (includes ending date)
+
+        :return: DatetimeIndex of the sessions between start and end
+        """
+        lo = np.searchsorted(self.sessions, _to_days(start)[0], side="left")
+        hi = np.searchsorted(self.sessions, _to_days(end)[0], side="right")
+        return _to_index(self.sessions[lo:hi])
+
+    def resolve_range(self, start, end) -> typing.Tuple[Timestamp, Timestamp]:
+        """
+        Snaps a date range to trading sessions (start moves forward, end moves back),
+        clipped to the range of the session index
+
+        :param start: start date
+        :param end: end date (includes ending date)
+
+        :raise ValueError if the range lies outside of the session index or there is no session between start and end
+
+        :return: (first session, last session) as Timestamps
+        """
+        lo = np.searchsorted(self.sessions, _to_days(start)[0], side="left")
+        hi = np.searchsorted(self.sessions, _to_days(end)[0], side="right") - 1
+        if lo >= len(self.sessions) or hi < 0:
+            raise ValueError(
+                f"{Timestamp(start).date()} to {Timestamp(end).date()} is outside of the session index "
+                f"({self.start.date()} to {self.end.date()})"
+            )
+        if hi < lo:
+            raise ValueError(f"no trading session between {Timestamp(start).date()} and {Timestamp(end).date()}")
+        first, last = _to_index(self.sessions[[lo, hi]])
+        return first, last
+
+    def _check_bounds(self, ordinal: np.ndarray, name: str):
+        if np.any(ordinal >= len(self.sessions)) or (name != "exact" and np.any(ordinal < 0)):
+            raise ValueError(
+                f"{name}: date outside of the session index ({self.start.date()} to {self.end.date()})"
+            )
+
+    def _build_sessions(self) -> np.ndarray:
+        """
+        :return: weekdays between start and end that are not regular or adhoc holidays
+        """
+        weekdays = date_range(self.start, self.end, freq='B')
+        holidays = self.regular_holidays.holidays(start=self.start, end=self.end)
+        adhoc = [holiday.tz_localize(None) if holiday.tzinfo else holiday for holiday in self.adhoc_holidays]
+        closed = np.concatenate((_to_days(holidays), _to_days(adhoc)))
+        days = _to_days(weekdays)
+        return days[~np.isin(days, closed)]
+
+    def _load_sessions(self) -> np.ndarray:
+        """
+        :return: session index read from the disk cache (built and written on the first call)
+        """
+        if self.cache_dir is None:
+            return self._build_sessions()
+
+        file_name = f".{self.name}_sessions_{self.start:%Y%m%d}_{self.end:%Y%m%d}_{self.rules_fingerprint}.npy"
+        path = os.path.join(self.cache_dir, file_name)
+        if os.path.exists(path):
+            count("cache_hits", source="calendar")
+            return np.load(path)
+
+        count("cache_misses", source="calendar")
+        sessions = self._build_sessions()
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.save(path, sessions)
+        except OSError:
+            pass  # read-only location, keep the in-memory index only
+        return sessions
+
+
+def _to_days(dates) -> np.ndarray:
+    """
+    :return: int64 array of days since epoch
+    """
+    if isinstance(dates, (str, Timestamp)) or not hasattr(dates, "__len__"):
+        dates = [dates]
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+
+
+def _to_index(days: np.ndarray) -> DatetimeIndex:
+    return DatetimeIndex(np.asarray(days).astype("datetime64[D]").astype("datetime64[ns]"))
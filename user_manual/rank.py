@@ -23,5 +23,6 @@ def line2row(line):
     return {"symbol": symbol, "volume": volume}
 
 
-with open("sample.csv") as file:
-    print(rank([line2row(line) for line in file.readlines()[1:]])[:10])
+if __name__ == "__main__":
+    with open("sample.csv") as file:
+        print(rank([line2row(line) for line in file.readlines()[1:]])[:10])
@@ -0,0 +1,256 @@
+import queue
+import typing
+import threading
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from alignment import Panel
+
+
+"""
+NOTE:
+Rolling (lookback x features) windows of every ID and session for training models, over a feature
+Panel (i.e. Data_Loader.compute_panel) without materializing the windows.
+windows is a strided view of the panel values (sliding_window_view), window k of an ID covers the
+sessions k to k + lookback - 1 and is dated by its last session. The validity of every window
+(all values finite and the ID listed over the whole window, and a finite target if one is asked)
+is computed with cumulative sums of the per-session flags, so it costs one (sessions x IDs) pass
+whatever the lookback.
+Only the minibatches are copied (one gather of batch_size windows). They can be drawn in date order
+or at random, and built ahead of the training loop by a background thread (prefetch).
+"""
+
+# =============================================================================
+# Batch
+# =============================================================================
+
+
+class Batch(typing.NamedTuple):
+    x: np.ndarray  # (batch, lookback, features) values of the windows
+    mask: np.ndarray  # (batch, lookback, features) True where the value is finite and the ID listed
+    y: np.ndarray  # (batch,) target horizon sessions after the window (None without target)
+    sessions: pd.DatetimeIndex  # last session of every window
+    ids: pd.Index  # ID of every window
+
+
+# =============================================================================
+# Window Sampler
+# =============================================================================
+
+
+class WindowSampler:
+    """
+    Minibatches of rolling windows over a feature Panel
+    """
+
+    def __init__(
+        self,
+        panel: Panel,
+        lookback: int,
+        fields: typing.List[str] = None,
+        target: str = None,
+        horizon: int = 1,
+        complete: bool = True,
+    ):
+        """
+        :param panel: feature panel (i.e. Data_Loader.compute_panel or load_panel, any float dtype)
+        :param lookback: number of sessions of every window
+        :param fields: fields of the windows (all the fields of the panel if None)
+        :param target: field to predict (i.e. "return"), no target if None
+        :param horizon: sessions between the last session of a window and its target (at least 1)
+        :param complete: if True only the windows without NaN over a listed period are sampled,
+            otherwise every window ending on a session with data (use Batch.mask)
+        :raise ValueError if lookback is not in [1, number of sessions], horizon is below 1 or a field is unknown
+        """
+        n_sessions, n_ids, _ = panel.values.shape
+        if lookback < 1 or lookback > n_sessions:
+            raise ValueError(f"lookback must be between 1 and the number of sessions ({n_sessions})")
+        if horizon < 1:
+            raise ValueError(f"horizon must be at least 1 session, got {horizon}")
+        fields = panel.fields if fields is None else list(fields)
+        unknown = [f for f in fields + ([] if target is None else [target]) if f not in panel.fields]
+        if len(unknown) > 0:
+            raise ValueError(f"unknown fields {unknown}")
+
+        self.panel = panel
+        self.lookback = lookback
+        self.fields = fields
+        self.target = target
+        self.horizon = horizon
+        self._field_index = np.array([panel.fields.index(f) for f in fields], dtype=np.intp)
+
+        # (windows, IDs, lookback, features) view of the values, no copy
+        self.windows = np.moveaxis(sliding_window_view(panel.values, lookback, axis=0), 3, 2)
+
+        finite = np.isfinite(panel.values[:, :, self._field_index]).all(axis=2) & panel.listed
+        if complete:
+            # number of complete sessions in every window from the cumulative sum along the sessions
+            cumulative = np.zeros((n_sessions + 1, n_ids), dtype=np.int64)
+            np.cumsum(finite, axis=0, out=cumulative[1:])
+            valid = cumulative[lookback:] - cumulative[:-lookback] == lookback
+        else:
+            valid = panel.presence[lookback - 1 :].copy()
+        if target is not None:
+            y = panel.values[:, :, panel.fields.index(target)]
+            target_valid = np.zeros_like(valid)
+            shifted = y[lookback - 1 + horizon :]
+            target_valid[: len(shifted)] = np.isfinite(shifted) & panel.listed[lookback - 1 + horizon :]
+            valid &= target_valid
+        self.valid = valid
+
+    def __len__(self) -> int:
+        """
+        :return: number of windows sampled by batches
+        """
+        return int(self.valid.sum())
+
+    @property
+    def sessions(self) -> pd.DatetimeIndex:
+        """
+        :return: last session of the windows (first axis of windows and valid)
+        """
+        return self.panel.sessions[self.lookback - 1 :]
+
+    def window(self, session, ticker: str) -> np.ndarray:
+        """
+        :param session: last session of the window
+        :param ticker: ID of the panel
+
+        :return: (lookback, fields) view of the panel (all the fields of the panel)
+        :raise KeyError if the session or the ID is not in the panel
+        """
+        k = self.sessions.get_loc(pd.Timestamp(session))
+        return self.windows[k, self.panel.ids.get_loc(ticker)]
+
+    def batches(
+        self,
+        batch_size: int,
+        order: str = "date",
+        start=None,
+        end=None,
+        seed: int = None,
+        drop_last: bool = False,
+        prefetch: int = 0,
+    ) -> typing.Iterator[Batch]:
+        """
+        :param batch_size: number of windows per batch
+        :param order: "date" (by last session, then by ID) or "random" (shuffled once per call)
+        :param start: first last-session of the windows (i.e. split train / validation by date)
+        :param end: last last-session of the windows
+        :param seed: seed of the random order
+        :param drop_last: skip the last batch if it has less than batch_size windows
+        :param prefetch: number of batches built ahead by a background thread (0: built on demand)
+
+        :return: iterator of Batch
+        :raise ValueError if order is unknown
+        """
+        if order not in ["date", "random"]:
+            raise ValueError(f"unknown order {order}, use 'date' or 'random'")
+        valid = self.valid
+        if start is not None or end is not None:
+            sessions = self.sessions
+            in_range = np.ones(len(sessions), dtype=bool)
+            if start is not None:
+                in_range &= sessions >= pd.Timestamp(start)
+            if end is not None:
+                in_range &= sessions <= pd.Timestamp(end)
+            valid = valid & in_range[:, None]
+        # row major: sorted by date, then by ID
+        rows, columns = np.nonzero(valid)
+        if order == "random":
+            permutation = np.random.default_rng(seed).permutation(len(rows))
+            rows, columns = rows[permutation], columns[permutation]
+
+        generator = self._generate(rows, columns, batch_size, drop_last)
+        if prefetch > 0:
+            return _prefetch(generator, prefetch)
+        return generator
+
+    def _generate(self, rows: np.ndarray, columns: np.ndarray, batch_size: int, drop_last: bool) -> typing.Iterator[Batch]:
+        n = len(rows)
+        stop = n - n % batch_size if drop_last else n
+        offsets = np.arange(self.lookback)[None, :, None]
+        fields = self._field_index[None, None, :]
+        for lo in range(0, stop, batch_size):
+            k, i = rows[lo : lo + batch_size], columns[lo : lo + batch_size]
+            # one gather of the batch from the view (batch, lookback, features)
+            x = self.windows[k[:, None, None], i[:, None, None], offsets, fields]
+            listed = self.panel.listed[k[:, None] + offsets[:, :, 0], i[:, None]]
+            mask = np.isfinite(x) & listed[:, :, None]
+            y = None
+            if self.target is not None:
+                y = self.panel.values[k + self.lookback - 1 + self.horizon, i, self.panel.fields.index(self.target)]
+            yield Batch(x, mask, y, self.sessions[k], self.panel.ids[i])
+
+
+# =============================================================================
+# Prefetch
+# =============================================================================
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_DONE = object()
+
+
+def _prefetch(generator: typing.Iterator, depth: int) -> typing.Iterator:
+    """
+    :return: items of generator produced by a background thread, at most depth items ahead
+        (errors are raised in the consumer, the thread stops when the consumer stops iterating)
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in generator:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_Failure(e))
+            return
+        put(_DONE)
+
+    thread = threading.Thread(target=produce, name="window_sampler.prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+
+    from datetime import datetime
+    from dataloader import Data_Loader_CSV
+
+    loader = Data_Loader_CSV("data/kaggle", ["AAPL", "MSFT", "GS"], [], datetime(2019, 1, 2), datetime(2020, 6, 30))
+    panel = loader.compute_panel(["volatility_20", "skewness_20"], dtype=np.float32)
+    sampler = WindowSampler(panel, 60, fields=["return", "volatility_20", "skewness_20"], target="return")
+    print(len(sampler), "windows", sampler.window(datetime(2020, 6, 1), "AAPL").shape)
+    for batch in sampler.batches(256, order="random", end=datetime(2019, 12, 31), seed=0, prefetch=2):
+        print(batch.x.shape, batch.y.shape, batch.sessions[0], batch.ids[0])
@@ -1,307 +1,524 @@
-import os
-import wrds
-import csv
-import typing
-import random
-import numpy as np
-import pandas as pd
-from datetime import datetime
-from abc import ABC, abstractmethod
-
-
-"""
-NOTE:
-You need to pip install wrds before using this data loader
-You also need to have a valid wrds account to access the database
-"""
-
-# =============================================================================
-# Data Loader Abstract Class
-# =============================================================================
-
-class wrds_loader(ABC):
-    def __init__(self,library:str,meta_table_name:str):
-        """
-        :param library: name of library on WRDS
-        :param meta_table_name: name of the metadata table name
-        """
-        self.db = wrds.Connection()
-        self.library = library
-        self.meta_table_name = meta_table_name
-        self.ticker_id = self.__get_meta_data(meta_table_name)
-        super().__init__()
-    
-    def __get_meta_data(self,meta_table_name) -> pd.DataFrame:
-        """
-        :param meta_table_name: name of library that contains the metadata
-        
-        :return: Dataframe of the metadata
-        """
-        return self.db.get_table(library = self.library, table=meta_table_name)
-    
-    def return_tables_in_library(self) -> typing.List[str]:
-        """
-        :return: List of tables that exist in this library
-        """
-        return self.db.list_tables(library=self.library)
-    
-    def return_dates_of_table(self,table_name:str) -> typing.Tuple[str]:
-        """
-        :param table_name: name of table of interest
-        
-        :return: (start_date,end_date) of that table
-        """
-        query = f"select max(data.date),min(data.date) from {self.library}.{table_name} as data"
-        date = self.db.raw_sql(query)
-        start = date["min"][0].strftime("%Y-%m-%d")
-        end = date["max"][0].strftime("%Y-%m-%d")
-        return(start,end)
-    
-    def load_table_all(self):
-        pass
-    
-    def load_table_specific(self):
-        pass
-    
-    def load_table_specific_multi(self):
-        pass
-    
-    def close_connection(self):
-        self.db.close()
-    
-
-# =============================================================================
-# Option Metrics Data Loader
-# =============================================================================
-
-class wrds_loader_option_metrics(wrds_loader):
-    
-    def __init__(self,transform_tickers:bool = False, prefix:str ="stock", starting_int:int = 1, random_increment:bool = False):
-        """
-        :param transform_tickers: whether to transform the tickers or not
-        :param prefix: new ticker name before number (i.e. stock => stock_01, s => s_01)
-        :param starting_int: starting number for transformed ticker
-        :param random_increment: whether the name is incremented by 1 or a random number between 2 and 100
-        """
-        super().__init__("optionm","securd1")
-        self.transform_tickers = transform_tickers
-        if transform_tickers == True:
-            self.ticker_to_transformed = self.generate_transformed_tickers(prefix, starting_int, random_increment)
-        else:
-            self.ticker_to_transformed = None
-    
-    def load_table_all(self, start:datetime, end:datetime, other_table_name:str, columns:typing.List[str] = [], limit:int=10) -> typing.Dict[str,pd.DataFrame]:
-        """
-        :param start: starting date
-        :param end: ending date
-        :param other_table_name: name of data table in the library
-        :param columns: columns in the data table that you want to extract  (if zero return all columns)
-        :param limit: number of results you want to return (if zero return all results)
-        
-        
-        :return: Dict of Dataframes (each df represents the time series for a particular ticker)
-        """
-        start_format = start.strftime("%Y-%m-%d")
-        end_format = end.strftime("%Y-%m-%d")
-        query = f"select id.ticker from {self.library}.{self.meta_table_name} as id join {self.library}.{other_table_name} as data on id.secid = data.secid where date(data.date) >= '{start_format}' and date(data.date) <= '{end_format}'"
-        tickers = self.db.raw_sql(query)
-        output = {}
-        if self.transform_tickers  == True:
-              for ticker in tickers["ticker"]:
-                      if ticker != None:
-                        df = self.__load_table_one(ticker, start, end, other_table_name,columns, limit)
-                        secids = set(df["secid"])
-                        if len(secids) > 1:
-                            new_ticker = set()
-                            for secid in secids:
-                                new_ticker.add(self.ticker_to_transformed[int(secid)][1])
-                            if len(new_ticker) > 1:
-                                raise Exception("multiple new tickers for ticker, check!")
-                            else:
-                                df["ticker"] = new_ticker
-                                output[new_ticker] = df
-                        else:
-                            new_ticker = self.ticker_to_transformed[int(secids.pop())][1]
-                            df["ticker"] = new_ticker
-                            output[new_ticker] = df   
-        else:
-            for ticker in tickers["ticker"]:
-                if ticker != None:
-                    df = self.__load_table_one(ticker, start, end, other_table_name,columns, limit)
-                    output[ticker] = df
-
-        return output
-    
-    
-    def load_table_specific(self,ticker:str, start:datetime, end:datetime, other_table_name:str,columns:typing.List[str] = [], limit:int=10) -> typing.Dict[str,pd.DataFrame]:
-        """
-        :param ticker: name of ticker you desire
-        :param start: starting date
-        :param end: ending date
-        :param other_table_name: name of data table in the library
-        :param columns: columns in the data table that you want to extract  (if zero return all columns)
-        :param limit: number of results you want to return (if zero return all results)
-                
-        :return: Dict of Dataframes (each df represents the time series for a particular ticker)
-        """
-        
-        df = self.__load_table_one(ticker, start, end, other_table_name,columns, limit)
-        
-        if self.transform_tickers  == True:
-            secids = set(df["secid"])
-            if len(secids) > 1:
-                new_ticker = set()
-                for secid in secids:
-                    new_ticker.add(self.ticker_to_transformed[int(secid)][1])
-                if len(new_ticker) > 1:
-                    raise Exception("multiple new tickers for ticker, check!")
-                else:
-                    df["ticker"] = new_ticker
-                    ticker = new_ticker
-            else:
-                new_ticker = self.ticker_to_transformed[int(secids.pop())][1]
-                df["ticker"] = new_ticker
-                ticker = new_ticker
-                
-        return {ticker:df}
-        
-        
-    def load_table_specific_multi(self,tickers:typing.List[str], start:datetime, end:datetime, other_table_name:str,columns:typing.List[str] = [], limit:int=10) -> typing.Dict[str,pd.DataFrame]:
-        """
-        :param tickerS: list of ticker you desire
-        :param start: starting date
-        :param end: ending date
-        :param other_table_name: name of data table in the library
-        :param columns: columns in the data table that you want to extract  (if zero return all columns)
-        :param limit: number of results you want to return (if zero return all results)
-                
-        :return: Dict of Dataframes (each df represents the time series for a particular ticker)
-        """
-        output = {}
-        if self.transform_tickers  == True:
-            for ticker in tickers:
-                df = self.__load_table_one(ticker, start, end, other_table_name,columns, limit)
-                secids = set(df["secid"])
-                if len(secids) > 1:
-                    new_ticker = set()
-                    for secid in secids:
-                        new_ticker.add(self.ticker_to_transformed[int(secid)][1])
-                    if len(new_ticker) > 1:
-                        raise Exception("multiple new tickers for ticker, check!")
-                    else:
-                        df["ticker"] = new_ticker
-                        output[new_ticker] = df
-                else:
-                    new_ticker = self.ticker_to_transformed[int(secids.pop())][1]
-                    df["ticker"] = new_ticker
-                    output[new_ticker] = df
-        else: 
-            for ticker in tickers:
-                df = self.__load_table_one(ticker, start, end, other_table_name,columns, limit)
-                output[ticker] = df
-    
-        return output
-    
-    def generate_transformed_tickers(self,prefix:str,start:int,random_increment:bool) -> typing.Dict[int,typing.Tuple[str,str]]:
-        """
-        :param prefix: new ticker name before number (i.e. stock => stock_01, s => s_01)
-        :param start: starting number for increment 
-        :param random_increment: whether the name is incremented by 1 or a random number between 2 and 100
-
-        :return: Dict with secid as key and (ticker name, new transformed ticker name) as value 
-        """
-        if prefix != "":
-            prefix += "_"
-        
-        if random_increment == True:
-            increment = random.randint(2, 100)
-        else:
-            increment = 1
-        
-        ticker_to_random = {}
-        for row in self.ticker_id.to_numpy():
-            ticker_to_random[int(row[0])] = (row[2],prefix+str(start))
-            start += increment
-        
-        return ticker_to_random
-    
-    def save_tickers_hashmap(self):
-        pass
-    
-    def save_as_csv(self,results:typing.Dict[str,pd.DataFrame]):
-        pass
-    
-    def __load_table_one(self,ticker:str, start:datetime, end:datetime, other_table_name:str,columns:typing.List[str] = [], limit:int=10) -> pd.DataFrame:
-        """
-        :param ticker: name of ticker you desire
-        :param start: starting date
-        :param end: ending date
-        :param other_table_name: name of data table in the library
-        :param columns: columns in the data table that you want to extract  (if zero return all columns)
-        :param limit: number of results you want to return (if zero return all results)
-        
-        :raise ColumnNotInDataError if columns does not exist in data
-        
-        :return: dataframes with dataset required
-        """
-        start_format = start.strftime("%Y-%m-%d")
-        end_format = end.strftime("%Y-%m-%d")
-        if len(columns) != 0:
-            other_data_column = set(self.db.get_table(library = self.library, table=other_table_name,obs=1).columns)
-            columns_not_in_data = set(columns).difference(other_data_column)
-            if len(columns_not_in_data) != 0:
-                raise Exception(f"ColumnNotInDataError: '{columns_not_in_data}' is not in {other_table_name} \n The available columns are {other_data_column}")
-            else:
-                if "date" not in columns:
-                    columns.append("date")
-                if "secid" not in columns:
-                    columns.append("secid")
-                columns_string = ', '.join([f"data.{column}" for column in columns])
-                if limit != 0:
-                    query = f"select id.ticker, {columns_string} from {self.library}.{self.meta_table_name} as id join {self.library}.{other_table_name} as data on id.secid = data.secid where id.ticker = '{ticker}' and date(data.date) >= '{start_format}' and date(data.date) <= '{end_format}' limit {limit}"
-                else:
-                    query = f"select id.ticker, {columns_string} from {self.library}.{self.meta_table_name} as id join {self.library}.{other_table_name} as data on id.secid = data.secid where id.ticker = '{ticker}' and date(data.date) >= '{start_format}' and date(data.date) <= '{end_format}'"
-        else:
-            if limit != 0:
-                query = f"select id.ticker, data.*  from {self.library}.{self.meta_table_name} as id join {self.library}.{other_table_name} as data on id.secid = data.secid where id.ticker = '{ticker}' and date(data.date) >= '{start_format}' and date(data.date) <= '{end_format}' limit {limit}"
-            else:
-                query = f"select id.ticker, data.*  from {self.library}.{self.meta_table_name} as id join {self.library}.{other_table_name} as data on id.secid = data.secid where id.ticker = '{ticker}' and date(data.date) >= '{start_format}' and date(data.date) <= '{end_format}'"
-        
-        return self.db.raw_sql(query,date_cols=["date"],index_col=["date"])
-    
-    
-# =============================================================================
-# Compustats Data Loader
-# =============================================================================
-
-
-
-# =============================================================================
-# Simple Tutorial
-# =============================================================================
-
-if __name__ == "__main__":
-    
-    loader = wrds_loader_option_metrics()
-    
-    table_name = "secprd"
-    # table_name = "hvold2015"
-    # table_name = "opprcd2015"
-    # table_name = "stdopd2015"
-    # table_name = "vsurfd2015"
-    
-    start_date = datetime(2015,12,10)
-    end_date = datetime(2015,12,21)
-    limit = 10
-    
-    # data_all = loader.load_table_all(start_date, end_date, table_name,limit=limit)
-    
-    ticker = "AAPL"
-    
-    data_one = loader.load_table_specific(ticker, start_date, end_date, table_name)
-        
-    tickers = ["AAPL","GOOGL","FB"]
-    
-    data_multi = loader.load_table_specific_multi(tickers, start_date, end_date, table_name)
-    
-    loader.close_connection()
+import os
+import csv
+import typing
+import queue
+import random
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from user_manual.USCalendar import USTradingCalendar
+from instrumentation import span, count, traced
+
+
+"""
+NOTE:
+You need to pip install wrds before using this data loader
+You also need to have a valid wrds account to access the database
+The connection is only opened (and the metadata table downloaded) when the first query needs it
+"""
+
+# =============================================================================
+# Year-partitioned tables
+# =============================================================================
+
+def yearly_table_names(table_family:str, start:datetime, end:datetime) -> typing.List[typing.Tuple[str,datetime,datetime]]:
+    """
+    :param table_family: name of table without the year (i.e. opprcd, stdopd, vsurfd)
+    :param start: starting date
+    :param end: ending date
+    
+    :return: List of (table name, start, end) with the date range clipped to each year, in date order
+    """
+    if end < start:
+        raise Exception("TimeInvalid: The end date cannot be before the start date")
+    tables = []
+    for year in range(start.year, end.year + 1):
+        year_start = max(start, datetime(year, 1, 1))
+        year_end = min(end, datetime(year, 12, 31, 23, 59, 59))
+        tables.append((f"{table_family}{year}", year_start, year_end))
+    return tables
+
+# =============================================================================
+# Data Loader Abstract Class
+# =============================================================================
+
+class wrds_loader(ABC):
+    def __init__(self,library:str,meta_table_name:str,pool_size:int = 4):
+        """
+        :param library: name of library on WRDS
+        :param meta_table_name: name of the metadata table name
+        :param pool_size: maximum number of connections opened for concurrent queries
+        """
+        self.library = library
+        self.meta_table_name = meta_table_name
+        self.pool_size = pool_size
+        self._db = None
+        self._ticker_id = None
+        self._db_lock = threading.Lock()
+        self._pool = queue.Queue()
+        self._pool_opened = 0
+        self._pool_lock = threading.Lock()
+        super().__init__()
+    
+    @property
+    def db(self):
+        """
+        :return: main connection to WRDS (opened on first use, kept out of the pool so that
+            concurrent queries never run on it)
+        """
+        if self._db is None:
+            with self._db_lock:
+                if self._db is None:
+                    self._db = _connect()
+        return self._db
+    
+    @property
+    def ticker_id(self) -> pd.DataFrame:
+        """
+        :return: Dataframe of the metadata (downloaded on first use)
+        """
+        if self._ticker_id is None:
+            self._ticker_id = self.__get_meta_data(self.meta_table_name)
+        return self._ticker_id
+    
+    def __get_meta_data(self,meta_table_name) -> pd.DataFrame:
+        """
+        :param meta_table_name: name of library that contains the metadata
+        
+        :return: Dataframe of the metadata
+        """
+        with span("wrds.get_table", table=meta_table_name):
+            meta_data = self.db.get_table(library = self.library, table=meta_table_name)
+        count("queries_issued", source="wrds")
+        count("rows_read", len(meta_data), source="wrds")
+        return meta_data
+    
+    def return_tables_in_library(self) -> typing.List[str]:
+        """
+        :return: List of tables that exist in this library
+        """
+        return self.db.list_tables(library=self.library)
+    
+    def return_dates_of_table(self,table_name:str) -> typing.Tuple[str]:
+        """
+        :param table_name: name of table of interest
+        
+        :return: (start_date,end_date) of that table
+        """
+        query = f"select max(data.date),min(data.date) from {self.library}.{table_name} as data"
+        date = self._raw_sql(self.db, query)
+        start = date["min"][0].strftime("%Y-%m-%d")
+        end = date["max"][0].strftime("%Y-%m-%d")
+        return(start,end)
+    
+    def load_table_all(self):
+        pass
+    
+    def load_table_specific(self):
+        pass
+    
+    def load_table_specific_multi(self):
+        pass
+    
+    def close_connection(self):
+        """
+        Closes the main connection and the connections of the pool (the next query opens a new one)
+        """
+        with self._db_lock, self._pool_lock:
+            while not self._pool.empty():
+                self._pool.get().close()
+            self._pool_opened = 0
+            if self._db is not None:
+                self._db.close()
+            self._db = None
+    
+    def _acquire_connection(self):
+        """
+        :return: an idle connection from the pool (opens a new one while under pool_size)
+        """
+        try:
+            db = self._pool.get_nowait()
+            count("cache_hits", source="wrds_pool")
+            return db
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            open_new = self._pool_opened < self.pool_size
+            if open_new:
+                self._pool_opened += 1
+        if open_new:
+            count("cache_misses", source="wrds_pool")
+            return _connect()
+        with span("wrds.wait_connection"):
+            return self._pool.get()
+    
+    def _release_connection(self,db):
+        """
+        :param db: connection taken with _acquire_connection
+        """
+        self._pool.put(db)
+    
+    def _raw_sql(self,db,query:str,**kwargs) -> pd.DataFrame:
+        """
+        :param db: connection the query is sent to
+        :param query: sql query
+        :param kwargs: arguments of raw_sql (i.e. date_cols, index_col)
+        
+        :return: result of the query (timed and counted by the instrumentation)
+        """
+        with span("wrds.raw_sql", library=self.library):
+            df = db.raw_sql(query,**kwargs)
+        count("queries_issued", source="wrds")
+        count("rows_read", len(df), source="wrds")
+        return df
+    
+
+
+
+def _connect():
+    """
+    :return: new connection to WRDS (wrds is imported on the first connection)
+    """
+    import wrds
+
+    with span("wrds.connect"):
+        return wrds.Connection()
+
+
+# =============================================================================
+# Option Metrics Data Loader
+# =============================================================================
+
+class wrds_loader_option_metrics(wrds_loader):
+    
+    def __init__(self,transform_tickers:bool = False, prefix:str ="stock", starting_int:int = 1, random_increment:bool = False, pool_size:int = 4):
+        """
+        :param transform_tickers: whether to transform the tickers or not
+        :param prefix: new ticker name before number (i.e. stock => stock_01, s => s_01)
+        :param starting_int: starting number for transformed ticker
+        :param random_increment: whether the name is incremented by 1 or a random number between 2 and 100
+        :param pool_size: maximum number of connections opened for concurrent queries
+        """
+        super().__init__("optionm","securd1",pool_size)
+        self.transform_tickers = transform_tickers
+        self._transform_arguments = (prefix, starting_int, random_increment)
+        self._ticker_to_transformed = None
+    
+    @property
+    def ticker_to_transformed(self) -> typing.Dict[int,typing.Tuple[str,str]]:
+        """
+        :return: Dict with secid as key and (ticker name, new transformed ticker name) as value
+            (generated from the metadata on first use, None if the tickers are not transformed)
+        """
+        if self.transform_tickers == True and self._ticker_to_transformed is None:
+            self._ticker_to_transformed = self.generate_transformed_tickers(*self._transform_arguments)
+        return self._ticker_to_transformed
+    
+    @traced()
+    def load_table_all(self, start:datetime, end:datetime, other_table_name:str, columns:typing.List[str] = [], limit:int=10) -> typing.Dict[str,pd.DataFrame]:
+        """
+        :param start: starting date
+        :param end: ending date
+        :param other_table_name: name of data table in the library
+        :param columns: columns in the data table that you want to extract  (if zero return all columns)
+        :param limit: number of results you want to return (if zero return all results)
+        
+        
+        :return: Dict of Dataframes (each df represents the time series for a particular ticker)
+        """
+        start_format = start.strftime("%Y-%m-%d")
+        end_format = end.strftime("%Y-%m-%d")
+        query = f"select id.ticker from {self.library}.{self.meta_table_name} as id join {self.library}.{other_table_name} as data on id.secid = data.secid where date(data.date) >= '{start_format}' and date(data.date) <= '{end_format}'"
+        tickers = self._raw_sql(self.db, query)
+        output = {}
+        if self.transform_tickers  == True:
+              for ticker in tickers["ticker"]:
+                      if ticker != None:
+                        df = self.__load_table_one(ticker, start, end, other_table_name,columns, limit)
+                        secids = set(df["secid"])
+                        if len(secids) > 1:
+                            new_ticker = set()
+                            for secid in secids:
+                                new_ticker.add(self.ticker_to_transformed[int(secid)][1])
+                            if len(new_ticker) > 1:
+                                raise Exception("multiple new tickers for ticker, check!")
+                            else:
+                                df["ticker"] = new_ticker
+                                output[new_ticker] = df
+                        else:
+                            new_ticker = self.ticker_to_transformed[int(secids.pop())][1]
+                            df["ticker"] = new_ticker
+                            output[new_ticker] = df   
+        else:
+            for ticker in tickers["ticker"]:
+                if ticker != None:
+                    df = self.__load_table_one(ticker, start, end, other_table_name,columns, limit)
+                    output[ticker] = df
+
+        return output
+    
+    
+    @traced()
+    def load_table_specific(self,ticker:str, start:datetime, end:datetime, other_table_name:str,columns:typing.List[str] = [], limit:int=10) -> typing.Dict[str,pd.DataFrame]:
+        """
+        :param ticker: name of ticker you desire
+        :param start: starting date
+        :param end: ending date
+        :param other_table_name: name of data table in the library
+        :param columns: columns in the data table that you want to extract  (if zero return all columns)
+        :param limit: number of results you want to return (if zero return all results)
+                
+        :return: Dict of Dataframes (each df represents the time series for a particular ticker)
+        """
+        
+        df = self.__load_table_one(ticker, start, end, other_table_name,columns, limit)
+        
+        if self.transform_tickers  == True:
+            secids = set(df["secid"])
+            if len(secids) > 1:
+                new_ticker = set()
+                for secid in secids:
+                    new_ticker.add(self.ticker_to_transformed[int(secid)][1])
+                if len(new_ticker) > 1:
+                    raise Exception("multiple new tickers for ticker, check!")
+                else:
+                    df["ticker"] = new_ticker
+                    ticker = new_ticker
+            else:
+                new_ticker = self.ticker_to_transformed[int(secids.pop())][1]
+                df["ticker"] = new_ticker
+                ticker = new_ticker
+                
+        return {ticker:df}
+        
+        
+    @traced()
+    def load_table_specific_multi(self,tickers:typing.List[str], start:datetime, end:datetime, other_table_name:str,columns:typing.List[str] = [], limit:int=10) -> typing.Dict[str,pd.DataFrame]:
+        """
+        :param tickerS: list of ticker you desire
+        :param start: starting date
+        :param end: ending date
+        :param other_table_name: name of data table in the library
+        :param columns: columns in the data table that you want to extract  (if zero return all columns)
+        :param limit: number of results you want to return (if zero return all results)
+                
+        :return: Dict of Dataframes (each df represents the time series for a particular ticker)
+        """
+        output = {}
+        if self.transform_tickers  == True:
+            for ticker in tickers:
+                df = self.__load_table_one(ticker, start, end, other_table_name,columns, limit)
+                secids = set(df["secid"])
+                if len(secids) > 1:
+                    new_ticker = set()
+                    for secid in secids:
+                        new_ticker.add(self.ticker_to_transformed[int(secid)][1])
+                    if len(new_ticker) > 1:
+                        raise Exception("multiple new tickers for ticker, check!")
+                    else:
+                        df["ticker"] = new_ticker
+                        output[new_ticker] = df
+                else:
+                    new_ticker = self.ticker_to_transformed[int(secids.pop())][1]
+                    df["ticker"] = new_ticker
+                    output[new_ticker] = df
+        else: 
+            for ticker in tickers:
+                df = self.__load_table_one(ticker, start, end, other_table_name,columns, limit)
+                output[ticker] = df
+    
+        return output
+    
+    @traced()
+    def load_table_multi_year(self, table_family:str, start:datetime, end:datetime, tickers:typing.List[str] = [], columns:typing.List[str] = [], limit:int=0) -> typing.Dict[str,pd.DataFrame]:
+        """
+        Queries every yearly table of a family (i.e. vsurfd2010 ... vsurfd2019) concurrently
+        over the connection pool, so the load takes about as long as the slowest year
+        
+        :param table_family: name of data table without the year (i.e. opprcd, stdopd, vsurfd)
+        :param start: starting date
+        :param end: ending date
+        :param tickers: list of ticker you desire (if empty return all tickers)
+        :param columns: columns in the data table that you want to extract  (if zero return all columns)
+        :param limit: number of results you want to return for each year (if zero return all results)
+        
+        :raise ValueError if there is no trading session between start and end
+        :raise TableNotInLibraryError if no yearly table of the family covers the date range
+        :raise ColumnNotInDataError if columns does not exist in data
+        
+        :return: Dict of Dataframes (each df represents the time series for a particular ticker)
+        """
+        start, end = USTradingCalendar().resolve_range(start, end)
+        available = set(self.return_tables_in_library())
+        year_tables = [table for table in yearly_table_names(table_family, start, end) if table[0] in available]
+        if len(year_tables) == 0:
+            raise Exception(f"TableNotInLibraryError: no {table_family} table in {self.library} between {start.date()} and {end.date()}")
+        
+        columns = list(columns)
+        if len(columns) != 0:
+            other_data_column = set(self.db.get_table(library = self.library, table=year_tables[0][0],obs=1).columns)
+            columns_not_in_data = set(columns).difference(other_data_column)
+            if len(columns_not_in_data) != 0:
+                raise Exception(f"ColumnNotInDataError: '{columns_not_in_data}' is not in {year_tables[0][0]} \n The available columns are {other_data_column}")
+            for column in ["date", "secid"]:
+                if column not in columns:
+                    columns.append(column)
+        
+        with ThreadPoolExecutor(max_workers=min(self.pool_size, len(year_tables))) as executor:
+            futures = [executor.submit(self.__load_table_year, table, year_start, year_end, tickers, columns, limit) for table, year_start, year_end in year_tables]
+            # results are collected in year order, so concatenation keeps the dates sorted
+            frames = [future.result() for future in futures]
+        
+        df = pd.concat(frames).sort_index(kind="mergesort")
+        output = {}
+        for ticker, df_ticker in df.groupby("ticker", sort=False):
+            if self.transform_tickers == True:
+                new_tickers = set(self.ticker_to_transformed[int(secid)][1] for secid in set(df_ticker["secid"]))
+                if len(new_tickers) > 1:
+                    raise Exception("multiple new tickers for ticker, check!")
+                ticker = new_tickers.pop()
+                df_ticker = df_ticker.assign(ticker=ticker)
+            output[ticker] = df_ticker
+        
+        return output
+    
+    def generate_transformed_tickers(self,prefix:str,start:int,random_increment:bool) -> typing.Dict[int,typing.Tuple[str,str]]:
+        """
+        :param prefix: new ticker name before number (i.e. stock => stock_01, s => s_01)
+        :param start: starting number for increment 
+        :param random_increment: whether the name is incremented by 1 or a random number between 2 and 100
+
+        :return: Dict with secid as key and (ticker name, new transformed ticker name) as value 
+        """
+        if prefix != "":
+            prefix += "_"
+        
+        if random_increment == True:
+            increment = random.randint(2, 100)
+        else:
+            increment = 1
+        
+        ticker_to_random = {}
+        for row in self.ticker_id.to_numpy():
+            ticker_to_random[int(row[0])] = (row[2],prefix+str(start))
+            start += increment
+        
+        return ticker_to_random
+    
+    def save_tickers_hashmap(self):
+        pass
+    
+    def save_as_csv(self,results:typing.Dict[str,pd.DataFrame]):
+        pass
+    
+    def __load_table_one(self,ticker:str, start:datetime, end:datetime, other_table_name:str,columns:typing.List[str] = [], limit:int=10) -> pd.DataFrame:
+        """
+        :param ticker: name of ticker you desire
+        :param start: starting date
+        :param end: ending date
+        :param other_table_name: name of data table in the library
+        :param columns: columns in the data table that you want to extract  (if zero return all columns)
+        :param limit: number of results you want to return (if zero return all results)
+        
+        :raise ColumnNotInDataError if columns does not exist in data
+        
+        :return: dataframes with dataset required
+        """
+        start_format = start.strftime("%Y-%m-%d")
+        end_format = end.strftime("%Y-%m-%d")
+        if len(columns) != 0:
+            other_data_column = set(self.db.get_table(library = self.library, table=other_table_name,obs=1).columns)
+            count("queries_issued", source="wrds")
+            columns_not_in_data = set(columns).difference(other_data_column)
+            if len(columns_not_in_data) != 0:
+                raise Exception(f"ColumnNotInDataError: '{columns_not_in_data}' is not in {other_table_name} \n The available columns are {other_data_column}")
+            else:
+                if "date" not in columns:
+                    columns.append("date")
+                if "secid" not in columns:
+                    columns.append("secid")
+                columns_string = ', '.join([f"data.{column}" for column in columns])
+                if limit != 0:
+                    query = f"select id.ticker, {columns_string} from {self.library}.{self.meta_table_name} as id join {self.library}.{other_table_name} as data on id.secid = data.secid where id.ticker = '{ticker}' and date(data.date) >= '{start_format}' and date(data.date) <= '{end_format}' limit {limit}"
+                else:
+                    query = f"select id.ticker, {columns_string} from {self.library}.{self.meta_table_name} as id join {self.library}.{other_table_name} as data on id.secid = data.secid where id.ticker = '{ticker}' and date(data.date) >= '{start_format}' and date(data.date) <= '{end_format}'"
+        else:
+            if limit != 0:
+                query = f"select id.ticker, data.*  from {self.library}.{self.meta_table_name} as id join {self.library}.{other_table_name} as data on id.secid = data.secid where id.ticker = '{ticker}' and date(data.date) >= '{start_format}' and date(data.date) <= '{end_format}' limit {limit}"
+            else:
+                query = f"select id.ticker, data.*  from {self.library}.{self.meta_table_name} as id join {self.library}.{other_table_name} as data on id.secid = data.secid where id.ticker = '{ticker}' and date(data.date) >= '{start_format}' and date(data.date) <= '{end_format}'"
+        
+        return self._raw_sql(self.db, query,date_cols=["date"],index_col=["date"])
+    
+    
+    def __load_table_year(self, table_name:str, start:datetime, end:datetime, tickers:typing.List[str], columns:typing.List[str], limit:int) -> pd.DataFrame:
+        """
+        :param table_name: name of the yearly data table in the library
+        :param start: starting date (within the year of the table)
+        :param end: ending date (within the year of the table)
+        :param tickers: list of ticker you desire (if empty return all tickers)
+        :param columns: columns in the data table that you want to extract (if zero return all columns)
+        :param limit: number of results you want to return (if zero return all results)
+        
+        :return: dataframe of one yearly table, queried on a connection taken from the pool
+        """
+        start_format = start.strftime("%Y-%m-%d")
+        end_format = end.strftime("%Y-%m-%d")
+        if len(columns) != 0:
+            columns_string = ', '.join([f"data.{column}" for column in columns])
+        else:
+            columns_string = "data.*"
+        query = f"select id.ticker, {columns_string} from {self.library}.{self.meta_table_name} as id join {self.library}.{table_name} as data on id.secid = data.secid where date(data.date) >= '{start_format}' and date(data.date) <= '{end_format}'"
+        if len(tickers) != 0:
+            tickers_string = ', '.join([f"'{ticker}'" for ticker in tickers])
+            query += f" and id.ticker in ({tickers_string})"
+        if limit != 0:
+            query += f" limit {limit}"
+        
+        db = self._acquire_connection()
+        try:
+            return self._raw_sql(db, query,date_cols=["date"],index_col=["date"])
+        finally:
+            self._release_connection(db)
+    
+    
+# =============================================================================
+# Compustats Data Loader
+# =============================================================================
+
+
+
+# =============================================================================
+# Simple Tutorial
+# =============================================================================
+
+if __name__ == "__main__":
+    
+    loader = wrds_loader_option_metrics()
+    
+    table_name = "secprd"
+    # table_name = "hvold2015"
+    # table_name = "opprcd2015"
+    # table_name = "stdopd2015"
+    # table_name = "vsurfd2015"
+    
+    start_date = datetime(2015,12,10)
+    end_date = datetime(2015,12,21)
+    limit = 10
+    
+    # data_all = loader.load_table_all(start_date, end_date, table_name,limit=limit)
+    
+    ticker = "AAPL"
+    
+    data_one = loader.load_table_specific(ticker, start_date, end_date, table_name)
+        
+    tickers = ["AAPL","GOOGL","FB"]
+    
+    data_multi = loader.load_table_specific_multi(tickers, start_date, end_date, table_name)
+    
+    data_multi_year = loader.load_table_multi_year("vsurfd", datetime(2010,1,1), datetime(2019,12,31), tickers)
+    
+    loader.close_connection()